@@ -357,6 +357,47 @@ class AlarmCli(cmd.Cmd):
             self.display_alarms()
             print('Alarm/s "%s" could not be deleted.' % alarm_id_string)
 
+    def do_snoozealarm(self, alarm_id_string):
+        """
+        Snoozes a running alarm, identified by its id, to alert again after the
+        snooze time. E.g.:
+        'snoozealarm 3'
+        """
+        try:
+            alarm_id = int(alarm_id_string)
+        except ValueError:
+            self.display_alarms()
+            print('After "snoozealarm" there must be a number indicating ' +
+                  'the Alarm ID to be snoozed !')
+            return
+        alert_time = self.alarm_mgr.snooze(alarm_id)
+        self.display_alarms()
+        if alert_time is None:
+            print('Alarm ID %s is not running, it could not be snoozed.' %
+                  alarm_id)
+        else:
+            print('Alarm ID %s snoozed until %s' %
+                  (alarm_id, time.strftime('%H:%M', time.localtime(alert_time))))
+
+    def do_dismiss(self, alarm_id_string):
+        """
+        Dismisses an alarm, identified by its id, cancelling its snooze. E.g.:
+        'dismiss 3'
+        """
+        try:
+            alarm_id = int(alarm_id_string)
+        except ValueError:
+            self.display_alarms()
+            print('After "dismiss" there must be a number indicating ' +
+                  'the Alarm ID to be dismissed !')
+            return
+        success = self.alarm_mgr.dismiss(alarm_id)
+        self.display_alarms()
+        if success is True:
+            print('Alarm ID %s has been dismissed.' % alarm_id)
+        else:
+            print('Alarm ID %s was not snoozed.' % alarm_id)
+
     #
     # Settings command methods
     #
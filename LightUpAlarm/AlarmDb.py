@@ -27,11 +27,33 @@
 # configuration for simple conversion to json.
 #   row 1 -> column 'snooze_time', column 'offset_alert_time'
 #
+# The 'snoozes' table keeps the pending snooze alerts, so that they can be
+# restored after a restart, with the following columns:
+#   id: primary key ID for the snoozes row
+#   alarm_id: ID of the snoozed alarm, only one row per alarm.
+#   alert_time: Time of the snooze alert, in seconds since 1970.
+#
+# Several independent sets of alarms can be kept in the same database file
+# using namespaces. The 'alarms', 'settings' and 'snoozes' tables of each
+# namespace are prefixed with its name (e.g. 'kitchen_alarms'), the 'stations'
+# table is shared. All the AlarmDb instances of the same file share the same
+# dataset connection.
+#
+# The tables are created with all their columns in a single statement each,
+# the first time they are used in the process, instead of letting dataset add
+# the columns one by one as rows are inserted (each column addition reflects
+# the schema of the whole database, which grows with the namespaces). The
+# connections to the file are kept open in a pool, as each new SQLite
+# connection has to read that schema again.
+#
 from __future__ import unicode_literals, absolute_import, print_function
+import os
+import re
 import sys
 import json
 import time
 import types
+import threading
 # StringIO embedded into io in python 3
 try:
     import StringIO
@@ -39,16 +61,21 @@ except ImportError:
     from io import StringIO
 try:
     import dataset
+    from sqlalchemy import Boolean, Integer, Text, Column, Table, \
+        inspect, select, and_, or_, not_
+    from sqlalchemy.pool import QueuePool
 except ImportError:
     print("The dataset package needs to be installed !\nThe LightUpAlarm " +
           "folder contains a README file with more information.")
     sys.exit(1)
 try:
     from LightUpAlarm.AlarmItem import AlarmItem
+    from LightUpAlarm.AlarmSet import AlarmSet
     from LightUpAlarm.StationItem import StationItem
     from LightUpAlarm.Py23Compatibility import *
 except ImportError:
     from AlarmItem import AlarmItem
+    from AlarmSet import AlarmSet
     from StationItem import StationItem
     from Py23Compatibility import *
 
@@ -56,52 +83,277 @@ except ImportError:
 class AlarmDb(object):
     """ Creates and manages a Sqlite database to store and retrieve alarms. """
 
+    # Revision number and last change time of each database file and
+    # namespace, and of the stations of each database file, updated on every
+    # change done by any AlarmDb instance of this process. The namespaces have
+    # their own write locks, so the updates are guarded by a lock of their own
+    __revisions = {}
+    __stations_revisions = {}
+    __revisions_lock = threading.Lock()
+
+    # Time of the process start, the last change time of the databases not
+    # changed since then
+    __start_time = time.time()
+
+    # Dataset connection of each database file, shared by all the instances,
+    # and the names of its tables already created with all their columns. The
+    # lock guards both
+    __databases = {}
+    __created_tables = {}
+    __schema_lock = threading.Lock()
+
+    # Valid namespace names, used as a table names prefix
+    __namespace_pattern = re.compile(r'^[A-Za-z0-9]+$')
+
+    # Column types of the tables, besides the 'id' primary key. The tables are
+    # created before they are used, as the schema changes can not be part of
+    # a transaction
+    __alarms_columns = (
+        ('hour', Integer), ('minute', Integer), ('monday', Boolean),
+        ('tuesday', Boolean), ('wednesday', Boolean), ('thursday', Boolean),
+        ('friday', Boolean), ('saturday', Boolean), ('sunday', Boolean),
+        ('enabled', Boolean), ('label', Text), ('timestamp', Integer),
+        ('station_id', Integer))
+    __settings_columns = (('snooze_time', Integer),
+                          ('offset_alert_time', Integer))
+    __stations_columns = (('name', Text), ('url', Text))
+    __snoozes_columns = (('alarm_id', Integer), ('alert_time', Integer))
+
     #
     # constructor
     #
-    def __init__(self, db_name=None):
+    def __init__(self, db_name=None, namespace=None):
         """
         AlarmDbHelper initialiser. It can take an argument to indicate the
         sqlite database filename.
         By default if no settings are found in the db it wll add the snooze
         time to be 3 min, and the offset alert time to be -15 min.
         :param db_name: Optional string indicating the database filename.
+        :param namespace: Optional alphanumeric string indicating the
+                          namespace of the alarms, settings and snoozes. The
+                          default tables are used if None.
         """
+        self.db_name = db_name
         if isinstance(db_name, str_type):
             self.db_file = 'sqlite:///%s.db' % db_name
         else:
             if db_name is not None:
                 print('The database name inputted in the AlarmDbHelper ' +
                       'constructor is not a valid String !')
+                self.db_name = None
             self.db_file = 'sqlite:////home/yannick/alarmdatabase.db'
 
-        self.alarms_table = self.__connect_alarms()
+        if namespace is not None and not AlarmDb.is_valid_namespace(namespace):
+            print('ERROR: The namespace inputted in the AlarmDb constructor ' +
+                  'must be alphanumeric, "%s" ignored !' % namespace,
+                  file=sys.stderr)
+            namespace = None
+        self.namespace = namespace
+        if namespace is None:
+            self.__table_prefix = ''
+        else:
+            self.__table_prefix = '%s_' % namespace
+
+        # The connection and tables are created again if the file has been
+        # removed
+        if not os.path.isfile(self.db_file[len('sqlite:///'):]):
+            with AlarmDb.__schema_lock:
+                database = AlarmDb.__databases.pop(self.db_file, None)
+                if database is not None:
+                    database.engine.dispose()
+                AlarmDb.__created_tables.pop(self.db_file, None)
+
+        # Create the tables if they do not exist yet
+        self.__create_tables()
         # Check if the settings table is empty
         settings_table = self.__connect_settings()
         rows = settings_table.all()
         if rows.count == 0:
             settings_table.insert(dict(snooze_time=3, offset_alert_time=-15))
 
-        self.stations_table = self.__connect_stations()
+    @staticmethod
+    def is_valid_namespace(namespace):
+        """
+        Checks if a namespace name is valid, only letters and numbers.
+        :param namespace: Namespace name to check.
+        :return: Boolean indicating if the namespace name is valid.
+        """
+        return isinstance(namespace, str_type) and \
+            AlarmDb.__namespace_pattern.match(namespace) is not None
+
+    #
+    # Tables, got from the shared connection, which keeps them once loaded
+    #
+    @property
+    def alarms_table(self):
+        """ Dataset Table with the alarms of the namespace. """
+        return self.__connect_alarms()
+
+    @property
+    def stations_table(self):
+        """ Dataset Table with the stations. """
+        return self.__connect_stations()
+
+    @property
+    def snoozes_table(self):
+        """ Dataset Table with the snoozes of the namespace. """
+        return self.__connect_snoozes()
 
     #
     # db connection member functions
     #
+    def __connect(self):
+        """
+        Gets the dataset connection to the database file, shared by all the
+        AlarmDb instances. The schema is not reflected on connection, the
+        tables are loaded one by one, see __create_tables(). The SQLite
+        connections are pooled and can be used from any thread, as the pool
+        only gives each one to a thread at a time.
+        :return: Dataset Database instance.
+        """
+        database = AlarmDb.__databases.get(self.db_file)
+        if database is None:
+            with AlarmDb.__schema_lock:
+                database = AlarmDb.__databases.get(self.db_file)
+                if database is None:
+                    database = dataset.connect(
+                        self.db_file, reflectMetadata=False,
+                        engine_kwargs=dict(
+                            poolclass=QueuePool,
+                            connect_args=dict(check_same_thread=False)))
+                    AlarmDb.__databases[self.db_file] = database
+        return database
+
     def __connect_alarms(self):
         """ Connecting to a SQLite database table 'alarms'. """
-        alarms_table = dataset.connect(self.db_file)['alarms']
+        alarms_table = self.__connect()[self.__table_prefix + 'alarms']
         return alarms_table
 
     def __connect_settings(self):
         """ Connecting to a SQLite database table 'settings'. """
-        settings_table = dataset.connect(self.db_file)['settings']
+        settings_table = self.__connect()[self.__table_prefix + 'settings']
         return settings_table
 
     def __connect_stations(self):
         """ Connecting to a SQLite database table 'stations'. """
-        stations_table = dataset.connect(self.db_file)['stations']
+        stations_table = self.__connect()['stations']
         return stations_table
 
+    def __connect_snoozes(self):
+        """ Connecting to a SQLite database table 'snoozes'. """
+        snoozes_table = self.__connect()[self.__table_prefix + 'snoozes']
+        return snoozes_table
+
+    def __create_tables(self):
+        """
+        Creates the tables of the namespace and the stations table, each one
+        with all its columns in a single statement, if they do not exist yet.
+        The tables created by previous versions get their missing columns.
+        Each table is only checked the first time it is used in the process.
+        """
+        database = self.__connect()
+        tables = ((self.__table_prefix + 'alarms', AlarmDb.__alarms_columns),
+                  (self.__table_prefix + 'settings',
+                   AlarmDb.__settings_columns),
+                  ('stations', AlarmDb.__stations_columns),
+                  (self.__table_prefix + 'snoozes', AlarmDb.__snoozes_columns))
+        with AlarmDb.__schema_lock:
+            created = AlarmDb.__created_tables.setdefault(self.db_file, set())
+            for name, columns in tables:
+                if name in created:
+                    continue
+                table = Table(name, database.metadata,
+                              Column('id', Integer, primary_key=True),
+                              *[Column(column_name, column_type)
+                                for column_name, column_type in columns])
+                table.create(database.engine, checkfirst=True)
+                existing = [column['name'] for column in
+                            inspect(database.engine).get_columns(name)]
+                for column_name, column_type in columns:
+                    if column_name not in existing:
+                        database.op.add_column(
+                            name, Column(column_name, column_type))
+                # Registers the table defined above in the connection
+                database.load_table(name)
+                created.add(name)
+
+    #
+    # database revision member functions
+    #
+    def __changed(self, stations=False):
+        """
+        Registers a change of the database data, see get_revision().
+        :param stations: Boolean indicating if the stations have changed.
+        """
+        now = time.time()
+        with AlarmDb.__revisions_lock:
+            revisions = AlarmDb.__revisions
+            key = (self.db_file, self.namespace)
+            revisions[key] = (revisions.get(key, (0,))[0] + 1, now)
+            if stations is True:
+                revisions = AlarmDb.__stations_revisions
+                revisions[self.db_file] = \
+                    (revisions.get(self.db_file, (0,))[0] + 1, now)
+
+    def __get_revision_entry(self, stations):
+        """
+        :param stations: Boolean to get the stations revision entry.
+        :return: Tuple with the revision number and last change time.
+        """
+        if stations is True:
+            entry = AlarmDb.__stations_revisions.get(self.db_file)
+        else:
+            entry = AlarmDb.__revisions.get((self.db_file, self.namespace))
+        if entry is None:
+            entry = (0, AlarmDb.__start_time)
+        return entry
+
+    def get_revision(self, stations=False):
+        """
+        Gets the revision number of the database, which changes every time the
+        alarms, settings or stations are modified through any AlarmDb instance
+        of this process. It can be used to invalidate data derived from the
+        database.
+        :param stations: Boolean to get the revision of the stations instead,
+                         shared by all the namespaces of the database file.
+        :return: Integer with the database revision.
+        """
+        return self.__get_revision_entry(stations)[0]
+
+    def get_revision_time(self, stations=False):
+        """
+        Gets the time of the last change of the database revision, or of the
+        process start if it has not changed since.
+        :param stations: Boolean to get the stations last change time instead.
+        :return: Float with the time, in seconds since 1970.
+        """
+        return self.__get_revision_entry(stations)[1]
+
+    #
+    # transaction member functions
+    #
+    def begin(self):
+        """
+        Starts a transaction for the changes done from the current thread, they
+        are not saved until commit() is called. The transactions of the same
+        database file are shared by all the AlarmDb instances, namespaces
+        included.
+        """
+        self.__connect().begin()
+
+    def commit(self):
+        """ Saves the changes of the current thread transaction. """
+        self.__connect().commit()
+
+    def rollback(self):
+        """
+        Discards the changes of the current thread transaction. The database
+        revision changes, as any data derived from the discarded changes is no
+        longer valid.
+        """
+        self.__connect().rollback()
+        self.__changed(stations=True)
+
     #
     # member functions to set settings
     #
@@ -115,6 +367,7 @@ class AlarmDb(object):
             settings_table = self.__connect_settings()
             success = settings_table.update(
                 dict(id=1, snooze_time=snooze_time), ['id'])
+            self.__changed()
             return success
         else:
             return False
@@ -139,6 +392,7 @@ class AlarmDb(object):
             settings_table = self.__connect_settings()
             success = settings_table.update(
                 dict(id=1, offset_alert_time=offset_alert_time), ['id'])
+            self.__changed()
             return success
         else:
             return False
@@ -154,6 +408,17 @@ class AlarmDb(object):
         settings_dict = settings_table.find_one(id=1)
         return settings_dict['offset_alert_time']
 
+    def get_settings(self):
+        """
+        Retrieves all the settings with a single read of the settings table.
+        :return: Dictionary with the 'snooze_time' and 'offset_alert_time'
+                 integers, in minutes.
+        """
+        settings_table = self.__connect_settings()
+        settings_dict = settings_table.find_one(id=1)
+        return {'snooze_time': settings_dict['snooze_time'],
+                'offset_alert_time': settings_dict['offset_alert_time']}
+
     def reset_settings(self):
         """
         Resets the settings table to the default settings (3 min snooze time,
@@ -167,6 +432,7 @@ class AlarmDb(object):
             insert_success = settings_table.insert(
                 dict(snooze_time=3, offset_alert_time=-15))
             success = bool(insert_success)
+        self.__changed()
         return success
 
     #
@@ -188,14 +454,7 @@ class AlarmDb(object):
         alarms_table = self.alarms_table
         alarm_list = []
         for alarm in alarms_table:
-            alarm_list.append(
-                AlarmItem(alarm['hour'], alarm['minute'],
-                          days=(alarm['monday'], alarm['tuesday'],
-                                alarm['wednesday'], alarm['thursday'],
-                                alarm['friday'], alarm['saturday'],
-                                alarm['sunday']),
-                          enabled=alarm['enabled'], label=alarm['label'],
-                          timestamp=alarm['timestamp'], alarm_id=alarm['id'], station_id=alarm['station_id']))
+            alarm_list.append(AlarmItem.from_row(alarm))
         return alarm_list
 
     def get_all_enabled_alarms(self):
@@ -208,14 +467,7 @@ class AlarmDb(object):
         alarm_list = []
         enabled_alarms = alarms_table.find(enabled=True)
         for alarm in enabled_alarms:
-            alarm_list.append(
-                AlarmItem(alarm['hour'], alarm['minute'],
-                          days=(alarm['monday'], alarm['tuesday'],
-                                alarm['wednesday'], alarm['thursday'],
-                                alarm['friday'], alarm['saturday'],
-                                alarm['sunday']),
-                          enabled=alarm['enabled'], label=alarm['label'],
-                          timestamp=alarm['timestamp'], alarm_id=alarm['id'], station_id=alarm['station_id']))
+            alarm_list.append(AlarmItem.from_row(alarm))
         return alarm_list
 
     def get_all_disabled_alarms(self):
@@ -228,16 +480,24 @@ class AlarmDb(object):
         alarm_list = []
         disabled_alarms = alarms_table.find(enabled=False)
         for alarm in disabled_alarms:
-            alarm_list.append(
-                AlarmItem(alarm['hour'], alarm['minute'],
-                          days=(alarm['monday'], alarm['tuesday'],
-                                alarm['wednesday'], alarm['thursday'],
-                                alarm['friday'], alarm['saturday'],
-                                alarm['sunday']),
-                          enabled=alarm['enabled'], label=alarm['label'],
-                          timestamp=alarm['timestamp'], alarm_id=alarm['id'], station_id=alarm['station_id']))
+            alarm_list.append(AlarmItem.from_row(alarm))
         return alarm_list
 
+    def get_alarm_set(self, enabled=None):
+        """
+        Returns the alarms in an AlarmSet, built directly from the table rows,
+        for batch time calculations.
+        :param enabled: Optional boolean to only include the alarms with the
+                        given enabled state. All alarms are included if None.
+        :return: AlarmSet containing the alarms.
+        """
+        alarms_table = self.alarms_table
+        if enabled is None:
+            rows = alarms_table.all()
+        else:
+            rows = alarms_table.find(enabled=enabled)
+        return AlarmSet.from_rows(rows)
+
     def get_alarm(self, alarm_id):
         """
         Get the alarm with the given ID from the database.
@@ -251,17 +511,97 @@ class AlarmDb(object):
         if alarm_dict is None:
             return None
         else:
-            return AlarmItem(alarm_dict['hour'], alarm_dict['minute'],
-                             days=(alarm_dict['monday'], alarm_dict['tuesday'],
-                                   alarm_dict['wednesday'],
-                                   alarm_dict['thursday'],
-                                   alarm_dict['friday'], alarm_dict['saturday'],
-                                   alarm_dict['sunday']),
-                             enabled=alarm_dict['enabled'],
-                             label=alarm_dict['label'],
-                             timestamp=alarm_dict['timestamp'],
-                             alarm_id=alarm_dict['id'],
-                             station_id=alarm_dict['station_id'])
+            return AlarmItem.from_row(alarm_dict)
+
+    def query_alarms(self, fields=None, limit=None, cursor=None,
+                     enabled=None, active=None, day=None, station_id=None,
+                     hour_from=None, hour_to=None):
+        """
+        Gets a page of the alarms that match the filters, in order of ID. The
+        filters, field selection and page limits are all done by the database
+        query.
+        :param fields: Optional iterable with the AlarmItem.fields names of the
+                       columns to get, the 'id' is always included. All the
+                       columns are included if None.
+        :param limit: Optional positive integer with the maximum number of
+                      alarms.
+        :param cursor: Optional ID of the last alarm of the previous page, to
+                       only get the alarms with a higher ID.
+        :param enabled: Optional boolean with the enabled state of the alarms.
+        :param active: Optional boolean with the active state of the alarms
+                       (enabled with at least one repeat weekday).
+        :param day: Optional weekday (0 is Monday) the alarms repeat on.
+        :param station_id: Optional integer with the station ID of the alarms.
+        :param hour_from: Optional integer with the minimum alarm hour.
+        :param hour_to: Optional integer with the maximum alarm hour, if lower
+                        than hour_from the range goes through midnight.
+        :return: Tuple with a list of dictionaries with the alarm columns, and
+                 the cursor of the next page, None if it is the last page.
+        :raise ValueError: If a field name is not valid.
+        """
+        table = self.alarms_table.table
+        weekday_columns = [table.c[weekday]
+                           for weekday in AlarmItem.fields[6:13]]
+        clauses = []
+        if enabled is not None:
+            clauses.append(table.c.enabled == enabled)
+        if active is not None:
+            active_clause = and_(table.c.enabled == True,
+                                 or_(*[column == True
+                                       for column in weekday_columns]))
+            clauses.append(active_clause if active is True
+                           else not_(active_clause))
+        if day is not None:
+            clauses.append(weekday_columns[day] == True)
+        if station_id is not None:
+            clauses.append(table.c.station_id == station_id)
+        if hour_from is not None and hour_to is not None and \
+                hour_to < hour_from:
+            clauses.append(or_(table.c.hour >= hour_from,
+                               table.c.hour <= hour_to))
+        else:
+            if hour_from is not None:
+                clauses.append(table.c.hour >= hour_from)
+            if hour_to is not None:
+                clauses.append(table.c.hour <= hour_to)
+        return self.__query_page(
+            table, AlarmItem.fields, fields, clauses, limit, cursor)
+
+    def __query_page(self, table, all_fields, fields, clauses, limit, cursor):
+        """
+        Gets a page of the rows of a table, in order of ID.
+        :param table: SQLAlchemy Table to query.
+        :param all_fields: Tuple with the names of all the fields of the rows.
+        :param fields: Iterable with the names of the fields to get, None for
+                       all of them. The 'id' is always included.
+        :param clauses: List of SQLAlchemy clauses the rows have to match.
+        :param limit: Positive maximum number of rows, None for no limit.
+        :param cursor: ID of the last row of the previous page, or None.
+        :return: Tuple with a list of dictionaries with the rows, and the
+                 cursor of the next page, None if it is the last page.
+        :raise ValueError: If a field name is not valid.
+        """
+        if fields is not None:
+            invalid = [field for field in fields if field not in all_fields]
+            if invalid:
+                raise ValueError('Invalid fields: %s' % ', '.join(invalid))
+            all_fields = [field for field in all_fields
+                          if field == 'id' or field in fields]
+        if cursor is not None:
+            clauses = clauses + [table.c.id > cursor]
+        query = select([table.c[field] for field in all_fields])
+        if clauses:
+            query = query.where(and_(*clauses))
+        query = query.order_by(table.c.id)
+        if limit is not None:
+            # One more row, to know if there is a next page
+            query = query.limit(limit + 1)
+        rows = [dict(row) for row in self.__connect().query(query)]
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1]['id']
+        return rows, next_cursor
 
     def export_alarms_json(self):
         """
@@ -327,6 +667,7 @@ class AlarmDb(object):
                  friday=alarm_item.friday, saturday=alarm_item.saturday,
                  sunday=alarm_item.sunday, enabled=alarm_item.enabled,
                  label=alarm_item.label, timestamp=alarm_item.timestamp, station_id=alarm_item.station_id))
+        self.__changed()
         return key
 
     #
@@ -427,6 +768,7 @@ class AlarmDb(object):
             if not individual_success:
                 success = False
 
+        self.__changed()
         return success
 
     def update_alarm(self, alarm):
@@ -445,8 +787,10 @@ class AlarmDb(object):
                      wednesday=alarm.wednesday, thursday=alarm.thursday,
                      friday=alarm.friday, saturday=alarm.saturday,
                      sunday=alarm.sunday, enabled=alarm.enabled,
-                     label=alarm.label, timestamp=alarm.timestamp),
+                     label=alarm.label, timestamp=alarm.timestamp,
+                     station_id=alarm.station_id),
                 ['id'])
+            self.__changed()
         else:
             success = False
 
@@ -464,6 +808,7 @@ class AlarmDb(object):
         """
         alarms_table = self.alarms_table
         success = alarms_table.delete(id=alarm_id)
+        self.__changed()
         return success
 
     def delete_all_alarms(self):
@@ -473,6 +818,7 @@ class AlarmDb(object):
         """
         alarms_table = self.alarms_table
         success = alarms_table.delete()
+        self.__changed()
         return success
 
     #
@@ -494,7 +840,7 @@ class AlarmDb(object):
         stations_table = self.stations_table
         station_list = []
         for station in stations_table:
-            station_list.append(StationItem(station['name'], station['url'], station_id = station['id']))
+            station_list.append(StationItem.from_row(station))
 
         return station_list
 
@@ -511,7 +857,24 @@ class AlarmDb(object):
         if station_dict is None:
             return None
         else:
-            return StationItem(station_dict['name'], station_dict['url'], station_id = station_dict['id'])
+            return StationItem.from_row(station_dict)
+
+    def query_stations(self, fields=None, limit=None, cursor=None):
+        """
+        Gets a page of the stations, in order of ID, see query_alarms().
+        :param fields: Optional iterable with the StationItem.fields names of
+                       the columns to get, the 'id' is always included. All
+                       the columns are included if None.
+        :param limit: Optional positive integer with the maximum number of
+                      stations.
+        :param cursor: Optional ID of the last station of the previous page,
+                       to only get the stations with a higher ID.
+        :return: Tuple with a list of dictionaries with the station columns,
+                 and the cursor of the next page, None if it is the last page.
+        :raise ValueError: If a field name is not valid.
+        """
+        return self.__query_page(self.stations_table.table,
+                                 StationItem.fields, fields, [], limit, cursor)
 
     def export_stations_json(self):
         """
@@ -560,9 +923,28 @@ class AlarmDb(object):
         stations_table = self.stations_table
         key = stations_table.insert(
             dict(name=station_item.name, url=station_item.url))
+        self.__changed(stations=True)
         return key
 
-            #
+    #
+    # member functions to edit station data
+    #
+    def update_station(self, station):
+        """
+        Updates a station in the database.
+        :param station: StationItem instance of the station to update.
+        :return: Boolean indicating the success of the 'update' operation.
+        """
+        if isinstance(station, StationItem):
+            success = self.stations_table.update(
+                dict(id=station.id_, name=station.name, url=station.url),
+                ['id'])
+            self.__changed(stations=True)
+        else:
+            success = False
+        return success
+
+    #
     # member functions to remove station data
     #
     def delete_station(self, station_id):
@@ -574,6 +956,7 @@ class AlarmDb(object):
         """
         stations_table = self.stations_table
         success = stations_table.delete(id=station_id)
+        self.__changed(stations=True)
         return success
 
     def delete_all_stations(self):
@@ -583,4 +966,53 @@ class AlarmDb(object):
         """
         stations_table = self.stations_table
         success = stations_table.delete()
+        self.__changed(stations=True)
         return success
+
+    #
+    # member functions for the snoozes
+    #
+    # The snoozes are short lived and do not affect the alarms data, so they do
+    # not change the database revision.
+    def set_snooze(self, alarm_id, alert_time):
+        """
+        Saves the snooze alert time of an alarm, replacing the previous one.
+        :param alarm_id: Integer to indicate the ID of the snoozed alarm.
+        :param alert_time: Integer, time of the snooze alert in seconds since
+                           1970.
+        :return: Boolean indicating the success of the operation.
+        """
+        if not isinstance(alarm_id, int_type) or \
+                not isinstance(alert_time, int_type):
+            print('ERROR: Provided alarm_id and alert_time to ' +
+                  'AlarmDb().set_snooze must be integers !', file=sys.stderr)
+            return False
+        return self.snoozes_table.upsert(
+            dict(alarm_id=alarm_id, alert_time=alert_time),
+            ['alarm_id']) is not False
+
+    def get_all_snoozes(self):
+        """
+        Gets all the saved snoozes.
+        :return: Dictionary with the snooze alert times, in seconds since 1970,
+                 keyed by the alarm ID.
+        """
+        return dict((row['alarm_id'], row['alert_time'])
+                    for row in self.snoozes_table)
+
+    def delete_snooze(self, alarm_id):
+        """
+        Removes the snooze of an alarm.
+        :param alarm_id: Integer to indicate the ID of the snoozed alarm.
+        :return: Boolean indicating if the alarm had a snooze saved.
+        """
+        if self.snoozes_table.find_one(alarm_id=alarm_id) is None:
+            return False
+        return self.snoozes_table.delete(alarm_id=alarm_id)
+
+    def delete_all_snoozes(self):
+        """
+        Removes all the saved snoozes.
+        :return: Boolean indicating the success of the 'delete' operation.
+        """
+        return self.snoozes_table.delete()
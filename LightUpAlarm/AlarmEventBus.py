@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+#
+# Class to deliver the AlarmManager events to the subscribers.
+#
+# Copyright (c) 2015 carlosperate http://carlosperate.github.io
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# The events are published into a queue and delivered by a background thread,
+# so the publisher (a request thread or an alarm thread) never waits for the
+# subscribers. Events published while the previous ones are being delivered
+# are coalesced and sent together in the next batch.
+#
+from __future__ import unicode_literals, absolute_import, print_function
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+
+class AlarmEventBus(object):
+    """
+    Publish/subscribe hub for the alarm events. Each event is a dictionary with
+    the following keys:
+        type: One of the event types defined as class variables.
+        id: ID of the alarm or station the event refers to (None if all were
+            deleted), or the setting name for the settings event.
+        data: AlarmSnapshot with the alarm data for the alarm and alert events
+              (None if deleted), StationItem for the station events, the
+              new setting value for the settings event, and the snooze alert
+              time (in seconds since 1970, None if dismissed) for the snooze
+              events.
+        time: Time, in seconds since 1970, the event was published.
+        namespace: Namespace of the alarms the event refers to, None for the
+                   default alarms.
+    The subscribers are called from the delivery thread with a list of the
+    events in publishing order. Pending events with the same type, ID and
+    namespace are coalesced, only the latest one is delivered.
+    """
+
+    # Event types
+    alarm_added = 'alarm_added'
+    alarm_edited = 'alarm_edited'
+    alarm_deleted = 'alarm_deleted'
+    station_added = 'station_added'
+    station_edited = 'station_edited'
+    station_deleted = 'station_deleted'
+    settings_changed = 'settings_changed'
+    alarm_alert = 'alarm_alert'
+    offset_alert = 'offset_alert'
+    alarm_snoozed = 'alarm_snoozed'
+    alarm_dismissed = 'alarm_dismissed'
+
+    # Groups of event types to subscribe to
+    alarm_events = (alarm_added, alarm_edited, alarm_deleted)
+    change_events = alarm_events + \
+        (station_added, station_edited, station_deleted, settings_changed)
+    alert_events = (alarm_alert, offset_alert)
+    snooze_events = (alarm_snoozed, alarm_dismissed)
+
+    #
+    # metaclass methods
+    #
+    def __init__(self, coalesce_time=0.05):
+        """
+        AlarmEventBus initialiser. The delivery thread is only launched when
+        the first event with subscribers is published.
+        :param coalesce_time: Seconds to wait after an event is published
+                              before it is delivered, so that bursts of events
+                              are coalesced into a single batch.
+        """
+        self.__coalesce_time = coalesce_time
+        self.__condition = threading.Condition(threading.Lock())
+        # Subscribers as a list of (callback, event types set or None,
+        # namespaces set or None) tuples
+        self.__subscribers = []
+        # Events pending to be delivered, keyed by (type, id, namespace)
+        self.__pending = OrderedDict()
+        self.__delivering = False
+        self.__thread = None
+
+    #
+    # member methods
+    #
+    def subscribe(self, callback, event_types=None, namespaces=None):
+        """
+        Registers a callback to be executed with the published events.
+        :param callback: Function that takes a list of events.
+        :param event_types: Optional iterable with the event types to receive,
+                            all events are received if None.
+        :param namespaces: Optional iterable with the namespaces to receive
+                           the events from, all namespaces if None.
+        """
+        if event_types is not None:
+            event_types = frozenset(event_types)
+        if namespaces is not None:
+            namespaces = frozenset(namespaces)
+        with self.__condition:
+            self.__subscribers.append((callback, event_types, namespaces))
+
+    def unsubscribe(self, callback):
+        """
+        Removes all the subscriptions of a callback.
+        :param callback: Function previously registered with subscribe().
+        :return: Boolean indicating if the callback was subscribed.
+        """
+        with self.__condition:
+            subscribers = [subscriber for subscriber in self.__subscribers
+                           if subscriber[0] != callback]
+            removed = len(subscribers) != len(self.__subscribers)
+            self.__subscribers = subscribers
+        return removed
+
+    def publish(self, event_type, id_=None, data=None, namespace=None):
+        """
+        Queues an event to be delivered to the subscribers. It does not block,
+        and it is ignored if there are no subscribers.
+        :param event_type: One of the event types defined as class variables.
+        :param id_: ID of the alarm, station or setting the event refers to.
+        :param data: Event data, see the class docstring.
+        :param namespace: Namespace of the alarms the event refers to.
+        """
+        with self.__condition:
+            if not self.__subscribers:
+                return
+            key = (event_type, id_, namespace)
+            # Remove the pending event with the same key, so that the new one
+            # is delivered in its publishing position
+            self.__pending.pop(key, None)
+            self.__pending[key] = {'type': event_type, 'id': id_,
+                                   'data': data, 'time': time.time(),
+                                   'namespace': namespace}
+            if self.__thread is None or self.__thread.isAlive() is False:
+                self.__thread = threading.Thread(target=self.__delivery_loop)
+                self.__thread.daemon = True
+                self.__thread.start()
+            self.__condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Blocks until all the published events have been delivered.
+        :param timeout: Optional maximum number of seconds to wait.
+        :return: Boolean indicating if all the events were delivered.
+        """
+        end_time = None if timeout is None else time.time() + timeout
+        with self.__condition:
+            while self.__pending or self.__delivering:
+                if end_time is None:
+                    self.__condition.wait()
+                else:
+                    remaining = end_time - time.time()
+                    if remaining <= 0:
+                        return False
+                    self.__condition.wait(remaining)
+        return True
+
+    def __delivery_loop(self):
+        """ Delivery thread loop, sends the pending events in batches. """
+        while True:
+            with self.__condition:
+                while not self.__pending:
+                    self.__condition.wait()
+            # Wait with the lock released for more events to coalesce
+            if self.__coalesce_time:
+                time.sleep(self.__coalesce_time)
+            with self.__condition:
+                events = list(self.__pending.values())
+                self.__pending.clear()
+                subscribers = list(self.__subscribers)
+                self.__delivering = True
+            try:
+                for callback, event_types, namespaces in subscribers:
+                    callback_events = [
+                        event for event in events
+                        if (event_types is None or
+                            event['type'] in event_types) and
+                        (namespaces is None or
+                         event['namespace'] in namespaces)]
+                    if not callback_events:
+                        continue
+                    try:
+                        callback(callback_events)
+                    except Exception as e:
+                        print('ERROR: Alarm event subscriber %s failed: %s' %
+                              (callback, e), file=sys.stderr)
+            finally:
+                with self.__condition:
+                    self.__delivering = False
+                    self.__condition.notify_all()
@@ -7,7 +7,8 @@
 # Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
 #
 from __future__ import unicode_literals, absolute_import, print_function
-import collections
+import datetime
+import struct
 try:
     from LightUpAlarm.Py23Compatibility import *
 except ImportError:
@@ -34,6 +35,29 @@ class AlarmItem(object):
                    database, so this class does not set the value without an
                    input (stays as None).
     """
+    # Names of the weekdays in the same order as the repeat tuple
+    weekdays = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday',
+                'Saturday', 'Sunday')
+
+    # Serialised field names, in the same order as to_tuple()
+    fields = ('id', 'hour', 'minute', 'enabled', 'label', 'timestamp',
+              'monday', 'tuesday', 'wednesday', 'thursday', 'friday',
+              'saturday', 'sunday', 'station_id')
+
+    # Fixed size part of the binary encoding: id, hour, minute, weekdays
+    # bitmask, enabled, timestamp, station_id and label length, followed by
+    # the UTF-8 label. None values are encoded as -1.
+    __binary = struct.Struct(str('<iBBB?qiH'))
+
+    # Kinds of alert yielded by occurrences()
+    alarm_kind = 'alarm'
+    offset_kind = 'offset'
+
+    # Integer fields validated by from_dicts(): name, minimum value, maximum
+    # value (None if unbounded) and if the field is required
+    __integer_fields = (('hour', 0, 23, True), ('minute', 0, 59, True),
+                        ('id', 0, None, False), ('timestamp', 0, None, False),
+                        ('station_id', 0, None, False))
 
     #
     # metaclass methods: constructor, initialiser and print
@@ -66,15 +90,10 @@ class AlarmItem(object):
         instance.__hour = 0
         # Indicates if the alarm is enabled or not
         instance.__enabled = False
-        # Contains the days of the weeks that this alarm repeats
-        instance.__repeat = collections.OrderedDict()
-        instance.__repeat['Monday'] = False
-        instance.__repeat['Tuesday'] = False
-        instance.__repeat['Wednesday'] = False
-        instance.__repeat['Thursday'] = False
-        instance.__repeat['Friday'] = False
-        instance.__repeat['Saturday'] = False
-        instance.__repeat['Sunday'] = False
+        # Contains the days of the weeks that this alarm repeats, as a tuple
+        # and as a bitmask (Monday is bit 0) for fast time calculations
+        instance.__repeat = (False, False, False, False, False, False, False)
+        instance.__days_mask = 0
         # Contains the label string
         instance.__label = ''
         # Contains the timestamp of the last time it was modified
@@ -82,6 +101,11 @@ class AlarmItem(object):
 
         instance.__station_id = None
 
+        # Counts the changes to the instance data, and caches the snapshot of
+        # the current version
+        instance.__version = 0
+        instance.__snapshot = None
+
         # Assigning values using accessors with input sanitation
         instance.hour = hour
         instance.minute = minute
@@ -130,6 +154,126 @@ class AlarmItem(object):
         """
         pass
 
+    @classmethod
+    def from_row(cls, row):
+        """
+        Trusted constructor for the alarm data retrieved from the AlarmDb
+        database. The data was already validated by the accessors before it
+        was stored, so it is assigned directly without the input sanitation
+        and validity checks done in __new__.
+        Untrusted data (HTTP, CLI, etc) must use the normal constructor.
+        :param row: Dictionary-like database row with the 'alarms' table
+                    columns.
+        :return: Instance of the AlarmItem class.
+        """
+        instance = object.__new__(cls)
+        instance.__id = row['id']
+        instance.__minute = row['minute']
+        instance.__hour = row['hour']
+        instance.__enabled = row['enabled']
+        instance.__repeat = (row['monday'], row['tuesday'], row['wednesday'],
+                             row['thursday'], row['friday'], row['saturday'],
+                             row['sunday'])
+        instance.__days_mask = AlarmItem.__repeat_to_mask(instance.__repeat)
+        instance.__label = row['label']
+        instance.__timestamp = row['timestamp']
+        instance.__station_id = row['station_id']
+        instance.__version = 0
+        instance.__snapshot = None
+        return instance
+
+    @classmethod
+    def from_dicts(cls, raw_alarms):
+        """
+        Validates a batch of untrusted alarm data (HTTP, importers, etc) and
+        creates the AlarmItems for the valid entries in a single pass. It
+        applies the same rules as the accessors, but instead of printing to
+        stderr the reason of each failure is returned. Booleans are not
+        accepted as integers.
+        Each dictionary uses the AlarmItem.fields names as keys, 'hour' and
+        'minute' are required and the rest are optional, with the same
+        defaults as the constructor. The repeat weekdays can also be given as
+        a 7 item 'days' list.
+        :param raw_alarms: Iterable of dictionaries with the alarm data.
+        :return: Tuple with two lists in the same order as the input. The first
+                 contains the AlarmItem instances, or None for invalid data.
+                 The second contains a list of errors per alarm, each error a
+                 dictionary with the 'field' and 'error' keys, so valid alarms
+                 have an empty list.
+        """
+        alarms = []
+        errors = []
+        for raw_alarm in raw_alarms:
+            row, alarm_errors = AlarmItem.__validate_dict(raw_alarm)
+            alarms.append(cls.from_row(row) if not alarm_errors else None)
+            errors.append(alarm_errors)
+        return alarms, errors
+
+    @staticmethod
+    def __validate_dict(raw_alarm):
+        """
+        Validates the data of a single alarm for from_dicts().
+        :param raw_alarm: Dictionary with the alarm data.
+        :return: Tuple with a database-like row of the valid data and the list
+                 of errors found.
+        """
+        if not isinstance(raw_alarm, dict):
+            return None, [{'field': None,
+                           'error': 'The alarm data must be a dictionary'}]
+        row = {}
+        errors = []
+
+        for field, minimum, maximum, required in AlarmItem.__integer_fields:
+            value = raw_alarm.get(field)
+            if value is None:
+                row[field] = None
+                if required is True:
+                    errors.append({'field': field,
+                                   'error': 'This field is required'})
+            elif not isinstance(value, int_type) or \
+                    isinstance(value, bool_type):
+                errors.append({'field': field,
+                               'error': 'Must be an Integer'})
+            elif value < minimum or (maximum is not None and value > maximum):
+                if maximum is None:
+                    error = 'Must be a positive Integer'
+                else:
+                    error = 'Must be between %d and %d' % (minimum, maximum)
+                errors.append({'field': field, 'error': error})
+            else:
+                row[field] = value
+
+        weekdays = AlarmItem.fields[6:13]
+        days = raw_alarm.get('days')
+        if days is None:
+            days_fields = weekdays
+            days = [raw_alarm.get(weekday, False) for weekday in weekdays]
+        elif isinstance(days, (list, tuple)) and len(days) == 7:
+            days_fields = ('days',) * 7
+        else:
+            days_fields = ()
+            errors.append({'field': 'days',
+                           'error': 'Must be a list of 7 Booleans'})
+        for field, weekday, value in zip(days_fields, weekdays, days):
+            if isinstance(value, bool_type):
+                row[weekday] = value
+            else:
+                errors.append({'field': field, 'error': 'Must be a Boolean'})
+
+        enabled = raw_alarm.get('enabled', True)
+        if isinstance(enabled, bool_type):
+            row['enabled'] = enabled
+        else:
+            errors.append({'field': 'enabled', 'error': 'Must be a Boolean'})
+
+        label = raw_alarm.get('label', '')
+        if isinstance(label, str_type):
+            row['label'] = label
+        else:
+            errors.append({'field': 'label', 'error': 'Must be a String'})
+
+        return row, errors
+
     def __str__(self):
         """
         Converts the class instance data into a readable string format.
@@ -138,14 +282,118 @@ class AlarmItem(object):
         enabled = 'Yes' if self.enabled is True else 'No'
         ret_str = 'Alarm ID: %3d | Time: %02d:%02d | Enabled: %3s | Repeat: ' %\
                   (self.id_, self.hour, self.minute, enabled)
-        for day in self.__repeat:
-            if self.__repeat[day] is True:
+        for day, repeats in zip(AlarmItem.weekdays, self.__repeat):
+            if repeats is True:
                 ret_str += "%s " % str(day)[:3]
             else:
                 ret_str += "--- "
 
         return ret_str
 
+    #
+    # version accessor and snapshot
+    #
+    def __get_version(self):
+        return self.__version
+
+    version = property(__get_version)
+
+    def __changed(self):
+        """ Registers a change of the instance data. """
+        self.__version += 1
+        self.__snapshot = None
+
+    def snapshot(self):
+        """
+        Returns an immutable AlarmSnapshot with the current alarm data, to be
+        shared with other threads. The same snapshot instance is returned until
+        the alarm data changes, so changes can be detected with an identity
+        check.
+        :return: AlarmSnapshot of the current alarm version.
+        """
+        snapshot = self.__snapshot
+        if snapshot is None:
+            snapshot = AlarmSnapshot(
+                self.__id, self.__hour, self.__minute, self.__repeat,
+                self.__days_mask, self.__enabled, self.__label,
+                self.__timestamp, self.__station_id, self.__version)
+            self.__snapshot = snapshot
+        return snapshot
+
+    #
+    # serialisation methods
+    #
+    def to_tuple(self):
+        """
+        Converts the alarm data into a tuple, with the items in the same order
+        as the AlarmItem.fields names.
+        :return: Tuple with the alarm data.
+        """
+        return (self.__id, self.__hour, self.__minute, self.__enabled,
+                self.__label, self.__timestamp) + self.__repeat + \
+            (self.__station_id,)
+
+    def to_dict(self):
+        """
+        Converts the alarm data into a dictionary, using the AlarmItem.fields
+        names as keys (same as the AlarmDb 'alarms' table columns).
+        :return: Dictionary with the alarm data.
+        """
+        repeat = self.__repeat
+        return {'id': self.__id,
+                'hour': self.__hour,
+                'minute': self.__minute,
+                'enabled': self.__enabled,
+                'label': self.__label,
+                'timestamp': self.__timestamp,
+                'monday': repeat[0],
+                'tuesday': repeat[1],
+                'wednesday': repeat[2],
+                'thursday': repeat[3],
+                'friday': repeat[4],
+                'saturday': repeat[5],
+                'sunday': repeat[6],
+                'station_id': self.__station_id}
+
+    def to_bytes(self):
+        """
+        Converts the alarm data into a compact binary format, 22 bytes plus the
+        UTF-8 encoded label.
+        :return: Byte string with the encoded alarm data.
+        """
+        label = self.__label
+        if not isinstance(label, bytes):
+            label = label.encode('utf-8')
+        return AlarmItem.__binary.pack(
+            -1 if self.__id is None else self.__id,
+            self.__hour, self.__minute, self.__days_mask, self.__enabled,
+            -1 if self.__timestamp is None else self.__timestamp,
+            -1 if self.__station_id is None else self.__station_id,
+            len(label)) + label
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Trusted constructor for the data encoded by to_bytes(), the data is not
+        validated (see from_row()).
+        :param data: Byte string with the encoded alarm data.
+        :return: Instance of the AlarmItem class.
+        """
+        binary = AlarmItem.__binary
+        id_, hour, minute, days_mask, enabled, timestamp, station_id, \
+            label_length = binary.unpack_from(data)
+        row = {'id': None if id_ == -1 else id_,
+               'hour': hour,
+               'minute': minute,
+               'enabled': enabled,
+               'label': data[binary.size:binary.size + label_length].decode(
+                   'utf-8'),
+               'timestamp': None if timestamp == -1 else timestamp,
+               'station_id': None if station_id == -1 else station_id}
+        for day, weekday in enumerate(AlarmItem.fields[6:13]):
+            row[weekday] = bool(days_mask & (1 << day))
+        return cls.from_row(row)
+
     #
     # id accesor
     #
@@ -159,6 +407,7 @@ class AlarmItem(object):
         """
         if isinstance(new_id, int_type) and new_id >= 0:
             self.__id = new_id
+            self.__changed()
         else:
             print('ERROR: Provided AlarmItem().id type is not a positive ' +
                   'Integer: %s!' % new_id, file=sys.stderr)
@@ -178,6 +427,7 @@ class AlarmItem(object):
         """
         if isinstance(new_enabled, bool_type):
             self.__enabled = new_enabled
+            self.__changed()
         else:
             print('ERROR: Provided AlarmItem().enabled type is not a boolean' +
                   ': %s!' % new_enabled, file=sys.stderr)
@@ -198,6 +448,7 @@ class AlarmItem(object):
         if isinstance(new_minute, int_type):
             if 0 <= new_minute < 60:
                 self.__minute = new_minute
+                self.__changed()
             else:
                 print('ERROR: Provided AlarmItem().minute is not between 0 ' +
                       'and 59: %s!' % new_minute, file=sys.stderr)
@@ -221,6 +472,7 @@ class AlarmItem(object):
         if isinstance(new_hour, int_type):
             if 0 <= new_hour < 24:
                 self.__hour = new_hour
+                self.__changed()
             else:
                 print('ERROR: Provided AlarmItem().hour is not between 0 and ' +
                       '23: %s!' % new_hour, file=sys.stderr)
@@ -243,6 +495,7 @@ class AlarmItem(object):
         """
         try:
             self.__label = str(new_label)
+            self.__changed()
         except Exception:
             print('ERROR: Provided AlarmItem().label is not convertible to ' +
                   'a string: %s!' % new_label, file=sys.stderr)
@@ -263,6 +516,7 @@ class AlarmItem(object):
         """
         if isinstance(new_timestamp, int_type) and new_timestamp >= 0:
             self.__timestamp = new_timestamp
+            self.__changed()
         else:
             print('ERROR: Provided AlarmItem().timestamp type is not a ' +
                   'positive Integer: %s!' % new_timestamp, file=sys.stderr)
@@ -272,16 +526,25 @@ class AlarmItem(object):
     #
     # repeat accesor
     #
+    @staticmethod
+    def __repeat_to_mask(repeat):
+        """
+        Converts a 7 item repeat list into a weekday bitmask.
+        :param repeat: List of 7 booleans, Monday first.
+        :return: Integer with bit 0 set for Monday, bit 1 for Tuesday, etc.
+        """
+        mask = 0
+        for bit, day in enumerate(repeat):
+            if day is True:
+                mask |= 1 << bit
+        return mask
+
     def __get_repeat(self):
         """
         Returns the days of the week alarm repetition in the form of a tuple.
         :return: Tuple with 7 booleans to indicate repetition for the weekdays.
         """
-        repeat_tuple = (self.__repeat['Monday'], self.__repeat['Tuesday'],
-                        self.__repeat['Wednesday'], self.__repeat['Thursday'],
-                        self.__repeat['Friday'], self.__repeat['Saturday'],
-                        self.__repeat['Sunday'])
-        return repeat_tuple
+        return self.__repeat
 
     def __set_repeat(self, new_repeat):
         """
@@ -297,22 +560,47 @@ class AlarmItem(object):
                           'have to be Booleans!', file=sys.stderr)
                     break
             else:
-                day_int = 0
-                for day in self.__repeat:
-                    self.__repeat[day] = new_repeat[day_int]
-                    day_int += 1
+                self.__repeat = tuple(new_repeat)
+                self.__days_mask = AlarmItem.__repeat_to_mask(self.__repeat)
+                self.__changed()
         else:
             print('ERROR: The AlarmItem().repeat must be a list of 7 booleans!',
                   file=sys.stderr)
 
     repeat = property(__get_repeat, __set_repeat)
 
+    def __get_days_mask(self):
+        """
+        Returns the days of the week alarm repetition as a bitmask.
+        :return: Integer with bit 0 set if it repeats on Monday, bit 1 for
+                 Tuesday, and so on until bit 6 for Sunday.
+        """
+        return self.__days_mask
+
+    days_mask = property(__get_days_mask)
+
+    def __set_weekday(self, weekday, new_value):
+        """
+        Sets the repeat value of a single weekday, input has been sanitised by
+        the individual day accessors.
+        :param weekday: Integer from 0 (Monday) to 6 (Sunday).
+        :param new_value: Boolean to indicate the weekday repetition.
+        """
+        repeat = list(self.__repeat)
+        repeat[weekday] = new_value
+        self.__repeat = tuple(repeat)
+        if new_value is True:
+            self.__days_mask |= 1 << weekday
+        else:
+            self.__days_mask &= ~(1 << weekday)
+        self.__changed()
+
     def __get_monday(self):
-        return self.__repeat['Monday']
+        return self.__repeat[0]
 
     def __set_monday(self, new_monday):
         if isinstance(new_monday, bool_type):
-            self.__repeat['Monday'] = new_monday
+            self.__set_weekday(0, new_monday)
         else:
             print('ERROR: New value for the AlarmItem().monday variable has ' +
                   'to be a Boolean !', file=sys.stderr)
@@ -320,11 +608,11 @@ class AlarmItem(object):
     monday = property(__get_monday, __set_monday)
 
     def __get_tuesday(self):
-        return self.__repeat['Tuesday']
+        return self.__repeat[1]
 
     def __set_tuesday(self, new_tuesday):
         if isinstance(new_tuesday, bool_type):
-            self.__repeat['Tuesday'] = new_tuesday
+            self.__set_weekday(1, new_tuesday)
         else:
             print('ERROR: New value for the AlarmItem().tuesday variable has ' +
                   'to be a Boolean !', file=sys.stderr)
@@ -332,11 +620,11 @@ class AlarmItem(object):
     tuesday = property(__get_tuesday, __set_tuesday)
 
     def __get_wednesday(self):
-        return self.__repeat['Wednesday']
+        return self.__repeat[2]
 
     def __set_wednesday(self, new_wednesday):
         if isinstance(new_wednesday, bool_type):
-            self.__repeat['Wednesday'] = new_wednesday
+            self.__set_weekday(2, new_wednesday)
         else:
             print('ERROR: New value for the AlarmItem().wednesday variable ' +
                   'has to be a Boolean !', file=sys.stderr)
@@ -344,11 +632,11 @@ class AlarmItem(object):
     wednesday = property(__get_wednesday, __set_wednesday)
 
     def __get_thursday(self):
-        return self.__repeat['Thursday']
+        return self.__repeat[3]
 
     def __set_thursday(self, new_thursday):
         if isinstance(new_thursday, bool_type):
-            self.__repeat['Thursday'] = new_thursday
+            self.__set_weekday(3, new_thursday)
         else:
             print('ERROR: New value for the AlarmItem().thursday variable ' +
                   'has to be a Boolean !', file=sys.stderr)
@@ -356,11 +644,11 @@ class AlarmItem(object):
     thursday = property(__get_thursday, __set_thursday)
 
     def __get_friday(self):
-        return self.__repeat['Friday']
+        return self.__repeat[4]
 
     def __set_friday(self, new_friday):
         if isinstance(new_friday, bool_type):
-            self.__repeat['Friday'] = new_friday
+            self.__set_weekday(4, new_friday)
         else:
             print('ERROR: New value for the AlarmItem().friday variable has ' +
                   'to be a Boolean !', file=sys.stderr)
@@ -368,11 +656,11 @@ class AlarmItem(object):
     friday = property(__get_friday, __set_friday)
 
     def __get_saturday(self):
-        return self.__repeat['Saturday']
+        return self.__repeat[5]
 
     def __set_saturday(self, new_saturday):
         if isinstance(new_saturday, bool_type):
-            self.__repeat['Saturday'] = new_saturday
+            self.__set_weekday(5, new_saturday)
         else:
             print('ERROR: New value for the AlarmItem().saturday variable ' +
                   'has to be a Boolean !', file=sys.stderr)
@@ -380,11 +668,11 @@ class AlarmItem(object):
     saturday = property(__get_saturday, __set_saturday)
 
     def __get_sunday(self):
-        return self.__repeat['Sunday']
+        return self.__repeat[6]
 
     def __set_sunday(self, new_sunday):
         if isinstance(new_sunday, bool_type):
-            self.__repeat['Sunday'] = new_sunday
+            self.__set_weekday(6, new_sunday)
         else:
             print('ERROR: New value for the AlarmItem().sunday variable ' +
                   'has to be a Boolean !', file=sys.stderr)
@@ -404,6 +692,7 @@ class AlarmItem(object):
         """
         if isinstance(new_station_id, int_type) and new_station_id >= 0:
             self.__station_id = new_station_id
+            self.__changed()
         else:
             print('ERROR: Provided AlarmItem().station_id type is not a ' +
                   'positive Integer: %s!' % new_station_id, file=sys.stderr)
@@ -418,11 +707,7 @@ class AlarmItem(object):
         Checks if there are any repeat days enabled.
         :return: A boolean value indicating if an repeat weekday is activated.
         """
-        any_enabled = False
-        for day in self.__repeat:
-            if self.__repeat[day] is True:
-                any_enabled = True
-        return any_enabled
+        return self.__days_mask != 0
 
     def is_active(self):
         """
@@ -447,45 +732,85 @@ class AlarmItem(object):
         :param minute: start minute, value 0-59.
         :param weekday: start weekday, value 0-6.
         :return: Integer indicating the amount in minutes until the alarm
-                 triggers from the initial reference time and weekday.
+                 triggers from the initial reference time and weekday. None if
+                 the alarm has no repeat days enabled.
         """
-        alarm_day_minute = self.minute + (self.hour * 60)
+        days_mask = self.__days_mask
+        if days_mask == 0:
+            # Alarm has no enabled days
+            return None
+        alarm_day_minute = self.__minute + (self.__hour * 60)
         ref_day_minute = minute + (hour * 60)
-        one_day_minutes = 1440
-
-        # First corner case, check the same day after input time
-        if (self.repeat[weekday] is True) and \
-                (alarm_day_minute >= ref_day_minute):
-            return alarm_day_minute - ref_day_minute
-
-        # Check the rest of the week until, but not including, the same day
-        day = weekday + 1
-        if day > 6:
-            day = 0
-        day_count = 1
-        while day != weekday:
-            if self.repeat[day] is True:
-                # Add the days in minutes and relative time to reference
-                minutes_difference = day_count * one_day_minutes
-                if alarm_day_minute >= ref_day_minute:
-                    minutes_difference += alarm_day_minute - ref_day_minute
-                else:
-                    minutes_difference -= ref_day_minute - alarm_day_minute
-                # Returns on first encountered alarm
-                return minutes_difference
-            else:
-                day += 1
-                day_count += 1
-                if day > 6:
-                    day = 0
 
-        # Second corner case, check the same day before input time
-        if (self.repeat[weekday] is True) and \
-                (ref_day_minute > alarm_day_minute):
-            return (one_day_minutes * 7) - ref_day_minute + alarm_day_minute
-
-        # Alarm has no enabled days
-        return None
+        # Rotate the week bitmask so that bit 0 is the reference weekday
+        rotated = ((days_mask >> weekday) |
+                   (days_mask << (7 - weekday))) & 0x7F
+        if alarm_day_minute < ref_day_minute:
+            # The alarm time has already passed on the reference day, so it
+            # can only be found from the next day, or same day next week
+            rotated = (rotated >> 1) | ((rotated & 1) << 6)
+            day_count = 1
+        else:
+            day_count = 0
+        # Index of the lowest set bit is the number of days to the next alert
+        day_count += (rotated & -rotated).bit_length() - 1
+        return (day_count * 1440) + alarm_day_minute - ref_day_minute
+
+    def next_alert_datetime(self, reference=None):
+        """
+        Calculates the date and time of the first time this alarm will have to
+        trigger an alert after the reference datetime (independently of this
+        alarm being active or not).
+        :param reference: Optional datetime to calculate from, defaults to the
+                          current local time.
+        :return: Datetime of the next alert, or None if the alarm has no
+                 repeat days enabled.
+        """
+        if reference is None:
+            reference = datetime.datetime.now()
+        minutes = self.minutes_to_alert(
+            reference.hour, reference.minute, reference.weekday())
+        if minutes is None:
+            return None
+        return reference.replace(second=0, microsecond=0) + \
+            datetime.timedelta(minutes=minutes)
+
+    def occurrences(self, start, end=None, min_difference=None):
+        """
+        Generator of the alerts of this alarm from the start datetime (included)
+        until the end datetime (excluded), in time order. Each alert is only
+        calculated when requested, so without an end datetime it never stops.
+        The alarm data is copied when the generator starts, later edits of the
+        alarm do not change the yielded alerts.
+        Like next_alert_datetime(), it does not check the enabled state.
+        :param start: Datetime to start from.
+        :param end: Optional datetime to stop at.
+        :param min_difference: Optional time difference, in minutes, to yield
+                               the alerts of the offset alarm (as created by
+                               diff_alarm()) instead.
+        :return: Yields tuples with the alert datetime, this AlarmItem instance
+                 and the alert kind (AlarmItem.alarm_kind or
+                 AlarmItem.offset_kind).
+        """
+        if min_difference is None:
+            alarm = self.snapshot().to_alarm_item()
+            kind = AlarmItem.alarm_kind
+        else:
+            alarm = self.diff_alarm(min_difference)
+            kind = AlarmItem.offset_kind
+        if alarm is None:
+            return
+
+        one_minute = datetime.timedelta(minutes=1)
+        alert = alarm.next_alert_datetime(start)
+        if alert is None:
+            return
+        # The start datetime could be within the alert minute, after second 0
+        if alert < start:
+            alert = alarm.next_alert_datetime(alert + one_minute)
+        while end is None or alert < end:
+            yield alert, self, kind
+            alert = alarm.next_alert_datetime(alert + one_minute)
 
     def diff_alarm(self, min_difference):
         """
@@ -493,59 +818,168 @@ class AlarmItem(object):
         a time difference indicated by the parameter.
         It edits the label to indicate the time difference.
         It does not copy the ID nor the timestamp.
-        We are reducing the use case to have a range of -59 to 59 minutes to
-        simplify the code.
-        :para min_difference: Time difference, positive or negative in minutes
-                              from -59 to 59, for the new Alarm.
+        The calculation is done by the snapshot of the current version, which
+        memoizes the result, so this method only returns a new copy of it.
+        :para min_difference: Time difference, positive or negative in minutes,
+                              for the new Alarm. Any size is accepted, the
+                              repeat weekdays are rotated when the new time
+                              falls on a different day.
         :return: Alarm instance with this data + time difference. Returns None
                  if there was an issue with the input data
         """
-        # Input sanitation to given user case
+        alarm_diff = self.snapshot().diff_alarm(min_difference)
+        if alarm_diff is None:
+            return None
+        return alarm_diff.to_alarm_item()
+
+
+class AlarmSnapshot(object):
+    """
+    Immutable and hashable copy of the data of an AlarmItem at a given version,
+    created with AlarmItem.snapshot(). It can be shared with other threads
+    without locks, as an edit creates a new snapshot instead of modifying it,
+    so the holder only needs to replace its reference.
+    It has the same data items as the AlarmItem (id_, hour, minute, repeat,
+    enabled, label, timestamp and station_id), plus:
+        days_mask: Repeat weekdays bitmask, Monday is bit 0.
+        version: AlarmItem version the data was copied from.
+    Equality and hash only take into account the alarm data, not the version.
+    """
+    __slots__ = ('id_', 'hour', 'minute', 'repeat', 'days_mask', 'enabled',
+                 'label', 'timestamp', 'station_id', 'version', '__data',
+                 '__hash', '__diff_cache')
+
+    # Maximum number of different offsets memoized by diff_alarm()
+    diff_cache_size = 16
+
+    def __init__(self, id_, hour, minute, repeat, days_mask, enabled, label,
+                 timestamp, station_id, version):
+        """
+        AlarmSnapshot initialiser. The data is not validated, as it is meant
+        to be created from an AlarmItem instance.
+        """
+        data = (id_, hour, minute, tuple(repeat), days_mask, enabled, label,
+                timestamp, station_id)
+        for name, value in zip(AlarmSnapshot.__slots__[:9], data):
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, '_AlarmSnapshot__data', data)
+        object.__setattr__(self, '_AlarmSnapshot__hash', hash(data))
+        object.__setattr__(self, '_AlarmSnapshot__diff_cache', {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError('AlarmSnapshot instances are immutable.')
+
+    def __delattr__(self, name):
+        raise AttributeError('AlarmSnapshot instances are immutable.')
+
+    def __eq__(self, other):
+        if isinstance(other, AlarmSnapshot):
+            return self.__data == other.__data
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, AlarmSnapshot):
+            return self.__data != other.__data
+        return NotImplemented
+
+    def __hash__(self):
+        return self.__hash
+
+    def __str__(self):
+        return str(self.to_alarm_item())
+
+    def snapshot(self):
+        """ A snapshot is already immutable, so it returns itself. """
+        return self
+
+    def to_alarm_item(self):
+        """
+        Creates a new AlarmItem instance with the snapshot data.
+        :return: AlarmItem instance.
+        """
+        return AlarmItem.from_row(
+            {'id': self.id_, 'hour': self.hour, 'minute': self.minute,
+             'monday': self.repeat[0], 'tuesday': self.repeat[1],
+             'wednesday': self.repeat[2], 'thursday': self.repeat[3],
+             'friday': self.repeat[4], 'saturday': self.repeat[5],
+             'sunday': self.repeat[6], 'enabled': self.enabled,
+             'label': self.label, 'timestamp': self.timestamp,
+             'station_id': self.station_id})
+
+    def to_dict(self):
+        """
+        Converts the snapshot data into a dictionary, with the same keys as
+        AlarmItem.to_dict().
+        :return: Dictionary with the alarm data.
+        """
+        repeat = self.repeat
+        return {'id': self.id_,
+                'hour': self.hour,
+                'minute': self.minute,
+                'enabled': self.enabled,
+                'label': self.label,
+                'timestamp': self.timestamp,
+                'monday': repeat[0],
+                'tuesday': repeat[1],
+                'wednesday': repeat[2],
+                'thursday': repeat[3],
+                'friday': repeat[4],
+                'saturday': repeat[5],
+                'sunday': repeat[6],
+                'station_id': self.station_id}
+
+    def any_day_enabled(self):
+        """
+        Checks if there are any repeat days enabled.
+        :return: A boolean value indicating if an repeat weekday is activated.
+        """
+        return self.days_mask != 0
+
+    def is_active(self):
+        """
+        Determines if the Alarm is 'active', meaning enabled and at least one
+        weekday set to repeat.
+        :return: Boolean indicating the 'active' state.
+        """
+        return self.enabled is True and self.days_mask != 0
+
+    def diff_alarm(self, min_difference):
+        """
+        Returns a snapshot with the same data as this one with a time difference
+        indicated by the parameter, see AlarmItem.diff_alarm().
+        The new time is calculated in minutes of the week, and the weekdays
+        bitmask is rotated by the number of days the time has moved. The result
+        is memoized per offset, as the snapshot data never changes.
+        :param min_difference: Time difference, positive or negative in minutes,
+                               for the new Alarm.
+        :return: AlarmSnapshot with this data + time difference. Returns None
+                 if there was an issue with the input data.
+        """
+        # Input sanitation
         if not isinstance(min_difference, int_type):
             print('ERROR: Provided diff_alarm min_difference type is not an '
                   'Integer: %s!' % min_difference, file=sys.stderr)
             return None
-        else:
-            if not (-60 < min_difference < 60):
-                print('ERROR: Provided diff_alarm min_difference is not between'
-                      ' -59 and 59: %s!' % min_difference, file=sys.stderr)
-                return None
-
-        extra_hours = 0
-        extra_days = 0
-
-        new_minute = self.minute + min_difference
-        while new_minute >= 60:
-            new_minute %= 60
-            extra_hours += 1
-        while new_minute < 0:
-            new_minute += 60
-            extra_hours -= 1
-
-        new_hour = self.hour + extra_hours
-        while new_hour >= 24:
-            new_hour %= 24
-            extra_days += 1
-        while new_hour < 0:
-            new_hour += 24
-            extra_days -= 1
-
-        new_days = list(self.repeat)
-        if extra_days < 0:
-            # Move all items up by 1 per day
-            while extra_days < 0:
-                new_days.append(new_days.pop(0))
-                extra_days += 1
-        elif extra_days > 0:
-            # Move all items down by 1 per day, input sanitation protects
-            # against this breaking if extra_days > 6
-            list_to_head = new_days[(len(new_days) - extra_days):]
-            new_days = list_to_head + \
-                new_days[0:(len(new_days) - extra_days)]
 
+        alarm_diff = self.__diff_cache.get(min_difference)
+        if alarm_diff is not None:
+            return alarm_diff
+
+        extra_days, new_day_minute = divmod(
+            (self.hour * 60) + self.minute + min_difference, 1440)
+        # Rotate the weekdays so that each bit moves forward extra_days days
+        shift = extra_days % 7
+        new_days_mask = ((self.days_mask << shift) |
+                         (self.days_mask >> (7 - shift))) & 0x7F
         new_label = self.label + \
             (" (Alarm %s %+dmin)" % (self.id_, min_difference))
 
-        alarm_diff = AlarmItem(new_hour, new_minute, days=new_days,
-                               enabled=self.enabled, label=new_label)
+        alarm_diff = AlarmSnapshot(
+            None, new_day_minute // 60, new_day_minute % 60,
+            tuple(bool(new_days_mask & (1 << day)) for day in xrange(7)),
+            new_days_mask, self.enabled, new_label, None, None, self.version)
+        if len(self.__diff_cache) >= AlarmSnapshot.diff_cache_size:
+            self.__diff_cache.clear()
+        self.__diff_cache[min_difference] = alarm_diff
         return alarm_diff
@@ -7,38 +7,101 @@
 # Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
 #
 # Alarm management system. It saves alarms into a database using the AlarmDb
-# class and launches a running thread per active alarm using the AlarmThread
-# class.
+# class and schedules the alert checks of each active alarm, an AlarmThread
+# instance, in the AlarmScheduler shared by all the AlarmManager instances.
 # It also provides access to the Alarm settings (snooze time, and alarm
 # offset alert time).
 #
 from __future__ import unicode_literals, absolute_import, print_function
 import sys
 import time
+import heapq
+import types
+import functools
+import threading
 try:
     from LightUpAlarm.AlarmDb import AlarmDb
     from LightUpAlarm.AlarmItem import AlarmItem
     from LightUpAlarm.StationItem import StationItem
     from LightUpAlarm.AlarmThread import AlarmThread
+    from LightUpAlarm.AlarmScheduler import AlarmScheduler
+    from LightUpAlarm.AlarmEventBus import AlarmEventBus
+    from LightUpAlarm.ReadWriteLock import ReadWriteLock
     from LightUpAlarm.Py23Compatibility import *
 except ImportError:
     from AlarmDb import AlarmDb
     from AlarmItem import AlarmItem
     from StationItem import StationItem
     from AlarmThread import AlarmThread
+    from AlarmScheduler import AlarmScheduler
+    from AlarmEventBus import AlarmEventBus
+    from ReadWriteLock import ReadWriteLock
     from Py23Compatibility import *
 
 
+class namespacemethod(object):
+    """
+    Decorator for the AlarmManager methods that read the alarms data, which
+    can be called from the class, for the default namespace (as the original
+    static methods), or from an instance, for the namespace of the instance.
+    The method receives the class or the instance as its first argument.
+    """
+
+    def __init__(self, function):
+        self.__function = function
+        self.__doc__ = function.__doc__
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return types.MethodType(self.__function, owner)
+        return types.MethodType(self.__function, instance)
+
+
 class AlarmManager(object):
     """
     General management system for the LightUp Alarm package.
+    The database helper, lock and caches of this class are the ones of the
+    default namespace, shared by the class methods and the instances without
+    a namespace. An instance created with a namespace keeps its own ones, it
+    is meant to be a single instance per namespace (see AlarmNamespaces).
     """
     alarmdb = AlarmDb()
 
+    # Namespace of the alarms managed, None for the default
+    namespace = None
+
+    # Clock for the alarm times, an object with the time module interface that
+    # can be replaced by a VirtualClock. The durations measured for the
+    # startup timings and reconciler metrics always use the real time
+    clock = time
+
+    # AlarmScheduler running the alert checks of the alarms of all the
+    # namespaces from a single thread, one per clock, see __get_scheduler()
+    __schedulers = {}
+    __schedulers_lock = threading.Lock()
+
+    # Lock for the database access from different threads, the getters share
+    # the read lock and the mutations (including the alarm threads updates)
+    # hold the write lock. When both are needed, this lock has to be acquired
+    # before the instance alarm threads lock
+    __rw_lock = ReadWriteLock()
+
+    # Hub for the alarm change and alert events, see subscribe(). It is shared
+    # by all the namespaces
+    __event_bus = AlarmEventBus()
+
+    # Data derived from the database, only valid for the database revision it
+    # was created from: the 'alarm_set' with the (revision, AlarmSet of the
+    # enabled alarms), and the last get_next_alarm() result with the time it
+    # was calculated in 'next_alarm'. It is modified in place, so the default
+    # instances share it with the class
+    __caches = {'alarm_set': (None, None), 'next_alarm': None}
+
     #
     # Instance initialiser
     #
-    def __init__(self, alert_callback=None, offset_alert_callback=None):
+    def __init__(self, alert_callback=None, offset_alert_callback=None,
+                 reconcile_interval=None, arming_window=None, namespace=None):
         """
         On initialization we connect to the database and check if there are
         any alarms to load. If not, load a couple of dummy alarms.
@@ -48,111 +111,309 @@ class AlarmManager(object):
         :param offset_alert_callback: Optional argument to register a callback
                                       function to be executed on an offset time
                                       of the alarm.
+        :param reconcile_interval: Optional number of seconds between checks of
+                                   the background threads reconciler, see
+                                   start_reconciler(). Not started if None.
+        :param arming_window: Optional number of minutes. Only the alarms that
+                              will alert within this time (plus the offset
+                              alert time) get their threads launched before
+                              the initialiser returns, the rest are launched
+                              from a background thread, see wait_armed(). All
+                              are launched before returning if None.
+        :param namespace: Optional alphanumeric string with the namespace of
+                          the alarms, settings and snoozes to manage. They are
+                          stored in the same database file as the default ones
+                          (sharing its connection), with a database helper,
+                          lock and caches of this instance, so namespaces do
+                          not block each other. The default ones if None.
+        :raise ValueError: If the namespace name is not valid.
         """
+        if namespace is not None:
+            if not AlarmDb.is_valid_namespace(namespace):
+                raise ValueError('The namespace "%s" is not valid, it can ' %
+                                 namespace + 'only contain letters and numbers')
+            self.namespace = namespace
+            self.alarmdb = AlarmDb(AlarmManager.alarmdb.db_name, namespace)
+            self.__rw_lock = ReadWriteLock()
+            self.__caches = {'alarm_set': (None, None), 'next_alarm': None}
+        self.__scheduler = self.__get_scheduler(self.clock)
+
         # Save the alarm callback functions as a private member variable
         self.__alert_callback = alert_callback
         self.__offset_alert_callback = offset_alert_callback
 
-        # Create a private member list for the alarm threads
-        self.__alarm_threads = []
+        # Create a private member dictionary for the alarm threads (scheduled
+        # in the AlarmScheduler, not started), keyed by the alarm ID, with a
+        # lock as the reconciler can edit it from its own thread
+        self.__alarm_threads = {}
+        self.__threads_lock = threading.RLock()
+
+        # Background reconciler thread, the database revision of its last
+        # reconciliation and its metrics
+        self.__reconciler = None
+        self.__reconciler_stop = threading.Event()
+        self.__reconciled_revision = None
+        self.__reconciler_metrics = {
+            'checks': 0, 'skipped': 0, 'reconciliations': 0, 'drift': 0,
+            'threads_started': 0, 'threads_stopped': 0, 'last_check': None,
+            'last_duration': None}
+
+        # Startup phases duration, in seconds, see get_startup_timings()
+        start_time = time.time()
+        self.__startup_timings = {
+            'load': None, 'schedule': None, 'arm': None, 'ready': None,
+            'deferred_arm': None}
+        # Set when all the alarm threads have been launched
+        self.__armed = threading.Event()
 
-        # Set dummy alarms if database empty
-        if AlarmManager.alarmdb.get_number_of_alarms() == 0:
+        # Set dummy alarms if database empty, namespaces start without alarms
+        if self.namespace is None and self.alarmdb.get_number_of_alarms() == 0:
             self.load_dummy_alarms()
 
-        # Register and launch any active (enabled with repeat days) alarms
-        # from the database
-        alarms = AlarmManager.get_all_active_alarms()
-        for alarm in alarms:
-            self.__set_alarm_thread(alarm)
+        # Load the settings, enabled alarms and snoozes in a query each. The
+        # AlarmSet is also kept for get_next_alarm()
+        revision = self.alarmdb.get_revision()
+        settings = self.alarmdb.get_settings()
+        alarm_set = self.__get_enabled_alarm_set()
+        snoozes = self.alarmdb.get_all_snoozes()
+        phase_time = time.time()
+        self.__startup_timings['load'] = phase_time - start_time
+
+        # Select the active (enabled with repeat days) alarms to launch now,
+        # with an arming window the alert times are calculated in a single
+        # pass and the alarms sorted by them
+        offset_alert_time = settings['offset_alert_time']
+        schedule = []
+        deferred = []
+        if arming_window is None:
+            schedule = [alarm for alarm in alarm_set.get_alarms()
+                        if alarm.is_active() is True]
+        else:
+            # now_time[3] = hour, now_time[4] = minute, now_time[6] = weekday
+            now_time = self.clock.localtime()
+            for alarm, minutes in alarm_set.next_alarms(
+                    len(alarm_set), now_time[3], now_time[4], now_time[6]):
+                if alarm.id_ in snoozes or \
+                        minutes <= arming_window + abs(offset_alert_time):
+                    schedule.append(alarm)
+                else:
+                    deferred.append(alarm)
+        self.__startup_timings['schedule'] = time.time() - phase_time
+        phase_time = time.time()
+
+        # Launch the alarm threads that are close to alert
+        for alarm in schedule:
+            self.__set_alarm_thread(alarm, offset_alert_time)
+        self.__restore_snoozes(snoozes)
+        self.__startup_timings['arm'] = time.time() - phase_time
+        self.__startup_timings['ready'] = time.time() - start_time
+
+        if deferred:
+            arming_thread = threading.Thread(
+                target=self.__arm_deferred,
+                args=(deferred, offset_alert_time, revision, start_time))
+            arming_thread.daemon = True
+            arming_thread.start()
+        else:
+            self.__armed.set()
+
+        if reconcile_interval is not None:
+            self.start_reconciler(reconcile_interval)
+
+    @staticmethod
+    def __get_scheduler(clock):
+        """
+        Gets the AlarmScheduler shared by all the instances with the same
+        clock, creating it if needed.
+        :param clock: Clock of the alarm threads to schedule.
+        :return: AlarmScheduler instance.
+        """
+        with AlarmManager.__schedulers_lock:
+            scheduler = AlarmManager.__schedulers.get(clock)
+            if scheduler is None:
+                scheduler = AlarmScheduler(clock)
+                AlarmManager.__schedulers[clock] = scheduler
+            return scheduler
+
+    #
+    # Startup
+    #
+    def __arm_deferred(self, alarms, offset_alert_time, revision, start_time):
+        """
+        Launches the alarm threads deferred on startup, in alert time order.
+        If the database has changed since the alarms were loaded they are read
+        again, and alarms that already have a thread are skipped, as they have
+        been set by an edit.
+        :param alarms: List of the deferred AlarmItems.
+        :param offset_alert_time: Offset alert time loaded on startup.
+        :param revision: Database revision when the alarms were loaded.
+        :param start_time: Time the initialiser started.
+        """
+        phase_time = time.time()
+        try:
+            for alarm in alarms:
+                with self.__rw_lock.write_locked():
+                    if self.alarmdb.get_revision() != revision:
+                        alarm = self.get_alarm(alarm.id_)
+                        if alarm is None:
+                            continue
+                        offset_alert_time = None
+                    with self.__threads_lock:
+                        if alarm.id_ not in self.__alarm_threads:
+                            self.__set_alarm_thread_locked(
+                                alarm, offset_alert_time)
+        except Exception as e:
+            print('ERROR: Could not launch the deferred alarm threads: %s' % e,
+                  file=sys.stderr)
+        finally:
+            self.__startup_timings['deferred_arm'] = time.time() - phase_time
+            self.__armed.set()
+
+    def wait_armed(self, timeout=None):
+        """
+        Blocks until all the active alarms from startup have their threads
+        launched (see the arming_window initialiser argument).
+        :param timeout: Optional maximum number of seconds to wait.
+        :return: Boolean indicating if all the alarms have been launched.
+        """
+        self.__armed.wait(timeout)
+        return self.__armed.is_set()
+
+    def get_startup_timings(self):
+        """
+        Returns the duration of the initialiser phases:
+            load: Loading the settings, alarms and snoozes.
+            schedule: Sorting the alarms by alert time.
+            arm: Launching the alarm threads close to alert.
+            ready: Total time until the initialiser was ready to return.
+            deferred_arm: Launching the rest of alarm threads in the
+                          background, None if not finished or not deferred.
+        :return: Dictionary with a copy of the timings, in seconds.
+        """
+        return dict(self.__startup_timings)
 
     #
     # Methods to get an edit settings
     #
-    @staticmethod
-    def get_snooze_time():
+    @namespacemethod
+    def get_snooze_time(self):
         """
-        Static method, gets the current set snooze time interval.
+        Class method, gets the current set snooze time interval.
         :return: Integer with the snooze time interval in minutes.
         """
-        return AlarmManager.alarmdb.get_snooze_time()
+        with self.__rw_lock.read_locked():
+            return self.alarmdb.get_snooze_time()
 
-    @staticmethod
-    def set_snooze_time(snooze_time):
+    @namespacemethod
+    def set_snooze_time(self, snooze_time):
         """
-        Static method, sets the current snooze time interval.
+        Class method, sets the current snooze time interval.
         :param snooze_time: Integer, new snooze time in minutes.
         :return: Boolean indicating the operation success.
         """
-        return AlarmManager.alarmdb.set_snooze_time(snooze_time)
+        with self.__rw_lock.write_locked():
+            success = self.alarmdb.set_snooze_time(snooze_time)
+            if success is True:
+                self.__publish(
+                    AlarmEventBus.settings_changed, 'snooze_time', snooze_time)
+        return success
 
-    @staticmethod
-    def get_offset_alert_time():
+    @namespacemethod
+    def get_offset_alert_time(self):
         """
-        Static method, gets the offset alert time (the time difference before or
+        Class method, gets the offset alert time (the time difference before or
         after the alarm alert is triggered), used to set some action.
         :return: Integer, the offset alert time in minutes.
         """
-        return AlarmManager.alarmdb.get_offset_alert_time()
+        with self.__rw_lock.read_locked():
+            return self.alarmdb.get_offset_alert_time()
 
-    @staticmethod
-    def set__offset_alert_time(offset_alert_time):
+    @namespacemethod
+    def set__offset_alert_time(self, offset_alert_time):
         """
-        Static method, sets the offset alert time (the time before or after the
+        Class method, sets the offset alert time (the time before or after the
         alarm alert is triggered), used to set some additional action to the
         alarm alert.
         :param offset_alert_time: Integer, offset alert time in minutes.
         :return: Boolean indicating the operation success.
         """
-        return AlarmManager.alarmdb.set_offset_alert_time(offset_alert_time)
+        with self.__rw_lock.write_locked():
+            success = self.alarmdb.set_offset_alert_time(
+                offset_alert_time)
+            if success is True:
+                self.__publish(
+                    AlarmEventBus.settings_changed, 'offset_alert_time',
+                    offset_alert_time)
+        return success
+
+    #
+    # Database revision
+    #
+    @namespacemethod
+    def get_revision(self, stations=False):
+        """
+        Class method, gets the revision of the alarms and settings data, which
+        changes on every modification done from this process. It does not
+        access the database or wait for the modifications in progress, so it
+        can be used to validate cached data.
+        :param stations: Boolean to get the revision of the stations instead.
+        :return: Tuple with the integer revision number and the time of its
+                 last change, in seconds since 1970.
+        """
+        return (self.alarmdb.get_revision(stations=stations),
+                self.alarmdb.get_revision_time(stations=stations))
 
     #
     # static methods to retrieve alarms
     #
-    @staticmethod
-    def get_all_alarms():
+    @namespacemethod
+    def get_all_alarms(self):
         """
-        Static method, gets all the alarms from the database.
+        Class method, gets all the alarms from the database.
         :return: List of AlarmItems containing all alarms. Returns an empty list
                  if there aren't any.
         """
-        return AlarmManager.alarmdb.get_all_alarms()
+        with self.__rw_lock.read_locked():
+            return self.alarmdb.get_all_alarms()
 
-    @staticmethod
-    def get_number_of_alarms():
+    @namespacemethod
+    def get_number_of_alarms(self):
         """
         Gets the number of alarms stored in the database.
         :return: Integer indicating the number of alarms in the db.
         """
-        return AlarmManager.alarmdb.get_number_of_alarms()
+        with self.__rw_lock.read_locked():
+            return self.alarmdb.get_number_of_alarms()
 
-    @staticmethod
-    def get_all_enabled_alarms():
+    @namespacemethod
+    def get_all_enabled_alarms(self):
         """
         Gets all the enabled alarms from the database.
         :return: List of AlarmItems containing all enabled alarms. Returns an
                  empty list if there aren't any.
         """
-        return AlarmManager.alarmdb.get_all_enabled_alarms()
+        with self.__rw_lock.read_locked():
+            return self.alarmdb.get_all_enabled_alarms()
 
-    @staticmethod
-    def get_all_disabled_alarms():
+    @namespacemethod
+    def get_all_disabled_alarms(self):
         """
         Gets all the disabled alarms from the database.
         :return: List of AlarmItems containing all enabled alarms. Returns an
                  empty list if there aren't any.
         """
-        return AlarmManager.alarmdb.get_all_disabled_alarms()
+        with self.__rw_lock.read_locked():
+            return self.alarmdb.get_all_disabled_alarms()
 
-    @staticmethod
-    def get_all_active_alarms():
+    @namespacemethod
+    def get_all_active_alarms(self):
         """
         Gets all the active alarms (enabled with at least one repeating day)
         from the database.
         :return: List of AlarmItems containing all enabled alarms. Returns an
                  empty list if there aren't any.
         """
-        active_alarms = AlarmManager.get_all_enabled_alarms()
+        active_alarms = self.get_all_enabled_alarms()
         # Need to iterate backwards in order to remove items safely
         if active_alarms:
             for i in xrange(len(active_alarms) - 1, -1, -1):
@@ -162,8 +423,8 @@ class AlarmManager(object):
         else:
             return []
 
-    @staticmethod
-    def get_alarm(alarm_id):
+    @namespacemethod
+    def get_alarm(self, alarm_id):
         """
         Get the alarm with the given ID from the database.
         :param alarm_id: Integer to indicate the primary key of the Alarm to
@@ -171,29 +432,163 @@ class AlarmManager(object):
         :return: AlarmItem with the alarm data, or None if id could not be
                  found.
         """
-        return AlarmManager.alarmdb.get_alarm(alarm_id)
+        with self.__rw_lock.read_locked():
+            return self.alarmdb.get_alarm(alarm_id)
 
-    @staticmethod
-    def get_next_alarm():
+    @namespacemethod
+    def query_alarms(self, fields=None, limit=None, cursor=None, **filters):
+        """
+        Gets a page of the alarms that match the filters, with only the
+        selected fields, all done by the database query.
+        :param fields: Optional iterable with the AlarmItem.fields names to
+                       get, the 'id' is always included. All if None.
+        :param limit: Optional positive integer with the maximum number of
+                      alarms.
+        :param cursor: Optional cursor of the page, as returned for the
+                       previous page.
+        :param filters: Optional enabled, active, day, station_id, hour_from
+                        and hour_to filters, see AlarmDb.query_alarms().
+        :return: Tuple with a list of dictionaries with the alarm fields, and
+                 the cursor of the next page, None if it is the last page.
+        :raise ValueError: If a field name is not valid.
+        """
+        with self.__rw_lock.read_locked():
+            return self.alarmdb.query_alarms(fields, limit, cursor, **filters)
+
+    @namespacemethod
+    def __get_enabled_alarm_set(self):
         """
-        Gets the current time and all the active alarms. For each of these
-        alarms it calculates the elapsed time that will pass for its next alert.
-        Then it sorts the list based on this value and returns closes.
-        :return: AlarmItem of the next alarm to alert.
+        Gets an AlarmSet with all the enabled alarms. It is only loaded from
+        the database again if the database revision has changed.
+        :return: AlarmSet with the enabled alarms.
         """
+        revision = self.alarmdb.get_revision()
+        cached_revision, alarm_set = self.__caches['alarm_set']
+        if alarm_set is None or cached_revision != revision:
+            alarm_set = self.alarmdb.get_alarm_set(enabled=True)
+            self.__caches['alarm_set'] = (revision, alarm_set)
+        return alarm_set
+
+    @namespacemethod
+    def get_next_alarm(self):
+        """
+        Gets the next alarm to alert from the current time. The enabled alarms
+        are kept in an AlarmSet, which calculates in a single pass the elapsed
+        time for the next alert of each alarm and returns the closest.
+        The result is cached until its alert time passes, or the alarms or
+        settings are modified (detected with the database revision).
+        :return: AlarmItem of the next alarm to alert, with the minutes to its
+                 alert in the next_alert attribute. None if there are no active
+                 alarms.
+        """
+        with self.__rw_lock.read_locked():
+            return self.__get_next_alarm_locked()
+
+    @namespacemethod
+    def __get_next_alarm_locked(self):
+        """
+        Implementation of get_next_alarm(), the read lock has to be held.
+        :return: AlarmItem of the next alarm to alert, or None.
+        """
+        now = self.clock.time()
         # now_time[3] = tm_hour, now_time[4] = tm_minute, now_time[6] = tm_wday
-        now_time = time.localtime(time.time())
-
-        all_alarms = AlarmManager.get_all_active_alarms()
-        if len(all_alarms) > 0:
-            for alarm in all_alarms:
-                alarm.next_alert = alarm.minutes_to_alert(
-                    now_time[3], now_time[4], now_time[6])
-            sorted_alarms = sorted(
-                all_alarms, key=lambda a: a.next_alert)
-            return sorted_alarms[0]
+        now_time = self.clock.localtime(now)
+        week_minute = (now_time[6] * 1440) + (now_time[3] * 60) + now_time[4]
+        revision = self.alarmdb.get_revision()
+
+        cache = self.__caches['next_alarm']
+        if cache is not None and cache[0] == revision:
+            cached_time, cached_week_minute, alarm, minutes = cache[1:]
+            elapsed = (week_minute - cached_week_minute) % (7 * 1440)
+            # The local time elapsed has to match the real time elapsed, to
+            # discard clock changes and queries over a week apart
+            if elapsed <= ((now - cached_time) // 60) + 1:
+                if alarm is None:
+                    return None
+                elif elapsed <= minutes:
+                    next_alarm = alarm.snapshot().to_alarm_item()
+                    next_alarm.next_alert = minutes - elapsed
+                    return next_alarm
+
+        alarm_set = self.__get_enabled_alarm_set()
+        next_alarm = alarm_set.next_alarm(now_time[3], now_time[4], now_time[6])
+        if next_alarm is not None:
+            alarm, minutes = next_alarm
         else:
+            alarm, minutes = None, None
+        self.__caches['next_alarm'] = \
+            (revision, now, week_minute, alarm, minutes)
+        if alarm is None:
             return None
+        # The AlarmSet items are kept in the cache, so return a copy
+        next_alarm = alarm.snapshot().to_alarm_item()
+        next_alarm.next_alert = minutes
+        return next_alarm
+
+    @namespacemethod
+    def get_next_alarms(self, number):
+        """
+        Gets the given number of alarms to alert first from the current time,
+        using the cached AlarmSet of the enabled alarms.
+        :param number: Integer, maximum number of alarms to return.
+        :return: List of AlarmItems sorted by alert time, each with the minutes
+                 to its alert in the next_alert attribute. It has fewer items
+                 than requested if there are not enough active alarms.
+        """
+        # now_time[3] = tm_hour, now_time[4] = tm_minute, now_time[6] = tm_wday
+        now_time = self.clock.localtime()
+        with self.__rw_lock.read_locked():
+            alarm_set = self.__get_enabled_alarm_set()
+        next_alarms = []
+        for alarm, minutes in alarm_set.next_alarms(
+                number, now_time[3], now_time[4], now_time[6]):
+            next_alarm = alarm.snapshot().to_alarm_item()
+            next_alarm.next_alert = minutes
+            next_alarms.append(next_alarm)
+        return next_alarms
+
+    @namespacemethod
+    def iter_occurrences(self, start, end=None, offset_alert=False):
+        """
+        Generator of the alerts of all the active alarms from the start
+        datetime (included) until the end datetime (excluded), in time order.
+        The occurrences generator of each alarm is merged with a heap, so the
+        alerts are only calculated as they are requested.
+        Alerts at the same time are yielded in the alarms order, with the offset
+        alerts after the alarm alerts.
+        :param start: Datetime to start from.
+        :param end: Optional datetime to stop at, without it the generator only
+                    stops if there are no active alarms.
+        :param offset_alert: Boolean to indicate if the offset alerts, using
+                             the current offset alert time, are included.
+        :return: Yields tuples with the alert datetime, the AlarmItem and the
+                 alert kind (AlarmItem.alarm_kind or AlarmItem.offset_kind).
+        """
+        alarms = self.get_all_active_alarms()
+        generators = [alarm.occurrences(start, end) for alarm in alarms]
+        if offset_alert is True:
+            offset_time = self.get_offset_alert_time()
+            generators += [alarm.occurrences(start, end, offset_time)
+                           for alarm in alarms]
+
+        # The generator index is part of each heap item so that alerts at the
+        # same time never compare the AlarmItems
+        heap = []
+        for index, generator in enumerate(generators):
+            occurrence = next(generator, None)
+            if occurrence is not None:
+                heap.append((occurrence[0], index, occurrence, generator))
+        heapq.heapify(heap)
+
+        while heap:
+            alert, index, occurrence, generator = heap[0]
+            yield occurrence
+            occurrence = next(generator, None)
+            if occurrence is not None:
+                heapq.heapreplace(
+                    heap, (occurrence[0], index, occurrence, generator))
+            else:
+                heapq.heappop(heap)
 
     #
     # member methods to add alarms
@@ -219,12 +614,42 @@ class AlarmManager(object):
             hour, minute, days=days, enabled=enabled, label=label,
             timestamp=timestamp, station_id=station_id)
         if alarm is not None:
-            alarm.id_ = AlarmManager.alarmdb.add_alarm(alarm)
-            if alarm.id_ is not None:
-                self.__set_alarm_thread(alarm)
-                return alarm.id_
+            with self.__rw_lock.write_locked():
+                alarm.id_ = self.alarmdb.add_alarm(alarm)
+                if alarm.id_ is not None:
+                    self.__publish(
+                        AlarmEventBus.alarm_added, alarm.id_, alarm.snapshot())
+                    self.__set_alarm_thread(alarm)
+                    return alarm.id_
         return None
 
+    def add_alarms(self, raw_alarms):
+        """
+        Adds a batch of alarms from untrusted data, validated all together by
+        AlarmItem.from_dicts(). The valid alarms are saved into the database
+        and sent to __set_alarm_thread, the invalid ones are skipped.
+        :param raw_alarms: List of dictionaries with the alarm data, using the
+                           AlarmItem.fields names as keys.
+        :return: Tuple with two lists in the same order as the input. The first
+                 contains the newly created alarm IDs, or None if failed. The
+                 second contains the list of validation errors of each alarm.
+        """
+        alarms, errors = AlarmItem.from_dicts(raw_alarms)
+        alarm_ids = []
+        with self.__rw_lock.write_locked():
+            for alarm in alarms:
+                if alarm is not None:
+                    if alarm.station_id is None:
+                        alarm.station_id = 1
+                    alarm.id_ = self.alarmdb.add_alarm(alarm)
+                    if alarm.id_ is not None:
+                        self.__publish(
+                            AlarmEventBus.alarm_added, alarm.id_,
+                            alarm.snapshot())
+                        self.__set_alarm_thread(alarm)
+                alarm_ids.append(alarm.id_ if alarm is not None else None)
+        return alarm_ids, errors
+
     def load_dummy_alarms(self):
         """
         It loads 2 inactive dummy alarms into the database for demonstration
@@ -253,21 +678,30 @@ class AlarmManager(object):
         :param label: Strong to contain the alarm label.
         :return: Boolean indicating the success of the 'edit' operation.
         """
-        db = AlarmManager.alarmdb
-        # As the default values for AlarmDb.edit_alarm are all None as well we
-        # can send all through as is.
-        success = db.edit_alarm(
-            alarm_id,  hour=hour, minute=minute, days=days, enabled=enabled,
-            label=label, station_id=station_id)
+        db = self.alarmdb
+        stopped_threads = []
+        with self.__rw_lock.write_locked():
+            # As the default values for AlarmDb.edit_alarm are all None as well
+            # we can send all through as is.
+            success = db.edit_alarm(
+                alarm_id,  hour=hour, minute=minute, days=days,
+                enabled=enabled, label=label, station_id=station_id)
 
-        # If a successful edit was carried, then make sure the alarm is launched
-        if success is True:
-            self.__set_alarm_thread(AlarmManager.get_alarm(alarm_id))
+            # If a successful edit was carried, then make sure the alarm is
+            # launched
+            if success is True:
+                alarm = self.get_alarm(alarm_id)
+                self.__publish(
+                    AlarmEventBus.alarm_edited, alarm_id, alarm.snapshot())
+                self.__set_alarm_thread(
+                    alarm, stopped_threads=stopped_threads)
 
+        # A thread stopped by the edit is waited for without blocking readers
+        self.__join_alarm_threads(stopped_threads)
         return success
 
-    @staticmethod
-    def update_alarm(alarm):
+    @namespacemethod
+    def update_alarm(self, alarm):
         """
         Updates the alarm in the database with an AlarmItem input data.
         This method also updates the timestamp stored into the instance passed
@@ -276,7 +710,12 @@ class AlarmManager(object):
         :return: Boolean indicating the success of the 'update' operation.
         """
         if isinstance(alarm, AlarmItem):
-            success = AlarmManager.alarmdb.update_alarm(alarm)
+            with self.__rw_lock.write_locked():
+                success = self.alarmdb.update_alarm(alarm)
+                if success is True:
+                    self.__publish(
+                        AlarmEventBus.alarm_edited, alarm.id_,
+                        alarm.snapshot())
         else:
             success = False
         return success
@@ -289,28 +728,45 @@ class AlarmManager(object):
                          removed.
         :return: Boolean indicating the success of the 'delete alarm' operation.
         """
-        # First we need to ensure it there is no alarm thread running for it
-        self.__stop_alarm_thread(alarm_id)
-        # Remove it from the database
-        return AlarmManager.alarmdb.delete_alarm(alarm_id)
+        with self.__rw_lock.write_locked():
+            # First we need to ensure it there is no alarm thread running for
+            # it, it is waited for once the lock is released
+            with self.__threads_lock:
+                alarm_thread = self.__detach_alarm_thread_locked(alarm_id)
+            # Remove it from the database
+            success = self.alarmdb.delete_alarm(alarm_id)
+            if success is True:
+                self.alarmdb.delete_snooze(alarm_id)
+                self.__publish(
+                    AlarmEventBus.alarm_deleted, alarm_id)
+        if alarm_thread is not None:
+            self.__join_alarm_threads([alarm_thread])
+        return success
 
     def delete_all_alarms(self):
         """
         Removes all alarm threads and alarms from the database.
         :return: Boolean indicating the success of the 'delete all' operation.
         """
-        # Ensure there are no alarm threads running anymore
-        thread_success = self.__stop_all_alarm_threads()
-        # Remove from database
-        db_success = AlarmManager.alarmdb.delete_all_alarms()
+        with self.__rw_lock.write_locked():
+            # Ensure there are no alarm threads running anymore, they are
+            # waited for once the lock is released
+            with self.__threads_lock:
+                alarm_threads = self.__detach_all_alarm_threads_locked()
+            # Remove from database
+            db_success = self.alarmdb.delete_all_alarms()
+            if db_success is True:
+                self.alarmdb.delete_all_snoozes()
+                self.__publish(AlarmEventBus.alarm_deleted)
 
+        thread_success = self.__join_alarm_threads(alarm_threads)
         if thread_success is True and db_success is True:
             return True
         else:
             return False
 
-    @staticmethod
-    def get_station(station_id):
+    @namespacemethod
+    def get_station(self, station_id):
         """
         Get the station with the given ID from the database.
         :param station_id: Integer to indicate the primary key of the Station to
@@ -318,16 +774,36 @@ class AlarmManager(object):
         :return: StationItem with the station data, or None if id could not be
                  found.
         """
-        return AlarmManager.alarmdb.get_station(station_id)
+        with self.__rw_lock.read_locked():
+            return self.alarmdb.get_station(station_id)
 
-    @staticmethod
-    def get_all_stations():
+    @namespacemethod
+    def get_all_stations(self):
         """
-        Static method, gets all the stations from the database.
+        Class method, gets all the stations from the database.
         :return: List of StationItems containing all stations. Returns an empty list
                  if there aren't any.
         """
-        return AlarmManager.alarmdb.get_all_stations()
+        with self.__rw_lock.read_locked():
+            return self.alarmdb.get_all_stations()
+
+    @namespacemethod
+    def query_stations(self, fields=None, limit=None, cursor=None):
+        """
+        Gets a page of the stations with only the selected fields, all done
+        by the database query.
+        :param fields: Optional iterable with the StationItem.fields names to
+                       get, the 'id' is always included. All if None.
+        :param limit: Optional positive integer with the maximum number of
+                      stations.
+        :param cursor: Optional cursor of the page, as returned for the
+                       previous page.
+        :return: Tuple with a list of dictionaries with the station fields,
+                 and the cursor of the next page, None if it is the last page.
+        :raise ValueError: If a field name is not valid.
+        """
+        with self.__rw_lock.read_locked():
+            return self.alarmdb.query_stations(fields, limit, cursor)
 
     #
     # member methods to add stations
@@ -341,7 +817,11 @@ class AlarmManager(object):
         """
         station = StationItem(name, url)
         if station is not None:
-            station.id_ = AlarmManager.alarmdb.add_station(station)
+            with self.__rw_lock.write_locked():
+                station.id_ = self.alarmdb.add_station(station)
+                if station.id_ is not None:
+                    self.__publish(
+                        AlarmEventBus.station_added, station.id_, station)
             if station.id_ is not None:
                 return station.id_
         return None
@@ -354,7 +834,12 @@ class AlarmManager(object):
         :return: Boolean indicating the success of the 'delete station' operation.
         """
         # Remove it from the database
-        return AlarmManager.alarmdb.delete_station(station_id)
+        with self.__rw_lock.write_locked():
+            success = self.alarmdb.delete_station(station_id)
+            if success is True:
+                self.__publish(
+                    AlarmEventBus.station_deleted, station_id)
+        return success
 
     def delete_all_stations(self):
         """
@@ -362,127 +847,572 @@ class AlarmManager(object):
         :return: Boolean indicating the success of the 'delete all' operation.
         """
         # Remove from database
-        return AlarmManager.alarmdb.delete_all_stations()
+        with self.__rw_lock.write_locked():
+            success = self.alarmdb.delete_all_stations()
+            if success is True:
+                self.__publish(
+                    AlarmEventBus.station_deleted)
+        return success
 
 
+    #
+    # member methods to apply a batch of operations
+    #
+    def apply_operations(self, operations, atomic=True):
+        """
+        Applies a batch of alarm and station operations from untrusted data in
+        a single database transaction, followed by a single update of the
+        alarm threads. Each operation is a dictionary with the keys:
+            op: 'add', 'edit' or 'delete'.
+            type: 'alarm' or 'station'.
+            id: Integer with the ID of the alarm or station to edit or delete.
+            data: Dictionary with the data to add, or the fields to edit. The
+                  alarms use the AlarmItem.fields names as keys (validated as
+                  in add_alarms()) and the stations 'name' and 'url'.
+        :param operations: List of operation dictionaries.
+        :param atomic: Boolean to discard all the operations if any of them
+                       fails, otherwise only the failed ones are skipped.
+        :return: Tuple with a boolean indicating if the changes were saved, and
+                 a list with a dictionary per operation with the keys:
+                     success: Boolean indicating if the operation was applied.
+                     id: ID of the alarm or station, None if not available.
+                     errors: List of errors, as in AlarmItem.from_dicts().
+        """
+        results = []
+        events = []
+        alarm_ids = set()
+        stopped_threads = []
+        with self.__rw_lock.write_locked():
+            self.alarmdb.begin()
+            try:
+                for operation in operations:
+                    results.append(self.__apply_operation(
+                        operation, events, alarm_ids))
+                committed = atomic is False or \
+                    all(result['success'] for result in results)
+                if committed is True:
+                    self.alarmdb.commit()
+                else:
+                    self.alarmdb.rollback()
+            except Exception:
+                self.alarmdb.rollback()
+                raise
+
+            if committed is True:
+                for event in events:
+                    self.__publish(*event)
+                self.__replan_alarm_threads(alarm_ids, stopped_threads)
+            else:
+                for result in results:
+                    if result['success'] is True:
+                        result['success'] = False
+                        result['errors'].append(
+                            {'field': None,
+                             'error': 'Discarded, another operation failed'})
+        self.__join_alarm_threads(stopped_threads)
+        return committed, results
+
+    def __apply_operation(self, operation, events, alarm_ids):
+        """
+        Applies a single operation of apply_operations() to the database. The
+        write lock must be held and the transaction started.
+        :param operation: Dictionary with the operation data.
+        :param events: List to append the (type, id, data) events to publish.
+        :param alarm_ids: Set to add the IDs of the alarms changed.
+        :return: Dictionary with the operation result.
+        """
+        result = {'success': False, 'id': None, 'errors': []}
+        errors = result['errors']
+        if not isinstance(operation, dict):
+            errors.append({'field': None,
+                           'error': 'The operation must be a dictionary'})
+            return result
+
+        op = operation.get('op')
+        if op not in ('add', 'edit', 'delete'):
+            errors.append({'field': 'op',
+                           'error': 'Must be \'add\', \'edit\' or \'delete\''})
+        item_type = operation.get('type')
+        if item_type not in ('alarm', 'station'):
+            errors.append({'field': 'type',
+                           'error': 'Must be \'alarm\' or \'station\''})
+        item_id = operation.get('id')
+        if op in ('edit', 'delete'):
+            if not isinstance(item_id, int_type) or \
+                    isinstance(item_id, bool_type):
+                errors.append({'field': 'id', 'error': 'Must be an Integer'})
+            else:
+                result['id'] = item_id
+        data = operation.get('data', {})
+        if op in ('add', 'edit') and not isinstance(data, dict):
+            errors.append({'field': 'data', 'error': 'Must be a dictionary'})
+        if errors:
+            return result
+
+        if item_type == 'alarm':
+            self.__apply_alarm_operation(
+                op, item_id, data, result, events, alarm_ids)
+        else:
+            self.__apply_station_operation(op, item_id, data, result, events)
+        return result
+
+    def __apply_alarm_operation(self, op, alarm_id, data, result, events,
+                                alarm_ids):
+        """
+        Applies an alarm operation of apply_operations() to the database.
+        :param op: String with the operation, 'add', 'edit' or 'delete'.
+        :param alarm_id: Integer with the alarm ID, for 'edit' and 'delete'.
+        :param data: Dictionary with the alarm data, for 'add' and 'edit'.
+        :param result: Dictionary with the operation result to update.
+        :param events: List to append the (type, id, data) events to publish.
+        :param alarm_ids: Set to add the IDs of the alarms changed.
+        """
+        if op in ('edit', 'delete'):
+            alarm = self.alarmdb.get_alarm(alarm_id)
+            if alarm is None:
+                result['errors'].append(
+                    {'field': 'id', 'error': 'The alarm does not exist'})
+                return
+
+        if op == 'delete':
+            result['success'] = self.alarmdb.delete_alarm(alarm_id)
+            if result['success'] is True:
+                self.alarmdb.delete_snooze(alarm_id)
+                events.append((AlarmEventBus.alarm_deleted, alarm_id, None))
+                alarm_ids.add(alarm_id)
+            return
+
+        if op == 'edit':
+            # The edited fields are validated together with the current ones
+            raw_alarm = alarm.to_dict()
+            raw_alarm.update(data)
+            raw_alarm['id'] = alarm_id
+            data = raw_alarm
+        alarms, errors = AlarmItem.from_dicts([data])
+        alarm = alarms[0]
+        if alarm is None:
+            result['errors'].extend(errors[0])
+            return
+        if op == 'add':
+            if alarm.station_id is None:
+                alarm.station_id = 1
+            alarm.id_ = self.alarmdb.add_alarm(alarm)
+            result['success'] = alarm.id_ is not None
+            event_type = AlarmEventBus.alarm_added
+        else:
+            result['success'] = self.alarmdb.update_alarm(alarm)
+            event_type = AlarmEventBus.alarm_edited
+        if result['success'] is True:
+            result['id'] = alarm.id_
+            events.append((event_type, alarm.id_, alarm.snapshot()))
+            alarm_ids.add(alarm.id_)
+
+    def __apply_station_operation(self, op, station_id, data, result, events):
+        """
+        Applies a station operation of apply_operations() to the database.
+        :param op: String with the operation, 'add', 'edit' or 'delete'.
+        :param station_id: Integer with the station ID, for 'edit' and
+                           'delete'.
+        :param data: Dictionary with the station data, for 'add' and 'edit'.
+        :param result: Dictionary with the operation result to update.
+        :param events: List to append the (type, id, data) events to publish.
+        """
+        if op in ('edit', 'delete'):
+            station = self.alarmdb.get_station(station_id)
+            if station is None:
+                result['errors'].append(
+                    {'field': 'id', 'error': 'The station does not exist'})
+                return
+
+        if op == 'delete':
+            result['success'] = self.alarmdb.delete_station(station_id)
+            if result['success'] is True:
+                events.append(
+                    (AlarmEventBus.station_deleted, station_id, None))
+            return
+
+        if op == 'edit':
+            name = data.get('name', station.name)
+            url = data.get('url', station.url)
+        else:
+            name = data.get('name')
+            url = data.get('url')
+        for field, value in (('name', name), ('url', url)):
+            if not isinstance(value, str_type):
+                result['errors'].append(
+                    {'field': field, 'error': 'Must be a String'})
+        if result['errors']:
+            return
+        station = StationItem(name, url, station_id=station_id)
+        if station is None:
+            result['errors'].append(
+                {'field': None, 'error': 'Invalid station data'})
+            return
+        if op == 'add':
+            station.id_ = self.alarmdb.add_station(station)
+            result['success'] = station.id_ is not None
+            event_type = AlarmEventBus.station_added
+        else:
+            result['success'] = self.alarmdb.update_station(station)
+            event_type = AlarmEventBus.station_edited
+        if result['success'] is True:
+            result['id'] = station.id_
+            events.append((event_type, station.id_, station))
+
+    def __replan_alarm_threads(self, alarm_ids, stopped_threads):
+        """
+        Updates the alarm threads of the alarms changed by apply_operations()
+        all together, the write lock must be held.
+        :param alarm_ids: Set with the IDs of the alarms changed.
+        :param stopped_threads: List to append the alarm threads stopped, to
+                                wait for them once the lock is released.
+        """
+        if not alarm_ids:
+            return
+        offset_alert_time = self.alarmdb.get_offset_alert_time()
+        alarms = dict((alarm.id_, alarm)
+                      for alarm in self.alarmdb.get_all_alarms()
+                      if alarm.id_ in alarm_ids)
+        with self.__threads_lock:
+            for alarm_id in alarm_ids:
+                if alarm_id not in alarms:
+                    alarm_thread = self.__detach_alarm_thread_locked(alarm_id)
+                    if alarm_thread is not None:
+                        stopped_threads.append(alarm_thread)
+            for alarm in alarms.values():
+                self.__set_alarm_thread_locked(
+                    alarm, offset_alert_time, stopped_threads)
+
+    #
+    # Snooze
+    #
+    def snooze(self, alarm_id):
+        """
+        Snoozes an alarm, it will alert again after the snooze time. The
+        snooze is a one-shot alert set in the alarm thread (rescheduled to
+        check it), and it is saved in the database to be restored if the
+        AlarmManager is restarted.
+        :param alarm_id: ID of the alarm to snooze, it has to be running.
+        :return: Integer with the time of the snooze alert, in seconds since
+                 1970, or None if the alarm is not running.
+        """
+        with self.__rw_lock.write_locked():
+            with self.__threads_lock:
+                alarm_thread = self.__alarm_threads.get(alarm_id)
+                if alarm_thread is None or \
+                        self.__scheduler.is_scheduled(alarm_thread) is False:
+                    return None
+                alert_time = int(self.clock.time()) + \
+                    (self.get_snooze_time() * 60)
+                alarm_thread.snooze(alert_time)
+                self.__scheduler.add(alarm_thread)
+            self.alarmdb.set_snooze(alarm_id, alert_time)
+            self.__publish(
+                AlarmEventBus.alarm_snoozed, alarm_id, alert_time)
+        return alert_time
+
+    def dismiss(self, alarm_id):
+        """
+        Dismisses an alarm, cancelling its pending snooze alert.
+        :param alarm_id: ID of the alarm to dismiss.
+        :return: Boolean indicating if the alarm had a snooze alert pending.
+        """
+        with self.__rw_lock.write_locked():
+            pending = False
+            with self.__threads_lock:
+                alarm_thread = self.__alarm_threads.get(alarm_id)
+                if alarm_thread is not None:
+                    pending = alarm_thread.cancel_snooze()
+                    if pending is True and \
+                            self.__scheduler.is_scheduled(alarm_thread):
+                        self.__scheduler.add(alarm_thread)
+            if self.alarmdb.delete_snooze(alarm_id) is True:
+                pending = True
+            if pending is True:
+                self.__publish(
+                    AlarmEventBus.alarm_dismissed, alarm_id)
+        return pending
+
+    def get_snoozes(self):
+        """
+        Gets the pending snooze alerts from the alarm threads.
+        :return: Dictionary with the snooze alert times, in seconds since 1970,
+                 keyed by alarm ID.
+        """
+        snoozes = {}
+        with self.__threads_lock:
+            for alarm_id, alarm_thread in self.__alarm_threads.items():
+                snooze_time = alarm_thread.get_snooze_time()
+                if snooze_time is not None:
+                    snoozes[alarm_id] = snooze_time
+        return snoozes
+
+    def __restore_snoozes(self, snoozes):
+        """
+        Sets the snoozes saved in the database into the alarm threads. The
+        snoozes already passed, or without an alarm thread, are removed.
+        :param snoozes: Dictionary with the snoozes loaded from the database.
+        """
+        now = self.clock.time()
+        with self.__rw_lock.write_locked():
+            for alarm_id, alert_time in snoozes.items():
+                with self.__threads_lock:
+                    alarm_thread = self.__alarm_threads.get(alarm_id)
+                    if alert_time > now and alarm_thread is not None:
+                        alarm_thread.snooze(alert_time)
+                        self.__scheduler.add(alarm_thread)
+                        continue
+                self.alarmdb.delete_snooze(alarm_id)
+
+    #
+    # Events
+    #
+    @namespacemethod
+    def subscribe(self, callback, event_types=None, all_namespaces=False):
+        """
+        Registers a callback to be notified of the alarm changes and alerts.
+        The events are delivered asynchronously from a background thread, and
+        bursts of changes are coalesced, see AlarmEventBus.
+        :param callback: Function that takes a list of event dictionaries.
+        :param event_types: Optional iterable with the event types to receive
+                            (e.g. AlarmEventBus.change_events), all events are
+                            received if None.
+        :param all_namespaces: Boolean to receive the events of all the
+                               namespaces, instead of only the events of the
+                               namespace of this manager.
+        """
+        namespaces = None if all_namespaces is True else (self.namespace,)
+        self.__event_bus.subscribe(callback, event_types, namespaces)
+
+    @namespacemethod
+    def unsubscribe(self, callback):
+        """
+        Removes a callback registered with subscribe().
+        :param callback: Function to stop notifying.
+        :return: Boolean indicating if the callback was subscribed.
+        """
+        return self.__event_bus.unsubscribe(callback)
+
+    @namespacemethod
+    def flush_events(self, timeout=None):
+        """
+        Blocks until all the published events have been delivered.
+        :param timeout: Optional maximum number of seconds to wait.
+        :return: Boolean indicating if all the events were delivered.
+        """
+        return self.__event_bus.flush(timeout)
+
+    @namespacemethod
+    def __publish(self, event_type, id_=None, data=None):
+        """
+        Publishes an event of the namespace of this manager.
+        :param event_type: One of the AlarmEventBus event types.
+        :param id_: ID of the alarm, station or setting the event refers to.
+        :param data: Event data, see AlarmEventBus.
+        """
+        self.__event_bus.publish(event_type, id_, data, self.namespace)
+
+    def __alarm_alert(self, alarm):
+        """
+        Alarm threads alert callback, publishes the alert event and executes
+        the alert callback from the initialiser. The callback is deferred to
+        the scheduler callbacks thread, as it can take a while.
+        :param alarm: AlarmSnapshot of the alarm alerting.
+        """
+        self.__publish(
+            AlarmEventBus.alarm_alert, alarm.id_, alarm)
+        if self.__alert_callback is not None:
+            self.__scheduler.defer(self.__alert_callback, alarm)
+
+    def __offset_alarm_alert(self, alarm_id, alarm):
+        """
+        Alarm threads offset alert callback, publishes the offset alert event
+        and executes the offset alert callback from the initialiser, deferred
+        as the alert callback.
+        :param alarm_id: ID of the alarm, as the offset alarm does not have it.
+        :param alarm: AlarmSnapshot of the offset alarm alerting.
+        """
+        self.__publish(
+            AlarmEventBus.offset_alert, alarm_id, alarm)
+        if self.__offset_alert_callback is not None:
+            self.__scheduler.defer(self.__offset_alert_callback, alarm)
+
     #
     # member methods to launch, edit and stop alarm events
     #
-    def __set_alarm_thread(self, alarm):
+    def __set_alarm_thread(self, alarm, offset_alert_time=None,
+                           stopped_threads=None):
         """
         Takes an input alarm and determines if is active, in order to be
         launched as an alarm thread, or if a thread should be changed due to
         the new alarm data.
-        Maintains the thread list updated with the running alarms.
+        Maintains the threads dictionary updated with the running alarms.
         :param alarm: AlarmItem to launch, edited, or stop thread.
+        :param offset_alert_time: Optional offset alert time for a new thread,
+                                  read from the database if None.
+        :param stopped_threads: Optional list to append the alarm thread if it
+                                is stopped, for the callers holding the write
+                                lock to wait for it once released. If None
+                                it is waited for before returning.
         :return: Boolean indicating if Alarm Thread is running.
         """
-        thread_up = False
-        # First check if the alarm to be register is already in the list
-        for i, alarm_thread in enumerate(self.__alarm_threads):
-            if alarm.id_ == alarm_thread.get_id():
-                # Already set as launched, check if should be stopped or edited
-                if alarm.is_active() is False:
-                    self.__stop_alarm_thread(alarm.id_)
-                else:
-                    alarm_thread.edit_alarm(alarm)
-                    # It is meant to be up and running, check that it is
-                    if alarm_thread.isAlive() is False:
-                        self.__alarm_threads[i] = AlarmThread(
-                            alarm,
-                            alarm_callback=self.__alert_callback,
-                            offset_alarm_time=self.get_offset_alert_time(),
-                            offset_callback=self.__offset_alert_callback)
-                        self.__alarm_threads[i].start()
-                    thread_up = alarm_thread.isAlive()
-                break
-        # Else only executes if no alarm with same ID was found
-        else:
-            # Before thread is launched, check if the alarm is active
-            if alarm.is_active() is True:
-                alarm_thread = AlarmThread(
-                    alarm,
-                    alarm_callback=self.__alert_callback,
-                    offset_alarm_time=self.get_offset_alert_time(),
-                    offset_callback=self.__offset_alert_callback)
-                self.__alarm_threads.append(alarm_thread)
-                alarm_thread.start()
-                thread_up = alarm_thread.isAlive()
-
-        return thread_up
+        wait_stopped = stopped_threads is None
+        if wait_stopped is True:
+            stopped_threads = []
+        with self.__threads_lock:
+            running = self.__set_alarm_thread_locked(
+                alarm, offset_alert_time, stopped_threads)
+        if wait_stopped is True:
+            self.__join_alarm_threads(stopped_threads)
+        return running
+
+    def __set_alarm_thread_locked(self, alarm, offset_alert_time=None,
+                                  stopped_threads=None):
+        """
+        Implementation of __set_alarm_thread(), the threads lock must be held.
+        :param alarm: AlarmItem to launch, edited, or stop thread.
+        :param offset_alert_time: Optional offset alert time for a new thread,
+                                  read from the database if None.
+        :param stopped_threads: Optional list to append the alarm thread if it
+                                is stopped, it is not waited for here.
+        :return: Boolean indicating if Alarm Thread is running.
+        """
+        alarm_thread = self.__alarm_threads.get(alarm.id_)
+        if alarm_thread is not None:
+            # Already set as launched, check if should be stopped or edited
+            if alarm.is_active() is False:
+                self.__detach_alarm_thread_locked(alarm.id_)
+                if stopped_threads is not None:
+                    stopped_threads.append(alarm_thread)
+                return False
+            alarm_thread.edit_alarm(alarm)
+            # It is meant to be scheduled, reschedule it with the new data
+            if self.__scheduler.is_scheduled(alarm_thread) is True:
+                return self.__scheduler.add(alarm_thread)
+
+        # Before thread is (re)scheduled, check if the alarm is active
+        if alarm.is_active() is True:
+            if offset_alert_time is None:
+                offset_alert_time = self.get_offset_alert_time()
+            alarm_thread = AlarmThread(
+                alarm,
+                alarm_callback=self.__alarm_alert,
+                offset_alarm_time=offset_alert_time,
+                offset_callback=functools.partial(
+                    self.__offset_alarm_alert, alarm.id_),
+                clock=self.clock)
+            self.__alarm_threads[alarm.id_] = alarm_thread
+            self.__scheduler.add(alarm_thread)
+            return self.__scheduler.is_scheduled(alarm_thread)
+        return False
 
     def __stop_alarm_thread(self, alarm_id):
         """
-        Stops an AlarmThread and removes item from the threads list.
-        This method can take up to 2 seconds to run.
+        Stops an AlarmThread and removes item from the threads dictionary.
+        This method can take up to 3 seconds to run (if its alert callback is
+        being executed), it must not be called while holding the write lock.
         :param alarm_id: ID of the AlarmItem for the alarm thread to stop.
         :return: Boolean indicating if the operation was successful.
         """
-        success = False
-        for alarm_thread in self.__alarm_threads:
-            if alarm_id == alarm_thread.get_id():
-                alarm_thread.stop()
-                # Check that it has really stopped for a maximum period of 3s
-                milliseconds_passed = 0
-                while alarm_thread.isAlive() and (milliseconds_passed < 3000):
-                    time.sleep(0.01)
-                    milliseconds_passed += 10
-                # isAlive returns False if it has stopped
-                success = not alarm_thread.isAlive()
-                if success is True:
-                    self.__alarm_threads.remove(alarm_thread)
-        return success
+        with self.__threads_lock:
+            alarm_thread = self.__detach_alarm_thread_locked(alarm_id)
+        if alarm_thread is None:
+            return False
+        return self.__join_alarm_threads([alarm_thread], 3)
+
+    def __detach_alarm_thread_locked(self, alarm_id):
+        """
+        Unschedules an AlarmThread and removes it from the threads dictionary,
+        without waiting for a check in progress to finish. The threads lock
+        must be held.
+        :param alarm_id: ID of the AlarmItem for the alarm thread to stop.
+        :return: The AlarmThread stopped, to wait for it with
+                 __join_alarm_threads(), or None if there wasn't one.
+        """
+        alarm_thread = self.__alarm_threads.pop(alarm_id, None)
+        if alarm_thread is not None:
+            self.__scheduler.remove(alarm_thread)
+        return alarm_thread
 
     def __stop_all_alarm_threads(self):
         """
-        Stops all AlarmThreads and removes items from the threads list.
-        This method can take up to 15 seconds to run.
+        Stops all AlarmThreads and removes items from the threads dictionary.
+        This method can take up to 15 seconds to run, it must not be called
+        while holding the write lock.
         :return: Boolean indicating if the operation was successful.
         """
-        for alarm_thread in self.__alarm_threads:
-            alarm_thread.stop()
-
-        # Check, for a max time of 15s, that all threads have really stopped
-        milliseconds_passed = 0
-        continue_trying = True
-        while continue_trying and (milliseconds_passed < 15000):
-            continue_trying = False
-            # Need to iterate backwards in order to remove items safely
-            for i in xrange(len(self.__alarm_threads) - 1, -1, -1):
-                if self.__alarm_threads[i].isAlive() is True:
-                    continue_trying = True
-                else:
-                    del self.__alarm_threads[i]
-            time.sleep(0.01)
-            milliseconds_passed += 10
+        with self.__threads_lock:
+            alarm_threads = self.__detach_all_alarm_threads_locked()
+        return self.__join_alarm_threads(alarm_threads)
 
-        if self.__alarm_threads:
-            return False
-        else:
-            return True
+    def __detach_all_alarm_threads_locked(self):
+        """
+        Unschedules all the AlarmThreads and empties the threads dictionary,
+        without waiting for the checks in progress. The threads lock must be
+        held.
+        :return: List of the AlarmThreads stopped.
+        """
+        alarm_threads = list(self.__alarm_threads.values())
+        self.__alarm_threads.clear()
+        for alarm_thread in alarm_threads:
+            self.__scheduler.remove(alarm_thread)
+        return alarm_threads
+
+    def __join_alarm_threads(self, alarm_threads, timeout=15):
+        """
+        Waits for the checks in progress of unscheduled AlarmThreads to
+        finish, including their deferred alert callbacks. As it can block while
+        an alert callback finishes, no locks should be held. It does not wait
+        from the scheduler threads, as an alert callback can stop its own
+        alarm.
+        :param alarm_threads: Iterable of the unscheduled AlarmThreads.
+        :param timeout: Maximum number of seconds to wait for all of them.
+        :return: Boolean indicating if all the threads have finished.
+        """
+        return self.__scheduler.join(alarm_threads, timeout)
 
     def is_alarm_running(self, alarm_id):
         """
-        Checks if the given alarm ID is running as a thread.
+        Checks if the given alarm ID is running, its thread scheduled.
         :param alarm_id: ID of the AlarmItem for the alarm thread to check.
-        :return:
+        :return: Boolean indicating if the alarm thread is running.
         """
-        for alarm_thread in self.__alarm_threads:
-            if alarm_thread.get_id() == alarm_id:
-                return alarm_thread.isAlive()
-        return False
+        alarm_thread = self.__alarm_threads.get(alarm_id)
+        if alarm_thread is None:
+            return False
+        return self.__scheduler.is_scheduled(alarm_thread)
 
     def get_running_alarms(self):
         """
         Returns a list of all the running alarms (active alarms verified to be
-        running on their own thread).
-        :return: List of AlarmItems that are currently running.
+        scheduled).
+        The alarms loaded from the database for the threads check are reused,
+        so no additional database queries are done.
+        :return: List of AlarmItems that are currently running, sorted by ID.
         """
         # self test and self recovery
-        self.check_threads_state()
+        active_alarms = self.__reconcile_threads()[1]
         alarm_list = []
-        for alarm_thread in self.__alarm_threads:
-            alarm_list.append(AlarmManager.get_alarm(alarm_thread.get_id()))
+        for alarm_id in sorted(active_alarms):
+            if self.is_alarm_running(alarm_id) is True:
+                alarm_list.append(active_alarms[alarm_id])
+        return alarm_list
+
+    def get_live_alarms(self):
+        """
+        Returns the alarm data held by the alarm threads that are scheduled,
+        without checking the database or correcting the threads state. Cheaper
+        than get_running_alarms(), but it will not reflect changes done to the
+        database bypassing the AlarmManager.
+        :return: List of AlarmSnapshots of the scheduled alarm threads,
+                 sorted by ID.
+        """
+        alarm_list = []
+        with self.__threads_lock:
+            alarm_threads = sorted(self.__alarm_threads.items())
+        for alarm_id, alarm_thread in alarm_threads:
+            if self.__scheduler.is_scheduled(alarm_thread) is True:
+                alarm_list.append(alarm_thread.get_alarm())
         return alarm_list
 
     def check_threads_state(self):
@@ -490,40 +1420,176 @@ class AlarmManager(object):
         Retrieves all the alarms and checks if the are running or not as they
         should. Tries to correct any possible errors, and if it can't it prints
         an error into stderr.
+        The set of active alarm IDs is compared with the set of thread IDs, so
+        it runs in linear time with the number of alarms.
         :return: Boolean indicating if everything was running correctly before
                  the method was called.
         """
-        previously_correct = True
-        running_counter = 0
-        all_alarms = AlarmManager.get_all_alarms()
-        for alarm in all_alarms:
-            if alarm.is_active() is True:
-                # This alarm should be running
-                running_counter += 1
-                if self.is_alarm_running(alarm.id_) is False:
-                    self.__set_alarm_thread(alarm)
-                    previously_correct = False
-            else:
-                # This alarm should not be running
-                if self.is_alarm_running(alarm.id_) is True:
-                    self.__stop_alarm_thread(alarm.id_)
-                    previously_correct = False
+        return self.__reconcile_threads()[0]
 
-        # Check we have as many threads as expected
-        if len(self.__alarm_threads) != running_counter:
-            previously_correct = False
-            # We can only attempt to recover if there are extra threads not
-            # meant to be running
-            for alarm_thread in self.__alarm_threads:
-                for alarm in all_alarms:
-                    if alarm.id_ == alarm_thread.get_id():
-                        break
-                else:
-                    self.__stop_alarm_thread(alarm_thread.get_id())
+    def __reconcile_threads(self):
+        """
+        Implementation of check_threads_state(). It waits for the alarms
+        deferred on startup to be launched. The threads stopped are waited for
+        once the locks are released.
+        :return: Tuple with a boolean indicating if everything was running
+                 correctly before the method was called, and a dictionary with
+                 the active AlarmItems loaded from the database, keyed by ID.
+        """
+        self.__armed.wait()
+        stopped_threads = []
+        with self.__rw_lock.write_locked(), self.__threads_lock:
+            # Revision read before loading, a change during the load will be
+            # picked up on the next reconciliation
+            revision = self.alarmdb.get_revision()
+            previously_correct = True
+            threads_started = 0
+            threads_stopped = 0
+            active_alarms = {}
+            for alarm in self.get_all_alarms():
+                if alarm.is_active() is True:
+                    active_alarms[alarm.id_] = alarm
 
-            if len(self.__alarm_threads) != running_counter:
-                print('ERROR: Could not correct the alarm threads in' +
+            # Threads not meant to be running: deleted or inactive alarms
+            for alarm_id in set(self.__alarm_threads) - set(active_alarms):
+                previously_correct = False
+                stopped_threads.append(
+                    self.__detach_alarm_thread_locked(alarm_id))
+                threads_stopped += 1
+
+            # Active alarms without a running thread
+            for alarm_id, alarm in active_alarms.items():
+                if self.is_alarm_running(alarm_id) is False:
+                    previously_correct = False
+                    if self.__set_alarm_thread_locked(alarm) is True:
+                        threads_started += 1
+
+            if set(self.__alarm_threads) != set(active_alarms):
+                print('ERROR: Could not correct the alarm threads in ' +
                       'self.check_threads_state !',
                       file=sys.stderr)
 
+            self.__reconciled_revision = revision
+            metrics = self.__reconciler_metrics
+            metrics['reconciliations'] += 1
+            if previously_correct is False:
+                metrics['drift'] += 1
+            metrics['threads_started'] += threads_started
+            metrics['threads_stopped'] += threads_stopped
+
+        self.__join_alarm_threads(stopped_threads)
+        return previously_correct, active_alarms
+
+    #
+    # Background reconciler
+    #
+    def reconcile_threads(self):
+        """
+        Incremental version of check_threads_state(). The alarms are only
+        loaded and compared with the threads if the database revision has
+        changed since the last reconciliation, or if any thread is no longer
+        scheduled (e.g. its alert check failed).
+        Only database changes done from this process change the revision.
+        :return: Boolean indicating if everything was running correctly before
+                 the method was called, or None if the check was skipped.
+        """
+        start_time = time.time()
+        with self.__threads_lock:
+            metrics = self.__reconciler_metrics
+            metrics['checks'] += 1
+            all_alive = all(self.__scheduler.is_scheduled(alarm_thread)
+                            for alarm_thread in self.__alarm_threads.values())
+            skip = all_alive is True and self.__reconciled_revision == \
+                self.alarmdb.get_revision()
+            if skip is True:
+                metrics['skipped'] += 1
+        # The threads lock is released to take the write lock first
+        if skip is True:
+            previously_correct = None
+        else:
+            previously_correct = self.__reconcile_threads()[0]
+        with self.__threads_lock:
+            metrics['last_check'] = start_time
+            metrics['last_duration'] = time.time() - start_time
         return previously_correct
+
+    def shutdown(self):
+        """
+        Stops the background reconciler and all the alarm threads of this
+        instance, e.g. before discarding it. It waits for the deferred startup
+        threads to be launched first, so they are stopped as well.
+        This method can take up to 30 seconds to run.
+        :return: Boolean indicating if everything has stopped.
+        """
+        self.__armed.wait(15)
+        reconciler_stopped = self.stop_reconciler()
+        return self.__stop_all_alarm_threads() and reconciler_stopped
+
+    def __reconciler_loop(self, interval):
+        """
+        Background reconciler thread loop, it runs reconcile_threads() every
+        interval until stop_reconciler() is called.
+        :param interval: Number of seconds between checks.
+        """
+        while not self.__reconciler_stop.wait(interval):
+            try:
+                self.reconcile_threads()
+            except Exception as e:
+                print('ERROR: Alarm threads reconciler failed: %s' % e,
+                      file=sys.stderr)
+
+    def start_reconciler(self, interval=60):
+        """
+        Launches a background thread that periodically checks the alarm
+        threads are running as they should, correcting them if not, see
+        reconcile_threads(). It replaces the reconciler if already running.
+        :param interval: Number of seconds between checks.
+        :return: Boolean indicating if the reconciler is running.
+        """
+        self.stop_reconciler()
+        self.__reconciler_stop.clear()
+        self.__reconciler = threading.Thread(
+            target=self.__reconciler_loop, args=(interval,))
+        self.__reconciler.daemon = True
+        self.__reconciler.start()
+        return self.__reconciler.isAlive()
+
+    def stop_reconciler(self):
+        """
+        Stops the background reconciler thread, if running.
+        :return: Boolean indicating if the reconciler has stopped.
+        """
+        reconciler = self.__reconciler
+        if reconciler is None:
+            return True
+        self.__reconciler_stop.set()
+        reconciler.join(15)
+        if reconciler.isAlive() is False:
+            self.__reconciler = None
+            return True
+        return False
+
+    def is_reconciler_running(self):
+        """
+        :return: Boolean indicating if the background reconciler is running.
+        """
+        reconciler = self.__reconciler
+        return reconciler is not None and reconciler.isAlive()
+
+    def get_reconciler_metrics(self):
+        """
+        Returns the metrics of the threads reconciliation:
+            checks: Number of reconcile_threads() calls.
+            skipped: Number of checks skipped as nothing had changed.
+            reconciliations: Number of times the alarms have been compared with
+                             the threads (including check_threads_state()).
+            drift: Number of reconciliations that found threads not running as
+                   they should.
+            threads_started: Number of alarm threads launched to correct them.
+            threads_stopped: Number of alarm threads stopped to correct them.
+            last_check: Time, in seconds since 1970, of the last check.
+            last_duration: Duration, in seconds, of the last check.
+        :return: Dictionary with a copy of the metrics.
+        """
+        with self.__threads_lock:
+            return dict(self.__reconciler_metrics)
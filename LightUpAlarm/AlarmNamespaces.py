@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# Class to manage the alarms of several namespaces in the same process.
+#
+# Copyright (c) 2015 carlosperate http://carlosperate.github.io
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# Each namespace (e.g. a room or a profile) has its own alarms, settings,
+# snoozes and alert callbacks, managed by an AlarmManager instance created
+# with the namespace. All the namespaces share the database connection, the
+# events hub, the alarms scheduler thread and a single background reconciler
+# thread, instead of running them per namespace.
+#
+from __future__ import unicode_literals, absolute_import, print_function
+import sys
+import threading
+try:
+    from LightUpAlarm.AlarmDb import AlarmDb
+    from LightUpAlarm.AlarmManager import AlarmManager
+except ImportError:
+    from AlarmDb import AlarmDb
+    from AlarmManager import AlarmManager
+
+
+class AlarmNamespaces(object):
+    """
+    Registry of the AlarmManager instances of each namespace.
+    """
+
+    #
+    # metaclass methods
+    #
+    def __init__(self, reconcile_interval=None, arming_window=None):
+        """
+        AlarmNamespaces initialiser.
+        :param reconcile_interval: Optional number of seconds between checks of
+                                   the shared background reconciler, see
+                                   start_reconciler(). Not started if None.
+        :param arming_window: Optional number of minutes passed to each
+                              AlarmManager, to defer the scheduling of the
+                              alarms that will not alert soon.
+        """
+        self.__arming_window = arming_window
+        # AlarmManager instances keyed by the namespace name
+        self.__managers = {}
+        self.__lock = threading.Lock()
+        self.__reconciler = None
+        self.__reconciler_stop = threading.Event()
+        if reconcile_interval is not None:
+            self.start_reconciler(reconcile_interval)
+
+    def __len__(self):
+        """ Returns the number of namespaces. """
+        with self.__lock:
+            return len(self.__managers)
+
+    def __contains__(self, namespace):
+        """ Checks if a namespace has been added. """
+        with self.__lock:
+            return namespace in self.__managers
+
+    #
+    # member methods
+    #
+    def add(self, namespace, alert_callback=None, offset_alert_callback=None):
+        """
+        Creates the AlarmManager of a namespace, scheduling its alarms.
+        :param namespace: Alphanumeric string with the namespace name, or None
+                          for the default alarms.
+        :param alert_callback: Optional callback function to be executed on
+                               an alarm alert of this namespace.
+        :param offset_alert_callback: Optional callback function to be executed
+                                      on an offset alert of this namespace.
+        :return: AlarmManager instance of the namespace. None if the namespace
+                 name is not valid or it had already been added.
+        """
+        if namespace is not None and not AlarmDb.is_valid_namespace(namespace):
+            print('ERROR: The namespace "%s" is not valid, it can only ' %
+                  namespace + 'contain letters and numbers !',
+                  file=sys.stderr)
+            return None
+        with self.__lock:
+            if namespace in self.__managers:
+                print('ERROR: The alarms namespace "%s" has already been ' %
+                      namespace + 'added !', file=sys.stderr)
+                return None
+            alarm_mgr = AlarmManager(
+                alert_callback=alert_callback,
+                offset_alert_callback=offset_alert_callback,
+                arming_window=self.__arming_window, namespace=namespace)
+            self.__managers[namespace] = alarm_mgr
+        return alarm_mgr
+
+    def get(self, namespace):
+        """
+        Gets the AlarmManager of a namespace.
+        :param namespace: Name of the namespace.
+        :return: AlarmManager instance, or None if the namespace has not been
+                 added.
+        """
+        with self.__lock:
+            return self.__managers.get(namespace)
+
+    def remove(self, namespace):
+        """
+        Removes a namespace and unschedules its alarms. Its alarms are kept in
+        the database.
+        :param namespace: Name of the namespace.
+        :return: Boolean indicating if the namespace was removed and all its
+                 threads stopped.
+        """
+        with self.__lock:
+            alarm_mgr = self.__managers.pop(namespace, None)
+        if alarm_mgr is None:
+            return False
+        return alarm_mgr.shutdown()
+
+    def get_namespaces(self):
+        """
+        :return: Sorted list with the names of the added namespaces.
+        """
+        with self.__lock:
+            return sorted(self.__managers,
+                          key=lambda namespace: namespace or '')
+
+    def reconcile_threads(self):
+        """
+        Runs the incremental threads check of every namespace, see
+        AlarmManager.reconcile_threads().
+        :return: Dictionary keyed by the namespace with the result of each
+                 check.
+        """
+        with self.__lock:
+            managers = list(self.__managers.items())
+        results = {}
+        for namespace, alarm_mgr in managers:
+            try:
+                results[namespace] = alarm_mgr.reconcile_threads()
+            except Exception as e:
+                print('ERROR: Alarm threads reconciler of the namespace ' +
+                      '"%s" failed: %s' % (namespace, e), file=sys.stderr)
+                results[namespace] = False
+        return results
+
+    def shutdown(self):
+        """
+        Stops the shared reconciler and removes all the namespaces.
+        :return: Boolean indicating if all the threads have stopped.
+        """
+        results = [self.stop_reconciler()]
+        for namespace in self.get_namespaces():
+            results.append(self.remove(namespace))
+        return all(results)
+
+    #
+    # Shared reconciler
+    #
+    def __reconciler_loop(self, interval):
+        """
+        Background reconciler thread loop, it runs reconcile_threads() every
+        interval until stop_reconciler() is called.
+        :param interval: Number of seconds between checks.
+        """
+        while not self.__reconciler_stop.wait(interval):
+            self.reconcile_threads()
+
+    def start_reconciler(self, interval=60):
+        """
+        Launches a single background thread that periodically reconciles the
+        alarm threads of all the namespaces. It replaces the reconciler if
+        already running.
+        :param interval: Number of seconds between checks.
+        :return: Boolean indicating if the reconciler is running.
+        """
+        self.stop_reconciler()
+        self.__reconciler_stop.clear()
+        self.__reconciler = threading.Thread(
+            target=self.__reconciler_loop, args=(interval,))
+        self.__reconciler.daemon = True
+        self.__reconciler.start()
+        return self.__reconciler.isAlive()
+
+    def stop_reconciler(self):
+        """
+        Stops the shared background reconciler thread, if running.
+        :return: Boolean indicating if the reconciler has stopped.
+        """
+        reconciler = self.__reconciler
+        if reconciler is None:
+            return True
+        self.__reconciler_stop.set()
+        reconciler.join(15)
+        if reconciler.isAlive() is False:
+            self.__reconciler = None
+            return True
+        return False
+
+    def is_reconciler_running(self):
+        """
+        :return: Boolean indicating if the shared reconciler is running.
+        """
+        reconciler = self.__reconciler
+        return reconciler is not None and reconciler.isAlive()
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+#
+# Class to run the alert checks of many alarms from a single thread.
+#
+# Copyright (c) 2015 carlosperate http://carlosperate.github.io
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# Instead of a thread per alarm waking up every second, the scheduler keeps a
+# heap with the time each alarm has to be checked next, and its thread sleeps
+# until the first one is due. It is shared by the AlarmManager instances of
+# all the namespaces, so a process with hundreds of namespaces still runs a
+# single thread for all their alarms. The alert callbacks are handed over to
+# a second thread, so a slow callback (e.g. one driving the hardware) does not
+# delay the alerts of the other alarms.
+#
+from __future__ import unicode_literals, absolute_import, print_function
+import sys
+import time
+import heapq
+import atexit
+import itertools
+import threading
+import collections
+
+
+class AlarmScheduler(object):
+    """
+    Runs the alert checks of the scheduled entries from a single thread. An
+    entry is any object with the AlarmThread methods:
+        check_alerts(): Executes the alerts due at the current time.
+        get_next_check_time(): Returns the time check_alerts() has to be
+                               called next, or None if there is nothing to
+                               alert.
+    The entries are checked at their time in order from the scheduler thread,
+    so their checks should return quickly, and hand any slow work (as the
+    alert callbacks) over to defer(), which runs it in order from a callbacks
+    thread. An entry that raises an exception is unscheduled, as a thread would
+    have died.
+    """
+
+    # Maximum number of seconds between the time reads of the scheduler
+    # thread, so that clock changes are picked up
+    max_wait = 60
+
+    # Seconds between the time reads with a clock other than the time module,
+    # as the time of a VirtualClock can be advanced at any moment
+    poll_interval = 0.05
+
+    #
+    # metaclass methods
+    #
+    def __init__(self, clock=None):
+        """
+        AlarmScheduler initialiser. The threads are only launched when the
+        first entry is scheduled and the first call is deferred.
+        :param clock: Optional clock with the time module interface, the time
+                      module is used if None. It has to be the clock of the
+                      entries.
+        """
+        if clock is None:
+            clock = time
+        self.__clock = clock
+        self.__condition = threading.Condition(threading.Lock())
+        # Generation of each scheduled entry, increased every time it is
+        # rescheduled, so the older heap items are discarded
+        self.__entries = {}
+        # Heap of (check time, sequence, entry, generation) tuples, the
+        # sequence avoids comparing the entries with the same check time
+        self.__heap = []
+        self.__sequence = itertools.count()
+        # Entry being checked by the scheduler thread
+        self.__running = None
+        self.__last_time = None
+        self.__stopped = False
+        self.__thread = None
+        # Queue of (entry, function, args) deferred calls, the entry whose call
+        # is being executed, and the thread executing them
+        self.__callbacks = collections.deque()
+        self.__callback_running = None
+        self.__callback_thread = None
+        # The threads are stopped on exit, as their timed waits fail if they
+        # are still running while the interpreter tears down the modules
+        atexit.register(self.stop, 1)
+
+    def __len__(self):
+        """ Returns the number of scheduled entries. """
+        with self.__condition:
+            return len(self.__entries)
+
+    #
+    # member methods
+    #
+    def add(self, entry):
+        """
+        Schedules an entry, or reschedules it if it was already scheduled. It
+        has to be called after any change of the entry data (e.g. an alarm
+        edit or snooze), to recalculate its check time.
+        :param entry: Entry to schedule, see the class docstring.
+        :return: Boolean indicating if the entry is scheduled.
+        """
+        with self.__condition:
+            if self.__stopped is True:
+                return False
+            self.__push_locked(entry, self.__entries.get(entry, 0) + 1)
+            self.__condition.notify_all()
+            if self.__thread is None or self.__thread.isAlive() is False:
+                self.__thread = threading.Thread(target=self.__run)
+                self.__thread.daemon = True
+                self.__thread.start()
+        return True
+
+    def remove(self, entry):
+        """
+        Unschedules an entry. If it is being checked it finishes its check,
+        see join().
+        :param entry: Entry to unschedule.
+        :return: Boolean indicating if the entry was scheduled.
+        """
+        with self.__condition:
+            return self.__entries.pop(entry, None) is not None
+
+    def is_scheduled(self, entry):
+        """
+        :param entry: Entry to check.
+        :return: Boolean indicating if the entry is scheduled and the
+                 scheduler thread is running.
+        """
+        with self.__condition:
+            return entry in self.__entries and self.__thread is not None and \
+                self.__thread.isAlive()
+
+    def defer(self, function, *args):
+        """
+        Executes a function from the callbacks thread, after the ones deferred
+        before it, so it does not delay the checks of the other entries. Called
+        during a check it is attributed to the entry being checked, see join().
+        :param function: Function to execute.
+        :param args: Arguments of the function.
+        :return: Boolean indicating if the function has been queued, False if
+                 the scheduler has been stopped.
+        """
+        with self.__condition:
+            if self.__stopped is True:
+                return False
+            entry = None
+            if threading.current_thread() is self.__thread:
+                entry = self.__running
+            self.__callbacks.append((entry, function, args))
+            self.__condition.notify_all()
+            if self.__callback_thread is None or \
+                    self.__callback_thread.isAlive() is False:
+                self.__callback_thread = threading.Thread(
+                    target=self.__run_callbacks)
+                self.__callback_thread.daemon = True
+                self.__callback_thread.start()
+        return True
+
+    def join(self, entries, timeout=None):
+        """
+        Waits for the checks in progress of the given entries, and the calls
+        they have deferred, to finish, e.g. after removing them. It does not
+        wait when called from the scheduler or callbacks threads, as an alert
+        callback can remove its own entry.
+        :param entries: Iterable of entries.
+        :param timeout: Optional maximum number of seconds to wait.
+        :return: Boolean indicating if none of the entries is being checked.
+        """
+        entries = list(entries)
+        if threading.current_thread() in (self.__thread,
+                                          self.__callback_thread):
+            return True
+        deadline = None if timeout is None else time.time() + timeout
+        with self.__condition:
+            while self.__is_busy_locked(entries):
+                if deadline is None:
+                    self.__condition.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self.__condition.wait(remaining)
+        return True
+
+    def stop(self, timeout=None):
+        """
+        Unschedules all the entries and stops the scheduler and callbacks
+        threads, it cannot be used afterwards.
+        :param timeout: Optional maximum number of seconds to wait for the
+                        threads to finish.
+        :return: Boolean indicating if the threads have finished. The pending
+                 deferred calls are discarded, the one in progress finishes.
+        """
+        with self.__condition:
+            self.__stopped = True
+            self.__entries.clear()
+            self.__heap = []
+            self.__callbacks.clear()
+            self.__condition.notify_all()
+            threads = [thread for thread in (self.__thread,
+                                             self.__callback_thread)
+                       if thread is not None and
+                       thread is not threading.current_thread()]
+        deadline = None if timeout is None else time.time() + timeout
+        for thread in threads:
+            if deadline is None:
+                thread.join()
+            else:
+                thread.join(max(deadline - time.time(), 0))
+        return all(thread.isAlive() is False for thread in threads)
+
+    #
+    # scheduler thread
+    #
+    def __push_locked(self, entry, generation):
+        """
+        Sets the generation of an entry and adds its next check to the heap.
+        The lock must be held.
+        :param entry: Entry to schedule.
+        :param generation: Integer with the new generation of the entry.
+        """
+        self.__entries[entry] = generation
+        check_time = entry.get_next_check_time()
+        if check_time is not None:
+            heapq.heappush(self.__heap, (check_time, next(self.__sequence),
+                                         entry, generation))
+
+    def __is_busy_locked(self, entries):
+        """
+        The lock must be held.
+        :param entries: List of entries.
+        :return: Boolean indicating if any of the entries is being checked, or
+                 has a deferred call pending or in progress.
+        """
+        if self.__running is not None and self.__running in entries:
+            return True
+        if self.__callback_running is not None and \
+                self.__callback_running in entries:
+            return True
+        return any(entry is not None and entry in entries
+                   for entry, _, _ in self.__callbacks)
+
+    def __next_due_locked(self):
+        """
+        Waits until the first entry is due. The lock must be held.
+        :return: Entry to check, or None if the scheduler has been stopped.
+        """
+        while self.__stopped is False:
+            now = self.__clock.time()
+            if self.__last_time is not None and now < self.__last_time:
+                # The clock has gone back, all the check times are recalculated
+                self.__heap = []
+                for entry, generation in list(self.__entries.items()):
+                    self.__push_locked(entry, generation + 1)
+            self.__last_time = now
+
+            # Discard the items of unscheduled or rescheduled entries
+            heap = self.__heap
+            while heap and self.__entries.get(heap[0][2]) != heap[0][3]:
+                heapq.heappop(heap)
+            if heap and heap[0][0] <= now:
+                return heapq.heappop(heap)[2]
+
+            timeout = self.max_wait
+            if heap:
+                timeout = min(timeout, heap[0][0] - now)
+            if self.__clock is not time:
+                timeout = min(timeout, self.poll_interval)
+            self.__condition.wait(timeout)
+        return None
+
+    def __run(self):
+        """
+        Scheduler thread loop, checks each entry at its time and schedules its
+        next check, until stop() is called.
+        """
+        while True:
+            with self.__condition:
+                entry = self.__next_due_locked()
+                if entry is None:
+                    return
+                self.__running = entry
+            try:
+                entry.check_alerts()
+                failed = False
+            except Exception as e:
+                print('ERROR: The alert check of %s failed, it has been ' %
+                      entry + 'unscheduled: %s' % e, file=sys.stderr)
+                failed = True
+            with self.__condition:
+                self.__running = None
+                generation = self.__entries.get(entry)
+                if generation is not None:
+                    if failed is True:
+                        del self.__entries[entry]
+                    else:
+                        self.__push_locked(entry, generation + 1)
+                self.__condition.notify_all()
+
+    def __run_callbacks(self):
+        """
+        Callbacks thread loop, executes the deferred calls in order until
+        stop() is called. A call raising an exception is reported, its entry
+        stays scheduled.
+        """
+        while True:
+            with self.__condition:
+                while self.__stopped is False and not self.__callbacks:
+                    self.__condition.wait(self.max_wait)
+                if self.__stopped is True:
+                    return
+                entry, function, args = self.__callbacks.popleft()
+                self.__callback_running = entry
+            try:
+                function(*args)
+            except Exception as e:
+                print('ERROR: The deferred call %s of %s failed: %s' %
+                      (function, entry, e), file=sys.stderr)
+            with self.__condition:
+                self.__callback_running = None
+                self.__condition.notify_all()
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+#
+# Class to store a group of alarms in columns for batch time calculations.
+#
+# Copyright (c) 2015 carlosperate http://carlosperate.github.io
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# The alarm data is kept as one column per field (id, hour, minute, weekday
+# bitmask and enabled state) so that the time to the next alert of every alarm
+# can be calculated in a single pass. If NumPy is installed the columns are
+# NumPy arrays and the calculations are vectorised, otherwise it falls back to
+# plain Python lists with the same results.
+#
+from __future__ import unicode_literals, absolute_import, print_function
+import heapq
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional, the pure Python implementation is used instead
+    numpy = None
+try:
+    from LightUpAlarm.AlarmItem import AlarmItem
+    from LightUpAlarm.Py23Compatibility import *
+except ImportError:
+    from AlarmItem import AlarmItem
+    from Py23Compatibility import *
+
+
+class AlarmSet(object):
+    """
+    Columnar container for a group of AlarmItems, with the following columns.
+        ids: AlarmItem IDs.
+        hours: Hour values of the alarms.
+        minutes: Minute values of the alarms.
+        days_masks: Repeat weekdays bitmasks, Monday is bit 0.
+        enabled: Enabled state of the alarms.
+    The AlarmItem instances are also kept, in the same order, to be returned by
+    the query methods.
+    """
+
+    # Value used for alarms that will never alert (disabled or without repeat
+    # days), larger than any possible time to alert (under 7 days)
+    no_alert = 7 * 1440
+
+    # Index of the lowest set bit for each 7 bit value, 0 has no set bit
+    __lowest_bit = tuple(
+        ((value & -value).bit_length() - 1) if value else 0
+        for value in xrange(128))
+
+    #
+    # metaclass methods
+    #
+    def __init__(self, alarms=()):
+        """
+        AlarmSet initialiser. Creates the data columns from the input alarms.
+        :param alarms: Iterable of AlarmItems.
+        """
+        self.__alarms = list(alarms)
+        self.__use_numpy = numpy is not None
+        ids = [alarm.id_ for alarm in self.__alarms]
+        hours = [alarm.hour for alarm in self.__alarms]
+        minutes = [alarm.minute for alarm in self.__alarms]
+        days_masks = [alarm.days_mask for alarm in self.__alarms]
+        enabled = [alarm.enabled for alarm in self.__alarms]
+        if self.__use_numpy is True:
+            self.ids = numpy.array(
+                [-1 if id_ is None else id_ for id_ in ids], dtype=numpy.int64)
+            self.hours = numpy.array(hours, dtype=numpy.int32)
+            self.minutes = numpy.array(minutes, dtype=numpy.int32)
+            self.days_masks = numpy.array(days_masks, dtype=numpy.int32)
+            self.enabled = numpy.array(enabled, dtype=numpy.bool_)
+            self.__lowest_bit_array = numpy.array(
+                AlarmSet.__lowest_bit, dtype=numpy.int32)
+        else:
+            self.ids = ids
+            self.hours = hours
+            self.minutes = minutes
+            self.days_masks = days_masks
+            self.enabled = enabled
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Creates an AlarmSet directly from the AlarmDb 'alarms' table rows.
+        :param rows: Iterable of dictionary-like database rows.
+        :return: AlarmSet instance.
+        """
+        return cls([AlarmItem.from_row(row) for row in rows])
+
+    def __len__(self):
+        return len(self.__alarms)
+
+    def get_alarms(self):
+        """
+        :return: List with the AlarmItems of the set, in the set order.
+        """
+        return list(self.__alarms)
+
+    #
+    # member methods to calculate time
+    #
+    def minutes_to_alert(self, hour, minute, weekday):
+        """
+        Calculates, for every alarm in the set, the time in minutes that will
+        elapse from the reference time and weekday until its next alert.
+        Uses the same calculation as AlarmItem.minutes_to_alert().
+        :param hour: start hour, value 0-23.
+        :param minute: start minute, value 0-59.
+        :param weekday: start weekday, value 0-6.
+        :return: NumPy array, or list if NumPy is not available, with the
+                 minutes to alert for each alarm, in the same order as the
+                 alarms. Alarms that are disabled or do not repeat any day are
+                 set to AlarmSet.no_alert.
+        """
+        ref_day_minute = minute + (hour * 60)
+        if self.__use_numpy is True:
+            alarm_day_minute = self.minutes + (self.hours * 60)
+            rotated = ((self.days_masks >> weekday) |
+                       (self.days_masks << (7 - weekday))) & 0x7F
+            passed = alarm_day_minute < ref_day_minute
+            rotated = numpy.where(
+                passed, (rotated >> 1) | ((rotated & 1) << 6), rotated)
+            lowest_bit = self.__lowest_bit_array[rotated]
+            minutes_to_alert = ((lowest_bit + passed) * 1440) + \
+                alarm_day_minute - ref_day_minute
+            active = self.enabled & (self.days_masks != 0)
+            return numpy.where(active, minutes_to_alert, AlarmSet.no_alert)
+        else:
+            lowest_bit = AlarmSet.__lowest_bit
+            minutes_to_alert = []
+            for i in xrange(len(self.__alarms)):
+                days_mask = self.days_masks[i]
+                if self.enabled[i] is not True or days_mask == 0:
+                    minutes_to_alert.append(AlarmSet.no_alert)
+                    continue
+                alarm_day_minute = self.minutes[i] + (self.hours[i] * 60)
+                rotated = ((days_mask >> weekday) |
+                           (days_mask << (7 - weekday))) & 0x7F
+                day_count = 0
+                if alarm_day_minute < ref_day_minute:
+                    rotated = (rotated >> 1) | ((rotated & 1) << 6)
+                    day_count = 1
+                day_count += lowest_bit[rotated]
+                minutes_to_alert.append(
+                    (day_count * 1440) + alarm_day_minute - ref_day_minute)
+            return minutes_to_alert
+
+    def next_alarm(self, hour, minute, weekday):
+        """
+        Finds the next active alarm to alert from the reference time.
+        If several alarms alert at the same time the first one in the set is
+        returned.
+        :param hour: start hour, value 0-23.
+        :param minute: start minute, value 0-59.
+        :param weekday: start weekday, value 0-6.
+        :return: Tuple with the AlarmItem and its minutes to alert, or None if
+                 there are no active alarms.
+        """
+        if not self.__alarms:
+            return None
+        minutes_to_alert = self.minutes_to_alert(hour, minute, weekday)
+        if self.__use_numpy is True:
+            index = int(numpy.argmin(minutes_to_alert))
+        else:
+            index = min(xrange(len(minutes_to_alert)),
+                        key=minutes_to_alert.__getitem__)
+        minutes = int(minutes_to_alert[index])
+        if minutes == AlarmSet.no_alert:
+            return None
+        return self.__alarms[index], minutes
+
+    def next_alarms(self, number, hour, minute, weekday):
+        """
+        Finds the given number of active alarms that will alert first from the
+        reference time, without sorting the whole set.
+        If several alarms alert at the same time they keep the set order.
+        :param number: Integer, maximum number of alarms to return.
+        :param hour: start hour, value 0-23.
+        :param minute: start minute, value 0-59.
+        :param weekday: start weekday, value 0-6.
+        :return: List of tuples with the AlarmItem and its minutes to alert,
+                 sorted by alert time. It has fewer items than requested if
+                 there are not enough active alarms.
+        """
+        if number < 1 or not self.__alarms:
+            return []
+        minutes_to_alert = self.minutes_to_alert(hour, minute, weekday)
+        if self.__use_numpy is True:
+            number = min(number, len(self.__alarms))
+            kth_minutes = numpy.partition(minutes_to_alert, number - 1)[
+                number - 1]
+            indexes = numpy.nonzero(minutes_to_alert <= kth_minutes)[0]
+            indexes = indexes[numpy.argsort(
+                minutes_to_alert[indexes], kind='mergesort')][:number]
+        else:
+            indexes = heapq.nsmallest(number, xrange(len(minutes_to_alert)),
+                                      key=minutes_to_alert.__getitem__)
+        return [(self.__alarms[i], int(minutes_to_alert[i])) for i in indexes
+                if minutes_to_alert[i] != AlarmSet.no_alert]
+
+    def alarms_within(self, time_window, hour, minute, weekday):
+        """
+        Finds all the active alarms that will alert within the given number of
+        minutes from the reference time.
+        :param time_window: Integer, number of minutes to look ahead.
+        :param hour: start hour, value 0-23.
+        :param minute: start minute, value 0-59.
+        :param weekday: start weekday, value 0-6.
+        :return: List of tuples with the AlarmItem and its minutes to alert,
+                 sorted by alert time.
+        """
+        minutes_to_alert = self.minutes_to_alert(hour, minute, weekday)
+        if self.__use_numpy is True:
+            indexes = numpy.nonzero(
+                (minutes_to_alert <= time_window) &
+                (minutes_to_alert != AlarmSet.no_alert))[0]
+            indexes = indexes[
+                numpy.argsort(minutes_to_alert[indexes], kind='mergesort')]
+            return [(self.__alarms[i], int(minutes_to_alert[i]))
+                    for i in indexes]
+        else:
+            within = [(self.__alarms[i], minutes)
+                      for i, minutes in enumerate(minutes_to_alert)
+                      if minutes <= time_window and
+                      minutes != AlarmSet.no_alert]
+            return sorted(within, key=lambda item: item[1])
+
+    def alarms_per_hour(self):
+        """
+        Counts the number of active alarms set for each hour of the day.
+        :return: List of 24 integers, the first item is for 00:xx.
+        """
+        if self.__use_numpy is True:
+            active = self.enabled & (self.days_masks != 0)
+            return numpy.bincount(
+                self.hours[active], minlength=24).tolist()
+        else:
+            histogram = [0] * 24
+            for i in xrange(len(self.__alarms)):
+                if self.enabled[i] is True and self.days_masks[i] != 0:
+                    histogram[self.hours[i]] += 1
+            return histogram
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+#
+# Class to replay the alarm alerts faster than real time.
+#
+# Copyright (c) 2015 carlosperate http://carlosperate.github.io
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# The simulation uses the same AlarmThread alert checks as the running alarms,
+# but instead of running the threads it steps them minute by minute from the
+# current thread with a VirtualClock. A week of alarms is replayed in well
+# under a second, and the resulting event log only depends on the alarms, the
+# settings and the start time.
+#
+from __future__ import unicode_literals, absolute_import, print_function
+import time
+import functools
+try:
+    from LightUpAlarm.AlarmItem import AlarmItem
+    from LightUpAlarm.AlarmThread import AlarmThread
+    from LightUpAlarm.VirtualClock import VirtualClock
+except ImportError:
+    from AlarmItem import AlarmItem
+    from AlarmThread import AlarmThread
+    from VirtualClock import VirtualClock
+
+
+class AlarmSimulation(object):
+    """
+    Replays the alerts of a list of alarms over a period of virtual time. The
+    event log is a list of tuples with:
+        time: Virtual time of the event, in seconds since 1970.
+        event: AlarmItem.alarm_kind or AlarmItem.offset_kind for the alerts,
+               or the hardware procedure name from the hardware timeline.
+        alarm_id: ID of the alarm that caused the event.
+    The events are sorted by time, events at the same time are kept in the
+    order they were produced.
+    """
+
+    #
+    # metaclass methods
+    #
+    def __init__(self, alarms, offset_alert_time=None, hardware_timeline=None,
+                 hardware_trigger=AlarmItem.offset_kind):
+        """
+        AlarmSimulation initialiser.
+        :param alarms: Iterable of AlarmItems, only the active ones alert.
+        :param offset_alert_time: Optional offset alert time, in minutes.
+        :param hardware_timeline: Optional list of (seconds, procedure name)
+                                  tuples (e.g. HardwareThread.get_timeline())
+                                  to log after each hardware trigger alert.
+        :param hardware_trigger: Alert kind that launches the hardware
+                                 timeline, the offset alert by default.
+        """
+        self.__alarms = [alarm.snapshot() for alarm in alarms]
+        self.__offset_alert_time = offset_alert_time
+        if hardware_timeline is None:
+            hardware_timeline = []
+        self.__hardware_timeline = list(hardware_timeline)
+        self.__hardware_trigger = hardware_trigger
+        self.__clock = None
+        self.__log = []
+
+    #
+    # member methods
+    #
+    def run(self, start_time=None, days=7):
+        """
+        Replays the alerts from the start time for the given number of days.
+        :param start_time: Optional time to start from, in seconds since 1970,
+                           the current time if None. It is rounded down to the
+                           minute.
+        :param days: Number of days to simulate.
+        :return: List with the event log, see the class docstring.
+        """
+        if start_time is None:
+            start_time = time.time()
+        start_time = int(start_time) - (int(start_time) % 60)
+        end_time = start_time + (days * 24 * 60 * 60)
+        self.__clock = VirtualClock(start_time, auto_advance=True)
+        self.__log = []
+
+        alarm_threads = [
+            AlarmThread(
+                alarm,
+                alarm_callback=functools.partial(
+                    self.__alert, AlarmItem.alarm_kind, alarm.id_),
+                offset_alarm_time=self.__offset_alert_time,
+                offset_callback=functools.partial(
+                    self.__alert, AlarmItem.offset_kind, alarm.id_),
+                clock=self.__clock)
+            for alarm in self.__alarms if alarm.is_active() is True]
+
+        # The alerts only depend on the minute, so check once per minute
+        while self.__clock.time() < end_time:
+            for alarm_thread in alarm_threads:
+                alarm_thread.check_alerts()
+            self.__clock.sleep(60)
+
+        self.__log = [event for event in self.__log if event[0] < end_time]
+        self.__log.sort(key=lambda event: event[0])
+        return list(self.__log)
+
+    def get_log(self):
+        """
+        :return: List with the event log of the last run.
+        """
+        return list(self.__log)
+
+    @staticmethod
+    def format_log(log):
+        """
+        Formats an event log into human readable lines.
+        :param log: List with an event log, as returned by run().
+        :return: String with a line per event.
+        """
+        return '\n'.join(
+            '%s  %-10s  Alarm %s' %
+            (time.strftime('%a %Y-%m-%d %H:%M:%S', time.localtime(event[0])),
+             event[1], event[2])
+            for event in log)
+
+    def __alert(self, kind, alarm_id, alarm):
+        """
+        Alarm threads callback, logs the alert and the hardware timeline it
+        launches.
+        :param kind: AlarmItem.alarm_kind or AlarmItem.offset_kind.
+        :param alarm_id: ID of the alarm that has alerted.
+        :param alarm: AlarmSnapshot given by the alarm thread.
+        """
+        now = self.__clock.time()
+        self.__log.append((now, kind, alarm_id))
+        if kind == self.__hardware_trigger:
+            for seconds, name in self.__hardware_timeline:
+                self.__log.append((now + seconds, name, alarm_id))
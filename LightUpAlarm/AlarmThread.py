@@ -19,22 +19,30 @@ import threading
 
 class AlarmThread(threading.Thread):
     """
-    This thread class contains an instance to an AlarmItem and when it is
-    running checks the time every 5 seconds to determine if the Alarm (or any
+    This thread class contains an immutable snapshot of an AlarmItem and when it
+    is running checks the time every second to determine if the Alarm (or any
     pre or post alert) should be triggered.
 
-    This class does NOT edit the variables from the AlarmItem instance reference
-    that it takes as constructor parameter. It does attach a callback function
-    reference for the alert trigger in this thread, and it only uses the class
-    instance data to determine if the alarm is meant to be trigger or not.
+    The AlarmItem given to the constructor, or to edit_alarm(), is converted
+    into an AlarmSnapshot, so the thread never reads an AlarmItem while it is
+    being modified by AlarmManager. An edit replaces the snapshot reference in
+    a single assignment, and each loop iteration works with the reference it
+    read at the start, so the data is always consistent. The pre/post alert is
+    only recalculated when the snapshot reference changes.
 
-    If it reads old data while it is being modified by AlarmManger, it will read
-    the new correct version at the next infinite loop iteration and not cause a
-    problem.
+    It is for this reason that locks are not required for the alarm data. The
+    loop waits between checks on a stop event, set by the externally accessible
+    stop() method, so the thread exits as soon as it is stopped.
 
-    It is for this reason that locks are not required for the AlarmItem data or
-    the __run private variable (modifiable by the externally accessible stop()
-    method).
+    A snooze is kept as a single one-shot alert time checked by the same loop,
+    with a lock as it is cleared by the loop when it triggers.
+
+    The time is read from a clock object with the time module interface (the
+    time module by default), so it can be replaced by a VirtualClock. Each loop
+    iteration is done by check_alerts(), which can also be called directly to
+    step the alarm without running the thread. The AlarmManager does not start
+    the threads, it schedules them in an AlarmScheduler, which calls
+    check_alerts() at the time given by get_next_check_time().
     """
 
     # This class variable blocks any alarm thread to execute the callback while
@@ -46,23 +54,25 @@ class AlarmThread(threading.Thread):
     # metaclass methods
     #
     def __init__(self, alarm_item, alarm_callback=None, offset_alarm_time=None,
-                 offset_callback=None):
+                 offset_callback=None, clock=None):
         """
         AlarmThread initialiser. Takes an AlarmItem instance, a callback
         function and a pre or post alert time and callback to initialise the
         member variables.
-        :param alarm_item: AlarmItem instance.
+        :param alarm_item: AlarmItem or AlarmSnapshot instance.
         :param alarm_callback: Callback function to execute when alarm triggers.
         :para offset_alarm_time: Indicates if a pre or post alarm alert shall
                                  be triggered. Input sanitation done at
                                  Alar.diff_alarm()
         :param offset_callback: If the offset_alarm_time is set, it will
                                 execute this callback on the pre or post alert.
+        :param clock: Optional clock with the time module interface, the time
+                      module is used if None.
         """
         threading.Thread.__init__(self)
         self.daemon = True
 
-        self.__alarm = alarm_item
+        self.__alarm = alarm_item.snapshot()
         self.__id = self.__alarm.id_
         # Attach the callback to the alarm object for easy storage
         self.__alarm_callback = alarm_callback
@@ -75,10 +85,22 @@ class AlarmThread(threading.Thread):
             self.__offset_time = offset_alarm_time
             self.__offset_callback = offset_callback
             self.__offset_alarm = self.__alarm.diff_alarm(self.__offset_time)
+            # Snapshot from which the offset alarm was derived
+            self.__offset_source = self.__alarm
             if self.__offset_alarm is not None:
                 self.__offset_flag = True
 
-        self.__run = True
+        # One-shot snooze alert time, in seconds since 1970
+        self.__snooze_time = None
+        self.__snooze_lock = threading.Lock()
+
+        if clock is None:
+            clock = time
+        self.__clock = clock
+        # (year day, hour, minute) of the last alert, to alert once per minute
+        self.__alert_minute = None
+
+        self.__stop_event = threading.Event()
 
     #
     # control thread methods
@@ -86,51 +108,135 @@ class AlarmThread(threading.Thread):
     def run(self):
         """
         Infinite loop function to run until it is stopped by calling the stop()
-        method. It sleeps for 1 second between iterations.
-        At each iteration it first determines if the alarm is enabled and set to
-        trigger any day, if so it then checks if this time is the alarm time.
-        """
-        while self.__run:
-            # Only check for the time if the Alarm is active
-            if self.__alarm.is_active() is True:
-                time_now = time.localtime(time.time())
-                alert_triggered = False
-
-                # Check if it is the alarm time
-                if (self.__alarm.repeat[time_now.tm_wday] is True) and \
-                        (self.__alarm.hour == time_now.tm_hour) and \
-                        (self.__alarm.minute == time_now.tm_min):
-                    self.alarm_alert(self.__alarm, self.__alarm_callback)
-                    alert_triggered = True
-
-                if self.__offset_flag is True:
-                    # Sync and check if it is the pre/post alert time
-                    self.sync_offset_alarm()
-                    if (self.__offset_alarm.repeat[time_now.tm_wday] is True) \
-                            and (self.__offset_alarm.hour == time_now.tm_hour) \
-                            and (self.__offset_alarm.minute == time_now.tm_min):
-                        self.alarm_alert(
-                            self.__offset_alarm, self.__offset_callback)
-                        alert_triggered = True
-
-                if alert_triggered:
-                    # Wait for the current minute to be over, in order to not
-                    # execute the callback/s more than once
-                    time_to_elapse = time_now
-                    while (time_to_elapse.tm_hour == time_now.tm_hour) and \
-                          (time_to_elapse.tm_min == time_now.tm_min):
-                        time.sleep(1)
-                        time_now = time.localtime(time.time())
-
-            # Now just sleep for 5 seconds before checking again
-            time.sleep(1)
+        method. It checks the alerts every second, see check_alerts().
+        """
+        while not self.__stop_event.is_set():
+            self.check_alerts()
+            self.__sleep(1)
+
+    def __sleep(self, seconds):
+        """
+        Waits between the alert checks. With the real time it waits on the stop
+        event, so stop() wakes it up straight away. The time of other clocks
+        (as a VirtualClock) only moves with their sleeps, so those are used.
+        :param seconds: Number of seconds to wait.
+        """
+        if self.__clock is time:
+            self.__stop_event.wait(seconds)
+        else:
+            self.__clock.sleep(seconds)
+
+    def check_alerts(self):
+        """
+        Executes the alerts due at the current clock time. It first checks for
+        a due snooze, then determines if the alarm is enabled and set to
+        trigger any day, if so it then checks if this time is the alarm or the
+        pre/post alert time. Each alarm minute only alerts once.
+        :return: Boolean indicating if any alert was triggered.
+        """
+        # Read the snapshot reference once, as it can be replaced by an edit
+        alarm = self.__alarm
+        now = self.__clock.time()
+        alert_triggered = False
+
+        # Check if a snooze alert is due, it is cleared before the alert
+        with self.__snooze_lock:
+            snooze_triggered = self.__snooze_time is not None and \
+                self.__snooze_time <= now
+            if snooze_triggered is True:
+                self.__snooze_time = None
+        if snooze_triggered is True:
+            self.alarm_alert(alarm, self.__alarm_callback)
+            alert_triggered = True
+
+        # Only check for the time if the Alarm is active
+        if alarm.is_active() is True:
+            time_now = self.__clock.localtime(now)
+            alert_minute = (time_now.tm_yday, time_now.tm_hour, time_now.tm_min)
+            # Do not execute the callback/s more than once in the same minute
+            if alert_minute == self.__alert_minute:
+                return alert_triggered
+            minute_alerted = False
+
+            # Check if it is the alarm time
+            if (alarm.repeat[time_now.tm_wday] is True) and \
+                    (alarm.hour == time_now.tm_hour) and \
+                    (alarm.minute == time_now.tm_min):
+                self.__alert_minute = alert_minute
+                minute_alerted = True
+                self.alarm_alert(alarm, self.__alarm_callback)
+
+            if self.__offset_flag is True:
+                # Sync and check if it is the pre/post alert time
+                offset_alarm = self.sync_offset_alarm()
+                if (offset_alarm.repeat[time_now.tm_wday] is True) \
+                        and (offset_alarm.hour == time_now.tm_hour) \
+                        and (offset_alarm.minute == time_now.tm_min):
+                    self.__alert_minute = alert_minute
+                    minute_alerted = True
+                    self.alarm_alert(offset_alarm, self.__offset_callback)
+
+            alert_triggered = alert_triggered or minute_alerted
+        return alert_triggered
+
+    def get_next_check_time(self):
+        """
+        Calculates when check_alerts() has to be called to trigger the next
+        alert: the pending snooze, or the start of the next alarm or pre/post
+        alert minute (the current minute if it has not alerted yet).
+        :return: Time of the next check, in seconds since 1970, or None if
+                 there is nothing to alert (inactive alarm without a snooze).
+        """
+        alarm = self.__alarm
+        check_times = []
+        snooze_time = self.__snooze_time
+        if snooze_time is not None:
+            check_times.append(snooze_time)
+
+        if alarm.is_active() is True:
+            time_now = self.__clock.localtime(self.__clock.time())
+            alerted = self.__alert_minute == \
+                (time_now.tm_yday, time_now.tm_hour, time_now.tm_min)
+            alert_alarms = [alarm]
+            if self.__offset_flag is True:
+                alert_alarms.append(self.sync_offset_alarm())
+            for alert_alarm in alert_alarms:
+                check_times.append(
+                    self.__get_alert_time(alert_alarm, time_now, alerted))
+        return min(check_times) if check_times else None
+
+    @staticmethod
+    def __get_alert_time(alarm, time_now, skip_current_minute):
+        """
+        Calculates the time of the next alert of an active alarm. The local
+        date and time are converted with mktime, so the daylight saving time
+        changes are taken into account.
+        :param alarm: AlarmSnapshot of the alarm or pre/post alert.
+        :param time_now: time.struct_time with the current local time.
+        :param skip_current_minute: Boolean to skip an alert in the current
+                                    minute, as it has already alerted.
+        :return: Time of the alert, in seconds since 1970.
+        """
+        alarm_item = alarm.to_alarm_item()
+        day_minute = (time_now.tm_hour * 60) + time_now.tm_min
+        minutes = alarm_item.minutes_to_alert(
+            time_now.tm_hour, time_now.tm_min, time_now.tm_wday)
+        if minutes == 0 and skip_current_minute is True:
+            extra_days, next_minute = divmod(day_minute + 1, 1440)
+            minutes = 1 + alarm_item.minutes_to_alert(
+                next_minute // 60, next_minute % 60,
+                (time_now.tm_wday + extra_days) % 7)
+        days = (day_minute + minutes) // 1440
+        return time.mktime((time_now.tm_year, time_now.tm_mon,
+                            time_now.tm_mday + days, alarm.hour, alarm.minute,
+                            0, 0, 0, -1))
 
     def stop(self):
         """
         Stops the infinite loop in run method and causes the thread to exit once
-        the current operation finishes.
+        the current operation finishes, without waiting for it (see join()).
         """
-        self.__run = False
+        self.__stop_event.set()
 
     #
     # member methods
@@ -141,23 +247,26 @@ class AlarmThread(threading.Thread):
         """
         return self.__id
 
+    def get_alarm(self):
+        """
+        :return: The AlarmSnapshot with the alarm data used by this thread.
+        """
+        return self.__alarm
+
     def edit_alarm(self, alarm_item):
         """
-        Edits the alarm instance to a new one, if the IDs are the same.
-        In most cases this will be unnecessary, as the input alarm is
-        referencing the same instance, but there are cases where a new AlarmItem
-        instance is created to represent the same alarm and this method needs
-        to update the thread data.
-        :param alarm_item: AlarmItem for the new Alarm instance.
+        Replaces the alarm snapshot with one of the new alarm data, if the IDs
+        are the same. The reference is replaced in a single assignment, so the
+        running loop picks it up at its next iteration.
+        :param alarm_item: AlarmItem or AlarmSnapshot with the new Alarm data.
         :return: Boolean indicating if the operation was successful.
         """
         # Only edit the alarm if it contains the same ID
         if alarm_item.id_ == self.__id == self.__alarm.id_:
-            self.__alarm = alarm_item
+            self.__alarm = alarm_item.snapshot()
             # Edit the offset alert if enabled
             if self.__offset_flag is True:
-                self.__offset_alarm = \
-                    self.__alarm.diff_alarm(self.__offset_time)
+                self.sync_offset_alarm()
             success = True
         else:
             print('ERROR: Provided AlarmItem is not correct for this thread.\n'
@@ -166,20 +275,46 @@ class AlarmThread(threading.Thread):
             success = False
         return success
 
+    def snooze(self, alert_time):
+        """
+        Sets a one-shot alert of the alarm at the given time, replacing any
+        previous snooze. It uses the alarm callback.
+        :param alert_time: Time of the snooze alert, in seconds since 1970.
+        """
+        with self.__snooze_lock:
+            self.__snooze_time = alert_time
+
+    def cancel_snooze(self):
+        """
+        Removes the pending snooze alert, if any.
+        :return: Boolean indicating if there was a snooze alert pending.
+        """
+        with self.__snooze_lock:
+            pending = self.__snooze_time is not None
+            self.__snooze_time = None
+        return pending
+
+    def get_snooze_time(self):
+        """
+        :return: Time of the pending snooze alert, in seconds since 1970, or
+                 None if there isn't one.
+        """
+        return self.__snooze_time
+
     def sync_offset_alarm(self):
         """
-        This method will check if the alarm and the offset_alarm data are still
-        the same. Required because the alarm instance can be edited outside of
-        this class and the alarm data has to stay synchronised.
+        This method will check if the offset_alarm was derived from the current
+        alarm snapshot, and recreate it if not. As snapshots are immutable a
+        change of data always comes with a new snapshot, so an identity check
+        is enough.
         This method edits the class member variable __offset_alarm directly.
-        Doing these checks, instead of recreating the offset_alarm each time
-        is about an order of magnitude faster.
+        :return: The offset alarm snapshot for the current alarm snapshot.
         """
-        if (self.__offset_alarm.hour != self.__alarm.hour) or \
-                (self.__offset_alarm.minute != self.__alarm.minute) or \
-                (self.__offset_alarm.repeat != self.__alarm.repeat) or \
-                (self.__offset_alarm.enabled != self.__alarm.enabled):
-            self.__offset_alarm = self.__alarm.diff_alarm(self.__offset_time)
+        alarm = self.__alarm
+        if self.__offset_source is not alarm:
+            self.__offset_alarm = alarm.diff_alarm(self.__offset_time)
+            self.__offset_source = alarm
+        return self.__offset_alarm
 
     @classmethod
     def alarm_alert(cls, alarm_item, callback):
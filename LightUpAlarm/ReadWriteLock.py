@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+#
+# Class to share data between threads with multiple readers and a writer.
+#
+# Copyright (c) 2015 carlosperate http://carlosperate.github.io
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# This file only contains a class definition, which description can be found in
+# its docstring.
+#
+from __future__ import unicode_literals, absolute_import, print_function
+import threading
+import contextlib
+
+
+class ReadWriteLock(object):
+    """
+    Lock that allows any number of threads to hold it for reading at the same
+    time, or a single thread to hold it for writing.
+    Waiting writers have priority over new readers, so a constant flow of
+    readers cannot starve the writers.
+    It is reentrant: a thread holding the read lock can take it again (even if
+    a writer is waiting), and the thread holding the write lock can take it
+    again or take the read lock. A thread holding only the read lock cannot
+    take the write lock, as two threads doing so would deadlock, so it raises
+    a RuntimeError instead.
+    """
+
+    #
+    # metaclass methods
+    #
+    def __init__(self):
+        """ ReadWriteLock initialiser. """
+        self.__condition = threading.Condition(threading.Lock())
+        # Number of read locks held, including the nested ones
+        self.__readers = 0
+        self.__writer = None
+        self.__writer_count = 0
+        self.__waiting_writers = 0
+        # Number of read locks held by each thread
+        self.__local = threading.local()
+
+    #
+    # member methods
+    #
+    def acquire_read(self):
+        """ Blocks until the lock can be held for reading. """
+        current_thread = threading.current_thread()
+        thread_readers = getattr(self.__local, 'readers', 0)
+        with self.__condition:
+            if thread_readers == 0 and self.__writer is not current_thread:
+                while self.__writer is not None or self.__waiting_writers:
+                    self.__condition.wait()
+            self.__readers += 1
+        self.__local.readers = thread_readers + 1
+
+    def release_read(self):
+        """ Releases a read lock held by the current thread. """
+        thread_readers = getattr(self.__local, 'readers', 0)
+        if thread_readers == 0:
+            raise RuntimeError('Cannot release an un-acquired read lock')
+        with self.__condition:
+            self.__readers -= 1
+            if self.__readers == 0:
+                self.__condition.notify_all()
+        self.__local.readers = thread_readers - 1
+
+    def acquire_write(self):
+        """ Blocks until the lock can be held for writing. """
+        current_thread = threading.current_thread()
+        with self.__condition:
+            if self.__writer is current_thread:
+                self.__writer_count += 1
+                return
+            if getattr(self.__local, 'readers', 0) > 0:
+                raise RuntimeError('Cannot upgrade a read lock into a write '
+                                   'lock')
+            self.__waiting_writers += 1
+            try:
+                while self.__writer is not None or self.__readers > 0:
+                    self.__condition.wait()
+            finally:
+                self.__waiting_writers -= 1
+                if self.__waiting_writers == 0 and self.__writer is None:
+                    # Interrupted while waiting, let the readers continue
+                    self.__condition.notify_all()
+            self.__writer = current_thread
+            self.__writer_count = 1
+
+    def release_write(self):
+        """ Releases the write lock held by the current thread. """
+        with self.__condition:
+            if self.__writer is not threading.current_thread():
+                raise RuntimeError('Cannot release an un-acquired write lock')
+            self.__writer_count -= 1
+            if self.__writer_count == 0:
+                self.__writer = None
+                self.__condition.notify_all()
+
+    @contextlib.contextmanager
+    def read_locked(self):
+        """ Context manager to hold the lock for reading. """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def write_locked(self):
+        """ Context manager to hold the lock for writing. """
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
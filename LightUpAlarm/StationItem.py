@@ -9,6 +9,7 @@
 #
 from __future__ import unicode_literals, absolute_import, print_function
 import collections
+import struct
 try:
     from LightUpAlarm.Py23Compatibility import *
 except ImportError:
@@ -22,6 +23,12 @@ class StationItem(object):
         name: String containing the name of the station.
         url: String containing the URL of the station.
     """
+    # Serialised field names, in the same order as to_tuple()
+    fields = ('id', 'name', 'url')
+
+    # Fixed size part of the binary encoding: id (-1 for None), and name and
+    # url lengths, followed by the UTF-8 name and url.
+    __binary = struct.Struct(str('<iHH'))
 
     #
     # metaclass methods: constructor, initialiser and print
@@ -75,6 +82,22 @@ class StationItem(object):
         """
         pass
 
+    @classmethod
+    def from_row(cls, row):
+        """
+        Trusted constructor for the station data retrieved from the AlarmDb
+        database, which skips the input sanitation done in __new__.
+        Untrusted data (HTTP, CLI, etc) must use the normal constructor.
+        :param row: Dictionary-like database row with the 'stations' table
+                    columns.
+        :return: Instance of the StationItem class.
+        """
+        instance = object.__new__(cls)
+        instance.__id = row['id']
+        instance.__name = row['name']
+        instance.__url = row['url']
+        return instance
+
     def __str__(self):
         """
         Converts the class instance data into a readable string format.
@@ -85,6 +108,57 @@ class StationItem(object):
 
         return ret_str
 
+    #
+    # serialisation methods
+    #
+    def to_tuple(self):
+        """
+        Converts the station data into a tuple, with the items in the same
+        order as the StationItem.fields names.
+        :return: Tuple with the station data.
+        """
+        return self.__id, self.__name, self.__url
+
+    def to_dict(self):
+        """
+        Converts the station data into a dictionary, using the
+        StationItem.fields names as keys.
+        :return: Dictionary with the station data.
+        """
+        return {'id': self.__id, 'name': self.__name, 'url': self.__url}
+
+    def to_bytes(self):
+        """
+        Converts the station data into a compact binary format, 8 bytes plus
+        the UTF-8 encoded name and url.
+        :return: Byte string with the encoded station data.
+        """
+        name = self.__name
+        if not isinstance(name, bytes):
+            name = name.encode('utf-8')
+        url = self.__url
+        if not isinstance(url, bytes):
+            url = url.encode('utf-8')
+        return StationItem.__binary.pack(
+            -1 if self.__id is None else self.__id, len(name), len(url)) + \
+            name + url
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Trusted constructor for the data encoded by to_bytes(), the data is not
+        validated (see from_row()).
+        :param data: Byte string with the encoded station data.
+        :return: Instance of the StationItem class.
+        """
+        binary = StationItem.__binary
+        id_, name_length, url_length = binary.unpack_from(data)
+        url_start = binary.size + name_length
+        return cls.from_row(
+            {'id': None if id_ == -1 else id_,
+             'name': data[binary.size:url_start].decode('utf-8'),
+             'url': data[url_start:url_start + url_length].decode('utf-8')})
+
     #
     # id accesor
     #
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+# Virtual clock to run the alarms and hardware timelines faster than real time.
+#
+# Copyright (c) 2015 carlosperate http://carlosperate.github.io
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# The classes that depend on the time (AlarmThread, AlarmManager, and the
+# LightUpHardware HardwareThread and ramps) use a clock object with the same
+# interface as the time module: time(), localtime() and sleep(). The time
+# module itself is the default clock, and this class can be used instead to
+# control the time from the tests or from a simulation.
+#
+from __future__ import unicode_literals, absolute_import, print_function
+import time
+import threading
+
+
+class VirtualClock(object):
+    """
+    Clock with a virtual time that only moves forward when it is advanced.
+    In auto advance mode a sleep() advances the time by the slept seconds
+    without blocking, which is meant to run a single thread in a simulation.
+    Otherwise sleep() blocks the calling thread until another thread advances
+    the time past its wake up time.
+    """
+
+    #
+    # metaclass methods
+    #
+    def __init__(self, start_time=0, auto_advance=True):
+        """
+        VirtualClock initialiser.
+        :param start_time: Virtual time to start from, in seconds since 1970.
+        :param auto_advance: Boolean to advance the time on sleep() instead of
+                             blocking.
+        """
+        self.__time = start_time
+        self.auto_advance = auto_advance
+        self.__condition = threading.Condition(threading.Lock())
+
+    #
+    # time module interface
+    #
+    def time(self):
+        """
+        :return: Current virtual time, in seconds since 1970.
+        """
+        with self.__condition:
+            return self.__time
+
+    def localtime(self, seconds=None):
+        """
+        Converts a time to the local time struct, as time.localtime().
+        :param seconds: Optional time in seconds since 1970, the current
+                        virtual time if None.
+        :return: time.struct_time with the local time.
+        """
+        if seconds is None:
+            seconds = self.time()
+        return time.localtime(seconds)
+
+    def sleep(self, seconds):
+        """
+        Advances the time by the given seconds in auto advance mode, or blocks
+        until the time has been advanced by them.
+        :param seconds: Number of virtual seconds to sleep.
+        """
+        if seconds <= 0:
+            return
+        with self.__condition:
+            wake_time = self.__time + seconds
+            if self.auto_advance is True:
+                self.__time = wake_time
+                self.__condition.notify_all()
+            else:
+                while self.__time < wake_time:
+                    self.__condition.wait()
+
+    #
+    # member methods
+    #
+    def advance(self, seconds):
+        """
+        Moves the time forward, waking up the sleeping threads that are due.
+        :param seconds: Number of seconds to advance.
+        :return: The new virtual time.
+        """
+        return self.set_time(self.time() + seconds)
+
+    def set_time(self, new_time):
+        """
+        Sets the virtual time, waking up the sleeping threads that are due. It
+        can only move forward.
+        :param new_time: New time, in seconds since 1970.
+        :return: The new virtual time.
+        """
+        with self.__condition:
+            self.__time = max(self.__time, new_time)
+            self.__condition.notify_all()
+            return self.__time
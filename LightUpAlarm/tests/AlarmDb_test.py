@@ -7,14 +7,17 @@
 # Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
 #
 from __future__ import unicode_literals, absolute_import
+import io
 import unittest
 import mock
 import time
 import json
 import os
+import threading
 try:
     from LightUpAlarm.AlarmDb import AlarmDb
     from LightUpAlarm.AlarmItem import AlarmItem
+    from LightUpAlarm.StationItem import StationItem
 except ImportError:
     import sys
     file_dir = os.path.dirname(os.path.realpath(__file__))
@@ -22,6 +25,7 @@ except ImportError:
     sys.path.insert(0, package_dir)
     from LightUpAlarm.AlarmDb import AlarmDb
     from LightUpAlarm.AlarmItem import AlarmItem
+    from LightUpAlarm.StationItem import StationItem
 
 
 class AlarmDbTestCase(unittest.TestCase):
@@ -210,6 +214,81 @@ class AlarmDbTestCase(unittest.TestCase):
         self.assertEqual(len(enabled_alarms), 3)
         self.assertEqual(len(disabled_alarms), 2)
 
+    def test_query_alarms(self):
+        """
+        Adds alarms with different hours, repeat days, states and stations,
+        and checks the filters, field selection and pages of query_alarms(),
+        which are done by the query without creating any AlarmItem.
+        """
+        adh = AlarmDb(self.db_name)
+        adh.delete_all_alarms()
+        weekend = (False, False, False, False, False, True, True)
+        no_days = (False, False, False, False, False, False, False)
+        alarm_ids = [
+            adh.add_alarm(AlarmItem(5, 0, days=self.random_days,
+                                    enabled=True, station_id=1)),
+            adh.add_alarm(AlarmItem(8, 0, days=weekend, enabled=True)),
+            adh.add_alarm(AlarmItem(12, 0, days=no_days, enabled=True)),
+            adh.add_alarm(AlarmItem(18, 0, days=weekend, enabled=False,
+                                    station_id=2)),
+            adh.add_alarm(AlarmItem(23, 0, days=self.random_days,
+                                    enabled=True, station_id=2))]
+        alarm_dicts = [adh.get_alarm(alarm_id).to_dict()
+                       for alarm_id in alarm_ids]
+
+        def query_ids(**query):
+            with mock.patch.object(AlarmItem, 'from_row',
+                                   side_effect=AssertionError('Created')):
+                rows, next_cursor = adh.query_alarms(**query)
+            self.assertIsNone(next_cursor)
+            return [alarm_ids.index(row['id']) for row in rows]
+
+        self.assertEqual(adh.query_alarms(), (alarm_dicts, None))
+        self.assertEqual(query_ids(enabled=True), [0, 1, 2, 4])
+        self.assertEqual(query_ids(enabled=False), [3])
+        self.assertEqual(query_ids(active=True), [0, 1, 4])
+        self.assertEqual(query_ids(active=False), [2, 3])
+        self.assertEqual(query_ids(day=6), [1, 3])
+        self.assertEqual(query_ids(day=2, enabled=True), [0, 4])
+        self.assertEqual(query_ids(station_id=2), [3, 4])
+        self.assertEqual(query_ids(hour_from=8), [1, 2, 3, 4])
+        self.assertEqual(query_ids(hour_to=12), [0, 1, 2])
+        self.assertEqual(query_ids(hour_from=8, hour_to=18), [1, 2, 3])
+        self.assertEqual(query_ids(hour_from=22, hour_to=6), [0, 4])
+        self.assertEqual(query_ids(hour_from=13, hour_to=17), [])
+
+        # Field selection, the ID is always included
+        rows, _ = adh.query_alarms(fields=('hour', 'sunday'), enabled=False)
+        self.assertEqual(rows, [{'id': alarm_ids[3], 'hour': 18,
+                                 'sunday': True}])
+        self.assertRaises(ValueError, adh.query_alarms, fields=('hours',))
+
+        # Pages
+        rows, cursor = adh.query_alarms(fields=('id',), limit=2)
+        self.assertEqual(rows, [{'id': alarm_ids[0]}, {'id': alarm_ids[1]}])
+        self.assertEqual(cursor, alarm_ids[1])
+        rows, cursor = adh.query_alarms(limit=2, cursor=cursor)
+        self.assertEqual(rows, alarm_dicts[2:4])
+        rows, cursor = adh.query_alarms(limit=2, cursor=cursor)
+        self.assertEqual((rows, cursor), (alarm_dicts[4:], None))
+        rows, cursor = adh.query_alarms(limit=1, cursor=alarm_ids[0],
+                                        active=True)
+        self.assertEqual((rows, cursor), (alarm_dicts[1:2], alarm_ids[1]))
+
+        # Stations
+        adh.delete_all_stations()
+        station_ids = [adh.add_station(StationItem('Station %d' % i,
+                                                   'http://%d' % i))
+                       for i in range(3)]
+        rows, cursor = adh.query_stations(fields=('name',), limit=2)
+        self.assertEqual(rows, [{'id': station_ids[0], 'name': 'Station 0'},
+                                {'id': station_ids[1], 'name': 'Station 1'}])
+        rows, cursor = adh.query_stations(cursor=cursor)
+        self.assertEqual(rows, [station.to_dict()
+                                for station in adh.get_all_stations()][2:])
+        self.assertIsNone(cursor)
+        adh.delete_all_stations()
+
     def test_edit_alarm(self):
         """ Creates an alarm and edits it. """
         adh = AlarmDb(self.db_name)
@@ -420,6 +499,14 @@ class AlarmDbTestCase(unittest.TestCase):
         self.assertFalse(success)
         self.assertEquals(adh.get_offset_alert_time(), 5)
 
+    def test_get_settings(self):
+        """ Test all the settings are retrieved together. """
+        adh = AlarmDb(self.db_name)
+        self.assertTrue(adh.set_snooze_time(4))
+        self.assertTrue(adh.set_offset_alert_time(-6))
+        self.assertEqual(adh.get_settings(),
+                         {'snooze_time': 4, 'offset_alert_time': -6})
+
     def test_reset_settings(self):
         """ Test reset settings. """
         adh = AlarmDb(self.db_name)
@@ -435,5 +522,194 @@ class AlarmDbTestCase(unittest.TestCase):
         self.assertNotEquals(adh.get_snooze_time(), 321)
         self.assertNotEquals(adh.get_offset_alert_time(), 123)
 
+    def test_revision(self):
+        """
+        Checks the database revision changes with every modification, from any
+        AlarmDb instance, but not when the data is only read.
+        """
+        alarm_db = AlarmDb(self.db_name)
+        other_db = AlarmDb(self.db_name)
+        self.only_five_entries(alarm_db)
+
+        def assert_changed(function, *args, **kwargs):
+            revision = alarm_db.get_revision()
+            function(*args, **kwargs)
+            self.assertNotEqual(alarm_db.get_revision(), revision)
+            self.assertEqual(other_db.get_revision(), alarm_db.get_revision())
+
+        assert_changed(alarm_db.add_alarm, AlarmItem(10, 20))
+        assert_changed(other_db.edit_alarm, 1, hour=9)
+        alarm = alarm_db.get_alarm(2)
+        alarm.minute = 5
+        assert_changed(alarm_db.update_alarm, alarm)
+        assert_changed(alarm_db.delete_alarm, 3)
+        assert_changed(alarm_db.set_snooze_time, 4)
+        assert_changed(alarm_db.set_offset_alert_time, -5)
+        assert_changed(alarm_db.reset_settings)
+        assert_changed(alarm_db.add_station, StationItem('name', 'url'))
+        assert_changed(alarm_db.delete_station, 1)
+        assert_changed(alarm_db.delete_all_stations)
+        assert_changed(alarm_db.delete_all_alarms)
+
+        revision = alarm_db.get_revision()
+        alarm_db.get_all_alarms()
+        alarm_db.get_alarm_set()
+        alarm_db.get_snooze_time()
+        self.assertEqual(alarm_db.get_revision(), revision)
+
+        # The stations revision only changes with the stations, and it is
+        # shared by the namespaces
+        namespace_db = AlarmDb(self.db_name, namespace='revision')
+        stations_revision = alarm_db.get_revision(stations=True)
+        alarm_db.add_alarm(AlarmItem(10, 20))
+        self.assertEqual(alarm_db.get_revision(stations=True),
+                         stations_revision)
+        before_change = time.time()
+        namespace_db.add_station(StationItem('name', 'url'))
+        self.assertNotEqual(alarm_db.get_revision(stations=True),
+                            stations_revision)
+        self.assertGreaterEqual(
+            alarm_db.get_revision_time(stations=True), before_change)
+        self.assertLess(alarm_db.get_revision_time(), before_change)
+        namespace_db.delete_all_stations()
+
+    def test_revision_concurrent_changes(self):
+        """
+        Checks no revision is lost when the stations shared revision is
+        changed at the same time from the threads of several namespaces.
+        """
+        namespace_dbs = [AlarmDb(self.db_name, namespace='revision%d' % i)
+                         for i in range(4)]
+        stations_revision = namespace_dbs[0].get_revision(stations=True)
+
+        def change_stations(alarm_db):
+            for _ in range(500):
+                alarm_db._AlarmDb__changed(stations=True)
+
+        threads = [threading.Thread(target=change_stations, args=(alarm_db,))
+                   for alarm_db in namespace_dbs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(namespace_dbs[0].get_revision(stations=True),
+                         stations_revision + 2000)
+        for alarm_db in namespace_dbs:
+            self.assertEqual(alarm_db.get_revision(), 500)
+
+    def test_snoozes(self):
+        """
+        Tests the snoozes are saved, replaced and removed without changing the
+        database revision.
+        """
+        alarm_db = AlarmDb(self.db_name)
+        alarm_db.delete_all_snoozes()
+        revision = alarm_db.get_revision()
+        self.assertEqual(alarm_db.get_all_snoozes(), {})
+        self.assertTrue(alarm_db.set_snooze(3, 1000))
+        self.assertTrue(alarm_db.set_snooze(4, 2000))
+        self.assertTrue(alarm_db.set_snooze(3, 3000))
+        self.assertEqual(alarm_db.get_all_snoozes(), {3: 3000, 4: 2000})
+        self.assertEqual(AlarmDb(self.db_name).get_all_snoozes(),
+                         {3: 3000, 4: 2000})
+
+        self.assertTrue(alarm_db.delete_snooze(3))
+        self.assertFalse(alarm_db.delete_snooze(3))
+        self.assertEqual(alarm_db.get_all_snoozes(), {4: 2000})
+        self.assertTrue(alarm_db.delete_all_snoozes())
+        self.assertEqual(alarm_db.get_all_snoozes(), {})
+        self.assertEqual(alarm_db.get_revision(), revision)
+
+        # Invalid data
+        with mock.patch('sys.stderr', new=io.StringIO()):
+            self.assertFalse(alarm_db.set_snooze(3, 10.5))
+            self.assertFalse(alarm_db.set_snooze('3', 10))
+        self.assertEqual(alarm_db.get_all_snoozes(), {})
+
+    def test_transaction(self):
+        """
+        Tests the changes in a transaction are discarded by a rollback, and
+        saved by a commit.
+        """
+        alarm_db = AlarmDb(self.db_name)
+        self.only_five_entries(alarm_db)
+        alarm_db.delete_all_stations()
+        station_id = alarm_db.add_station(StationItem('name', 'url'))
+        alarms = alarm_db.get_all_alarms()
+        alarms_dicts = [alarm.to_dict() for alarm in alarms]
+
+        alarm_db.begin()
+        alarm_db.add_alarm(AlarmItem(7, 15))
+        alarm_db.delete_alarm(alarms[0].id_)
+        alarms[1].hour = 23
+        alarm_db.update_alarm(alarms[1])
+        self.assertTrue(alarm_db.update_station(
+            StationItem('new', 'url', station_id=station_id)))
+        self.assertEqual(alarm_db.get_number_of_alarms(), 5)
+        revision = alarm_db.get_revision()
+        alarm_db.rollback()
+        self.assertNotEqual(alarm_db.get_revision(), revision)
+        self.assertEqual(
+            [alarm.to_dict() for alarm in alarm_db.get_all_alarms()],
+            alarms_dicts)
+        self.assertEqual(alarm_db.get_number_of_alarms(), 5)
+        self.assertEqual(alarm_db.get_station(station_id).name, 'name')
+
+        alarm_db.begin()
+        new_id = alarm_db.add_alarm(AlarmItem(7, 15))
+        alarm_db.delete_alarm(alarms[0].id_)
+        self.assertTrue(alarm_db.update_station(
+            StationItem('new', 'url', station_id=station_id)))
+        alarm_db.commit()
+        self.assertEqual(alarm_db.get_number_of_alarms(), 5)
+        self.assertIsNone(alarm_db.get_alarm(alarms[0].id_))
+        self.assertEqual(alarm_db.get_alarm(new_id).minute, 15)
+        self.assertEqual(alarm_db.get_station(station_id).name, 'new')
+        alarm_db.delete_all_stations()
+
+    def test_namespaces(self):
+        """
+        Tests the alarms, settings, snoozes and revision of each namespace are
+        independent, while the stations are shared.
+        """
+        alarm_db = AlarmDb(self.db_name)
+        kitchen_db = AlarmDb(self.db_name, 'kitchen')
+        self.assertIsNone(alarm_db.namespace)
+        self.assertEqual(kitchen_db.namespace, 'kitchen')
+        self.only_five_entries(alarm_db)
+        kitchen_db.delete_all_alarms()
+        kitchen_db.delete_all_snoozes()
+        alarm_db.delete_all_stations()
+
+        revision = alarm_db.get_revision()
+        kitchen_id = kitchen_db.add_alarm(AlarmItem(7, 15))
+        self.assertEqual(alarm_db.get_revision(), revision)
+        self.assertEqual(alarm_db.get_number_of_alarms(), 5)
+        self.assertEqual(kitchen_db.get_number_of_alarms(), 1)
+        self.assertEqual(kitchen_db.get_alarm(kitchen_id).hour, 7)
+        self.assertEqual(
+            AlarmDb(self.db_name, 'kitchen').get_number_of_alarms(), 1)
+
+        alarm_db.set_snooze_time(4)
+        kitchen_db.set_snooze_time(9)
+        self.assertEqual(alarm_db.get_snooze_time(), 4)
+        self.assertEqual(kitchen_db.get_snooze_time(), 9)
+        kitchen_db.set_snooze(kitchen_id, 1000)
+        self.assertNotIn(kitchen_id, alarm_db.get_all_snoozes())
+        self.assertEqual(kitchen_db.get_all_snoozes(), {kitchen_id: 1000})
+
+        alarm_db.add_station(StationItem('name', 'url'))
+        self.assertEqual(len(kitchen_db.get_all_stations()), 1)
+
+        # Invalid names fall back to the default tables
+        with mock.patch('sys.stderr', new=io.StringIO()) as test_srderr:
+            invalid_db = AlarmDb(self.db_name, 'kitchen_alarms')
+            self.assertIn('namespace', test_srderr.getvalue())
+        self.assertIsNone(invalid_db.namespace)
+        self.assertEqual(invalid_db.get_number_of_alarms(), 5)
+        kitchen_db.delete_all_alarms()
+        kitchen_db.delete_all_snoozes()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Unit test for the AlarmEventBus class.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+from __future__ import unicode_literals, absolute_import
+import io
+import mock
+import unittest
+import threading
+try:
+    from LightUpAlarm.AlarmEventBus import AlarmEventBus
+except ImportError:
+    import os
+    import sys
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    from LightUpAlarm.AlarmEventBus import AlarmEventBus
+
+
+class AlarmEventBusTestCase(unittest.TestCase):
+    """ Tests for AlarmEventBus class. """
+
+    def test_publish(self):
+        """ Tests the events are delivered from a different thread. """
+        event_bus = AlarmEventBus(coalesce_time=0)
+        received = []
+        threads = []
+
+        def subscriber(events):
+            received.extend(events)
+            threads.append(threading.current_thread())
+
+        # Events without subscribers are discarded
+        event_bus.publish(AlarmEventBus.alarm_added, 1, 'discarded')
+        event_bus.subscribe(subscriber)
+        event_bus.publish(AlarmEventBus.alarm_added, 2, 'data')
+        self.assertTrue(event_bus.flush(5))
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0]['type'], AlarmEventBus.alarm_added)
+        self.assertEqual(received[0]['id'], 2)
+        self.assertEqual(received[0]['data'], 'data')
+        self.assertIsInstance(received[0]['time'], float)
+        self.assertNotEqual(threads[0], threading.current_thread())
+
+        self.assertTrue(event_bus.unsubscribe(subscriber))
+        self.assertFalse(event_bus.unsubscribe(subscriber))
+        event_bus.publish(AlarmEventBus.alarm_added, 3, 'data')
+        self.assertTrue(event_bus.flush(5))
+        self.assertEqual(len(received), 1)
+
+    def test_coalesce(self):
+        """ Tests events published while delivering are sent coalesced. """
+        event_bus = AlarmEventBus(coalesce_time=0)
+        batches = []
+        blocking = threading.Event()
+        release = threading.Event()
+
+        def subscriber(events):
+            batches.append([(event['type'], event['id'], event['data'])
+                            for event in events])
+            blocking.set()
+            release.wait(5)
+
+        event_bus.subscribe(subscriber)
+        event_bus.publish(AlarmEventBus.alarm_added, 1, 'first')
+        blocking.wait(5)
+        # The subscriber is blocked, so these are kept pending
+        event_bus.publish(AlarmEventBus.alarm_edited, 1, 'old')
+        event_bus.publish(AlarmEventBus.alarm_edited, 2, 'other')
+        event_bus.publish(AlarmEventBus.alarm_edited, 1, 'new')
+        event_bus.publish(AlarmEventBus.settings_changed, 'snooze_time', 5)
+        release.set()
+        self.assertTrue(event_bus.flush(5))
+        self.assertEqual(batches, [
+            [(AlarmEventBus.alarm_added, 1, 'first')],
+            [(AlarmEventBus.alarm_edited, 2, 'other'),
+             (AlarmEventBus.alarm_edited, 1, 'new'),
+             (AlarmEventBus.settings_changed, 'snooze_time', 5)]])
+
+    def test_event_types(self):
+        """ Tests the subscribers only receive the requested event types. """
+        event_bus = AlarmEventBus(coalesce_time=0.01)
+        changes = []
+        alerts = []
+        event_bus.subscribe(changes.extend, AlarmEventBus.change_events)
+        event_bus.subscribe(alerts.extend, AlarmEventBus.alert_events)
+        event_bus.publish(AlarmEventBus.alarm_deleted, 1)
+        event_bus.publish(AlarmEventBus.alarm_alert, 2, 'alarm')
+        self.assertTrue(event_bus.flush(5))
+        self.assertEqual([event['type'] for event in changes],
+                         [AlarmEventBus.alarm_deleted])
+        self.assertEqual([event['type'] for event in alerts],
+                         [AlarmEventBus.alarm_alert])
+
+    def test_namespaces(self):
+        """ Tests the subscribers only receive the requested namespaces. """
+        event_bus = AlarmEventBus(coalesce_time=0.01)
+        kitchen = []
+        everything = []
+        event_bus.subscribe(kitchen.extend, namespaces=('kitchen',))
+        event_bus.subscribe(everything.extend)
+        event_bus.publish(AlarmEventBus.alarm_added, 1, namespace='kitchen')
+        event_bus.publish(AlarmEventBus.alarm_added, 1, namespace='bedroom')
+        event_bus.publish(AlarmEventBus.alarm_added, 1)
+        self.assertTrue(event_bus.flush(5))
+        self.assertEqual([event['namespace'] for event in kitchen],
+                         ['kitchen'])
+        # Events with the same type and ID are not coalesced across namespaces
+        self.assertEqual([event['namespace'] for event in everything],
+                         ['kitchen', 'bedroom', None])
+
+    def test_subscriber_error(self):
+        """ Tests a failing subscriber does not stop the delivery. """
+        event_bus = AlarmEventBus(coalesce_time=0)
+        received = []
+
+        def failing_subscriber(events):
+            raise ValueError('subscriber error')
+
+        event_bus.subscribe(failing_subscriber)
+        event_bus.subscribe(received.extend)
+        with mock.patch('sys.stderr', new=io.StringIO()) as test_srderr:
+            event_bus.publish(AlarmEventBus.alarm_added, 1)
+            self.assertTrue(event_bus.flush(5))
+            self.assertIn('subscriber error', test_srderr.getvalue())
+        self.assertEqual(len(received), 1)
+        # The delivery continues for the next events
+        event_bus.publish(AlarmEventBus.alarm_added, 2)
+        self.assertTrue(event_bus.flush(5))
+        self.assertEqual(len(received), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
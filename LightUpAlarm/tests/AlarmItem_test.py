@@ -10,8 +10,11 @@ from __future__ import unicode_literals, absolute_import
 import unittest
 import mock
 import io
+import itertools
+from datetime import datetime, timedelta
 try:
     from LightUpAlarm.AlarmItem import AlarmItem
+    from LightUpAlarm.Py23Compatibility import str_type
 except ImportError:
     import os
     import sys
@@ -19,6 +22,7 @@ except ImportError:
     package_dir = os.path.dirname(os.path.dirname(file_dir))
     sys.path.insert(0, package_dir)
     from LightUpAlarm.AlarmItem import AlarmItem
+    from LightUpAlarm.Py23Compatibility import str_type
 
 
 class AlarmItemTestCase(unittest.TestCase):
@@ -93,6 +97,39 @@ class AlarmItemTestCase(unittest.TestCase):
                                label=label, timestamp=timestamp, alarm_id=id_)
         self.assertEqual(id_, alarm_test.id_)
 
+    def test_from_row(self):
+        """
+        Tests the trusted from_row constructor produces the same data as the
+        validating constructor.
+        """
+        days = (False, True, True, False, False, False, True)
+        row = {'id': 265, 'hour': 23, 'minute': 59, 'monday': days[0],
+               'tuesday': days[1], 'wednesday': days[2], 'thursday': days[3],
+               'friday': days[4], 'saturday': days[5], 'sunday': days[6],
+               'enabled': False, 'label': 'Alarm label',
+               'timestamp': 12345678, 'station_id': 3}
+        expected = AlarmItem(23, 59, days=days, enabled=False,
+                             label='Alarm label', timestamp=12345678,
+                             alarm_id=265, station_id=3)
+        alarm_test = AlarmItem.from_row(row)
+        self.assertIsInstance(alarm_test, AlarmItem)
+        self.assertEqual(alarm_test.id_, expected.id_)
+        self.assertEqual(alarm_test.hour, expected.hour)
+        self.assertEqual(alarm_test.minute, expected.minute)
+        self.assertEqual(alarm_test.repeat, expected.repeat)
+        self.assert_repeat(alarm_test, days)
+        self.assertEqual(alarm_test.enabled, expected.enabled)
+        self.assertEqual(alarm_test.label, expected.label)
+        self.assertEqual(alarm_test.timestamp, expected.timestamp)
+        self.assertEqual(alarm_test.station_id, expected.station_id)
+        self.assertEqual(str(alarm_test), str(expected))
+
+        # The accessors still sanitise data once the instance is created
+        with mock.patch('sys.stderr', new=io.StringIO()) as test_srderr:
+            alarm_test.hour = 24
+            self.assert_stderr(test_srderr)
+            self.assertEqual(alarm_test.hour, 23)
+
     def test_constructor_hour_min_range(self):
         """
         Test constructor values for hours and minutes to produce a None object
@@ -458,6 +495,218 @@ class AlarmItemTestCase(unittest.TestCase):
         time_diff = test_alarm.minutes_to_alert(4, 15, 2)
         self.assertEqual(time_diff, ((one_day * 5) + (60 * 5) + 15))
 
+    def test_time_to_alarm_all_combinations(self):
+        """
+        Compares minutes_to_alert against a day by day walk of the week for
+        all weekdays, all minutes of the day and all 128 repeat combinations.
+        """
+        def walk_minutes_to_alert(alarm_minute, repeat, ref_minute, weekday):
+            """ Reference implementation walking the week day by day. """
+            if repeat[weekday] is True and alarm_minute >= ref_minute:
+                return alarm_minute - ref_minute
+            for day_count in xrange(1, 7):
+                if repeat[(weekday + day_count) % 7] is True:
+                    return (day_count * 1440) + alarm_minute - ref_minute
+            if repeat[weekday] is True:
+                return (1440 * 7) - ref_minute + alarm_minute
+            return None
+
+        test_alarm = AlarmItem(0, 0)
+        for mask in xrange(128):
+            repeat = tuple(bool(mask & (1 << day)) for day in xrange(7))
+            # Spread the alarm time across the day with each repeat mask
+            alarm_minute = (mask * 37) % 1440
+            test_alarm.hour = alarm_minute // 60
+            test_alarm.minute = alarm_minute % 60
+            test_alarm.repeat = repeat
+            self.assertEqual(test_alarm.days_mask, mask)
+            for weekday in xrange(7):
+                for ref_minute in xrange(1440):
+                    self.assertEqual(
+                        test_alarm.minutes_to_alert(
+                            ref_minute // 60, ref_minute % 60, weekday),
+                        walk_minutes_to_alert(
+                            alarm_minute, repeat, ref_minute, weekday))
+
+    def test_next_alert_datetime(self):
+        """ Tests next_alert_datetime returns the absolute next alert time. """
+        # Monday 9:30 and Thursday 9:30
+        test_alarm = AlarmItem(
+            9, 30, (True, False, False, True, False, False, False), True)
+        # 2015-06-01 was a Monday
+        reference = datetime(2015, 6, 1, 9, 29, 45, 10)
+        self.assertEqual(test_alarm.next_alert_datetime(reference),
+                         datetime(2015, 6, 1, 9, 30))
+        reference = datetime(2015, 6, 1, 9, 31)
+        self.assertEqual(test_alarm.next_alert_datetime(reference),
+                         datetime(2015, 6, 4, 9, 30))
+        reference = datetime(2015, 6, 6, 23, 59)
+        self.assertEqual(test_alarm.next_alert_datetime(reference),
+                         datetime(2015, 6, 8, 9, 30))
+
+        test_alarm.repeat = (False, False, False, False, False, False, False)
+        self.assertIsNone(test_alarm.next_alert_datetime(reference))
+
+    def test_days_mask(self):
+        """ Tests the days_mask follows all the repeat accessors. """
+        test_alarm = AlarmItem(
+            9, 30, (True, False, False, True, False, False, True), True)
+        self.assertEqual(test_alarm.days_mask, 0b1001001)
+        test_alarm.monday = False
+        test_alarm.tuesday = True
+        self.assertEqual(test_alarm.days_mask, 0b1001010)
+        test_alarm.repeat = (False, False, False, False, False, False, False)
+        self.assertEqual(test_alarm.days_mask, 0)
+        self.assertFalse(test_alarm.any_day_enabled())
+
+    def test_from_dicts(self):
+        """
+        Tests the batch validation returns the valid alarms and the errors of
+        the invalid ones, in the input order, without writing to stderr.
+        """
+        raw_alarms = [
+            {'hour': 7, 'minute': 30},
+            {'hour': 23, 'minute': 59, 'monday': True, 'sunday': True,
+             'enabled': False, 'label': 'label', 'timestamp': 1234,
+             'id': 5, 'station_id': 2},
+            {'hour': 24, 'minute': '5', 'tuesday': 'yes'},
+            {'minute': 0, 'days': [True] * 7, 'enabled': None, 'label': 5},
+            {'hour': True, 'minute': 0, 'days': [True] * 6,
+             'timestamp': -1},
+            'not a dictionary']
+        with mock.patch('sys.stderr', new=io.StringIO()) as test_srderr:
+            alarms, errors = AlarmItem.from_dicts(raw_alarms)
+            self.assertEqual(test_srderr.getvalue(), '')
+        self.assertEqual(len(alarms), len(raw_alarms))
+        self.assertEqual(len(errors), len(raw_alarms))
+
+        # Valid alarms
+        self.assertEqual(errors[0], [])
+        self.assertEqual(
+            alarms[0].to_tuple(),
+            AlarmItem(7, 30, days=(False,) * 7, enabled=True).to_tuple())
+        self.assertEqual(errors[1], [])
+        self.assertEqual(
+            alarms[1].to_tuple(),
+            AlarmItem(23, 59, days=(True, False, False, False, False, False,
+                                    True), enabled=False, label='label',
+                      timestamp=1234, alarm_id=5, station_id=2).to_tuple())
+
+        # Invalid alarms
+        def error_fields(index):
+            self.assertIsNone(alarms[index])
+            return sorted(error['field'] for error in errors[index])
+
+        self.assertEqual(error_fields(2), ['hour', 'minute', 'tuesday'])
+        self.assertEqual(error_fields(3), ['enabled', 'hour', 'label'])
+        self.assertEqual(error_fields(4), ['days', 'hour', 'timestamp'])
+        self.assertEqual(error_fields(5), [None])
+        for alarm_errors in errors[2:]:
+            for error in alarm_errors:
+                self.assertIsInstance(error['error'], str_type)
+
+    def test_serialisation(self):
+        """
+        Tests the to_tuple, to_dict and binary encoding methods, and that the
+        binary data can be decoded back into the same alarm.
+        """
+        days = (False, True, True, False, False, False, True)
+        # Database rows can contain non ASCII labels
+        alarm_test = AlarmItem.from_row(
+            {'id': 265, 'hour': 23, 'minute': 59, 'monday': days[0],
+             'tuesday': days[1], 'wednesday': days[2], 'thursday': days[3],
+             'friday': days[4], 'saturday': days[5], 'sunday': days[6],
+             'enabled': False, 'label': 'Alarm label \u00e9',
+             'timestamp': 12345678, 'station_id': 3})
+        expected_tuple = (265, 23, 59, False, 'Alarm label \u00e9', 12345678,
+                          False, True, True, False, False, False, True, 3)
+        self.assertEqual(alarm_test.to_tuple(), expected_tuple)
+        self.assertEqual(len(AlarmItem.fields), len(expected_tuple))
+        self.assertEqual(alarm_test.to_dict(),
+                         {'id': 265, 'hour': 23, 'minute': 59,
+                          'enabled': False, 'label': 'Alarm label \u00e9',
+                          'timestamp': 12345678, 'monday': False,
+                          'tuesday': True, 'wednesday': True,
+                          'thursday': False, 'friday': False,
+                          'saturday': False, 'sunday': True, 'station_id': 3})
+        # The dictionary can be used as a database row
+        self.assertEqual(
+            AlarmItem.from_row(alarm_test.to_dict()).to_tuple(),
+            expected_tuple)
+
+        binary = alarm_test.to_bytes()
+        self.assertIsInstance(binary, bytes)
+        self.assertEqual(len(binary), 22 + len('Alarm label \u00e9'.encode(
+            'utf-8')))
+        alarm_decoded = AlarmItem.from_bytes(binary)
+        self.assertIsInstance(alarm_decoded, AlarmItem)
+        self.assertEqual(alarm_decoded.to_tuple(), expected_tuple)
+
+        # Values not set yet (None) are kept
+        alarm_test = AlarmItem(7, 0, days=days, label='')
+        alarm_decoded = AlarmItem.from_bytes(alarm_test.to_bytes())
+        self.assertEqual(alarm_decoded.to_tuple(), alarm_test.to_tuple())
+        self.assertIsNone(alarm_decoded.id_)
+        self.assertIsNone(alarm_decoded.timestamp)
+        self.assertIsNone(alarm_decoded.station_id)
+
+    def test_snapshot(self):
+        """
+        Tests the snapshot is immutable, hashable and only replaced when the
+        alarm data changes.
+        """
+        days = (True, False, False, True, False, False, True)
+        alarm_test = AlarmItem(9, 30, days, True, label='label', alarm_id=5,
+                               timestamp=1234, station_id=2)
+        snapshot = alarm_test.snapshot()
+        self.assertEqual(snapshot.id_, 5)
+        self.assertEqual(snapshot.hour, 9)
+        self.assertEqual(snapshot.minute, 30)
+        self.assertEqual(snapshot.repeat, days)
+        self.assertEqual(snapshot.days_mask, alarm_test.days_mask)
+        self.assertEqual(snapshot.enabled, True)
+        self.assertEqual(snapshot.label, 'label')
+        self.assertEqual(snapshot.timestamp, 1234)
+        self.assertEqual(snapshot.station_id, 2)
+        self.assertEqual(snapshot.version, alarm_test.version)
+        self.assertTrue(snapshot.is_active())
+        self.assertEqual(str(snapshot), str(alarm_test))
+        self.assertEqual(snapshot.to_dict(), alarm_test.to_dict())
+        self.assertIs(snapshot.snapshot(), snapshot)
+
+        # Immutable
+        with self.assertRaises(AttributeError):
+            snapshot.hour = 10
+        with self.assertRaises(AttributeError):
+            del snapshot.hour
+        self.assertEqual(snapshot.hour, 9)
+
+        # Same instance until the alarm data changes
+        self.assertIs(alarm_test.snapshot(), snapshot)
+        version = alarm_test.version
+        alarm_test.tuesday = True
+        self.assertGreater(alarm_test.version, version)
+        new_snapshot = alarm_test.snapshot()
+        self.assertIsNot(new_snapshot, snapshot)
+        self.assertNotEqual(new_snapshot, snapshot)
+        self.assertEqual(snapshot.repeat, days)
+        self.assertTrue(new_snapshot.repeat[1])
+
+        # Equality and hash are based on the data, not the instance
+        same_data = AlarmItem(9, 30, days, True, label='label', alarm_id=5,
+                              timestamp=1234, station_id=2).snapshot()
+        self.assertEqual(same_data, snapshot)
+        self.assertEqual(hash(same_data), hash(snapshot))
+        self.assertEqual(len(set([snapshot, same_data, new_snapshot])), 2)
+
+        # Back to an AlarmItem and derived offset alarms
+        alarm_copy = snapshot.to_alarm_item()
+        self.assertIsInstance(alarm_copy, AlarmItem)
+        self.assertEqual(alarm_copy.snapshot(), snapshot)
+        diff_snapshot = snapshot.diff_alarm(-15)
+        self.assertEqual(diff_snapshot.minute, 15)
+        self.assertEqual(diff_snapshot.repeat, days)
+
     def test_string_alarm(self):
         """ Checks the __str__ output is correct. """
         test_alarm = AlarmItem(
@@ -475,6 +724,62 @@ class AlarmItemTestCase(unittest.TestCase):
         test_alarm.repeat = (False, False, False, False, False, False, False)
         self.assertFalse(test_alarm.any_day_enabled())
 
+    def test_occurrences(self):
+        """
+        Tests the occurrences generator against a minute by minute walk of two
+        weeks, including the start and end limits and the offset alerts.
+        """
+        days = (True, False, False, True, False, False, True)
+        alarm_test = AlarmItem(7, 30, days, enabled=True, alarm_id=3)
+        # 2015-06-01 was a Monday
+        start = datetime(2015, 6, 1, 0, 0)
+        end = start + timedelta(days=14)
+        expected = []
+        walk = start
+        while walk < end:
+            if days[walk.weekday()] and (walk.hour, walk.minute) == (7, 30):
+                expected.append(walk)
+            walk += timedelta(minutes=1)
+
+        occurrences = list(alarm_test.occurrences(start, end))
+        self.assertEqual([alert for alert, _, _ in occurrences], expected)
+        for _, alarm, kind in occurrences:
+            self.assertIs(alarm, alarm_test)
+            self.assertEqual(kind, AlarmItem.alarm_kind)
+
+        # Start is included, even with seconds within the alert minute is not
+        alerts = [alert for alert, _, _ in alarm_test.occurrences(
+            datetime(2015, 6, 1, 7, 30), datetime(2015, 6, 4, 7, 30))]
+        self.assertEqual(alerts, [datetime(2015, 6, 1, 7, 30)])
+        alerts = [alert for alert, _, _ in alarm_test.occurrences(
+            datetime(2015, 6, 1, 7, 30, 10), datetime(2015, 6, 4, 7, 31))]
+        self.assertEqual(alerts, [datetime(2015, 6, 4, 7, 30)])
+
+        # Without end it keeps going, and it is not affected by later edits
+        generator = alarm_test.occurrences(start)
+        first_alerts = list(itertools.islice(generator, 2))
+        alarm_test.hour = 9
+        self.assertEqual(
+            [alert for alert, _, _ in first_alerts + [next(generator)]],
+            expected[:3])
+        self.assertEqual(next(alarm_test.occurrences(start))[0],
+                         datetime(2015, 6, 1, 9, 30))
+
+        # Offset alerts, -90 minutes from 00:30 on Monday is Sunday at 23:00
+        alarm_test = AlarmItem(
+            0, 30, (True, False, False, False, False, False, False),
+            enabled=True)
+        occurrences = list(alarm_test.occurrences(start, end, -90))
+        self.assertEqual(
+            [alert for alert, _, _ in occurrences],
+            [datetime(2015, 6, 7, 23, 0), datetime(2015, 6, 14, 23, 0)])
+        self.assertEqual(occurrences[0][2], AlarmItem.offset_kind)
+        self.assertIs(occurrences[0][1], alarm_test)
+
+        # No repeat days
+        alarm_test = AlarmItem(7, 30, enabled=True)
+        self.assertEqual(list(alarm_test.occurrences(start)), [])
+
     def test_diff_alarm(self):
         """ Tests the diff_alarm method returned Alarms. """
         # Helper function to assert the alarm properties, takes the outer scope
@@ -604,15 +909,10 @@ class AlarmItemTestCase(unittest.TestCase):
             test_alarm.diff_alarm(time_diff)
             self.assertEqual(test_srderr.getvalue(), '')
 
-            # Lower boundary
-            time_diff = -60
-            test_alarm.diff_alarm(time_diff)
-            self.assert_stderr(test_srderr)
-
-            # Upper boundary
-            time_diff = 60
-            test_alarm.diff_alarm(time_diff)
-            self.assert_stderr(test_srderr)
+            # Offsets of any size are valid
+            for time_diff in (-60, 60, -1440 * 9, 1440 * 9):
+                test_alarm.diff_alarm(time_diff)
+                self.assertEqual(test_srderr.getvalue(), '')
 
             # other types instead of integer
             time_diff = 0.1
@@ -622,6 +922,64 @@ class AlarmItemTestCase(unittest.TestCase):
             test_alarm.diff_alarm(time_diff)
             self.assert_stderr(test_srderr)
 
+    def test_diff_alarm_large_offsets(self):
+        """
+        Tests diff_alarm with offsets larger than an hour, comparing the result
+        with the weekday and time of each alert moved by the offset.
+        """
+        test_days = (True, False, False, True, True, False, False)
+        test_alarm = AlarmItem(
+            6, 15, days=test_days, enabled=True, label='test', alarm_id=4)
+        for time_diff in (-90, 90, -1440, 1440, -3000, 4321, -1440 * 7,
+                          1440 * 7, -20000, 20000):
+            expected_days = [False] * 7
+            for day, repeats in enumerate(test_days):
+                if repeats is True:
+                    week_minute = (day * 1440) + (6 * 60) + 15 + time_diff
+                    expected_days[(week_minute // 1440) % 7] = True
+                    expected_day_minute = week_minute % 1440
+            diff_alarm = test_alarm.diff_alarm(time_diff)
+            self.assertEqual(diff_alarm.hour, expected_day_minute // 60)
+            self.assertEqual(diff_alarm.minute, expected_day_minute % 60)
+            self.assert_repeat(diff_alarm, expected_days)
+            self.assertEqual(diff_alarm.label,
+                             'test (Alarm 4 %+dmin)' % time_diff)
+
+        # A -90 minutes sunrise offset moves to the previous day
+        diff_alarm = AlarmItem(
+            1, 0, days=(True, False, False, False, False, False, False),
+            enabled=True, alarm_id=4).diff_alarm(-90)
+        self.assertEqual((diff_alarm.hour, diff_alarm.minute), (23, 30))
+        self.assert_repeat(
+            diff_alarm, (False, False, False, False, False, False, True))
+
+    def test_diff_alarm_memoized(self):
+        """
+        Tests the diff_alarm results are memoized per alarm version and offset.
+        """
+        test_alarm = AlarmItem(
+            9, 30, days=(True, False, False, False, False, False, False),
+            enabled=True, alarm_id=4)
+        snapshot = test_alarm.snapshot()
+        diff_snapshot = snapshot.diff_alarm(-90)
+        self.assertIs(snapshot.diff_alarm(-90), diff_snapshot)
+        self.assertIsNot(snapshot.diff_alarm(90), diff_snapshot)
+        self.assertIs(test_alarm.snapshot().diff_alarm(-90), diff_snapshot)
+        self.assertEqual(diff_snapshot.version, test_alarm.version)
+
+        # AlarmItem.diff_alarm returns a new copy of the memoized result
+        diff_alarm = test_alarm.diff_alarm(-90)
+        self.assertIsInstance(diff_alarm, AlarmItem)
+        self.assertIsNot(diff_alarm, test_alarm.diff_alarm(-90))
+        self.assertEqual(diff_alarm.snapshot(), diff_snapshot)
+
+        # A new version calculates a new offset alarm
+        test_alarm.hour = 10
+        new_diff_snapshot = test_alarm.snapshot().diff_alarm(-90)
+        self.assertIsNot(new_diff_snapshot, diff_snapshot)
+        self.assertEqual(new_diff_snapshot.hour, 9)
+        self.assertEqual(diff_snapshot.hour, 8)
+
 
 if __name__ == '__main__':
     unittest.main()
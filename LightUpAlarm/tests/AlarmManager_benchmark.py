@@ -0,0 +1,90 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Benchmark for the AlarmManager read throughput from several threads.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# Runs the AlarmManager getters from 1, 2, 4 and 8 threads at the same time
+# and prints the total number of reads per second, with and without a thread
+# editing the alarms in the background. It is not part of the unit tests, run
+# it directly with: python AlarmManager_benchmark.py
+# It uses the default alarms database, which alarms are deleted.
+#
+from __future__ import unicode_literals, absolute_import, print_function
+import time
+import threading
+try:
+    from LightUpAlarm.AlarmManager import AlarmManager
+except ImportError:
+    import os
+    import sys
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    from LightUpAlarm.AlarmManager import AlarmManager
+
+
+NUMBER_OF_ALARMS = 50
+READS_PER_THREAD = 200
+THREAD_COUNTS = (1, 2, 4, 8)
+
+
+def read_alarms(alarm_mgr, alarm_ids):
+    """ Reads all the alarms, one alarm and the next alarm. """
+    for i in range(READS_PER_THREAD):
+        alarm_mgr.get_all_alarms()
+        alarm_mgr.get_alarm(alarm_ids[i % len(alarm_ids)])
+        alarm_mgr.get_next_alarm()
+
+
+def edit_alarms(alarm_mgr, alarm_ids, stop_event):
+    """ Edits the alarms until the stop event is set. """
+    i = 0
+    while not stop_event.is_set():
+        alarm_mgr.edit_alarm(alarm_ids[i % len(alarm_ids)], minute=i % 60)
+        i += 1
+
+
+def benchmark(alarm_mgr, alarm_ids, number_of_threads, with_edits):
+    """ Prints the total reads per second of the reading threads. """
+    stop_event = threading.Event()
+    editor = threading.Thread(
+        target=edit_alarms, args=(alarm_mgr, alarm_ids, stop_event))
+    threads = [threading.Thread(target=read_alarms, args=(alarm_mgr, alarm_ids))
+               for _ in range(number_of_threads)]
+    if with_edits is True:
+        editor.start()
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start_time
+    stop_event.set()
+    if with_edits is True:
+        editor.join()
+    # Each read_alarms loop does 3 reads
+    reads = number_of_threads * READS_PER_THREAD * 3
+    print('%d thread(s)%s %10.1f reads/s' %
+          (number_of_threads, ' + editor' if with_edits else ' ' * 9,
+           reads / elapsed))
+
+
+def main():
+    alarm_mgr = AlarmManager()
+    alarm_mgr.delete_all_alarms()
+    alarm_ids = [alarm_mgr.add_alarm(
+        i % 24, i % 60, days=(True, False, True, False, True, False, False),
+        enabled=False, label='') for i in range(NUMBER_OF_ALARMS)]
+    print('Reading %d alarms, %d loops per thread:' %
+          (NUMBER_OF_ALARMS, READS_PER_THREAD))
+    for with_edits in (False, True):
+        for number_of_threads in THREAD_COUNTS:
+            benchmark(alarm_mgr, alarm_ids, number_of_threads, with_edits)
+    alarm_mgr.delete_all_alarms()
+
+
+if __name__ == '__main__':
+    main()
@@ -15,14 +15,18 @@
 from __future__ import unicode_literals, absolute_import
 import io
 import mock
+import itertools
 import time
 import types
 import unittest
 import threading
+from datetime import datetime, timedelta
 try:
     from LightUpAlarm.AlarmDb import AlarmDb
     from LightUpAlarm.AlarmItem import AlarmItem
     from LightUpAlarm.AlarmManager import AlarmManager
+    from LightUpAlarm.AlarmEventBus import AlarmEventBus
+    from LightUpAlarm.VirtualClock import VirtualClock
 except ImportError:
     import os
     import sys
@@ -32,6 +36,8 @@ except ImportError:
     from LightUpAlarm.AlarmDb import AlarmDb
     from LightUpAlarm.AlarmItem import AlarmItem
     from LightUpAlarm.AlarmManager import AlarmManager
+    from LightUpAlarm.AlarmEventBus import AlarmEventBus
+    from LightUpAlarm.VirtualClock import VirtualClock
 
 
 class AlarmManagerTestCase(unittest.TestCase):
@@ -162,6 +168,36 @@ class AlarmManagerTestCase(unittest.TestCase):
                 8, 30, (False, True, False, True, False, True, False), 2.3)
             self.assertIsNone(add_success)
 
+    def test_add_alarms(self):
+        """
+        Adds a batch of alarms with valid and invalid data and checks only the
+        valid ones are saved and launched.
+        """
+        alarm_mgr = AlarmManager()
+        alarm_mgr.delete_all_alarms()
+        alarm_ids, errors = alarm_mgr.add_alarms([
+            {'hour': self.hour, 'minute': 20, 'monday': True},
+            {'hour': 25, 'minute': 20},
+            {'hour': self.hour, 'minute': 30, 'enabled': False,
+             'label': 'disabled', 'station_id': 3}])
+        self.assertEqual(len(alarm_ids), 3)
+        self.assertEqual(errors[0], [])
+        self.assertEqual([error['field'] for error in errors[1]], ['hour'])
+        self.assertEqual(errors[2], [])
+        self.assertIsNone(alarm_ids[1])
+        self.assertEqual(AlarmManager.get_number_of_alarms(), 2)
+
+        self.assert_alarm(AlarmManager.get_alarm(alarm_ids[0]), alarm_ids[0],
+                          self.hour, 20,
+                          (True, False, False, False, False, False, False),
+                          True, '')
+        self.assertEqual(AlarmManager.get_alarm(alarm_ids[0]).station_id, 1)
+        self.assertTrue(alarm_mgr.is_alarm_running(alarm_ids[0]))
+        self.assert_alarm(AlarmManager.get_alarm(alarm_ids[2]), alarm_ids[2],
+                          self.hour, 30, (False,) * 7, False, 'disabled')
+        self.assertEqual(AlarmManager.get_alarm(alarm_ids[2]).station_id, 3)
+        self.assertFalse(alarm_mgr.is_alarm_running(alarm_ids[2]))
+
     def test_dummy_alarms(self):
         """
         Tests that if the database is empty it will populate it with the dummy
@@ -276,6 +312,149 @@ class AlarmManagerTestCase(unittest.TestCase):
         next_alarm = AlarmManager.get_next_alarm()
         self.assertEqual(next_alarm.id_, 3)
 
+    @mock.patch('LightUpAlarm.AlarmManager.time.time')
+    @mock.patch('LightUpAlarm.AlarmManager.time.localtime')
+    def test_get_next_alarm_cache(self, mock_localtime, mock_time):
+        """
+        Checks the next alarm result is reused until its alert time passes or
+        the alarms are modified.
+        """
+        alarm_mgr = AlarmManager()
+        self.create_alarms(alarm_mgr)
+
+        def set_time(weekday, hour, minute):
+            # Real time in seconds has to advance with the local time
+            mock_time.return_value = \
+                1500000000 + (((weekday * 24 + hour) * 60) + minute) * 60
+            #     year, mon, mday, hour, min, sec, wday, yday, isdst
+            mock_localtime.return_value = time.struct_time(
+                (2015, 0, 0, hour, minute, 0, weekday, 0, 0))
+
+        get_alarm_set = AlarmManager.alarmdb.get_alarm_set
+        with mock.patch.object(AlarmManager.alarmdb, 'get_alarm_set',
+                               wraps=get_alarm_set) as mock_alarm_set:
+            # Alarm 4 is the next on Tuesday at 13:35
+            set_time(1, 10, 0)
+            next_alarm = AlarmManager.get_next_alarm()
+            self.assertEqual(next_alarm.id_, 4)
+            self.assertEqual(next_alarm.next_alert, 215)
+            self.assertEqual(mock_alarm_set.call_count, 1)
+
+            # Cached until the alert time
+            set_time(1, 12, 0)
+            next_alarm = AlarmManager.get_next_alarm()
+            self.assertEqual(next_alarm.id_, 4)
+            self.assertEqual(next_alarm.next_alert, 95)
+            set_time(1, 13, 35)
+            self.assertEqual(AlarmManager.get_next_alarm().next_alert, 0)
+            self.assertEqual(mock_alarm_set.call_count, 1)
+
+            # After the alert time it is calculated again, alarm 2 on Wednesday
+            # at 9:00, but the alarms are not loaded again
+            set_time(1, 13, 36)
+            next_alarm = AlarmManager.get_next_alarm()
+            self.assertEqual(next_alarm.id_, 2)
+            self.assertEqual(next_alarm.next_alert, 1164)
+            self.assertEqual(mock_alarm_set.call_count, 1)
+
+            # The returned alarm is a copy
+            next_alarm.hour = 5
+            self.assertEqual(AlarmManager.get_next_alarm().hour, 9)
+
+            # Modifications invalidate the cache
+            alarm_mgr.edit_alarm(1, days=(True,) * 7)
+            next_alarm = AlarmManager.get_next_alarm()
+            self.assertEqual(next_alarm.id_, 1)
+            self.assertEqual(mock_alarm_set.call_count, 2)
+            AlarmDb().edit_alarm(1, enabled=False)
+            self.assertEqual(AlarmManager.get_next_alarm().id_, 2)
+            self.assertEqual(mock_alarm_set.call_count, 3)
+
+            # No active alarms is also cached
+            alarm_mgr.delete_all_alarms()
+            self.assertIsNone(AlarmManager.get_next_alarm())
+            self.assertIsNone(AlarmManager.get_next_alarm())
+            self.assertEqual(mock_alarm_set.call_count, 4)
+
+    @mock.patch('LightUpAlarm.AlarmManager.time.localtime')
+    def test_get_next_alarms(self, mock_time):
+        """ Checks the top next alarms are in alert order. """
+        alarm_mgr = AlarmManager()
+        self.create_alarms(alarm_mgr)
+        #             year, mon, mday, hour, min, sec, wday, yday, isdst
+        time_tuple = (2015,  0,     0,   10,  00,  00,   1,    0,     0)
+        mock_time.return_value = time.struct_time(time_tuple)
+        next_alarms = AlarmManager.get_next_alarms(3)
+        self.assertEqual([alarm.id_ for alarm in next_alarms], [4, 2, 5])
+        self.assertEqual([alarm.next_alert for alarm in next_alarms],
+                         [215, 1380, 2085])
+        self.assertEqual(
+            [alarm.id_ for alarm in AlarmManager.get_next_alarms(10)],
+            [4, 2, 5, 1, 3])
+        self.assertEqual(AlarmManager.get_next_alarms(0), [])
+
+    def test_get_next_alarm_clock(self):
+        """ Tests the next alarm is calculated with the class clock. """
+        alarm_mgr = AlarmManager()
+        self.create_alarms(alarm_mgr)
+        # Monday 1st of June 2015 at 8:00
+        clock = VirtualClock(time.mktime(datetime(2015, 6, 1, 8).timetuple()),
+                             auto_advance=False)
+        with mock.patch.object(AlarmManager, 'clock', clock):
+            next_alarm = alarm_mgr.get_next_alarm()
+            self.assertEqual(next_alarm.id_, 3)
+            self.assertEqual(next_alarm.next_alert, 195)
+            clock.advance(4 * 60 * 60)
+            next_alarm = alarm_mgr.get_next_alarm()
+            self.assertEqual(next_alarm.id_, 1)
+            self.assertEqual(next_alarm.next_alert, 1230)
+            self.assertEqual([alarm.id_ for alarm in
+                              alarm_mgr.get_next_alarms(3)], [1, 4, 2])
+
+    def test_iter_occurrences(self):
+        """
+        Creates 5 alarms and checks the merged occurrences of a week are in
+        time order and match the occurrences of each individual alarm.
+        """
+        alarm_mgr = AlarmManager()
+        self.create_alarms(alarm_mgr)
+        alarm_mgr.add_alarm(  # id 6, not active
+            8, 30, (True, True, True, True, True, True, True), False, '')
+        # 2015-06-01 was a Monday
+        start = datetime(2015, 6, 1, 0, 0)
+        end = start + timedelta(days=7)
+
+        occurrences = list(AlarmManager.iter_occurrences(start, end))
+        alerts = [alert for alert, _, _ in occurrences]
+        self.assertEqual(alerts, sorted(alerts))
+        expected = []
+        for alarm in AlarmManager.get_all_active_alarms():
+            expected += [(alert, alarm.id_) for alert, _, _ in
+                         alarm.occurrences(start, end)]
+        self.assertEqual(sorted(expected),
+                         sorted([(alert, alarm.id_)
+                                 for alert, alarm, _ in occurrences]))
+        # Monday only has alarm 3, Tuesday starts with alarm 1
+        self.assertEqual([(alert, alarm.id_) for alert, alarm, _ in
+                          occurrences[:2]],
+                         [(datetime(2015, 6, 1, 11, 15), 3),
+                          (datetime(2015, 6, 2, 8, 30), 1)])
+
+        # Offset alerts go after the alarm alerts at the same time
+        AlarmManager.set__offset_alert_time(-15)
+        occurrences = list(itertools.islice(
+            AlarmManager.iter_occurrences(start, offset_alert=True), 4))
+        self.assertEqual(
+            [(alert, alarm.id_, kind) for alert, alarm, kind in occurrences],
+            [(datetime(2015, 6, 1, 11, 0), 3, AlarmItem.offset_kind),
+             (datetime(2015, 6, 1, 11, 15), 3, AlarmItem.alarm_kind),
+             (datetime(2015, 6, 2, 8, 15), 1, AlarmItem.offset_kind),
+             (datetime(2015, 6, 2, 8, 30), 1, AlarmItem.alarm_kind)])
+
+        # No active alarms
+        alarm_mgr.delete_all_alarms()
+        self.assertEqual(list(AlarmManager.iter_occurrences(start)), [])
+
     def test_edit_alarm(self):
         """
         Places 5 alarms into the database, it then retrieves one, edits it and
@@ -345,9 +524,10 @@ class AlarmManagerTestCase(unittest.TestCase):
 
     def test_set_alarm_thread(self):
         """
-        Test that the __set_alarm_thread private method will only launch an
+        Test that the __set_alarm_thread private method will only schedule an
         Alarm Thread if there is an active alarm.
-        Ensure the thread has been launched successfully.
+        Ensure the thread has been scheduled successfully, without launching
+        a new thread per alarm.
         This test accesses private methods.
         """
         alarm = AlarmItem(self.hour, 34,
@@ -355,25 +535,36 @@ class AlarmManagerTestCase(unittest.TestCase):
                           enabled=False, label='test', alarm_id=96)
         alarm_mgr = AlarmManager()
         alarm_mgr.delete_all_alarms()
-        numb_threads = threading.activeCount()
 
         # Test setting inactive alarm
         launch_success = alarm_mgr._AlarmManager__set_alarm_thread(alarm)
         self.assertFalse(launch_success)
-        self.assertEqual(threading.activeCount(), numb_threads)
+        self.assertFalse(alarm_mgr.is_alarm_running(alarm.id_))
 
         # Test enabled alarm with no repeats
         alarm.repeat = (False, False, False, False, False, False, False)
         alarm.enabled = True
         launch_success = alarm_mgr._AlarmManager__set_alarm_thread(alarm)
         self.assertFalse(launch_success)
-        self.assertEqual(threading.activeCount(), numb_threads)
+        self.assertFalse(alarm_mgr.is_alarm_running(alarm.id_))
 
         # Test fully active alarm
         alarm.wednesday = True
         launch_success = alarm_mgr._AlarmManager__set_alarm_thread(alarm)
         self.assertTrue(launch_success)
-        self.assertGreater(threading.activeCount(), numb_threads)
+        self.assertTrue(alarm_mgr.is_alarm_running(alarm.id_))
+        numb_threads = threading.activeCount()
+
+        # More alarms are run by the same scheduler thread
+        for alarm_id in range(97, 107):
+            another_alarm = AlarmItem(
+                self.hour, 34, days=(True, True, True, True, True, True, True),
+                enabled=True, label='test', alarm_id=alarm_id)
+            launch_success = \
+                alarm_mgr._AlarmManager__set_alarm_thread(another_alarm)
+            self.assertTrue(launch_success)
+        self.assertEqual(threading.activeCount(), numb_threads)
+        alarm_mgr._AlarmManager__stop_all_alarm_threads()
 
     def test_set_alarm_thread_edit(self):
         """
@@ -390,34 +581,33 @@ class AlarmManagerTestCase(unittest.TestCase):
                                     False))
         alarm_mgr = AlarmManager()
         alarm_mgr.delete_all_alarms()
-        numb_threads = threading.activeCount()
         launch_success = alarm_mgr._AlarmManager__set_alarm_thread(first_alarm)
         self.assertTrue(launch_success)
-        self.assertGreater(threading.activeCount(), numb_threads)
+        self.assertTrue(alarm_mgr.is_alarm_running(first_alarm.id_))
 
         # Editing to the new alarm data should stop the thread as it is inactive
         launch_success = alarm_mgr._AlarmManager__set_alarm_thread(new_alarm)
         self.assertFalse(launch_success)
-        self.assertEqual(threading.activeCount(), numb_threads)
+        self.assertFalse(alarm_mgr.is_alarm_running(first_alarm.id_))
+        self.assertNotIn(
+            first_alarm.id_, alarm_mgr._AlarmManager__alarm_threads)
 
     def test_stop_alarm_thread(self):
         """
-        Test that the __stop_alarm_thread private method will stop a running
-        Alarm Thread, which due to the nature of the thread code can take up to
-        10 seconds.
+        Test that the __stop_alarm_thread private method will unschedule a
+        running Alarm Thread.
         This test accesses private methods.
         """
         alarm = AlarmItem(self.hour, 34, enabled=True, label='t', alarm_id=96,
                           days=(False, True, True, True, True, True, True))
         alarm_mgr = AlarmManager()
         alarm_mgr.delete_all_alarms()
-        numb_threads = threading.activeCount()
         launch_success = alarm_mgr._AlarmManager__set_alarm_thread(alarm)
         self.assertTrue(launch_success)
-        self.assertGreater(threading.activeCount(), numb_threads)
+        self.assertTrue(alarm_mgr.is_alarm_running(alarm.id_))
         stop_success = alarm_mgr._AlarmManager__stop_alarm_thread(alarm.id_)
         self.assertTrue(stop_success)
-        self.assertEqual(threading.activeCount(), numb_threads)
+        self.assertFalse(alarm_mgr.is_alarm_running(alarm.id_))
 
     def test_stop_all_alarm_threads(self):
         """
@@ -438,11 +628,12 @@ class AlarmManagerTestCase(unittest.TestCase):
         self.assertTrue(launch_success)
         launch_success = alarm_mgr._AlarmManager__set_alarm_thread(alarm_two)
         self.assertTrue(launch_success)
-        numb_threads = threading.activeCount()
-        self.assertGreaterEqual(numb_threads, 2)
+        self.assertEqual(
+            sorted(alarm.id_ for alarm in alarm_mgr.get_live_alarms()),
+            [31, 32])
         delete_success = alarm_mgr._AlarmManager__stop_all_alarm_threads()
         self.assertTrue(delete_success)
-        self.assertEqual(threading.activeCount(), numb_threads - 2)
+        self.assertEqual(alarm_mgr.get_live_alarms(), [])
 
     def test_get_running_alarms(self):
         """
@@ -462,6 +653,40 @@ class AlarmManagerTestCase(unittest.TestCase):
         running_alarms = alarm_mgr.get_running_alarms()
         self.assertEqual(len(running_alarms), 0)
 
+    def test_get_running_alarms_queries(self):
+        """
+        Checks get_running_alarms does not query each alarm individually, and
+        the live alarms are taken from the threads without database access.
+        """
+        alarm_mgr = AlarmManager()
+        self.create_alarms(alarm_mgr)
+        alarm_mgr.edit_alarm(2, enabled=False)
+        with mock.patch.object(AlarmManager.alarmdb, 'get_alarm') as \
+                mock_get_alarm:
+            running_alarms = alarm_mgr.get_running_alarms()
+            self.assertEqual(mock_get_alarm.call_count, 0)
+        self.assertEqual([alarm.id_ for alarm in running_alarms], [1, 3, 4, 5])
+        self.assert_alarm(running_alarms[0], 1, 8, 30,
+                          (False, True, False, True, False, True, False),
+                          True, '')
+
+        with mock.patch.object(AlarmManager.alarmdb, 'get_all_alarms') as \
+                mock_get_all_alarms:
+            live_alarms = alarm_mgr.get_live_alarms()
+            self.assertEqual(mock_get_all_alarms.call_count, 0)
+        self.assertEqual([alarm.id_ for alarm in live_alarms], [1, 3, 4, 5])
+        self.assertEqual(live_alarms[0], running_alarms[0].snapshot())
+
+        # Database changes bypassing AlarmManager are not seen by the live
+        # alarms until the threads are checked
+        AlarmDb().edit_alarm(3, enabled=False)
+        self.assertEqual([alarm.id_ for alarm in alarm_mgr.get_live_alarms()],
+                         [1, 3, 4, 5])
+        self.assertEqual(
+            [alarm.id_ for alarm in alarm_mgr.get_running_alarms()], [1, 4, 5])
+        self.assertEqual([alarm.id_ for alarm in alarm_mgr.get_live_alarms()],
+                         [1, 4, 5])
+
     def test_alarm_trigger_callback(self):
         """
         Creates and alarm to trigger within a minute and check it has done so
@@ -508,6 +733,26 @@ class AlarmManagerTestCase(unittest.TestCase):
         self.assertTrue(alarm_mgr.is_alarm_running(alarm_active.id_))
         self.assertFalse(alarm_mgr.is_alarm_running(alarm_inactive.id_))
 
+    def test_alarm_threads_registry(self):
+        """
+        Checks the alarm threads are registered by alarm ID, and that a dead
+        thread of an alarm no longer active is removed by check_threads_state.
+        """
+        alarm_mgr = AlarmManager()
+        self.create_alarms(alarm_mgr)
+        alarm_mgr.edit_alarm(2, enabled=False)
+        alarm_threads = alarm_mgr._AlarmManager__alarm_threads
+        self.assertEqual(set(alarm_threads), set([1, 3, 4, 5]))
+        for alarm_id, alarm_thread in alarm_threads.items():
+            self.assertEqual(alarm_thread.get_id(), alarm_id)
+
+        # Unschedule a thread and disable its alarm bypassing AlarmManager
+        alarm_mgr._AlarmManager__scheduler.remove(alarm_threads[3])
+        AlarmDb().edit_alarm(3, enabled=False)
+        self.assertFalse(alarm_mgr.check_threads_state())
+        self.assertEqual(set(alarm_threads), set([1, 4, 5]))
+        self.assertTrue(alarm_mgr.check_threads_state())
+
     def test_check_threads_state(self):
         """ Test almost all pathways of check_threads_state. """
         alarm_mgr = AlarmManager()
@@ -516,14 +761,14 @@ class AlarmManagerTestCase(unittest.TestCase):
         self.assertTrue(check_result)
 
         # Now that everything is working correctly, sneak around AlarmManager
-        # and edit a running thread by editing an AlarmItem using the
-        # AlarmThread internal reference to the AlarmItem instance (which does
-        # not do the extra checks for tracking like AlarmManager does).
-        # Also edit the database entry for that alarm bypassing AlarmManager.
-        alarm_bypass = \
-            alarm_mgr._AlarmManager__alarm_threads[0]._AlarmThread__alarm
-        alarm_bypass.enabled = False
-        alarm_id = alarm_bypass.id_
+        # and edit the database entry of a running alarm thread bypassing
+        # AlarmManager (which does the extra checks for tracking). The thread
+        # holds an immutable snapshot of the alarm, so it cannot be edited
+        # directly.
+        alarm_id = min(alarm_mgr._AlarmManager__alarm_threads)
+        alarm_bypass = alarm_mgr._AlarmManager__alarm_threads[
+            alarm_id]._AlarmThread__alarm
+        self.assertEqual(alarm_bypass.id_, alarm_id)
         AlarmDb().edit_alarm(alarm_id, enabled=False)
         check_result = alarm_mgr.check_threads_state()
         self.assertFalse(check_result)
@@ -535,8 +780,7 @@ class AlarmManagerTestCase(unittest.TestCase):
         # Now the thread for alarm 'alarm_bypass' with ID 'alarm_id' has been
         # stopped, we can bypass AlarmManager again to activate it and check
         # if check_threads_state recovers again.
-        alarm_bypass.enabled = True
-        AlarmDb().edit_alarm(alarm_bypass.id_, enabled=True)
+        AlarmDb().edit_alarm(alarm_id, enabled=True)
         check_result = alarm_mgr.check_threads_state()
         self.assertFalse(check_result)
         check_result = alarm_mgr.check_threads_state()
@@ -552,10 +796,9 @@ class AlarmManagerTestCase(unittest.TestCase):
         check_result = alarm_mgr.check_threads_state()
         self.assertTrue(check_result)
 
-        # Now we stop a running thread bypassing AlarmManager public methods
-        alarm_mgr._AlarmManager__alarm_threads[0].stop()
-        while alarm_mgr._AlarmManager__alarm_threads[0].isAlive():
-            time.sleep(0.1)
+        # Now we unschedule a thread bypassing AlarmManager public methods
+        alarm_mgr._AlarmManager__scheduler.remove(
+            alarm_mgr._AlarmManager__alarm_threads[alarm_id])
         check_result = alarm_mgr.check_threads_state()
         self.assertFalse(check_result)
         check_result = alarm_mgr.check_threads_state()
@@ -567,5 +810,457 @@ class AlarmManagerTestCase(unittest.TestCase):
         # not tested.
 
 
+    def test_reconcile_threads(self):
+        """
+        Checks the incremental reconciliation skips the work if nothing has
+        changed, corrects the threads otherwise, and updates the metrics.
+        """
+        alarm_mgr = AlarmManager()
+        self.create_alarms(alarm_mgr)
+        alarm_mgr.check_threads_state()
+        metrics = alarm_mgr.get_reconciler_metrics()
+
+        # Nothing changed since the last check, the database is not read
+        with mock.patch.object(AlarmManager.alarmdb, 'get_all_alarms') as \
+                mock_get_all_alarms:
+            self.assertIsNone(alarm_mgr.reconcile_threads())
+            self.assertEqual(mock_get_all_alarms.call_count, 0)
+        new_metrics = alarm_mgr.get_reconciler_metrics()
+        self.assertEqual(new_metrics['checks'], metrics['checks'] + 1)
+        self.assertEqual(new_metrics['skipped'], metrics['skipped'] + 1)
+        self.assertEqual(new_metrics['reconciliations'],
+                         metrics['reconciliations'])
+        self.assertIsNotNone(new_metrics['last_check'])
+        self.assertIsNotNone(new_metrics['last_duration'])
+
+        # Database edited bypassing AlarmManager
+        metrics = new_metrics
+        AlarmDb().edit_alarm(2, enabled=False)
+        self.assertFalse(alarm_mgr.reconcile_threads())
+        self.assertFalse(alarm_mgr.is_alarm_running(2))
+        new_metrics = alarm_mgr.get_reconciler_metrics()
+        self.assertEqual(new_metrics['drift'], metrics['drift'] + 1)
+        self.assertEqual(new_metrics['threads_stopped'],
+                         metrics['threads_stopped'] + 1)
+        self.assertIsNone(alarm_mgr.reconcile_threads())
+
+        # A dead thread is detected without database changes
+        metrics = alarm_mgr.get_reconciler_metrics()
+        alarm_mgr._AlarmManager__scheduler.remove(
+            alarm_mgr._AlarmManager__alarm_threads[3])
+        self.assertFalse(alarm_mgr.reconcile_threads())
+        self.assertTrue(alarm_mgr.is_alarm_running(3))
+        new_metrics = alarm_mgr.get_reconciler_metrics()
+        self.assertEqual(new_metrics['threads_started'],
+                         metrics['threads_started'] + 1)
+        self.assertIsNone(alarm_mgr.reconcile_threads())
+
+    def test_background_reconciler(self):
+        """ Checks the background reconciler corrects the threads. """
+        alarm_mgr = AlarmManager()
+        self.create_alarms(alarm_mgr)
+        self.assertFalse(alarm_mgr.is_reconciler_running())
+        self.assertTrue(alarm_mgr.start_reconciler(0.05))
+        self.assertTrue(alarm_mgr.is_reconciler_running())
+
+        AlarmDb().edit_alarm(4, enabled=False)
+        milliseconds_passed = 0
+        while alarm_mgr.is_alarm_running(4) and milliseconds_passed < 5000:
+            time.sleep(0.05)
+            milliseconds_passed += 50
+        self.assertFalse(alarm_mgr.is_alarm_running(4))
+        self.assertGreater(alarm_mgr.get_reconciler_metrics()['checks'], 0)
+
+        self.assertTrue(alarm_mgr.stop_reconciler())
+        self.assertFalse(alarm_mgr.is_reconciler_running())
+        self.assertTrue(alarm_mgr.stop_reconciler())
+
+    def test_events(self):
+        """ Tests the change events published by the AlarmManager. """
+        alarm_mgr = AlarmManager()
+        alarm_mgr.delete_all_alarms()
+        received = []
+        alarm_mgr.subscribe(received.extend, AlarmEventBus.change_events)
+        try:
+            alarm_id = alarm_mgr.add_alarm(
+                8, 30, (True, False, False, False, False, False, False), True)
+            alarm_mgr.edit_alarm(alarm_id, hour=9)
+            alarm_mgr.edit_alarm(alarm_id, minute=45)
+            alarm_mgr.set_snooze_time(5)
+            self.assertTrue(alarm_mgr.flush_events(5))
+            alarm_mgr.delete_alarm(alarm_id)
+            self.assertTrue(alarm_mgr.flush_events(5))
+        finally:
+            alarm_mgr.unsubscribe(received.extend)
+
+        events = [(event['type'], event['id']) for event in received]
+        self.assertEqual(events[0], (AlarmEventBus.alarm_added, alarm_id))
+        self.assertEqual(events[-2:], [
+            (AlarmEventBus.settings_changed, 'snooze_time'),
+            (AlarmEventBus.alarm_deleted, alarm_id)])
+        # The edits can be coalesced, the last one has the latest data
+        edits = [event for event in received
+                 if event['type'] == AlarmEventBus.alarm_edited]
+        self.assertIn(len(edits), (1, 2))
+        self.assertEqual((edits[-1]['data'].hour, edits[-1]['data'].minute),
+                         (9, 45))
+        self.assertIsNone(received[-1]['data'])
+
+        # Alerts from the alarm threads are published with the alarm ID
+        alerts = []
+        alarm_mgr.subscribe(alerts.extend, AlarmEventBus.alert_events)
+        try:
+            alarm = AlarmItem(
+                8, 30, (True, False, False, False, False, False, False), True,
+                alarm_id=alarm_id)
+            alarm_mgr._AlarmManager__alarm_alert(alarm.snapshot())
+            alarm_mgr._AlarmManager__offset_alarm_alert(
+                alarm_id, alarm.diff_alarm(-10))
+            self.assertTrue(alarm_mgr.flush_events(5))
+        finally:
+            alarm_mgr.unsubscribe(alerts.extend)
+        self.assertEqual(
+            [(event['type'], event['id']) for event in alerts],
+            [(AlarmEventBus.alarm_alert, alarm_id),
+             (AlarmEventBus.offset_alert, alarm_id)])
+
+    def test_apply_operations(self):
+        """
+        Tests a batch of operations is saved only if all of them are valid
+        when atomic, the valid ones are saved otherwise, and the alarm threads
+        and events follow the saved changes.
+        """
+        alarm_mgr = AlarmManager()
+        alarm_mgr.delete_all_alarms()
+        alarm_mgr.delete_all_stations()
+        days = (True, True, True, True, True, True, True)
+        enabled_id = alarm_mgr.add_alarm(8, 30, days, True)
+        disabled_id = alarm_mgr.add_alarm(9, 30, days, False)
+        station_id = alarm_mgr.add_station('name', 'url')
+        self.assertTrue(alarm_mgr.is_alarm_running(enabled_id))
+        operations = [
+            {'op': 'add', 'type': 'alarm',
+             'data': {'hour': 7, 'minute': 15, 'days': list(days),
+                      'enabled': True}},
+            {'op': 'edit', 'type': 'alarm', 'id': disabled_id,
+             'data': {'enabled': True}},
+            {'op': 'delete', 'type': 'alarm', 'id': enabled_id},
+            {'op': 'edit', 'type': 'station', 'id': station_id,
+             'data': {'name': 'new'}},
+            {'op': 'add', 'type': 'station',
+             'data': {'name': 'other', 'url': 'url'}},
+            {'op': 'edit', 'type': 'alarm', 'id': disabled_id,
+             'data': {'hour': 25}},
+            {'op': 'delete', 'type': 'alarm', 'id': 9999},
+            {'op': 'rename', 'type': 'alarm', 'id': enabled_id}]
+
+        # Atomic, nothing is saved
+        revision = alarm_mgr.get_revision()
+        committed, results = alarm_mgr.apply_operations(operations)
+        self.assertFalse(committed)
+        self.assertEqual([result['success'] for result in results],
+                         [False] * len(operations))
+        self.assertEqual([len(result['errors']) for result in results],
+                         [1] * len(operations))
+        self.assertEqual(results[5]['errors'][0]['field'], 'hour')
+        self.assertEqual(results[6]['errors'][0]['field'], 'id')
+        self.assertEqual(results[7]['errors'][0]['field'], 'op')
+        self.assertEqual(alarm_mgr.get_number_of_alarms(), 2)
+        self.assertEqual(len(alarm_mgr.get_all_stations()), 1)
+        self.assertEqual(alarm_mgr.get_station(station_id).name, 'name')
+        self.assertFalse(alarm_mgr.get_alarm(disabled_id).enabled)
+        self.assertNotEqual(alarm_mgr.get_revision(), revision)
+        self.assertTrue(alarm_mgr.is_alarm_running(enabled_id))
+        self.assertFalse(alarm_mgr.is_alarm_running(disabled_id))
+
+        # Not atomic, the valid operations are saved
+        received = []
+        alarm_mgr.subscribe(received.extend, AlarmEventBus.change_events)
+        try:
+            committed, results = alarm_mgr.apply_operations(
+                operations, atomic=False)
+            self.assertTrue(alarm_mgr.flush_events(5))
+        finally:
+            alarm_mgr.unsubscribe(received.extend)
+        self.assertTrue(committed)
+        self.assertEqual([result['success'] for result in results],
+                         [True] * 5 + [False] * 3)
+        new_id = results[0]['id']
+        self.assertEqual(alarm_mgr.get_alarm(new_id).hour, 7)
+        self.assertEqual(alarm_mgr.get_alarm(new_id).station_id, 1)
+        self.assertTrue(alarm_mgr.get_alarm(disabled_id).enabled)
+        self.assertEqual(alarm_mgr.get_alarm(disabled_id).hour, 9)
+        self.assertIsNone(alarm_mgr.get_alarm(enabled_id))
+        self.assertEqual(alarm_mgr.get_station(station_id).name, 'new')
+        self.assertEqual(alarm_mgr.get_station(results[4]['id']).name, 'other')
+        self.assertFalse(alarm_mgr.is_alarm_running(enabled_id))
+        self.assertTrue(alarm_mgr.is_alarm_running(disabled_id))
+        self.assertTrue(alarm_mgr.is_alarm_running(new_id))
+        self.assertEqual(
+            set((event['type'], event['id']) for event in received),
+            set([(AlarmEventBus.alarm_added, new_id),
+                 (AlarmEventBus.alarm_edited, disabled_id),
+                 (AlarmEventBus.alarm_deleted, enabled_id),
+                 (AlarmEventBus.station_edited, station_id),
+                 (AlarmEventBus.station_added, results[4]['id'])]))
+        alarm_mgr.delete_all_alarms()
+        alarm_mgr.delete_all_stations()
+
+    def test_snooze(self):
+        """
+        Tests snoozing and dismissing alarms, and the snoozes being restored
+        by a new AlarmManager.
+        """
+        alarm_mgr = AlarmManager()
+        self.create_alarms(alarm_mgr)
+        alarm_ids = sorted(alarm_mgr._AlarmManager__alarm_threads)
+        alarm_mgr.set_snooze_time(7)
+        self.assertIsNone(alarm_mgr.snooze(max(alarm_ids) + 1))
+
+        before = int(time.time())
+        alert_time = alarm_mgr.snooze(alarm_ids[0])
+        self.assertGreaterEqual(alert_time, before + (7 * 60))
+        self.assertLessEqual(alert_time, int(time.time()) + (7 * 60))
+        self.assertEqual(alarm_mgr.get_snoozes(), {alarm_ids[0]: alert_time})
+        self.assertEqual(AlarmManager.alarmdb.get_all_snoozes(),
+                         {alarm_ids[0]: alert_time})
+        alarm_mgr.snooze(alarm_ids[1])
+
+        # Dismissed snoozes are removed from the thread and the database
+        self.assertTrue(alarm_mgr.dismiss(alarm_ids[1]))
+        self.assertFalse(alarm_mgr.dismiss(alarm_ids[1]))
+        self.assertEqual(alarm_mgr.get_snoozes(), {alarm_ids[0]: alert_time})
+
+        # Pending snoozes are restored, and the passed ones are removed
+        AlarmManager.alarmdb.set_snooze(alarm_ids[2], before - 60)
+        alarm_mgr._AlarmManager__stop_all_alarm_threads()
+        alarm_mgr = AlarmManager()
+        self.assertEqual(alarm_mgr.get_snoozes(), {alarm_ids[0]: alert_time})
+        self.assertEqual(AlarmManager.alarmdb.get_all_snoozes(),
+                         {alarm_ids[0]: alert_time})
+
+        # Deleting the alarm removes its snooze
+        self.assertTrue(alarm_mgr.delete_alarm(alarm_ids[0]))
+        self.assertEqual(AlarmManager.alarmdb.get_all_snoozes(), {})
+        self.assertEqual(alarm_mgr.get_snoozes(), {})
+
+    def test_startup_arming(self):
+        """
+        Tests the alarms outside the arming window are launched after the
+        initialiser, and the startup timings.
+        """
+        alarm_mgr = AlarmManager()
+        alarm_mgr.delete_all_alarms()
+        alarm_mgr.set__offset_alert_time(-15)
+        every_day = (True, True, True, True, True, True, True)
+        soon = datetime.now() + timedelta(minutes=30)
+        later = datetime.now() + timedelta(minutes=180)
+        soon_id = alarm_mgr.add_alarm(
+            soon.hour, soon.minute, every_day, True, '')
+        later_id = alarm_mgr.add_alarm(
+            later.hour, later.minute, every_day, True, '')
+        alarm_mgr._AlarmManager__stop_all_alarm_threads()
+
+        def wait_called(mock_arm):
+            # The mock is called from the arming thread started at the end of
+            # the initialiser, so it might not have run yet
+            for _ in range(100):
+                if mock_arm.called:
+                    break
+                time.sleep(0.01)
+            self.assertTrue(mock_arm.called)
+
+        # Without the deferred arming running only the close alarm is running
+        arm_deferred = AlarmManager._AlarmManager__arm_deferred
+        with mock.patch.object(
+                AlarmManager, '_AlarmManager__arm_deferred') as mock_arm:
+            alarm_mgr = AlarmManager(arming_window=60)
+            wait_called(mock_arm)
+        self.assertTrue(alarm_mgr.is_alarm_running(soon_id))
+        self.assertFalse(alarm_mgr.is_alarm_running(later_id))
+        self.assertFalse(alarm_mgr.wait_armed(0))
+        timings = alarm_mgr.get_startup_timings()
+        for phase in ('load', 'schedule', 'arm', 'ready'):
+            self.assertGreaterEqual(timings[phase], 0)
+        self.assertIsNone(timings['deferred_arm'])
+
+        deferred_alarms = mock_arm.call_args[0][0]
+        self.assertEqual([alarm.id_ for alarm in deferred_alarms], [later_id])
+        arm_deferred(alarm_mgr, *mock_arm.call_args[0])
+        self.assertTrue(alarm_mgr.wait_armed(0))
+        self.assertTrue(alarm_mgr.is_alarm_running(later_id))
+        self.assertGreaterEqual(
+            alarm_mgr.get_startup_timings()['deferred_arm'], 0)
+        self.assertTrue(alarm_mgr.check_threads_state())
+        alarm_mgr._AlarmManager__stop_all_alarm_threads()
+
+        # Alarms edited before their deferred arming are read again
+        with mock.patch.object(
+                AlarmManager, '_AlarmManager__arm_deferred') as mock_arm:
+            alarm_mgr = AlarmManager(arming_window=60)
+            wait_called(mock_arm)
+        alarm_mgr.edit_alarm(later_id, enabled=False)
+        arm_deferred(alarm_mgr, *mock_arm.call_args[0])
+        self.assertFalse(alarm_mgr.is_alarm_running(later_id))
+        self.assertTrue(alarm_mgr.check_threads_state())
+
+        # Without an arming window all alarms are launched
+        alarm_mgr._AlarmManager__stop_all_alarm_threads()
+        alarm_mgr.edit_alarm(later_id, enabled=True)
+        alarm_mgr = AlarmManager()
+        self.assertTrue(alarm_mgr.wait_armed(0))
+        self.assertTrue(alarm_mgr.is_alarm_running(later_id))
+
+    def test_namespaces(self):
+        """
+        Tests the namespace instances manage their own alarms, settings and
+        events, independently of the default AlarmManager, sharing its alarms
+        scheduler thread.
+        """
+        self.assertRaises(ValueError, AlarmManager, namespace='kitchen alarms')
+
+        alarm_mgr = AlarmManager()
+        self.create_alarms(alarm_mgr)
+        numb_threads = threading.activeCount()
+        kitchen_mgr = AlarmManager(namespace='kitchen')
+        kitchen_mgr.delete_all_alarms()
+        self.assertEqual(kitchen_mgr.namespace, 'kitchen')
+        self.assertIsNone(AlarmManager.namespace)
+        # New namespaces do not get the dummy alarms
+        self.assertEqual(kitchen_mgr.get_number_of_alarms(), 0)
+
+        kitchen_events = []
+        kitchen_mgr.subscribe(kitchen_events.extend,
+                              AlarmEventBus.change_events)
+        try:
+            kitchen_id = kitchen_mgr.add_alarm(
+                self.hour, 10, (True, True, True, True, True, True, True),
+                True, 'kitchen')
+            kitchen_mgr.set_snooze_time(7)
+            alarm_mgr.set_snooze_time(3)
+            alarm_mgr.edit_alarm(1, minute=20)
+            self.assertTrue(kitchen_mgr.flush_events(5))
+        finally:
+            kitchen_mgr.unsubscribe(kitchen_events.extend)
+
+        self.assertEqual(kitchen_mgr.get_number_of_alarms(), 1)
+        self.assertEqual(alarm_mgr.get_number_of_alarms(), 5)
+        self.assertEqual(AlarmManager.get_number_of_alarms(), 5)
+        self.assertEqual(kitchen_mgr.get_alarm(kitchen_id).label, 'kitchen')
+        self.assertEqual(kitchen_mgr.get_snooze_time(), 7)
+        self.assertEqual(AlarmManager.get_snooze_time(), 3)
+        self.assertEqual(kitchen_mgr.get_next_alarm().id_, kitchen_id)
+        self.assertTrue(kitchen_mgr.is_alarm_running(kitchen_id))
+        self.assertTrue(kitchen_mgr.check_threads_state())
+        self.assertTrue(alarm_mgr.check_threads_state())
+        self.assertEqual(threading.activeCount(), numb_threads)
+        # Only the events from the kitchen namespace are received
+        self.assertEqual(
+            [(event['type'], event['id'], event['namespace'])
+             for event in kitchen_events],
+            [(AlarmEventBus.alarm_added, kitchen_id, 'kitchen'),
+             (AlarmEventBus.settings_changed, 'snooze_time', 'kitchen')])
+
+        self.assertTrue(kitchen_mgr.shutdown())
+        self.assertFalse(kitchen_mgr.is_alarm_running(kitchen_id))
+        self.assertTrue(alarm_mgr.check_threads_state())
+        kitchen_mgr.delete_all_alarms()
+
+    def test_concurrent_access(self):
+        """
+        Stress test with several threads reading the alarms while others edit
+        them, checking all the operations succeed and the read data is always
+        a consistent alarm.
+        """
+        alarm_mgr = AlarmManager()
+        self.create_alarms(alarm_mgr)
+        alarm_ids = sorted(alarm.id_ for alarm in alarm_mgr.get_all_alarms())
+        errors = []
+
+        def reader():
+            try:
+                for i in range(50):
+                    alarms = alarm_mgr.get_all_alarms()
+                    if len(alarms) != 5:
+                        errors.append('Read %d alarms' % len(alarms))
+                    for alarm in alarms:
+                        if alarm.minute != alarm.hour:
+                            errors.append('Inconsistent alarm %s' % alarm)
+                    alarm_mgr.get_next_alarm()
+            except Exception as e:
+                errors.append(e)
+
+        def editor(seed):
+            try:
+                for i in range(20):
+                    value = (seed + i) % 24
+                    alarm_id = alarm_ids[(seed + i) % len(alarm_ids)]
+                    # Hour and minute set in one operation, they are always
+                    # read with the same value
+                    if alarm_mgr.edit_alarm(
+                            alarm_id, hour=value, minute=value) is not True:
+                        errors.append('Edit of alarm %s failed' % alarm_id)
+            except Exception as e:
+                errors.append(e)
+
+        for alarm_id in alarm_ids:
+            alarm_mgr.edit_alarm(alarm_id, hour=0, minute=0)
+        threads = [threading.Thread(target=reader) for _ in range(4)]
+        threads += [threading.Thread(target=editor, args=(seed,))
+                    for seed in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(60)
+            self.assertFalse(thread.isAlive())
+        self.assertEqual(errors, [])
+        self.assertTrue(alarm_mgr.check_threads_state())
+
+    def test_stop_threads_unlocked(self):
+        """
+        Checks the alarm threads stopped by a delete are waited for without
+        holding the write lock, so the readers are not blocked while an alert
+        callback finishes, and that idle threads exit straight away.
+        """
+        alerting = threading.Event()
+        release = threading.Event()
+
+        def alert_callback(alarm):
+            alerting.set()
+            release.wait(10)
+
+        alarm_mgr = AlarmManager(alert_callback=alert_callback)
+        self.create_alarms(alarm_mgr)
+        start_time = time.time()
+        self.assertTrue(alarm_mgr.delete_alarm(5))
+        self.assertLess(time.time() - start_time, 0.5)
+
+        # Alarm thread 1 kept busy in its alert callback by a due snooze
+        self.assertTrue(alarm_mgr.wait_armed(5))
+        alarm_thread = alarm_mgr._AlarmManager__alarm_threads[1]
+        alarm_thread.snooze(time.time() - 1)
+        alarm_mgr._AlarmManager__scheduler.add(alarm_thread)
+        self.assertTrue(alerting.wait(5))
+        results = []
+        delete_thread = threading.Thread(
+            target=lambda: results.append(alarm_mgr.delete_alarm(1)))
+        delete_thread.start()
+        try:
+            time.sleep(0.1)
+            self.assertTrue(delete_thread.isAlive())
+            start_time = time.time()
+            self.assertEqual(alarm_mgr.get_number_of_alarms(), 3)
+            self.assertLess(time.time() - start_time, 0.5)
+        finally:
+            release.set()
+        delete_thread.join(5)
+        self.assertEqual(results, [True])
+        self.assertFalse(alarm_mgr.is_alarm_running(1))
+
+        start_time = time.time()
+        self.assertTrue(alarm_mgr.delete_all_alarms())
+        self.assertLess(time.time() - start_time, 0.5)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Unit test for the AlarmNamespaces class.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+from __future__ import unicode_literals, absolute_import
+import io
+import mock
+import time
+import unittest
+import threading
+try:
+    from LightUpAlarm.AlarmDb import AlarmDb
+    from LightUpAlarm.AlarmManager import AlarmManager
+    from LightUpAlarm.AlarmNamespaces import AlarmNamespaces
+except ImportError:
+    import os
+    import sys
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    from LightUpAlarm.AlarmDb import AlarmDb
+    from LightUpAlarm.AlarmManager import AlarmManager
+    from LightUpAlarm.AlarmNamespaces import AlarmNamespaces
+
+
+class AlarmNamespacesTestCase(unittest.TestCase):
+    """ Tests for AlarmNamespaces class. """
+
+    # Namespaces used in the tests, their alarms are deleted
+    names = ['room%s' % i for i in range(300)]
+
+    every_day = (True, True, True, True, True, True, True)
+
+    def setUp(self):
+        """ Deletes the alarms of the test namespaces. """
+        for name in self.names:
+            alarmdb = AlarmDb(AlarmManager.alarmdb.db_name, name)
+            alarmdb.delete_all_alarms()
+            alarmdb.delete_all_snoozes()
+        # Twelve hours from now, so the alarms do not alert during the tests
+        time_now = time.localtime(time.time())
+        self.hour = (time_now.tm_hour + 12) % 24
+
+    def test_add_remove(self):
+        """ Tests adding, getting and removing namespaces. """
+        namespaces = AlarmNamespaces()
+        kitchen_mgr = namespaces.add(self.names[0])
+        self.assertIsInstance(kitchen_mgr, AlarmManager)
+        self.assertEqual(kitchen_mgr.namespace, self.names[0])
+        self.assertIs(namespaces.get(self.names[0]), kitchen_mgr)
+        self.assertIsNone(namespaces.get(self.names[1]))
+        self.assertIn(self.names[0], namespaces)
+        self.assertEqual(len(namespaces), 1)
+
+        with mock.patch('sys.stderr', new=io.StringIO()) as test_srderr:
+            self.assertIsNone(namespaces.add(self.names[0]))
+            self.assertIsNone(namespaces.add('not valid'))
+            self.assertIn('already', test_srderr.getvalue())
+        self.assertEqual(namespaces.get_namespaces(), [self.names[0]])
+
+        alarm_id = kitchen_mgr.add_alarm(
+            self.hour, 10, self.every_day, True, '')
+        self.assertTrue(kitchen_mgr.is_alarm_running(alarm_id))
+        self.assertTrue(namespaces.remove(self.names[0]))
+        self.assertFalse(namespaces.remove(self.names[0]))
+        self.assertFalse(kitchen_mgr.is_alarm_running(alarm_id))
+        self.assertEqual(len(namespaces), 0)
+        # The alarms are kept in the database
+        self.assertEqual(
+            AlarmDb(AlarmManager.alarmdb.db_name,
+                    self.names[0]).get_number_of_alarms(), 1)
+
+    def test_many_namespaces(self):
+        """
+        Tests many namespaces with their own alarms and callbacks, run by the
+        shared scheduler thread and reconciled by the shared reconciler.
+        """
+        namespaces = AlarmNamespaces()
+        namespaces.add(self.names[0], alert_callback=lambda alarm: None)
+        numb_threads = threading.activeCount()
+        for i, name in enumerate(self.names[1:], 1):
+            alarm_mgr = namespaces.add(
+                name, alert_callback=lambda alarm: None)
+            alarm_mgr.add_alarm(self.hour, i % 60, self.every_day, True, name)
+            alarm_mgr.add_alarm(
+                self.hour, (i + 1) % 60, self.every_day, True, name)
+        self.assertEqual(threading.activeCount(), numb_threads)
+        self.assertEqual(namespaces.get_namespaces(), sorted(self.names))
+        for i, name in enumerate(self.names[1:], 1):
+            alarm_mgr = namespaces.get(name)
+            alarms = alarm_mgr.get_all_alarms()
+            self.assertEqual([(alarm.minute, alarm.label) for alarm in alarms],
+                             [(i % 60, name), ((i + 1) % 60, name)])
+            self.assertEqual(len(alarm_mgr.get_live_alarms()), 2)
+
+        results = namespaces.reconcile_threads()
+        self.assertEqual(sorted(results), sorted(self.names))
+        self.assertTrue(all(result is not False
+                            for result in results.values()))
+
+        # An unscheduled thread is corrected by the shared reconciler
+        alarm_mgr = namespaces.get(self.names[3])
+        alarm_id = alarm_mgr.get_all_alarms()[0].id_
+        alarm_mgr._AlarmManager__scheduler.remove(
+            alarm_mgr._AlarmManager__alarm_threads[alarm_id])
+        self.assertFalse(alarm_mgr.is_alarm_running(alarm_id))
+        self.assertTrue(namespaces.start_reconciler(0.05))
+        self.assertTrue(namespaces.is_reconciler_running())
+        for _ in range(100):
+            if alarm_mgr.is_alarm_running(alarm_id):
+                break
+            time.sleep(0.05)
+        self.assertTrue(alarm_mgr.is_alarm_running(alarm_id))
+
+        self.assertTrue(namespaces.shutdown())
+        self.assertFalse(namespaces.is_reconciler_running())
+        self.assertEqual(len(namespaces), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
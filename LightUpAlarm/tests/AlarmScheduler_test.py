@@ -0,0 +1,244 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Unit test for the AlarmScheduler class.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# The scheduler runs with a VirtualClock, so the alerts are triggered by
+# advancing the time instead of waiting for them.
+#
+from __future__ import unicode_literals, absolute_import
+import io
+import time
+import mock
+import unittest
+import threading
+try:
+    from LightUpAlarm.AlarmItem import AlarmItem
+    from LightUpAlarm.AlarmThread import AlarmThread
+    from LightUpAlarm.AlarmScheduler import AlarmScheduler
+    from LightUpAlarm.VirtualClock import VirtualClock
+except ImportError:
+    import os
+    import sys
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    from LightUpAlarm.AlarmItem import AlarmItem
+    from LightUpAlarm.AlarmThread import AlarmThread
+    from LightUpAlarm.AlarmScheduler import AlarmScheduler
+    from LightUpAlarm.VirtualClock import VirtualClock
+
+
+class AlarmSchedulerTestCase(unittest.TestCase):
+    """ Tests for AlarmScheduler class. """
+
+    every_day = (True, True, True, True, True, True, True)
+
+    def setUp(self):
+        # Local midnight of a fixed day, at a virtual time
+        self.start_time = time.mktime((2015, 6, 1, 0, 0, 0, 0, 0, -1))
+        self.clock = VirtualClock(self.start_time, auto_advance=False)
+        self.scheduler = AlarmScheduler(self.clock)
+        self.alerts = []
+
+    def tearDown(self):
+        self.assertTrue(self.scheduler.stop(5))
+
+    def alarm_thread(self, hour, minute, alarm_id):
+        """ Creates an AlarmThread recording its alerts. """
+        alarm = AlarmItem(hour, minute, days=self.every_day, enabled=True,
+                          alarm_id=alarm_id)
+        return AlarmThread(alarm, alarm_callback=self.alerts.append,
+                           clock=self.clock)
+
+    def wait_alerts(self, number, timeout=5):
+        """ Waits until the given number of alerts have been triggered. """
+        deadline = time.time() + timeout
+        while len(self.alerts) < number and time.time() < deadline:
+            time.sleep(0.01)
+        return len(self.alerts)
+
+    def test_alerts(self):
+        """
+        Tests the alarms are alerted in order from a single thread, and that
+        the unscheduled ones do not alert.
+        """
+        numb_threads = threading.activeCount()
+        alarm_threads = [self.alarm_thread(0, minute, minute)
+                         for minute in (3, 1, 2, 4)]
+        for alarm_thread in alarm_threads:
+            self.assertTrue(self.scheduler.add(alarm_thread))
+        self.assertEqual(threading.activeCount(), numb_threads + 1)
+        self.assertEqual(len(self.scheduler), 4)
+        self.assertTrue(self.scheduler.is_scheduled(alarm_threads[0]))
+        self.assertTrue(self.scheduler.remove(alarm_threads[3]))
+        self.assertFalse(self.scheduler.remove(alarm_threads[3]))
+        self.assertFalse(self.scheduler.is_scheduled(alarm_threads[3]))
+
+        time.sleep(0.1)
+        self.assertEqual(self.alerts, [])
+        for minute in range(1, 5):
+            self.clock.advance(60)
+            self.assertEqual(self.wait_alerts(min(minute, 3)), min(minute, 3))
+        time.sleep(0.1)
+        self.assertEqual([alarm.id_ for alarm in self.alerts], [1, 2, 3])
+
+        # Each alarm minute alerts once, the next alert is the next day
+        self.assertEqual(alarm_threads[1].get_next_check_time(),
+                         time.mktime((2015, 6, 2, 0, 1, 0, 0, 0, -1)))
+        self.clock.set_time(alarm_threads[1].get_next_check_time())
+        self.assertEqual(self.wait_alerts(4), 4)
+        self.assertEqual(self.alerts[-1].id_, 1)
+
+    def test_many_entries(self):
+        """
+        Tests hundreds of alarms, as the ones of many namespaces, are alerted
+        from the single scheduler thread.
+        """
+        numb_threads = threading.activeCount()
+        alarm_threads = [self.alarm_thread(0, 1 + (i % 3), i)
+                         for i in range(600)]
+        for alarm_thread in alarm_threads:
+            self.assertTrue(self.scheduler.add(alarm_thread))
+        self.assertEqual(threading.activeCount(), numb_threads + 1)
+        self.assertEqual(len(self.scheduler), 600)
+
+        for minute in range(1, 4):
+            self.clock.advance(60)
+            self.assertEqual(self.wait_alerts(200 * minute), 200 * minute)
+        self.assertEqual(sorted(alarm.id_ for alarm in self.alerts),
+                         list(range(600)))
+        self.assertEqual(threading.activeCount(), numb_threads + 1)
+
+    def test_reschedule(self):
+        """ Tests an edited or snoozed entry gets its new check time. """
+        alarm_thread = self.alarm_thread(10, 0, 1)
+        self.assertTrue(self.scheduler.add(alarm_thread))
+        self.assertEqual(alarm_thread.get_next_check_time(),
+                         self.start_time + 10 * 60 * 60)
+
+        alarm_thread.edit_alarm(AlarmItem(
+            0, 1, days=self.every_day, enabled=True, alarm_id=1))
+        self.assertTrue(self.scheduler.add(alarm_thread))
+        self.clock.advance(60)
+        self.assertEqual(self.wait_alerts(1), 1)
+
+        alarm_thread.snooze(self.clock.time() + 30)
+        self.assertTrue(self.scheduler.add(alarm_thread))
+        self.clock.advance(30)
+        self.assertEqual(self.wait_alerts(2), 2)
+        self.assertEqual(len(self.scheduler), 1)
+
+    def test_join(self):
+        """
+        Tests join() waits for the alert callback of a removed entry, and
+        that it does not block from the scheduler thread.
+        """
+        alerting = threading.Event()
+        release = threading.Event()
+        join_results = []
+
+        def alert_callback(alarm):
+            alerting.set()
+            join_results.append(self.scheduler.join([alarm_thread], 5))
+            release.wait(5)
+
+        alarm_thread = AlarmThread(
+            AlarmItem(0, 1, days=self.every_day, enabled=True, alarm_id=1),
+            alarm_callback=alert_callback, clock=self.clock)
+        self.scheduler.add(alarm_thread)
+        self.clock.advance(60)
+        self.assertTrue(alerting.wait(5))
+        self.assertTrue(self.scheduler.remove(alarm_thread))
+        self.assertFalse(self.scheduler.join([alarm_thread], 0.1))
+        self.assertTrue(self.scheduler.join([], 0.1))
+        release.set()
+        self.assertTrue(self.scheduler.join([alarm_thread], 5))
+        self.assertEqual(join_results, [True])
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_defer(self):
+        """
+        Tests a blocking deferred alert callback does not delay the alerts of
+        the other alarms, that join() waits for it, and that a failing one is
+        reported without stopping the alerts.
+        """
+        release = threading.Event()
+        blocked = []
+
+        def blocking_callback(alarm):
+            blocked.append(alarm)
+            release.wait(5)
+
+        def deferring_callback(alarm):
+            self.scheduler.defer(blocking_callback, alarm)
+
+        blocking_thread = AlarmThread(
+            AlarmItem(0, 1, days=self.every_day, enabled=True, alarm_id=1),
+            alarm_callback=deferring_callback, clock=self.clock)
+        self.scheduler.add(blocking_thread)
+        self.scheduler.add(self.alarm_thread(0, 2, 2))
+        self.clock.advance(60)
+        deadline = time.time() + 5
+        while not blocked and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(blocked), 1)
+
+        self.clock.advance(60)
+        self.assertEqual(self.wait_alerts(1), 1)
+        self.assertTrue(self.scheduler.remove(blocking_thread))
+        self.assertFalse(self.scheduler.join([blocking_thread], 0.1))
+        self.assertTrue(self.scheduler.join([], 0.1))
+        release.set()
+        self.assertTrue(self.scheduler.join([blocking_thread], 5))
+
+        # The deferred calls are executed in order
+        failing_callback = mock.Mock(side_effect=ValueError('test'))
+        done = threading.Event()
+        with mock.patch('sys.stderr', new=io.StringIO()) as test_srderr:
+            self.assertTrue(self.scheduler.defer(failing_callback, 1))
+            self.assertTrue(self.scheduler.defer(done.set))
+            self.assertTrue(done.wait(5))
+            self.assertIn('ERROR', test_srderr.getvalue())
+        failing_callback.assert_called_once_with(1)
+        self.clock.advance(60 * 60 * 24)
+        self.assertEqual(self.wait_alerts(2), 2)
+
+    def test_failed_check(self):
+        """ Tests an entry raising an exception is unscheduled. """
+        failing_entry = mock.Mock()
+        failing_entry.get_next_check_time.return_value = self.start_time
+        failing_entry.check_alerts.side_effect = ValueError('test')
+        alarm_thread = self.alarm_thread(0, 1, 1)
+        with mock.patch('sys.stderr', new=io.StringIO()) as test_srderr:
+            self.scheduler.add(failing_entry)
+            self.scheduler.add(alarm_thread)
+            deadline = time.time() + 5
+            while self.scheduler.is_scheduled(failing_entry) and \
+                    time.time() < deadline:
+                time.sleep(0.01)
+            self.assertIn('ERROR', test_srderr.getvalue())
+        self.assertFalse(self.scheduler.is_scheduled(failing_entry))
+        self.assertEqual(failing_entry.check_alerts.call_count, 1)
+
+        # The other entries are still checked
+        self.clock.advance(60)
+        self.assertEqual(self.wait_alerts(1), 1)
+
+    def test_stop(self):
+        """ Tests the scheduler threads stop and cannot be used after. """
+        alarm_thread = self.alarm_thread(0, 1, 1)
+        self.assertTrue(self.scheduler.add(alarm_thread))
+        self.assertTrue(self.scheduler.defer(self.alerts.append, 1))
+        self.assertTrue(self.scheduler.stop(5))
+        self.assertFalse(self.scheduler.is_scheduled(alarm_thread))
+        self.assertFalse(self.scheduler.add(alarm_thread))
+        self.assertFalse(self.scheduler.defer(self.alerts.append, 2))
+        self.assertEqual(len(self.scheduler), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
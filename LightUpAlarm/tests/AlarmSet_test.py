@@ -0,0 +1,188 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Unit test for the AlarmSet class.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# The tests run with NumPy, if it is installed, and with the pure Python
+# fallback, and compare the results with the AlarmItem calculations.
+#
+from __future__ import unicode_literals, absolute_import
+import mock
+import random
+import unittest
+try:
+    from LightUpAlarm.AlarmItem import AlarmItem
+    from LightUpAlarm.AlarmSet import AlarmSet
+except ImportError:
+    import os
+    import sys
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    from LightUpAlarm.AlarmItem import AlarmItem
+    from LightUpAlarm.AlarmSet import AlarmSet
+
+
+class AlarmSetTestCase(unittest.TestCase):
+    """ Tests for AlarmSet class. """
+
+    #
+    # Helper methods
+    #
+    @staticmethod
+    def random_alarms(number):
+        """ Creates a list of alarms with random data, always the same. """
+        rand = random.Random(42)
+        alarms = []
+        for i in xrange(number):
+            days = tuple(rand.random() > 0.5 for _ in xrange(7))
+            alarms.append(AlarmItem(
+                rand.randint(0, 23), rand.randint(0, 59), days=days,
+                enabled=rand.random() > 0.2, alarm_id=i + 1))
+        return alarms
+
+    def run_with_and_without_numpy(self, test_function):
+        """ Runs the test function with NumPy (if present) and without it. """
+        test_function()
+        with mock.patch('LightUpAlarm.AlarmSet.numpy', None):
+            test_function()
+
+    #
+    # Tests
+    #
+    def test_minutes_to_alert(self):
+        """ Compares the batch calculation with AlarmItem.minutes_to_alert. """
+        alarms = AlarmSetTestCase.random_alarms(300)
+
+        def test_function():
+            alarm_set = AlarmSet(alarms)
+            self.assertEqual(len(alarm_set), len(alarms))
+            for weekday in xrange(7):
+                for hour, minute in ((0, 0), (7, 30), (12, 1), (23, 59)):
+                    minutes = alarm_set.minutes_to_alert(hour, minute, weekday)
+                    for alarm, alarm_minutes in zip(alarms, minutes):
+                        if alarm.is_active():
+                            self.assertEqual(
+                                alarm_minutes,
+                                alarm.minutes_to_alert(hour, minute, weekday))
+                        else:
+                            self.assertEqual(alarm_minutes, AlarmSet.no_alert)
+
+        self.run_with_and_without_numpy(test_function)
+
+    def test_next_alarm(self):
+        """ Tests next_alarm returns the closest active alarm. """
+        alarms = [
+            AlarmItem(11, 20, (True, False, False, False, False, False, False),
+                      True, alarm_id=1),
+            AlarmItem(11, 15, (True, False, False, False, False, False, False),
+                      True, alarm_id=2),
+            AlarmItem(11, 16, (True, True, True, True, True, True, True),
+                      False, alarm_id=3)]
+
+        def test_function():
+            alarm_set = AlarmSet(alarms)
+            alarm, minutes = alarm_set.next_alarm(12, 30, 0)
+            self.assertEqual(alarm.id_, 2)
+            self.assertEqual(minutes, (1440 * 7) - 75)
+            alarm, minutes = alarm_set.next_alarm(11, 17, 0)
+            self.assertEqual(alarm.id_, 1)
+            self.assertEqual(minutes, 3)
+            # Same alert time returns the first alarm in the set
+            alarm_set = AlarmSet(alarms + [AlarmItem(
+                11, 20, (True, False, False, False, False, False, False),
+                True, alarm_id=4)])
+            alarm, minutes = alarm_set.next_alarm(11, 17, 0)
+            self.assertEqual(alarm.id_, 1)
+            # No active alarms
+            self.assertIsNone(AlarmSet(alarms[2:]).next_alarm(11, 17, 0))
+            self.assertIsNone(AlarmSet().next_alarm(11, 17, 0))
+
+        self.run_with_and_without_numpy(test_function)
+
+    def test_next_alarms(self):
+        """ Tests next_alarms returns the closest alarms in alert order. """
+        alarms = AlarmSetTestCase.random_alarms(200)
+        # Repeated alarms to check the order of alarms with the same time
+        alarms += [AlarmItem(alarm.hour, alarm.minute, alarm.repeat,
+                             alarm.enabled, alarm_id=alarm.id_ + 1000)
+                   for alarm in alarms[:50]]
+        active = [alarm for alarm in alarms if alarm.is_active()]
+
+        def test_function():
+            alarm_set = AlarmSet(alarms)
+            for weekday, hour, minute in ((0, 0, 0), (3, 6, 45), (6, 23, 59)):
+                expected = sorted(
+                    [(alarm.minutes_to_alert(hour, minute, weekday), i)
+                     for i, alarm in enumerate(alarms) if alarm.is_active()])
+                expected = [(alarms[i].id_, minutes) for minutes, i in expected]
+                for number in (1, 5, 37, len(active), len(alarms) + 10):
+                    next_alarms = alarm_set.next_alarms(
+                        number, hour, minute, weekday)
+                    self.assertEqual(
+                        [(alarm.id_, minutes)
+                         for alarm, minutes in next_alarms],
+                        expected[:number])
+                first = alarm_set.next_alarm(hour, minute, weekday)
+                self.assertEqual(
+                    alarm_set.next_alarms(1, hour, minute, weekday), [first])
+            self.assertEqual(alarm_set.next_alarms(0, 0, 0, 0), [])
+            self.assertEqual(AlarmSet().next_alarms(5, 0, 0, 0), [])
+
+        self.run_with_and_without_numpy(test_function)
+
+    def test_alarms_within(self):
+        """ Tests alarms_within returns the sorted alarms in the window. """
+        alarms = AlarmSetTestCase.random_alarms(200)
+
+        def test_function():
+            alarm_set = AlarmSet(alarms)
+            within = alarm_set.alarms_within(8 * 60, 6, 45, 3)
+            expected = sorted(
+                [(alarm, alarm.minutes_to_alert(6, 45, 3)) for alarm in alarms
+                 if alarm.is_active() and
+                 alarm.minutes_to_alert(6, 45, 3) <= 8 * 60],
+                key=lambda item: item[1])
+            self.assertEqual(
+                [(alarm.id_, minutes) for alarm, minutes in within],
+                [(alarm.id_, minutes) for alarm, minutes in expected])
+            # A full week includes every active alarm
+            within = alarm_set.alarms_within(1440 * 8, 6, 45, 3)
+            self.assertEqual(
+                len(within), len([a for a in alarms if a.is_active()]))
+
+        self.run_with_and_without_numpy(test_function)
+
+    def test_alarms_per_hour(self):
+        """ Tests the alarms_per_hour histogram only counts active alarms. """
+        alarms = AlarmSetTestCase.random_alarms(200)
+        expected = [0] * 24
+        for alarm in alarms:
+            if alarm.is_active():
+                expected[alarm.hour] += 1
+
+        def test_function():
+            self.assertEqual(AlarmSet(alarms).alarms_per_hour(), expected)
+            self.assertEqual(AlarmSet().alarms_per_hour(), [0] * 24)
+
+        self.run_with_and_without_numpy(test_function)
+
+    def test_from_rows(self):
+        """ Tests creating the AlarmSet from database rows. """
+        row = {'id': 5, 'hour': 9, 'minute': 30, 'monday': True,
+               'tuesday': False, 'wednesday': False, 'thursday': False,
+               'friday': False, 'saturday': False, 'sunday': False,
+               'enabled': True, 'label': '', 'timestamp': 1234,
+               'station_id': 1}
+        alarm_set = AlarmSet.from_rows([row])
+        self.assertEqual([alarm.id_ for alarm in alarm_set.get_alarms()], [5])
+        alarm, minutes = alarm_set.next_alarm(9, 0, 0)
+        self.assertEqual(alarm.id_, 5)
+        self.assertEqual(minutes, 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Unit test for the AlarmSimulation class.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+from __future__ import unicode_literals, absolute_import
+import io
+import time
+import mock
+import unittest
+from datetime import datetime, timedelta
+try:
+    from LightUpAlarm.AlarmItem import AlarmItem
+    from LightUpAlarm.AlarmSimulation import AlarmSimulation
+except ImportError:
+    import os
+    import sys
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    from LightUpAlarm.AlarmItem import AlarmItem
+    from LightUpAlarm.AlarmSimulation import AlarmSimulation
+
+
+class AlarmSimulationTestCase(unittest.TestCase):
+    """ Tests for AlarmSimulation class. """
+
+    # Monday 1st of June 2015 at midnight
+    start = datetime(2015, 6, 1)
+
+    alarms = [
+        AlarmItem(7, 30, days=(True, True, True, True, True, False, False),
+                  enabled=True, alarm_id=1),
+        AlarmItem(9, 0, days=(False, False, False, False, False, True, True),
+                  enabled=True, alarm_id=2),
+        AlarmItem(0, 5, days=(True, False, True, False, True, False, True),
+                  enabled=True, alarm_id=3),
+        AlarmItem(6, 0, days=(True, True, True, True, True, True, True),
+                  enabled=False, alarm_id=4)]
+
+    def run_simulation(self, simulation, days=7):
+        """ Runs a simulation from the start, with the alerts output hidden. """
+        with mock.patch('sys.stdout', new=io.StringIO()):
+            return simulation.run(
+                time.mktime(self.start.timetuple()), days=days)
+
+    def test_week(self):
+        """
+        Tests a week of alarm and offset alerts matches the alarms occurrences,
+        without running in real time.
+        """
+        simulation = AlarmSimulation(self.alarms, offset_alert_time=-15)
+        start_time = time.time()
+        log = self.run_simulation(simulation)
+        self.assertLess(time.time() - start_time, 5)
+
+        end = self.start + timedelta(days=7)
+        expected = []
+        for alarm in self.alarms:
+            if alarm.is_active() is False:
+                continue
+            expected += [(alert, kind, alarm.id_) for alert, _, kind in
+                         alarm.occurrences(self.start, end)]
+            expected += [(alert, kind, alarm.id_) for alert, _, kind in
+                         alarm.occurrences(self.start, end, -15)]
+        expected.sort()
+        self.assertEqual(
+            [(datetime.fromtimestamp(event[0]), event[1], event[2])
+             for event in log],
+            expected)
+        # 5 + 2 + 4 alarm alerts, each with an offset alert
+        self.assertEqual(len(log), 22)
+        self.assertEqual(simulation.get_log(), log)
+
+    def test_hardware_timeline(self):
+        """
+        Tests the hardware timeline is logged after the offset alerts, and the
+        log is the same for every run.
+        """
+        timeline = [(0, 'lamp'), (120, 'room_light'), (600, 'coffee'),
+                    (900, 'end')]
+        simulation = AlarmSimulation(
+            self.alarms[:1], offset_alert_time=-15, hardware_timeline=timeline)
+        log = self.run_simulation(simulation, days=1)
+        self.assertEqual(
+            [(datetime.fromtimestamp(event[0]).strftime('%H:%M'), event[1])
+             for event in log],
+            [('07:15', AlarmItem.offset_kind), ('07:15', 'lamp'),
+             ('07:17', 'room_light'), ('07:25', 'coffee'),
+             ('07:30', 'end'), ('07:30', AlarmItem.alarm_kind)])
+        self.assertEqual(self.run_simulation(simulation, days=1), log)
+        self.assertEqual(len(AlarmSimulation.format_log(log).splitlines()), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
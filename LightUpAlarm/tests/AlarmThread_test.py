@@ -19,6 +19,7 @@ from datetime import datetime, timedelta
 try:
     from LightUpAlarm.AlarmItem import AlarmItem
     from LightUpAlarm.AlarmThread import AlarmThread
+    from LightUpAlarm.VirtualClock import VirtualClock
 except ImportError:
     import os
     import sys
@@ -27,6 +28,7 @@ except ImportError:
     sys.path.insert(0, package_dir)
     from LightUpAlarm.AlarmItem import AlarmItem
     from LightUpAlarm.AlarmThread import AlarmThread
+    from LightUpAlarm.VirtualClock import VirtualClock
 
 
 class AlarmThreadTestCase(unittest.TestCase):
@@ -41,13 +43,15 @@ class AlarmThreadTestCase(unittest.TestCase):
                                days=(True, True, True, True, True, True, True))
         # With minimum parameters
         alarm_thread = AlarmThread(alarm_test)
-        self.assertIs(alarm_thread._AlarmThread__alarm, alarm_test)
+        self.assertIs(
+            alarm_thread._AlarmThread__alarm, alarm_test.snapshot())
         self.assertFalse(alarm_thread._AlarmThread__offset_flag)
 
         # With minimum parameters + callback
         alarm_thread = AlarmThread(
             alarm_test, alarm_callback=AlarmThreadTestCase.empty_callback)
-        self.assertIs(alarm_thread._AlarmThread__alarm, alarm_test)
+        self.assertIs(
+            alarm_thread._AlarmThread__alarm, alarm_test.snapshot())
         self.assertIs(
             alarm_thread._AlarmThread__alarm_callback,
             AlarmThreadTestCase.empty_callback)
@@ -57,7 +61,8 @@ class AlarmThreadTestCase(unittest.TestCase):
         alarm_thread = AlarmThread(
             alarm_test, alarm_callback=AlarmThreadTestCase.empty_callback,
             offset_alarm_time=15)
-        self.assertIs(alarm_thread._AlarmThread__alarm, alarm_test)
+        self.assertIs(
+            alarm_thread._AlarmThread__alarm, alarm_test.snapshot())
         self.assertIs(
             alarm_thread._AlarmThread__alarm_callback,
             AlarmThreadTestCase.empty_callback)
@@ -70,7 +75,8 @@ class AlarmThreadTestCase(unittest.TestCase):
             alarm_test, alarm_callback=AlarmThreadTestCase.empty_callback,
             offset_callback=AlarmThreadTestCase.empty_callback,
             offset_alarm_time=15)
-        self.assertIs(alarm_thread._AlarmThread__alarm, alarm_test)
+        self.assertIs(
+            alarm_thread._AlarmThread__alarm, alarm_test.snapshot())
         self.assertIs(
             alarm_thread._AlarmThread__alarm_callback,
             AlarmThreadTestCase.empty_callback)
@@ -83,7 +89,8 @@ class AlarmThreadTestCase(unittest.TestCase):
 
         # Incorrect offset_alarm_time
         alarm_thread = AlarmThread(alarm_test, offset_alarm_time="5")
-        self.assertIs(alarm_thread._AlarmThread__alarm, alarm_test)
+        self.assertIs(
+            alarm_thread._AlarmThread__alarm, alarm_test.snapshot())
         self.assertFalse(alarm_thread._AlarmThread__offset_flag)
         self.assertIsNone(alarm_thread._AlarmThread__offset_alarm)
 
@@ -110,7 +117,8 @@ class AlarmThreadTestCase(unittest.TestCase):
         alarm_thread = AlarmThread(
             alarm_test, alarm_callback=AlarmThreadTestCase.empty_callback,
             offset_alarm_time=offset_minutes)
-        self.assertIs(alarm_thread._AlarmThread__alarm, alarm_test)
+        self.assertIs(
+            alarm_thread._AlarmThread__alarm, alarm_test.snapshot())
 
         # The edit_alarm method prints to stderr if wrong alarm if input, so
         # we need to capture stderr to test it.
@@ -119,7 +127,8 @@ class AlarmThreadTestCase(unittest.TestCase):
             self.assertEqual(test_srderr.getvalue(), '')
             alarm_thread.edit_alarm(new_alarm)
             self.assertNotEqual(test_srderr.getvalue(), '')
-            self.assertIsNot(alarm_thread._AlarmThread__alarm, new_alarm)
+            self.assertIsNot(
+                alarm_thread._AlarmThread__alarm, new_alarm.snapshot())
              # Check the offset alert has not been updated
             self.assertEqual(alarm_thread._AlarmThread__offset_alarm.minute,
                              old_minute + offset_minutes)
@@ -131,22 +140,46 @@ class AlarmThreadTestCase(unittest.TestCase):
             self.assertEqual(test_srderr.getvalue(), '')
             alarm_thread.edit_alarm(new_alarm)
             self.assertEqual(test_srderr.getvalue(), '')
-            self.assertIs(alarm_thread._AlarmThread__alarm, new_alarm)
+            self.assertIs(
+                alarm_thread._AlarmThread__alarm, new_alarm.snapshot())
             # Check the offset alert has also been updated
             self.assertEqual(alarm_thread._AlarmThread__offset_alarm.minute,
                              new_minute + offset_minutes)
 
+    def test_sync_offset_alarm(self):
+        """
+        Tests the offset alarm is only recalculated when the alarm snapshot
+        reference is replaced.
+        """
+        alarm_test = AlarmItem(9, 35, enabled=True, alarm_id=36,
+                               days=(True, True, True, True, True, True, True))
+        alarm_thread = AlarmThread(alarm_test, offset_alarm_time=-15)
+        offset_alarm = alarm_thread.sync_offset_alarm()
+        self.assertEqual(offset_alarm.minute, 20)
+        self.assertIs(alarm_thread.sync_offset_alarm(), offset_alarm)
+
+        # Editing the AlarmItem does not change the thread snapshot
+        alarm_test.minute = 50
+        self.assertEqual(alarm_thread._AlarmThread__alarm.minute, 35)
+        self.assertIs(alarm_thread.sync_offset_alarm(), offset_alarm)
+
+        # Until the new snapshot is given to the thread
+        self.assertTrue(alarm_thread.edit_alarm(alarm_test))
+        self.assertEqual(alarm_thread._AlarmThread__alarm.minute, 50)
+        self.assertIsNot(alarm_thread.sync_offset_alarm(), offset_alarm)
+        self.assertEqual(alarm_thread.sync_offset_alarm().minute, 35)
+
     def test_run(self):
         """
         Creates and alarm to trigger within a minute to instate AlarmThread,
         with an offset alert trigger of -1 minute.
-        This test uses the member method AlarmManagerTestCase.c as the callback
-        method. As the expected number of arguments is not 0, a TypeError is
-        raised when executed, proving that the run method triggers on the alarm
-        time and executes the callback.
-        This test can take a little over 10 seconds in its worse case scenario.
+        This test uses a callback with the wrong number of arguments, so a
+        TypeError is raised when executed, proving that the run method triggers
+        on the alarm time and executes the callback.
+        The thread uses a VirtualClock, set 10 seconds before the alarm minute
+        ends, so the test does not wait in real time.
         """
-        def good_callback():
+        def good_callback(alarm):
             pass
 
         def bad_callback(one, two, three):
@@ -156,38 +189,92 @@ class AlarmThreadTestCase(unittest.TestCase):
             """
             pass
 
-        # Set alarm for current minute, but only if there is at least 10seconds
-        # left for this minute. Better than setting it for the next minute.
-        time_now = time.localtime(time.time())
-        while time_now.tm_sec > 50:
-            time.sleep(1)
-            time_now = time.localtime(time.time())
-
+        start = datetime(2015, 6, 1, 8, 30, 50)
+        clock = VirtualClock(time.mktime(start.timetuple()))
         alarm_thread = AlarmThread(
             AlarmItem(
-                time_now.tm_hour, time_now.tm_min, enabled=True, alarm_id=96,
+                start.hour, start.minute, enabled=True, alarm_id=96,
                 days=(True, True, True, True, True, True, True)),
             alarm_callback=bad_callback,
             offset_alarm_time=-1,
-            offset_callback=good_callback)
+            offset_callback=good_callback,
+            clock=clock)
         self.assertRaises(TypeError, alarm_thread.run)
         alarm_thread.stop()
 
         # This time test the pre/post alert
-        time_now = time.localtime(time.time())
-        while time_now.tm_sec > 50:
-            time.sleep(1)
-            time_now = time.localtime(time.time())
-
-        alarm_time = datetime.now() + timedelta(minutes=1)
+        alarm_time = start + timedelta(minutes=1)
         alarm_thread = AlarmThread(
             AlarmItem(
                 alarm_time.hour, alarm_time.minute, enabled=True, alarm_id=97,
                 days=(True, True, True, True, True, True, True)),
             alarm_callback=good_callback,
             offset_alarm_time=-1,
-            offset_callback=bad_callback)
+            offset_callback=bad_callback,
+            clock=clock)
+        self.assertRaises(TypeError, alarm_thread.run)
+
+    def test_stop(self):
+        """ Tests a running thread exits as soon as it is stopped. """
+        alarm_thread = AlarmThread(
+            AlarmItem(9, 35, enabled=True, alarm_id=95,
+                      days=(True, True, True, True, True, True, True)))
+        alarm_thread.start()
+        time.sleep(0.1)
+        start_time = time.time()
+        alarm_thread.stop()
+        alarm_thread.join(5)
+        self.assertFalse(alarm_thread.isAlive())
+        self.assertLess(time.time() - start_time, 0.5)
+
+    def test_check_alerts(self):
+        """
+        Tests the alarm and offset alerts are triggered once at their minute,
+        stepping a VirtualClock over a day.
+        """
+        alerts = []
+        start = datetime(2015, 6, 1, 0, 0, 0)  # Monday
+        clock = VirtualClock(time.mktime(start.timetuple()))
+        alarm_thread = AlarmThread(
+            AlarmItem(7, 10, enabled=True, alarm_id=99,
+                      days=(True, False, False, False, False, False, False)),
+            alarm_callback=lambda alarm: alerts.append(
+                ('alarm', datetime.fromtimestamp(clock.time()))),
+            offset_alarm_time=-15,
+            offset_callback=lambda alarm: alerts.append(
+                ('offset', datetime.fromtimestamp(clock.time()))),
+            clock=clock)
+        # Checking every 20 seconds for two days, only Monday alerts
+        for _ in range(2 * 24 * 60 * 3):
+            alarm_thread.check_alerts()
+            clock.sleep(20)
+        self.assertEqual(alerts, [
+            ('offset', datetime(2015, 6, 1, 6, 55)),
+            ('alarm', datetime(2015, 6, 1, 7, 10))])
+
+    def test_snooze(self):
+        """
+        Tests the snooze alert is set, cancelled and triggered by the run loop,
+        using a callback with the wrong number of arguments to stop it.
+        """
+        def bad_callback(one, two, three):
+            pass
+
+        alarm_thread = AlarmThread(
+            AlarmItem(9, 35, enabled=False, alarm_id=98,
+                      days=(True, True, True, True, True, True, True)),
+            alarm_callback=bad_callback)
+        self.assertIsNone(alarm_thread.get_snooze_time())
+        self.assertFalse(alarm_thread.cancel_snooze())
+        alarm_thread.snooze(1234)
+        self.assertEqual(alarm_thread.get_snooze_time(), 1234)
+        self.assertTrue(alarm_thread.cancel_snooze())
+        self.assertIsNone(alarm_thread.get_snooze_time())
+
+        # A due snooze alerts even if the alarm is not active, only once
+        alarm_thread.snooze(time.time() - 1)
         self.assertRaises(TypeError, alarm_thread.run)
+        self.assertIsNone(alarm_thread.get_snooze_time())
 
 
 if __name__ == '__main__':
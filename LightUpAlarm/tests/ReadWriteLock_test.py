@@ -0,0 +1,123 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Unit test for the ReadWriteLock class.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+from __future__ import unicode_literals, absolute_import
+import time
+import unittest
+import threading
+try:
+    from LightUpAlarm.ReadWriteLock import ReadWriteLock
+except ImportError:
+    import os
+    import sys
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    from LightUpAlarm.ReadWriteLock import ReadWriteLock
+
+
+class ReadWriteLockTestCase(unittest.TestCase):
+    """ Tests for ReadWriteLock class. """
+
+    def test_shared_read(self):
+        """ Tests that several threads can hold the read lock together. """
+        rw_lock = ReadWriteLock()
+        number_of_threads = 4
+        all_reading = threading.Event()
+        readers = []
+        readers_lock = threading.Lock()
+
+        def reader():
+            with rw_lock.read_locked():
+                with readers_lock:
+                    readers.append(threading.current_thread())
+                    if len(readers) == number_of_threads:
+                        all_reading.set()
+                all_reading.wait(5)
+
+        threads = [threading.Thread(target=reader)
+                   for _ in range(number_of_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertTrue(all_reading.is_set())
+
+    def test_exclusive_write(self):
+        """ Tests that the write lock excludes the readers and writers. """
+        rw_lock = ReadWriteLock()
+        events = []
+
+        def writer():
+            with rw_lock.write_locked():
+                events.append('write start')
+                time.sleep(0.2)
+                events.append('write end')
+
+        def reader():
+            with rw_lock.read_locked():
+                events.append('read')
+
+        rw_lock.acquire_read()
+        writer_thread = threading.Thread(target=writer)
+        writer_thread.start()
+        time.sleep(0.1)
+        # The writer waits for the read lock to be released
+        self.assertEqual(events, [])
+        # New readers wait for the waiting writer
+        reader_thread = threading.Thread(target=reader)
+        reader_thread.start()
+        time.sleep(0.1)
+        self.assertEqual(events, [])
+        rw_lock.release_read()
+        writer_thread.join(5)
+        reader_thread.join(5)
+        self.assertEqual(events, ['write start', 'write end', 'read'])
+
+        # Writers exclude each other
+        del events[:]
+        threads = [threading.Thread(target=writer) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(events, ['write start', 'write end'] * 3)
+
+    def test_reentrant(self):
+        """ Tests the nested acquisitions from the same thread. """
+        rw_lock = ReadWriteLock()
+        with rw_lock.write_locked():
+            with rw_lock.write_locked():
+                with rw_lock.read_locked():
+                    pass
+
+        writer_thread = threading.Thread(target=rw_lock.acquire_write)
+        rw_lock.acquire_read()
+        writer_thread.start()
+        time.sleep(0.1)
+        # Nested read lock with a waiting writer does not deadlock
+        with rw_lock.read_locked():
+            pass
+        rw_lock.release_read()
+        writer_thread.join(5)
+        self.assertFalse(writer_thread.isAlive())
+
+    def test_errors(self):
+        """ Tests the upgrade and the releases of un-acquired locks fail. """
+        rw_lock = ReadWriteLock()
+        self.assertRaises(RuntimeError, rw_lock.release_read)
+        self.assertRaises(RuntimeError, rw_lock.release_write)
+        with rw_lock.read_locked():
+            self.assertRaises(RuntimeError, rw_lock.acquire_write)
+        # The lock is still usable after the errors
+        with rw_lock.write_locked():
+            pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Benchmark for the AlarmItem and StationItem serialisation methods.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# Serialises 10k alarms (and stations) through each of the available formats
+# and prints the best time of several runs. It is not part of the unit tests,
+# run it directly with: python Serialisation_benchmark.py
+#
+from __future__ import unicode_literals, absolute_import, print_function
+import json
+import timeit
+try:
+    from LightUpAlarm.AlarmItem import AlarmItem
+    from LightUpAlarm.StationItem import StationItem
+except ImportError:
+    import os
+    import sys
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    from LightUpAlarm.AlarmItem import AlarmItem
+    from LightUpAlarm.StationItem import StationItem
+
+
+NUMBER_OF_ITEMS = 10000
+REPEAT = 5
+
+
+def property_dict(alarm):
+    """ Dictionary built through the property getters, the old approach. """
+    return {'id': alarm.id_,
+            'hour': alarm.hour,
+            'minute': alarm.minute,
+            'enabled': alarm.enabled,
+            'label': alarm.label,
+            'timestamp': alarm.timestamp,
+            'monday': alarm.monday,
+            'tuesday': alarm.tuesday,
+            'wednesday': alarm.wednesday,
+            'thursday': alarm.thursday,
+            'friday': alarm.friday,
+            'saturday': alarm.saturday,
+            'sunday': alarm.sunday,
+            'station_id': alarm.station_id}
+
+
+def benchmark(name, function):
+    """ Prints the best time, in milliseconds, of the function runs. """
+    best = min(timeit.repeat(function, number=1, repeat=REPEAT))
+    print('%-36s %8.2f ms' % (name, best * 1000))
+
+
+def main():
+    alarms = [AlarmItem(i % 24, i % 60, days=tuple(
+        bool(i & (1 << day)) for day in range(7)), enabled=bool(i % 2),
+        label='Alarm %d' % i, timestamp=1430000000 + i, alarm_id=i + 1,
+        station_id=i % 10) for i in range(NUMBER_OF_ITEMS)]
+    stations = [StationItem('Station %d' % i, 'http://radio.test/%d' % i,
+                            station_id=i + 1)
+                for i in range(NUMBER_OF_ITEMS)]
+    print('Serialising %d alarms, best of %d:' % (NUMBER_OF_ITEMS, REPEAT))
+
+    benchmark('property getters dict',
+              lambda: [property_dict(alarm) for alarm in alarms])
+    benchmark('AlarmItem.to_dict()',
+              lambda: [alarm.to_dict() for alarm in alarms])
+    benchmark('AlarmItem.to_tuple()',
+              lambda: [alarm.to_tuple() for alarm in alarms])
+    benchmark('AlarmItem.to_bytes()',
+              lambda: b''.join([alarm.to_bytes() for alarm in alarms]))
+    benchmark('JSON, to_dict() with indent=4',
+              lambda: json.dumps([alarm.to_dict() for alarm in alarms],
+                                 indent=4, separators=(',', ': ')))
+    benchmark('JSON, to_dict() compact',
+              lambda: json.dumps([alarm.to_dict() for alarm in alarms],
+                                 separators=(',', ':')))
+    benchmark('JSON, to_tuple() compact',
+              lambda: json.dumps([alarm.to_tuple() for alarm in alarms],
+                                 separators=(',', ':')))
+    encoded = [alarm.to_bytes() for alarm in alarms]
+    benchmark('AlarmItem.from_bytes()',
+              lambda: [AlarmItem.from_bytes(data) for data in encoded])
+
+    print('Serialising %d stations, best of %d:' % (NUMBER_OF_ITEMS, REPEAT))
+    benchmark('StationItem.to_dict()',
+              lambda: [station.to_dict() for station in stations])
+    benchmark('StationItem.to_tuple()',
+              lambda: [station.to_tuple() for station in stations])
+    benchmark('StationItem.to_bytes()',
+              lambda: b''.join([station.to_bytes() for station in stations]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Unit test for the StationItem class.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+from __future__ import unicode_literals, absolute_import
+import unittest
+try:
+    from LightUpAlarm.StationItem import StationItem
+except ImportError:
+    import os
+    import sys
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    from LightUpAlarm.StationItem import StationItem
+
+
+class StationItemTestCase(unittest.TestCase):
+    """ Tests for StationItem class. """
+
+    def test_constructor(self):
+        """ Tests the constructor and the trusted from_row constructor. """
+        station_test = StationItem('Radio', 'http://radio.test/stream', 4)
+        self.assertIsInstance(station_test, StationItem)
+        self.assertEqual(station_test.id_, 4)
+        self.assertEqual(station_test.name, 'Radio')
+        self.assertEqual(station_test.url, 'http://radio.test/stream')
+
+        station_test = StationItem.from_row(
+            {'id': 4, 'name': 'Radio', 'url': 'http://radio.test/stream'})
+        self.assertIsInstance(station_test, StationItem)
+        self.assertEqual(station_test.id_, 4)
+        self.assertEqual(station_test.name, 'Radio')
+        self.assertEqual(station_test.url, 'http://radio.test/stream')
+
+    def test_serialisation(self):
+        """
+        Tests the to_tuple, to_dict and binary encoding methods, and that the
+        binary data can be decoded back into the same station.
+        """
+        # Database rows can contain non ASCII names
+        station_test = StationItem.from_row(
+            {'id': 4, 'name': 'Radio é', 'url': 'http://radio.test/stream'})
+        self.assertEqual(station_test.to_tuple(),
+                         (4, 'Radio é', 'http://radio.test/stream'))
+        self.assertEqual(station_test.to_dict(),
+                         {'id': 4, 'name': 'Radio é',
+                          'url': 'http://radio.test/stream'})
+        self.assertEqual(
+            StationItem.from_row(station_test.to_dict()).to_tuple(),
+            station_test.to_tuple())
+
+        binary = station_test.to_bytes()
+        self.assertIsInstance(binary, bytes)
+        station_decoded = StationItem.from_bytes(binary)
+        self.assertIsInstance(station_decoded, StationItem)
+        self.assertEqual(station_decoded.to_tuple(), station_test.to_tuple())
+
+        # Station without ID
+        station_test = StationItem('', 'http://radio.test/stream')
+        station_decoded = StationItem.from_bytes(station_test.to_bytes())
+        self.assertEqual(station_decoded.to_tuple(),
+                         (None, '', 'http://radio.test/stream'))
+
+
+if __name__ == '__main__':
+    unittest.main()
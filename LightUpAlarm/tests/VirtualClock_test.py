@@ -0,0 +1,72 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Unit test for the VirtualClock class.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+from __future__ import unicode_literals, absolute_import
+import time
+import unittest
+import threading
+try:
+    from LightUpAlarm.VirtualClock import VirtualClock
+except ImportError:
+    import os
+    import sys
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    from LightUpAlarm.VirtualClock import VirtualClock
+
+
+class VirtualClockTestCase(unittest.TestCase):
+    """ Tests for VirtualClock class. """
+
+    def test_auto_advance(self):
+        """ Tests the sleeps advance the time without blocking. """
+        clock = VirtualClock(1000)
+        self.assertEqual(clock.time(), 1000)
+        start_time = time.time()
+        clock.sleep(7 * 24 * 60 * 60)
+        self.assertLess(time.time() - start_time, 1)
+        self.assertEqual(clock.time(), 1000 + 7 * 24 * 60 * 60)
+        clock.sleep(-5)
+        self.assertEqual(clock.time(), 1000 + 7 * 24 * 60 * 60)
+        self.assertEqual(clock.localtime(), time.localtime(clock.time()))
+        self.assertEqual(clock.localtime(0), time.localtime(0))
+
+    def test_advance(self):
+        """ Tests the time only moves forward. """
+        clock = VirtualClock(1000, auto_advance=False)
+        self.assertEqual(clock.advance(30), 1030)
+        self.assertEqual(clock.set_time(2000), 2000)
+        self.assertEqual(clock.set_time(1500), 2000)
+        self.assertEqual(clock.time(), 2000)
+
+    def test_blocking_sleep(self):
+        """
+        Tests a sleep without auto advance blocks until the time is advanced
+        past its wake up time.
+        """
+        clock = VirtualClock(0, auto_advance=False)
+        woken = threading.Event()
+
+        def sleeper():
+            clock.sleep(60)
+            woken.set()
+
+        thread = threading.Thread(target=sleeper)
+        thread.daemon = True
+        thread.start()
+        self.assertFalse(woken.wait(0.1))
+        clock.advance(59)
+        self.assertFalse(woken.wait(0.1))
+        clock.advance(1)
+        self.assertTrue(woken.wait(5))
+        self.assertEqual(clock.time(), 60)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,7 +26,16 @@ brightness_start = 0.1
 brightness_end = 0.9
 
 
-def gradual_light_on(seconds):
+def gradual_light_on(seconds, clock=time, abort_event=None, on_step=None):
+    """
+    Gradually increases the lamp brightness in the inputted amount of time.
+    :param seconds: Time in seconds for the entire procedure to take.
+    :param clock: Optional clock with the time module interface to sleep.
+    :param abort_event: Optional threading.Event to stop increasing the
+                        brightness when set.
+    :param on_step: Optional function called with each brightness level set.
+    :return: Boolean indicating if the procedure was completed.
+    """
     sleep_time = seconds / 200.0
     brightness_step = (brightness_end - brightness_start) / 200.0
     brightness_level = brightness_start
@@ -44,7 +53,12 @@ def gradual_light_on(seconds):
 
     # Increase brightness gradually
     while brightness_level < brightness_end:
+        if abort_event is not None and abort_event.is_set():
+            return False
         unicornhat.brightness(brightness_level)
         unicornhat.show()
+        if on_step is not None:
+            on_step(brightness_level)
         brightness_level += brightness_step
-        time.sleep(sleep_time)
+        clock.sleep(sleep_time)
+    return True
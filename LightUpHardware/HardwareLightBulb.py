@@ -19,25 +19,36 @@ BRIDGE_IP = '192.168.0.10'
 ROOM_LIGHT_BULB_ID = 4
 
 
-def gradual_light_on(seconds):
+def gradual_light_on(seconds, clock=time, abort_event=None, on_step=None):
     """
     Gradually increases the light brightness from minimum to maximum in inputted
     amount of time.
     :param seconds: Time in seconds for the entire procedure to take.
+    :param clock: Optional clock with the time module interface to sleep.
+    :param abort_event: Optional threading.Event to stop increasing the
+                        brightness when set.
+    :param on_step: Optional function called with each brightness level set.
+    :return: Boolean indicating if the procedure was completed.
     """
     sleep_time = seconds / 255.0
 
     light_bulb = Light(__connected_bridge(), ROOM_LIGHT_BULB_ID)
     if light_bulb.reachable is False:
         print('Light %s switch is OFF' % ROOM_LIGHT_BULB_ID)
+        return False
     else:
         light_bulb.brightness = 0
         if light_bulb.on is False:
             light_bulb.on = True
         print('Increasing the light brightness for %s seconds.' % seconds)
         for x in range(1, 254):
-            time.sleep(sleep_time)
+            clock.sleep(sleep_time)
+            if abort_event is not None and abort_event.is_set():
+                return False
             light_bulb.brightness = x
+            if on_step is not None:
+                on_step(x)
+        return True
 
 
 def __connected_bridge():
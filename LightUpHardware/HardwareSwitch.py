@@ -88,15 +88,22 @@ def switch_off(input_switch=None):
 
 
 def safe_on():
-    """ Checks the state of the switch and only turns it ON if necessary. """
+    """
+    Checks the state of the switch and only turns it ON if necessary.
+    :return: Boolean indicating if the switch is ON.
+    """
     switch = _get_switch()
+    if switch is None:
+        return False
     switch_is_on = switch.get_state()
     if switch_is_on is False:
         print('Turning ON Switch.')
         switch.turn_on()
+        switch_is_on = switch.get_state()
     else:
         print('WARNING: The Switch is already ON, state unchanged !',
               file=sys.stderr)
+    return switch_is_on
 
 
 def test_switch():
@@ -34,7 +34,15 @@ class HardwareThread(object):
     HardwareThread.lamp_time             <-- correct
     instance.lamp_time                   <-- incorrect, AttributeError
     instance._HardwareThread__lamp_time  <-- works, but naughty
+
+    The run times are measured with the clock class variable, an object with
+    the time module interface (time(), localtime() and sleep()), so it can be
+    replaced to run the hardware timeline faster than real time.
+
+    A run can be aborted with abort(), and its state (see get_state()) is sent
+    to the functions registered with add_state_listener() on every change.
     """
+    clock = time
     __singleton = None
     __lamp_time = None
     __lamp_duration = None
@@ -45,6 +53,11 @@ class HardwareThread(object):
     __running = False
     __thread = None
     __threads = []
+    __abort = threading.Event()
+    __state_lock = threading.Lock()
+    __state = {'running': False, 'lamp': None, 'room_light': None,
+               'coffee': None}
+    __state_listeners = []
 
     #
     # metaclass methods to apply singleton pattern and set accessors
@@ -84,6 +97,28 @@ class HardwareThread(object):
 
     __metaclass__ = __HardwareThreadMetaclass
 
+    class __AbortableClock(object):
+        """
+        Clock used by a run, with the interface of the HardwareThread clock.
+        With the time module its sleep returns as soon as the run is aborted,
+        other clocks (like a virtual clock) cannot be interrupted.
+        """
+        def __init__(self, clock, abort_event):
+            self.__clock = clock
+            self.__abort_event = abort_event
+
+        def time(self):
+            return self.__clock.time()
+
+        def localtime(self, *args):
+            return self.__clock.localtime(*args)
+
+        def sleep(self, seconds):
+            if self.__clock is time:
+                self.__abort_event.wait(seconds)
+            else:
+                self.__clock.sleep(seconds)
+
     def __new__(cls, lamp=None, room_light=None, coffee_time=None,
                 total_time=None):
         """
@@ -177,6 +212,10 @@ class HardwareThread(object):
         cls.__running = False
         cls.__thread = None
         cls.__threads = []
+        cls.__abort.clear()
+        cls.__state = {'running': False, 'lamp': None, 'room_light': None,
+                       'coffee': None}
+        cls.clock = time
 
     #
     # Accesors
@@ -351,7 +390,9 @@ class HardwareThread(object):
         t = threading.Thread(
             name='LampThread',
             target=HardwareLamp.gradual_light_on,
-            args=(cls.lamp_duration,))
+            args=(cls.lamp_duration,
+                  cls.__AbortableClock(cls.clock, cls.__abort), cls.__abort,
+                  lambda brightness: cls.__set_state(lamp=brightness)))
         t.daemon = True
         cls.__threads.append(t)
         t.start()
@@ -364,7 +405,9 @@ class HardwareThread(object):
         t = threading.Thread(
             name='LightThread',
             target=HardwareLightBulb.gradual_light_on,
-            args=(cls.room_light_duration,))
+            args=(cls.room_light_duration,
+                  cls.__AbortableClock(cls.clock, cls.__abort), cls.__abort,
+                  lambda brightness: cls.__set_state(room_light=brightness)))
         t.daemon = True
         cls.__threads.append(t)
         t.start()
@@ -374,46 +417,56 @@ class HardwareThread(object):
         """ Creates and starts the thread to turn on the coffee machine. """
         t = threading.Thread(
             name='SwitchThread',
-            target=HardwareSwitch.safe_on)
+            target=lambda: cls.__set_state(coffee=HardwareSwitch.safe_on()))
         t.daemon = True
         cls.__threads.append(t)
         t.start()
 
+    @classmethod
+    def get_timeline(cls):
+        """
+        Gets the hardware procedures launched by a run, in launch order. The
+        procedures set to start after the total runtime are not launched.
+        :return: List of tuples with the time, in seconds from the start of
+                 the run, and the procedure name ('lamp', 'room_light' or
+                 'coffee'). The last tuple is the 'end' of the run.
+        """
+        timeline = [(launch_time, name) for launch_time, name in sorted(
+            ((cls.lamp_time, 'lamp'), (cls.room_light_time, 'room_light'),
+             (cls.coffee_time, 'coffee')), key=lambda item: item[0])
+            if launch_time < cls.total_time]
+        timeline.append((cls.total_time, 'end'))
+        return timeline
+
     @classmethod
     def __run(cls):
         """
-        Loop function to run as long as total_time indicates, in seconds.
+        Function to run as long as total_time indicates, in seconds.
         It launches the individual hardware threads at the times indicated by
-        their variables.
+        their variables, sleeping until each of them.
         """
-        start_time = time.time()
-        time_lamp = start_time + cls.lamp_time
-        time_room = start_time + cls.room_light_time
-        time_coffee = start_time + cls.coffee_time
-        end_time = start_time + cls.total_time
-        lamp_launched = False
-        room_launched = False
-        coffee_launched = False
+        clock = cls.__AbortableClock(cls.clock, cls.__abort)
+        start_time = clock.time()
+        launchers = {'lamp': cls._launch_lamp,
+                     'room_light': cls._launch_room_light,
+                     'coffee': cls._launch_coffee}
 
         # Time controlled loop to launch the required hardware functions
-        current_time = time.time()
-        while current_time < end_time:
-            if time_lamp < current_time and lamp_launched is False:
-                lamp_launched = True
-                cls._launch_lamp()
-            if time_room < current_time and room_launched is False:
-                room_launched = True
-                cls._launch_room_light()
-            if time_coffee < current_time and coffee_launched is False:
-                coffee_launched = True
-                cls._launch_coffee()
-            time.sleep(0.01)
-            current_time = time.time()
+        for launch_time, name in cls.get_timeline():
+            remaining_time = start_time + launch_time - clock.time()
+            if remaining_time > 0:
+                clock.sleep(remaining_time)
+            if cls.__abort.is_set():
+                print('HardwareThread run aborted.')
+                break
+            if name in launchers:
+                launchers[name]()
 
         # Don't wait for the threads to join, as it would overrun the requested
         # runtime. Ending this thread will kill its children (daemon=True).
         print('HardwareThread run finished.')
         cls.__running = False
+        cls.__set_state(running=False)
 
     @classmethod
     def start(cls):
@@ -436,6 +489,8 @@ class HardwareThread(object):
             while cls.__running is True:
                 time.sleep(float(random.randint(1, 100)) / 1000.0)
         cls.__running = True
+        cls.__abort.clear()
+        cls.__set_state(running=True, lamp=None, room_light=None, coffee=None)
 
         # Launch thread
         print('Running the Hardware Thread:\n\t'
@@ -462,3 +517,76 @@ class HardwareThread(object):
             return cls.__thread.isAlive()
         else:
             return False
+
+    @classmethod
+    def abort(cls):
+        """
+        Aborts the current run: the procedures not launched yet are skipped,
+        and the lamp and room light stop increasing their brightness. The
+        coffee machine switch is left as it is.
+        :return: Boolean indicating if there was a run in progress to abort.
+        """
+        in_progress = cls.__running is True or \
+            any(t.isAlive() for t in cls.__threads)
+        if in_progress is True:
+            cls.__abort.set()
+        return in_progress
+
+    #
+    # Run state
+    #
+    @classmethod
+    def get_state(cls):
+        """
+        Gets the state of the hardware controlled by the current, or last, run.
+        :return: Dictionary with the keys:
+                     running: Boolean indicating if the run is in progress.
+                     lamp: Lamp brightness level, None if not launched.
+                     room_light: Room light brightness level (0 to 254), None
+                                 if not launched.
+                     coffee: Boolean indicating if the coffee machine switch
+                             is ON, None if not launched.
+        """
+        with cls.__state_lock:
+            return dict(cls.__state)
+
+    @classmethod
+    def add_state_listener(cls, callback):
+        """
+        Registers a function to be called with the get_state() dictionary
+        every time the state changes, from the hardware threads.
+        :param callback: Function that takes the state dictionary.
+        """
+        with cls.__state_lock:
+            cls.__state_listeners = cls.__state_listeners + [callback]
+
+    @classmethod
+    def remove_state_listener(cls, callback):
+        """
+        Removes a function registered with add_state_listener().
+        :param callback: Function to stop notifying.
+        :return: Boolean indicating if the function was registered.
+        """
+        with cls.__state_lock:
+            listeners = [listener for listener in cls.__state_listeners
+                         if listener != callback]
+            removed = len(listeners) != len(cls.__state_listeners)
+            cls.__state_listeners = listeners
+        return removed
+
+    @classmethod
+    def __set_state(cls, **changes):
+        """
+        Updates the run state and notifies the listeners.
+        :param changes: State keys and their new values.
+        """
+        with cls.__state_lock:
+            cls.__state.update(changes)
+            state = dict(cls.__state)
+            listeners = cls.__state_listeners
+        for listener in listeners:
+            try:
+                listener(state)
+            except Exception as e:
+                print('ERROR: HardwareThread state listener failed: %s' % e,
+                      file=sys.stderr)
@@ -16,6 +16,7 @@ import unittest
 import threading
 try:
     from LightUpHardware.HardwareThread import HardwareThread
+    from LightUpAlarm.VirtualClock import VirtualClock
 except ImportError:
     import os
     import sys
@@ -24,6 +25,7 @@ except ImportError:
     sys.path.insert(0, package_dir)
     print("path added: %s" % package_dir)
     from LightUpHardware.HardwareThread import HardwareThread
+    from LightUpAlarm.VirtualClock import VirtualClock
 
 
 class HardwareThreadTestCase(unittest.TestCase):
@@ -616,6 +618,101 @@ class HardwareThreadTestCase(unittest.TestCase):
         end_time = time.time()
         self.assertAlmostEqual(2*2, end_time - start_time, delta=0.1*2)
 
+    def test_virtual_clock_run(self):
+        """
+        Tests a full 15 minutes run with a VirtualClock, which launches the
+        hardware at the timeline times without waiting in real time.
+        """
+        if HardwareThread._HardwareThread__singleton is not None:
+            HardwareThread._drop()
+        hw_thread_instance = HardwareThread(
+            lamp=(0, 180), room_light=(120, 780), coffee_time=600,
+            total_time=900)
+        self.assertEqual(HardwareThread.get_timeline(), [
+            (0, 'lamp'), (120, 'room_light'), (600, 'coffee'), (900, 'end')])
+        clock = VirtualClock(1000)
+        HardwareThread.clock = clock
+        launches = []
+
+        def mock_launcher(name):
+            def launch(cls):
+                launches.append((name, clock.time()))
+            return types.MethodType(launch, HardwareThread)
+
+        start_time = time.time()
+        with mock.patch.object(HardwareThread, '_launch_lamp',
+                               mock_launcher('lamp')), \
+                mock.patch.object(HardwareThread, '_launch_room_light',
+                                  mock_launcher('room_light')), \
+                mock.patch.object(HardwareThread, '_launch_coffee',
+                                  mock_launcher('coffee')), \
+                mock.patch('sys.stdout', new=io.StringIO()):
+            hw_thread_instance.start()
+            while hw_thread_instance.isAlive():
+                time.sleep(0.01)
+        self.assertLess(time.time() - start_time, 2)
+        self.assertEqual(launches, [
+            ('lamp', 1000), ('room_light', 1120), ('coffee', 1600)])
+        self.assertEqual(clock.time(), 1900)
+
+        # The procedures after the total time are not launched
+        HardwareThread.coffee_time = 950
+        self.assertEqual(HardwareThread.get_timeline()[-2:], [
+            (120, 'room_light'), (900, 'end')])
+        HardwareThread._drop()
+        self.assertIs(HardwareThread.clock, time)
+
+
+    def test_abort_and_state(self):
+        """
+        Tests the state listeners follow the lamp brightness, and an aborted
+        run stops the lamp and skips the procedures not launched yet.
+        """
+        if HardwareThread._HardwareThread__singleton is not None:
+            HardwareThread._drop()
+        hw_thread_instance = HardwareThread(
+            lamp=(0, 20), room_light=(5, 10), coffee_time=8, total_time=20)
+        states = []
+        HardwareThread.add_state_listener(states.append)
+        room_light_launch = mock.Mock()
+        coffee_launch = mock.Mock()
+        try:
+            with mock.patch.object(HardwareThread, '_launch_room_light',
+                                   room_light_launch), \
+                    mock.patch.object(HardwareThread, '_launch_coffee',
+                                      coffee_launch), \
+                    mock.patch('sys.stdout', new=io.StringIO()):
+                hw_thread_instance.start()
+                time.sleep(0.5)
+                self.assertTrue(HardwareThread.get_state()['running'])
+                self.assertGreater(HardwareThread.get_state()['lamp'], 0.1)
+
+                abort_time = time.time()
+                self.assertTrue(HardwareThread.abort())
+                while hw_thread_instance.isAlive():
+                    time.sleep(0.01)
+                self.assertLess(time.time() - abort_time, 0.5)
+                # The lamp thread stops at its next step, then stays still
+                time.sleep(0.1)
+                lamp_brightness = HardwareThread.get_state()['lamp']
+                time.sleep(0.3)
+        finally:
+            self.assertTrue(HardwareThread.remove_state_listener(states.append))
+        self.assertFalse(HardwareThread.remove_state_listener(states.append))
+
+        self.assertEqual(HardwareThread.get_state(), {
+            'running': False, 'lamp': lamp_brightness, 'room_light': None,
+            'coffee': None})
+        self.assertEqual(room_light_launch.call_count, 0)
+        self.assertEqual(coffee_launch.call_count, 0)
+        self.assertEqual(states[0], {'running': True, 'lamp': None,
+                                     'room_light': None, 'coffee': None})
+        self.assertEqual(states[-1], HardwareThread.get_state())
+        lamp_levels = [state['lamp'] for state in states[1:-1]]
+        self.assertEqual(lamp_levels, sorted(lamp_levels))
+        self.assertFalse(HardwareThread.abort())
+        HardwareThread._drop()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -11,16 +11,24 @@
 #
 from __future__ import unicode_literals, absolute_import
 import os
+import json
+import zlib
 import datetime
 import logging
+import threading
 from flask import Flask
 from flask import Response
 from flask import request, redirect, jsonify, render_template, \
     send_from_directory
+from werkzeug.http import is_resource_modified
 try:
     from LightUpServer.ServerAlarmAdapter import ServerAlarmAdapter
+    from LightUpServer.ThreadPoolWsgiServer import ThreadPoolWsgiServer
+    from LightUpServer.ServerControlChannel import ServerControlChannel
 except ImportError:
     from ServerAlarmAdapter import ServerAlarmAdapter
+    from ThreadPoolWsgiServer import ThreadPoolWsgiServer
+    from ServerControlChannel import ServerControlChannel
 
 
 # Creating flask instance
@@ -29,13 +37,200 @@ flask_server = Flask(__name__, static_url_path='/LightUpPi')
 # Uninitialised AlarmManager instance
 alarm_adapt = None
 
-# Callback function to be executed every time there is an alarm change
-callback_func = None
+# Content encodings of the JSON responses, in order of preference, and the
+# minimum size in bytes to compress them (the smaller ones do not gain enough
+# to pay for the compression time) with the zlib compression level
+CONTENT_ENCODINGS = ('gzip', 'deflate')
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 6
+
+# Integer arguments of the alarms and stations lists, with their minimum and
+# maximum (None if unbounded) values, and the weekdays of the 'day' filter
+LIST_INTEGER_ARGS = (('limit', 1, None), ('cursor', 0, None))
+FILTER_INTEGER_ARGS = (('station_id', 0, None), ('hour_from', 0, 23),
+                       ('hour_to', 0, 23))
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday',
+            'saturday', 'sunday')
+
+# Optional AlarmNamespaces instance, served from the /LightUpPi/ns/<namespace>/
+# routes, and the ServerAlarmAdapter of each of its namespaces, with a lock as
+# the requests are served from several threads
+alarm_namespaces = None
+namespace_adapters = {}
+namespace_adapters_lock = threading.Lock()
+
+
+def get_alarm_adapter(namespace=None):
+    """
+    Gets the ServerAlarmAdapter of the alarms namespace of a request. The
+    adapters are looked up and created with the lock held, so concurrent
+    requests share a single adapter per namespace. The adapters of removed or
+    replaced namespaces are closed after releasing the lock, disconnecting
+    their clients.
+    :param namespace: Name of the namespace, None for the default alarms.
+    :return: ServerAlarmAdapter instance, or None if the namespace is not
+             served.
+    """
+    if namespace is None:
+        return alarm_adapt
+    if alarm_namespaces is None:
+        return None
+    with namespace_adapters_lock:
+        alarm_mgr = alarm_namespaces.get(namespace)
+        old_adapter = namespace_adapters.get(namespace)
+        if alarm_mgr is None:
+            adapter = None
+            namespace_adapters.pop(namespace, None)
+        elif old_adapter is None or old_adapter.alarm_mgr is not alarm_mgr:
+            adapter = ServerAlarmAdapter(alarm_mgr)
+            namespace_adapters[namespace] = adapter
+        else:
+            adapter = old_adapter
+    if old_adapter is not None and old_adapter is not adapter:
+        old_adapter.close()
+    return adapter
+
+
+def namespace_error(namespace):
+    """
+    :param namespace: Name of the namespace not served.
+    :return: JSON response with the error message.
+    """
+    return jsonify({'error': 'The alarms namespace \'%s\' does not exist' %
+                    namespace})
+
+
+def compress(data, encoding):
+    """
+    Compresses the data with an HTTP content encoding.
+    :param data: Bytes to compress.
+    :param encoding: String with the content encoding, 'gzip' or 'deflate'.
+    :return: Bytes with the compressed data.
+    """
+    if encoding == 'gzip':
+        # zlib with the gzip container, Python 2 has no gzip.compress()
+        compressor = zlib.compressobj(
+            COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    else:
+        compressor = zlib.compressobj(COMPRESS_LEVEL)
+    return compressor.compress(data) + compressor.flush()
+
+
+def encoded_response(json_string, etag=None):
+    """
+    Creates the response of a JSON string, pretty printed if the request has
+    the 'pretty' argument, and compressed if it is at least COMPRESS_MIN_SIZE
+    bytes and the request Accept-Encoding header allows it.
+    :param json_string: String with the compact JSON data.
+    :param etag: Optional ETag string of the data. The compressed
+                 representations add the encoding name to it.
+    :return: Flask Response.
+    """
+    if 'pretty' in request.args:
+        # Only for the people reading it, so it is not worth adding the option
+        # to every ServerAlarmAdapter method
+        json_string = json.dumps(
+            json.loads(json_string), indent=4, separators=(',', ': '))
+    data = json_string.encode('utf-8')
+    response = Response(mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    encoding = None
+    if len(data) >= COMPRESS_MIN_SIZE:
+        encoding = request.accept_encodings.best_match(CONTENT_ENCODINGS)
+    if encoding is not None:
+        data = compress(data, encoding)
+        response.content_encoding = encoding
+        if etag is not None:
+            etag = '%s-%s' % (etag, encoding)
+    response.set_data(data)
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+
+def conditional_json(validator, get_json):
+    """
+    Responds to a GET request that can be conditional (If-None-Match or
+    If-Modified-Since headers). If the client data is up to date it responds
+    with a 304 without creating the JSON, otherwise with the JSON data
+    encoded by encoded_response().
+    :param validator: Tuple with the ETag string and the time of the last
+                      change of the data, in seconds since 1970.
+    :param get_json: Callable that returns the JSON string of the data.
+    :return: Flask Response, with the ETag and Last-Modified headers.
+    """
+    etag, last_modified = validator
+    # HTTP dates have a resolution of seconds
+    last_modified = datetime.datetime.utcfromtimestamp(int(last_modified))
+    # The client can have any of the data representations (compressed or not)
+    for representation_etag in [etag] + ['%s-%s' % (etag, encoding)
+                                         for encoding in CONTENT_ENCODINGS]:
+        if not is_resource_modified(request.environ, etag=representation_etag,
+                                    last_modified=last_modified):
+            response = Response(status=304)
+            response.set_etag(representation_etag)
+            response.vary.add('Accept-Encoding')
+            break
+    else:
+        response = encoded_response(get_json(), etag)
+    response.last_modified = last_modified
+    # The clients can cache it, but have to validate it on every use
+    response.cache_control.no_cache = True
+    return response
 
 
-def callback():
-    if callback_func is not None:
-        callback_func()
+def list_query(filters=False):
+    """
+    Parses the arguments of an 'id=all' request to get a page of its list,
+    with only some fields or items, which are all selected by the database.
+        limit: Maximum number of items, a positive integer.
+        cursor: The 'nextCursor' of the previous page response.
+        fields: Comma separated names of the fields to include, the 'id' is
+                always included.
+    And the alarm filters:
+        enabled, active: 'true' or 'false'.
+        day: Name of the repeat weekday, or its number with 0 as Monday.
+        station_id: Integer with the station ID.
+        hour_from, hour_to: Inclusive hour range, from 0 to 23.
+    :param filters: Boolean to parse the alarm filters as well.
+    :return: Tuple with the dictionary of the query arguments (empty if none
+             is given) and the error string (None if they are all valid).
+    """
+    query = {}
+    integer_args = LIST_INTEGER_ARGS
+    if filters is True:
+        integer_args += FILTER_INTEGER_ARGS
+    for name, minimum, maximum in integer_args:
+        value = request.args.get(name)
+        if value is not None:
+            try:
+                value = int(value)
+            except ValueError:
+                return query, 'The \'%s\' argument has to be an integer' % name
+            if value < minimum or (maximum is not None and value > maximum):
+                return query, 'The \'%s\' argument is out of range' % name
+            query[name] = value
+    fields = request.args.get('fields')
+    if fields is not None:
+        query['fields'] = [field.strip() for field in fields.split(',')
+                           if field.strip()]
+    if filters is True:
+        for name in ('enabled', 'active'):
+            value = request.args.get(name)
+            if value is not None:
+                if value.lower() not in ('true', 'false'):
+                    return query, 'The \'%s\' argument has to be \'true\' ' \
+                                  'or \'false\'' % name
+                query[name] = value.lower() == 'true'
+        day = request.args.get('day')
+        if day is not None:
+            if day.lower() in WEEKDAYS:
+                query['day'] = WEEKDAYS.index(day.lower())
+            elif day in [str(i) for i in range(7)]:
+                query['day'] = int(day)
+            else:
+                return query, 'The \'day\' argument has to be a weekday name'
+    return query, None
 
 
 @flask_server.route('/')
@@ -76,22 +271,38 @@ def template_test():
 
 
 @flask_server.route('/LightUpPi/getAlarm', methods=['GET'])
-def get_alarm():
-    callback()
-    global alarm_adapt
+@flask_server.route('/LightUpPi/ns/<namespace>/getAlarm', methods=['GET'])
+def get_alarm(namespace=None):
+    alarm_adapt = get_alarm_adapter(namespace)
+    if alarm_adapt is None:
+        return namespace_error(namespace)
     message = {'error': 'The \'id\' argument is required for \'getAlarm\''}
     alarm_id = request.args.get('id')
     if alarm_id is not None:
         if alarm_id == 'all':
             # /LightUpPi/getAlarm?id=all
-            json_response = alarm_adapt.json_get_all_alarms()
-            return Response(json_response,  mimetype='application/json')
+            # &limit=<>&cursor=<>&fields=<>&enabled=<>&active=<>&day=<>
+            # &station_id=<>&hour_from=<>&hour_to=<>
+            query, error = list_query(filters=True)
+            if error is not None:
+                message['error'] = error
+                return jsonify(message)
+            if not query:
+                return conditional_json(alarm_adapt.get_alarms_validator(),
+                                        alarm_adapt.json_get_all_alarms)
+            try:
+                return conditional_json(
+                    alarm_adapt.get_alarms_validator(),
+                    lambda: alarm_adapt.json_query_alarms(**query))
+            except ValueError as e:
+                message['error'] = '%s' % e
         else:
             # /LightUpPi/getAlarm?id=<alarm_id>
             try:
                 alarm_id = int(alarm_id)
-                json_response = alarm_adapt.json_get_alarm(int(alarm_id))
-                return Response(json_response,  mimetype='application/json')
+                return conditional_json(
+                    alarm_adapt.get_alarms_validator(),
+                    lambda: alarm_adapt.json_get_alarm(alarm_id))
             except ValueError:
                 message['error'] = 'The \'id\' argument has to be an integer'
 
@@ -100,7 +311,8 @@ def get_alarm():
 
 
 @flask_server.route('/LightUpPi/addAlarm', methods=['GET'])
-def add_alarm():
+@flask_server.route('/LightUpPi/ns/<namespace>/addAlarm', methods=['GET'])
+def add_alarm(namespace=None):
     """
     Adding an alarm to the database and launching it if active.
     The hour and minute arguments are mandatory and the others are optional.
@@ -110,7 +322,9 @@ def add_alarm():
         &timestamp=<>&station_id=<>
     :return: JSON string with response data indicating success of operation.
     """
-    global alarm_adapt
+    alarm_adapt = get_alarm_adapter(namespace)
+    if alarm_adapt is None:
+        return namespace_error(namespace)
 
     # Parsing the hour argument, if not present or wrong return error message
     hour = request.args.get('hour')
@@ -212,11 +426,12 @@ def add_alarm():
     json_response = alarm_adapt.json_add_alarm(
         hour, minute, enabled=enabled, label=label, timestamp=timestamp,
         days=(monday, tuesday, wednesday, thursday, friday, saturday, sunday), station_id=station_id)
-    return Response(json_response, mimetype='application/json')
+    return encoded_response(json_response)
 
 
 @flask_server.route('/LightUpPi/editAlarm', methods=['GET'])
-def edit_alarm():
+@flask_server.route('/LightUpPi/ns/<namespace>/editAlarm', methods=['GET'])
+def edit_alarm(namespace=None):
     """
     Edit an alarm to the database and launching it if active.
     The id arguments is mandatory and the others are optional.
@@ -226,7 +441,9 @@ def edit_alarm():
         &label=<>
     :return: JSON string with response data indicating success of operation.
     """
-    global alarm_adapt
+    alarm_adapt = get_alarm_adapter(namespace)
+    if alarm_adapt is None:
+        return namespace_error(namespace)
 
     # Parsing the id argument, if not present or wrong return error message
     id_ = request.args.get('id')
@@ -336,25 +553,28 @@ def edit_alarm():
     json_response = alarm_adapt.json_edit_alarm(
         alarm_id=id_, hour=hour, minute=minute, enabled=enabled, label=label,
         days=alarm_repeat, station_id=station_id)
-    return Response(json_response, mimetype='application/json')
+    return encoded_response(json_response)
 
 
 @flask_server.route('/LightUpPi/deleteAlarm', methods=['GET'])
-def delete_alarm():
-    global alarm_adapt
+@flask_server.route('/LightUpPi/ns/<namespace>/deleteAlarm', methods=['GET'])
+def delete_alarm(namespace=None):
+    alarm_adapt = get_alarm_adapter(namespace)
+    if alarm_adapt is None:
+        return namespace_error(namespace)
     message = {'error': 'The \'id\' argument is required for \'deleteAlarm\''}
     alarm_id = request.args.get('id')
     if alarm_id is not None:
         if alarm_id == 'all':
             # /LightUpPi/getAlarm?id=all
             json_response = alarm_adapt.json_delete_all_alarms()
-            return Response(json_response,  mimetype='application/json')
+            return encoded_response(json_response)
         else:
             # /LightUpPi/getAlarm?id=<alarm_id>
             try:
                 alarm_id = int(alarm_id)
                 json_response = alarm_adapt.json_delete_alarm(int(alarm_id))
-                return Response(json_response,  mimetype='application/json')
+                return encoded_response(json_response)
             except ValueError:
                 message['error'] = 'The \'id\' argument has to be an integer'
 
@@ -362,23 +582,161 @@ def delete_alarm():
     return jsonify(message)
 
 
+@flask_server.route('/LightUpPi/snoozeAlarm', methods=['GET'])
+@flask_server.route('/LightUpPi/ns/<namespace>/snoozeAlarm', methods=['GET'])
+def snooze_alarm(namespace=None):
+    """
+    Snoozes a running alarm, which will alert again after the snooze time.
+    /LightUpPi/snoozeAlarm?id=<alarm_id>
+    :return: JSON string with response data indicating success of operation.
+    """
+    alarm_adapt = get_alarm_adapter(namespace)
+    if alarm_adapt is None:
+        return namespace_error(namespace)
+    message = {'error': 'The \'id\' argument is required for '
+               '\'snoozeAlarm\''}
+    alarm_id = request.args.get('id')
+    if alarm_id is not None:
+        try:
+            json_response = alarm_adapt.json_snooze_alarm(int(alarm_id))
+            return encoded_response(json_response)
+        except ValueError:
+            message['error'] = 'The \'id\' argument has to be an integer'
+    return jsonify(message)
+
+
+@flask_server.route('/LightUpPi/dismissAlarm', methods=['GET'])
+@flask_server.route('/LightUpPi/ns/<namespace>/dismissAlarm', methods=['GET'])
+def dismiss_alarm(namespace=None):
+    """
+    Dismisses an alarm, cancelling its pending snooze.
+    /LightUpPi/dismissAlarm?id=<alarm_id>
+    :return: JSON string with response data indicating success of operation.
+    """
+    alarm_adapt = get_alarm_adapter(namespace)
+    if alarm_adapt is None:
+        return namespace_error(namespace)
+    message = {'error': 'The \'id\' argument is required for '
+               '\'dismissAlarm\''}
+    alarm_id = request.args.get('id')
+    if alarm_id is not None:
+        try:
+            json_response = alarm_adapt.json_dismiss_alarm(int(alarm_id))
+            return encoded_response(json_response)
+        except ValueError:
+            message['error'] = 'The \'id\' argument has to be an integer'
+    return jsonify(message)
+
+
+@flask_server.route('/LightUpPi/events', methods=['GET'])
+@flask_server.route('/LightUpPi/ns/<namespace>/events', methods=['GET'])
+def events(namespace=None):
+    """
+    Server-Sent Events stream of the alarm, station and settings changes, and
+    the alarm alerts and snoozes, see ServerEventStream.
+    A reconnecting client resumes from its Last-Event-ID header, or from the
+    lastEventId argument for the clients that cannot set it.
+    /LightUpPi/events
+    :return: text/event-stream response, the multi-threaded server hands over
+             its connection to the stream thread once the headers are sent.
+    """
+    alarm_adapt = get_alarm_adapter(namespace)
+    if alarm_adapt is None:
+        return namespace_error(namespace)
+    event_stream = alarm_adapt.get_event_stream()
+    last_event_id = request.headers.get('Last-Event-ID') or \
+        request.args.get('lastEventId')
+    detach = request.environ.get(ThreadPoolWsgiServer.detach_key)
+    if detach is not None:
+        data, position = event_stream.connect(last_event_id)
+        detach(lambda connection:
+               event_stream.add_connection(connection, position))
+        # An iterator, as a bytes body would set the Content-Length
+        body = iter([data])
+    else:
+        body = event_stream.stream(last_event_id)
+    response = Response(body, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@flask_server.route('/LightUpPi/control', methods=['GET'])
+@flask_server.route('/LightUpPi/ns/<namespace>/control', methods=['GET'])
+def control(namespace=None):
+    """
+    WebSocket control channel to snooze and dismiss the alarms and abort the
+    hardware run, which streams the ringing alarms and the hardware state, see
+    ServerControlChannel.
+    /LightUpPi/control
+    :return: 101 Switching Protocols response, the connection is handed over
+             to the channel thread once it is sent. It requires the
+             multi-threaded server, a JSON error is returned otherwise.
+    """
+    alarm_adapt = get_alarm_adapter(namespace)
+    if alarm_adapt is None:
+        return namespace_error(namespace)
+    message = {'dataType': 'Control channel', 'success': False}
+    detach = request.environ.get(ThreadPoolWsgiServer.detach_key)
+    key = request.headers.get('Sec-WebSocket-Key')
+    if request.headers.get('Upgrade', '').lower() != 'websocket' or \
+            'upgrade' not in request.headers.get('Connection', '').lower() \
+            or key is None:
+        message['error'] = 'The request has to be a WebSocket handshake'
+        response = jsonify(message)
+        response.status_code = 400
+        return response
+    if request.headers.get('Sec-WebSocket-Version') != '13':
+        message['error'] = 'Only the WebSocket version 13 is supported'
+        response = jsonify(message)
+        response.status_code = 426
+        response.headers['Sec-WebSocket-Version'] = '13'
+        return response
+    if detach is None:
+        message['error'] = 'The control channel requires the multi-threaded ' \
+                           'server'
+        response = jsonify(message)
+        response.status_code = 501
+        return response
+    control_channel = alarm_adapt.get_control_channel()
+    detach(control_channel.add_connection)
+    response = Response(status=101)
+    del response.headers['Content-Type']
+    response.headers['Upgrade'] = 'websocket'
+    response.headers['Connection'] = 'Upgrade'
+    response.headers['Sec-WebSocket-Accept'] = \
+        ServerControlChannel.accept_key(key)
+    return response
+
+
 @flask_server.route('/LightUpPi/getStation', methods=['GET'])
 def get_station():
-    callback()
     global alarm_adapt
     message = {'error': 'The \'id\' argument is required for \'getAlarm\''}
     station_id = request.args.get('id')
     if station_id is not None:
         if station_id == 'all':
-            # /LightUpPi/getStation?id=all
-            json_response = alarm_adapt.json_get_all_stations()
-            return Response(json_response,  mimetype='application/json')
+            # /LightUpPi/getStation?id=all&limit=<>&cursor=<>&fields=<>
+            query, error = list_query()
+            if error is not None:
+                message['error'] = error
+                return jsonify(message)
+            if not query:
+                return conditional_json(alarm_adapt.get_stations_validator(),
+                                        alarm_adapt.json_get_all_stations)
+            try:
+                return conditional_json(
+                    alarm_adapt.get_stations_validator(),
+                    lambda: alarm_adapt.json_query_stations(**query))
+            except ValueError as e:
+                message['error'] = '%s' % e
         else:
             # /LightUpPi/getStation?id=<station_id>
             try:
                 station_id = int(station_id)
-                json_response = alarm_adapt.json_get_station(int(station_id))
-                return Response(json_response,  mimetype='application/json')
+                return conditional_json(
+                    alarm_adapt.get_stations_validator(),
+                    lambda: alarm_adapt.json_get_station(station_id))
             except ValueError:
                 message['error'] = 'The \'id\' argument has to be an integer'
 
@@ -412,7 +770,7 @@ def add_station():
     # At this point all arguments should be correct
     json_response = alarm_adapt.json_add_station(
         name, url)
-    return Response(json_response, mimetype='application/json')
+    return encoded_response(json_response)
 
 
 @flask_server.route('/LightUpPi/deleteStation', methods=['GET'])
@@ -424,13 +782,13 @@ def delete_station():
         if station_id == 'all':
             # /LightUpPi/deleteStation?id=all
             json_response = alarm_adapt.json_delete_all_stations()
-            return Response(json_response,  mimetype='application/json')
+            return encoded_response(json_response)
         else:
             # /LightUpPi/deleteStation?id=<station_id>
             try:
                 station_id = int(station_id)
                 json_response = alarm_adapt.json_delete_station(int(station_id))
-                return Response(json_response,  mimetype='application/json')
+                return encoded_response(json_response)
             except ValueError:
                 message['error'] = 'The \'id\' argument has to be an integer'
 
@@ -438,10 +796,87 @@ def delete_station():
     return jsonify(message)
 
 
-def run(alarm_mgr_arg, silent=False, callback_arg=None):
-    global alarm_adapt, callback_func
-    alarm_adapt = ServerAlarmAdapter(alarm_mgr_arg)
-    callback_func = callback_arg
+@flask_server.route('/LightUpPi/batch', methods=['POST'])
+@flask_server.route('/LightUpPi/ns/<namespace>/batch', methods=['POST'])
+def batch(namespace=None):
+    """
+    Applies a batch of alarm and station operations in a single database
+    transaction. The request body is a JSON array of operations, for example:
+        [{"op": "add", "type": "alarm", "data": {"hour": 7, "minute": 30}},
+         {"op": "edit", "type": "station", "id": 2, "data": {"name": "BBC"}},
+         {"op": "delete", "type": "alarm", "id": 3}]
+    By default no operation is saved if any of them fails, the optional atomic
+    argument set to 'false' saves the valid operations only.
+    The full request is:
+    /LightUpPi/batch?atomic=<true|false>
+    :return: JSON string with the result of each operation.
+    """
+    alarm_adapt = get_alarm_adapter(namespace)
+    if alarm_adapt is None:
+        return namespace_error(namespace)
+
+    operations = request.get_json(force=True, silent=True)
+    if not isinstance(operations, list):
+        message = {'error': 'The request body must be a JSON array of '
+                   'operations'}
+        return jsonify(message)
+
+    atomic = request.args.get('atomic', 'true').lower()
+    if atomic not in ('true', 'false'):
+        message = {'error': 'The \'atomic\' argument must be \'true\' or '
+                   '\'false\''}
+        return jsonify(message)
+
+    json_response = alarm_adapt.json_batch(operations, atomic == 'true')
+    return encoded_response(json_response)
+
+
+def make_server(host='0.0.0.0', port=80, threads=8, request_timeout=30,
+                keep_alive=True, backlog=64):
+    """
+    Creates a multi-threaded WSGI server for the Flask app. It is bound and
+    listening, but it does not serve until its serve_forever() is called.
+    :param host: String with the host address to bind.
+    :param port: Integer with the port to bind, 0 for any free port.
+    :param threads: Integer with the number of worker threads.
+    :param request_timeout: Seconds before an idle connection is closed.
+    :param keep_alive: Boolean to keep the HTTP/1.1 connections open.
+    :param backlog: Integer with the size of the socket listen queue.
+    :return: ThreadPoolWsgiServer instance.
+    """
+    return ThreadPoolWsgiServer(
+        host, port, flask_server, threads=threads,
+        request_timeout=request_timeout, keep_alive=keep_alive,
+        backlog=backlog)
+
+
+def run(alarm_mgr_arg, silent=False, namespaces=None, threads=None,
+        request_timeout=30, keep_alive=True, backlog=64, hardware=None):
+    """
+    Launches the Flask server, blocking until it is stopped.
+    To be notified of the alarm changes done through the server subscribe to
+    the AlarmManager events.
+    :param alarm_mgr_arg: AlarmManager instance to serve.
+    :param silent: Boolean to only log the server errors.
+    :param namespaces: Optional AlarmNamespaces instance, its alarms are
+                       served from /LightUpPi/ns/<namespace>/<request>.
+    :param threads: Optional number of worker threads to serve with the
+                    multi-threaded WSGI server, if None the Flask development
+                    server is used.
+    :param request_timeout: Seconds before an idle connection is closed by the
+                            multi-threaded server.
+    :param keep_alive: Boolean to keep the connections open in the
+                       multi-threaded server.
+    :param backlog: Integer with the listen queue size of the multi-threaded
+                    server.
+    :param hardware: Optional hardware controller (the HardwareThread class)
+                     of the control channel of the default alarms, to abort
+                     its run and stream its state.
+    """
+    global alarm_adapt
+    global alarm_namespaces
+    alarm_adapt = ServerAlarmAdapter(alarm_mgr_arg, hardware)
+    alarm_namespaces = namespaces
 
     # Set up logging
     if silent is True:
@@ -456,4 +891,10 @@ def run(alarm_mgr_arg, silent=False, callback_arg=None):
     flask_server.static_folder = static_dir
 
     # Run flask
-    flask_server.run(host='0.0.0.0', port=80, debug=False)
+    if threads is None:
+        flask_server.run(host='0.0.0.0', port=80, debug=False)
+    else:
+        wsgi_server = make_server(
+            threads=threads, request_timeout=request_timeout,
+            keep_alive=keep_alive, backlog=backlog)
+        wsgi_server.serve_forever()
@@ -11,7 +11,16 @@
 #   LightUpAlarm.AlarmManager
 #
 from __future__ import unicode_literals, absolute_import
+import os
 import json
+import time
+import threading
+try:
+    from LightUpServer.ServerEventStream import ServerEventStream
+    from LightUpServer.ServerControlChannel import ServerControlChannel
+except ImportError:
+    from ServerEventStream import ServerEventStream
+    from ServerControlChannel import ServerControlChannel
 #try:
 #    from LightUpAlarm.AlarmManager import AlarmManager
 #except ImportError:
@@ -27,17 +36,75 @@ class ServerAlarmAdapter(object):
     of the LightUpPi Alarm system.
     """
 
+    # Unique to this process, the database revisions restart on every run so
+    # it is part of the ETags to not match the data of a previous run
+    process_token = '%x-%x' % (os.getpid(), int(time.time() * 1000))
+
     #
     # metaclass methods
     #
-    def __init__(self, alarm_mgr):
+    def __init__(self, alarm_mgr, hardware=None):
         """
         ServerAlarmAdapter initialiser. Takes an instance to
         LightUpAlarm.AlarmManager class and produces server
         :param alarm_mgr:
+        :param hardware: Optional hardware controller of the control channel,
+                         see ServerControlChannel.
         :return:
         """
         self.alarm_mgr = alarm_mgr
+        self.hardware = hardware
+        self.__event_stream = None
+        self.__control_channel = None
+        self.__streams_lock = threading.Lock()
+
+    @staticmethod
+    def to_json(data):
+        """
+        Encodes the data into the compact JSON sent in the responses, the
+        Server re-indents it when a pretty printed response is requested.
+        :param data: Dictionary or list with the data to encode.
+        :return: JSON string without whitespace between its elements.
+        """
+        return json.dumps(data, separators=(',', ':'))
+
+    #
+    # Server-Sent Events stream and WebSocket control channel
+    #
+    def get_event_stream(self):
+        """
+        Gets the stream of the AlarmManager events, created on the first call.
+        :return: ServerEventStream instance.
+        """
+        with self.__streams_lock:
+            if self.__event_stream is None:
+                self.__event_stream = ServerEventStream(
+                    self.alarm_mgr, ServerAlarmAdapter.process_token)
+            return self.__event_stream
+
+    def get_control_channel(self):
+        """
+        Gets the WebSocket control channel, created on the first call.
+        :return: ServerControlChannel instance.
+        """
+        with self.__streams_lock:
+            if self.__control_channel is None:
+                self.__control_channel = ServerControlChannel(
+                    self.alarm_mgr, self.hardware)
+            return self.__control_channel
+
+    def close(self):
+        """
+        Closes the event stream and the control channel, disconnecting their
+        clients.
+        """
+        with self.__streams_lock:
+            if self.__event_stream is not None:
+                self.__event_stream.close()
+                self.__event_stream = None
+            if self.__control_channel is not None:
+                self.__control_channel.close()
+                self.__control_channel = None
 
     #
     # Alarm operations with normal python data
@@ -51,37 +118,48 @@ class ServerAlarmAdapter(object):
 
     @staticmethod
     def alarm_to_dict(alarm):
-        return {'id': alarm.id_,
-                'hour': alarm.hour,
-                'minute': alarm.minute,
-                'enabled': alarm.enabled,
-                'label': alarm.label,
-                'timestamp': alarm.timestamp,
-                'monday': alarm.monday,
-                'tuesday': alarm.tuesday,
-                'wednesday': alarm.wednesday,
-                'thursday': alarm.thursday,
-                'friday': alarm.friday,
-                'saturday': alarm.saturday,
-                'sunday': alarm.sunday,
-                'station_id': alarm.station_id}
+        return alarm.to_dict()
 
     def get_alarm_repeat(self, alarm_id):
         alarm = self.alarm_mgr.get_alarm(alarm_id)
         return alarm.repeat
 
+    #
+    # HTTP cache validators, from the data revision without accessing the db
+    #
+    def get_alarms_validator(self):
+        """
+        Gets the validators of the alarms data responses.
+        :return: Tuple with the ETag string and the time of the last change,
+                 in seconds since 1970.
+        """
+        revision, revision_time = self.alarm_mgr.get_revision()
+        etag = '%s-alarms-%s-%s' % (ServerAlarmAdapter.process_token,
+                                    self.alarm_mgr.namespace or '', revision)
+        return etag, revision_time
+
+    def get_stations_validator(self):
+        """
+        Gets the validators of the stations data responses.
+        :return: Tuple with the ETag string and the time of the last change,
+                 in seconds since 1970.
+        """
+        revision, revision_time = self.alarm_mgr.get_revision(stations=True)
+        etag = '%s-stations-%s' % (ServerAlarmAdapter.process_token, revision)
+        return etag, revision_time
+
     #
     # retrieve alarm data in json format
     #
     def json_get_alarm(self, alarm_id):
         alarm = self.alarm_mgr.get_alarm(alarm_id)
-        return json.dumps(
-            ServerAlarmAdapter.alarm_to_dict(alarm),
-            indent=4, separators=(',', ': '))
+        return ServerAlarmAdapter.to_json(
+            ServerAlarmAdapter.alarm_to_dict(alarm))
 
     def json_get_next_alarm(self):
         alarm = self.alarm_mgr.get_next_alarm()
-        return json.dump(ServerAlarmAdapter.alarm_to_dict(alarm))
+        return ServerAlarmAdapter.to_json(
+            ServerAlarmAdapter.alarm_to_dict(alarm))
 
     def json_get_all_alarms(self):
         all_alarms = self.alarm_mgr.get_all_alarms()
@@ -91,7 +169,25 @@ class ServerAlarmAdapter(object):
         alarms_dicts = {'dataType': 'All alarms',
                         'size': len(alarms_dicts),
                         'alarms': alarms_dicts}
-        return json.dumps(alarms_dicts, indent=4, separators=(',', ': '))
+        return ServerAlarmAdapter.to_json(alarms_dicts)
+
+    def json_query_alarms(self, fields=None, limit=None, cursor=None,
+                          **filters):
+        """
+        Gets a page of the alarms, see AlarmManager.query_alarms().
+        :param fields: Optional iterable with the alarm fields to include.
+        :param limit: Optional positive integer with the page size.
+        :param cursor: Optional cursor of the page.
+        :param filters: Optional alarm filters.
+        :return: JSON string with the data type, the alarms of the page and
+                 the cursor of the next page, null if it is the last page.
+        """
+        alarms_dicts, next_cursor = self.alarm_mgr.query_alarms(
+            fields, limit, cursor, **filters)
+        return ServerAlarmAdapter.to_json({'dataType': 'All alarms',
+                                           'size': len(alarms_dicts),
+                                           'alarms': alarms_dicts,
+                                           'nextCursor': next_cursor})
 
     #
     # Perform operations to the alarms (add, edit, delete) returning json data
@@ -127,7 +223,7 @@ class ServerAlarmAdapter(object):
                 return_dict['success'] = False
         else:
             return_dict['success'] = False
-        return json.dumps(return_dict, indent=4, separators=(',', ': '))
+        return ServerAlarmAdapter.to_json(return_dict)
 
     def json_edit_alarm(self, alarm_id, hour=None, minute=None, days=None,
                         enabled=None, label=None, station_id=None):
@@ -154,7 +250,7 @@ class ServerAlarmAdapter(object):
         else:
             return_dict['timestamp'] = retrieved_alarm.timestamp
 
-        return json.dumps(return_dict, indent=4, separators=(',', ': '))
+        return ServerAlarmAdapter.to_json(return_dict)
 
     def json_delete_alarm(self, alarm_id):
         """
@@ -167,7 +263,35 @@ class ServerAlarmAdapter(object):
         return_dict = {'dataType': 'Deleted alarm',
                        'id': alarm_id,
                        'success': success}
-        return json.dumps(return_dict, indent=4, separators=(',', ': '))
+        return ServerAlarmAdapter.to_json(return_dict)
+
+    def json_snooze_alarm(self, alarm_id):
+        """
+        Snoozes the alarm with the given ID.
+        :param alarm_id: Integer to indicate ID of the Alarm to be snoozed.
+        :return: JSON string containing the data type, snoozed alarm ID,
+                 success information and the snooze alert time, in seconds
+                 since 1970.
+        """
+        alert_time = self.alarm_mgr.snooze(alarm_id)
+        return_dict = {'dataType': 'Snoozed alarm',
+                       'id': alarm_id,
+                       'success': alert_time is not None,
+                       'alert_time': alert_time}
+        return ServerAlarmAdapter.to_json(return_dict)
+
+    def json_dismiss_alarm(self, alarm_id):
+        """
+        Dismisses the alarm with the given ID, cancelling its snooze.
+        :param alarm_id: Integer to indicate ID of the Alarm to be dismissed.
+        :return: JSON string containing the data type, dismissed alarm ID, and
+                 if it had a snooze pending as the success information.
+        """
+        success = self.alarm_mgr.dismiss(alarm_id)
+        return_dict = {'dataType': 'Dismissed alarm',
+                       'id': alarm_id,
+                       'success': success}
+        return ServerAlarmAdapter.to_json(return_dict)
 
     def json_delete_all_alarms(self):
         """
@@ -177,24 +301,21 @@ class ServerAlarmAdapter(object):
         success = self.alarm_mgr.delete_all()
         return_dict = {'dataType': 'Deleted all alarms',
                        'success': success}
-        return json.dumps(return_dict, indent=4, separators=(',', ': '))
+        return ServerAlarmAdapter.to_json(return_dict)
 
 
 
     @staticmethod
     def station_to_dict(station):
-        return {'id': station.id_,
-                'name': station.name,
-                'url': station.url}
+        return station.to_dict()
 
     #
     # retrieve station data in json format
     #
     def json_get_station(self, station_id):
         station = self.alarm_mgr.get_station(station_id)
-        return json.dumps(
-            ServerAlarmAdapter.station_to_dict(station),
-            indent=4, separators=(',', ': '))
+        return ServerAlarmAdapter.to_json(
+            ServerAlarmAdapter.station_to_dict(station))
 
     def json_get_all_stations(self):
         all_stations = self.alarm_mgr.get_all_stations()
@@ -205,7 +326,23 @@ class ServerAlarmAdapter(object):
         stations_dicts = {'dataType': 'All stations',
                         'size': len(stations_dicts),
                         'stations': stations_dicts}
-        return json.dumps(stations_dicts, indent=4, separators=(',', ': '))
+        return ServerAlarmAdapter.to_json(stations_dicts)
+
+    def json_query_stations(self, fields=None, limit=None, cursor=None):
+        """
+        Gets a page of the stations, see AlarmManager.query_stations().
+        :param fields: Optional iterable with the station fields to include.
+        :param limit: Optional positive integer with the page size.
+        :param cursor: Optional cursor of the page.
+        :return: JSON string with the data type, the stations of the page and
+                 the cursor of the next page, null if it is the last page.
+        """
+        stations_dicts, next_cursor = self.alarm_mgr.query_stations(
+            fields, limit, cursor)
+        return ServerAlarmAdapter.to_json({'dataType': 'All stations',
+                                           'size': len(stations_dicts),
+                                           'stations': stations_dicts,
+                                           'nextCursor': next_cursor})
 
     #
     # Perform operations to the stations (add, edit, delete) returning json data
@@ -230,7 +367,7 @@ class ServerAlarmAdapter(object):
                 return_dict['success'] = False
         else:
             return_dict['success'] = False
-        return json.dumps(return_dict, indent=4, separators=(',', ': '))
+        return ServerAlarmAdapter.to_json(return_dict)
 
     def json_delete_station(self, station_id):
         """
@@ -243,7 +380,7 @@ class ServerAlarmAdapter(object):
         return_dict = {'dataType': 'Deleted station',
                        'id': station_id,
                        'success': success}
-        return json.dumps(return_dict, indent=4, separators=(',', ': '))
+        return ServerAlarmAdapter.to_json(return_dict)
 
     def json_delete_all_stations(self):
         """
@@ -253,4 +390,22 @@ class ServerAlarmAdapter(object):
         success = self.alarm_mgr.delete_all_stations()
         return_dict = {'dataType': 'Deleted all stations',
                        'success': success}
-        return json.dumps(return_dict, indent=4, separators=(',', ': '))
+        return ServerAlarmAdapter.to_json(return_dict)
+
+    #
+    # Perform a batch of alarm and station operations returning json data
+    #
+    def json_batch(self, operations, atomic=True):
+        """
+        Applies a batch of add, edit and delete operations to the alarms and
+        stations, see AlarmManager.apply_operations().
+        :param operations: List of operation dictionaries.
+        :param atomic: Boolean to discard all the operations if any fails.
+        :return: JSON string containing the data type, if the changes were
+                 saved, and the result of each operation in the same order.
+        """
+        success, results = self.alarm_mgr.apply_operations(operations, atomic)
+        return_dict = {'dataType': 'Batch',
+                       'success': success,
+                       'results': results}
+        return ServerAlarmAdapter.to_json(return_dict)
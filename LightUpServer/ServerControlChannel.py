@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+#
+# WebSocket control channel of the alarms and hardware from the LightUpServer
+# package.
+#
+# Copyright (c) 2015 carlosperate http://carlosperate.github.io
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# A persistent bidirectional channel for the clients that need to act on an
+# alert as soon as it happens: the commands are executed as soon as they are
+# received, without a new HTTP request each, and the alerts and the hardware
+# state are pushed as they change.
+# The WebSocket protocol (RFC 6455) is implemented here, as only the subset
+# used by the channel is needed: unfragmented server messages, no extensions
+# and no sub-protocols.
+#
+from __future__ import unicode_literals, absolute_import, print_function
+import os
+import json
+import base64
+import struct
+import hashlib
+import threading
+try:
+    from LightUpServer.SocketMultiplexer import SocketMultiplexer
+    from LightUpAlarm.AlarmEventBus import AlarmEventBus
+except ImportError:
+    import sys
+    package_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    sys.path.insert(0, package_dir)
+    from LightUpServer.SocketMultiplexer import SocketMultiplexer
+    from LightUpAlarm.AlarmEventBus import AlarmEventBus
+
+
+class ServerControlChannel(object):
+    """
+    Serves the WebSocket connections handed over by the server once the
+    handshake response is sent (see add_connection()), all from a single
+    SocketMultiplexer thread.
+    The clients send text messages with a JSON command object:
+        {"command": "snooze", "id": <alarm ID>, "ref": <optional reference>}
+        {"command": "dismiss", "id": <alarm ID>, "ref": ...}
+        {"command": "abort", "ref": ...}: Aborts the hardware run.
+        {"command": "state", "ref": ...}: Requests the state message.
+    Each command is replied with a {"type": "result", "command", "ref",
+    "success"} message, plus the command data or the "error" description.
+    The server sends the messages:
+        state: With the "ringing" alarm IDs, the pending "snoozes" and the
+               "hardware" state. Sent on connection and on request.
+        event: The alert and snooze AlarmEventBus events, with its "event"
+               type, "id", "data" and "time".
+        hardware: The hardware "state" every time it changes (lamp brightness
+                  step, room light level and coffee machine switch).
+    An alarm is ringing from its alert until it is snoozed, dismissed or
+    deleted, the alerts before the channel was created are not known.
+    """
+
+    # Appended to the client key to calculate the handshake accept key
+    websocket_guid = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+    # Frame operation codes
+    op_continuation = 0x0
+    op_text = 0x1
+    op_binary = 0x2
+    op_close = 0x8
+    op_ping = 0x9
+    op_pong = 0xA
+
+    # Close status codes
+    close_normal = 1000
+    close_protocol_error = 1002
+    close_unsupported = 1003
+    close_invalid_data = 1007
+    close_too_big = 1009
+
+    # Maximum size in bytes of a client message
+    max_message = 64 * 1024
+
+    #
+    # metaclass methods
+    #
+    def __init__(self, alarm_mgr, hardware=None, ping_interval=30):
+        """
+        ServerControlChannel initialiser, it subscribes to the alert and
+        snooze events of the AlarmManager namespace and to the hardware state.
+        :param alarm_mgr: AlarmManager instance to control.
+        :param hardware: Optional hardware controller with the abort(),
+                         get_state(), add_state_listener() and
+                         remove_state_listener() methods (the HardwareThread
+                         class), if None the abort command fails.
+        :param ping_interval: Seconds between the ping frames sent to keep the
+                              connections open through proxies and detect the
+                              disconnected clients.
+        """
+        self.alarm_mgr = alarm_mgr
+        self.hardware = hardware
+        self.__lock = threading.Lock()
+        self.__ringing = set()
+        self.__closed = False
+        self.__connections = SocketMultiplexer(
+            'ServerControlChannel', on_receive=self.__on_receive,
+            on_timer=self.__on_ping, timer_interval=ping_interval)
+        self.alarm_mgr.subscribe(
+            self.__on_events, AlarmEventBus.alert_events +
+            AlarmEventBus.snooze_events + (AlarmEventBus.alarm_deleted,))
+        if self.hardware is not None:
+            self.hardware.add_state_listener(self.__on_hardware_state)
+
+    #
+    # WebSocket protocol
+    #
+    @staticmethod
+    def accept_key(key):
+        """
+        :param key: String with the Sec-WebSocket-Key header of the client
+                    handshake.
+        :return: String with the Sec-WebSocket-Accept header of the response.
+        """
+        digest = hashlib.sha1(
+            (key.strip() + ServerControlChannel.websocket_guid).encode(
+                'utf-8')).digest()
+        return base64.b64encode(digest).decode('utf-8')
+
+    @staticmethod
+    def encode_frame(payload, opcode=op_text, mask=False):
+        """
+        Encodes a single frame message.
+        :param payload: Bytes of the frame payload.
+        :param opcode: Integer with the frame operation code.
+        :param mask: Boolean to mask the payload, as the clients have to do.
+        :return: Bytes with the frame.
+        """
+        length = len(payload)
+        mask_bit = 0x80 if mask is True else 0
+        if length < 126:
+            header = struct.pack(str('!BB'), 0x80 | opcode, mask_bit | length)
+        elif length < (1 << 16):
+            header = struct.pack(
+                str('!BBH'), 0x80 | opcode, mask_bit | 126, length)
+        else:
+            header = struct.pack(
+                str('!BBQ'), 0x80 | opcode, mask_bit | 127, length)
+        if mask is True:
+            mask_key = bytearray(os.urandom(4))
+            payload = bytearray(payload)
+            for i in range(length):
+                payload[i] ^= mask_key[i % 4]
+            header += bytes(mask_key)
+            payload = bytes(payload)
+        return header + payload
+
+    @staticmethod
+    def decode_frames(data):
+        """
+        Decodes the complete frames at the start of the received data.
+        :param data: Bytes received.
+        :return: Tuple with a list of (fin, opcode, masked, payload) tuples for
+                 each complete frame, and the bytes remaining.
+        :raise ValueError: If a frame is malformed, or it is larger than
+                           max_message.
+        """
+        frames = []
+        data = bytearray(data)
+        while len(data) >= 2:
+            fin = (data[0] & 0x80) != 0
+            opcode = data[0] & 0x0F
+            masked = (data[1] & 0x80) != 0
+            length = data[1] & 0x7F
+            if data[0] & 0x70:
+                raise ValueError('Frame with reserved bits set')
+            if opcode >= 0x8 and (length > 125 or fin is False):
+                raise ValueError('Fragmented or too long control frame')
+            position = 2
+            if length == 126:
+                if len(data) < 4:
+                    break
+                length = struct.unpack(str('!H'), bytes(data[2:4]))[0]
+                position = 4
+            elif length == 127:
+                if len(data) < 10:
+                    break
+                length = struct.unpack(str('!Q'), bytes(data[2:10]))[0]
+                position = 10
+            if length > ServerControlChannel.max_message:
+                raise ValueError('Frame larger than %d bytes' %
+                                 ServerControlChannel.max_message)
+            mask_key = None
+            if masked is True:
+                if len(data) < position + 4:
+                    break
+                mask_key = data[position:position + 4]
+                position += 4
+            if len(data) < position + length:
+                break
+            payload = data[position:position + length]
+            if mask_key is not None:
+                for i in range(length):
+                    payload[i] ^= mask_key[i % 4]
+            frames.append((fin, opcode, masked, bytes(payload)))
+            data = data[position + length:]
+        return frames, bytes(data)
+
+    #
+    # member methods to connect the clients
+    #
+    def add_connection(self, connection):
+        """
+        Serves a client connection from the channel thread, after the
+        handshake response has been sent. The state message is sent first.
+        :param connection: Socket of the client connection.
+        """
+        context = {'buffer': b'', 'fragments': None, 'closing': False}
+        with self.__lock:
+            # Added within the lock, so that no change is sent in between
+            self.__connections.add(
+                connection, self.__encode_message(self.__get_state()),
+                context)
+
+    def get_number_of_clients(self):
+        """
+        :return: Integer with the number of clients connected to the channel.
+        """
+        return self.__connections.get_number_of_connections()
+
+    def close(self):
+        """
+        Stops the channel, unsubscribing from the AlarmManager events and the
+        hardware state, and disconnecting all the clients.
+        """
+        with self.__lock:
+            if self.__closed is True:
+                return
+            self.__closed = True
+        self.alarm_mgr.unsubscribe(self.__on_events)
+        if self.hardware is not None:
+            self.hardware.remove_state_listener(self.__on_hardware_state)
+        self.__connections.close()
+
+    #
+    # private member methods to receive the client frames
+    #
+    def __on_receive(self, connection, context, data):
+        """
+        SocketMultiplexer received data callback, processes the complete
+        frames of a connection.
+        :param connection: Socket of the connection.
+        :param context: Dictionary with the incomplete 'buffer' and message
+                        'fragments' of the connection, and if it is
+                        'closing'.
+        :param data: Bytes received.
+        """
+        if context['closing'] is True:
+            return
+        try:
+            frames, context['buffer'] = ServerControlChannel.decode_frames(
+                context['buffer'] + data)
+        except ValueError:
+            frames = []
+            status = ServerControlChannel.close_protocol_error
+        else:
+            status = None
+        for frame in frames:
+            status = self.__process_frame(connection, context, *frame)
+            if status is not None:
+                break
+        if status is not None:
+            context['closing'] = True
+            self.__connections.send(
+                connection, ServerControlChannel.encode_frame(
+                    struct.pack(str('!H'), status),
+                    ServerControlChannel.op_close), True)
+
+    def __process_frame(self, connection, context, fin, opcode, masked,
+                        payload):
+        """
+        Processes a frame received from a connection.
+        :param connection: Socket of the connection.
+        :param context: Dictionary with the connection state.
+        :param fin: Boolean indicating if it is the final frame of a message.
+        :param opcode: Integer with the frame operation code.
+        :param masked: Boolean indicating if the payload was masked.
+        :param payload: Bytes of the unmasked payload.
+        :return: Integer with the status code to close the connection with,
+                 or None to keep it open.
+        """
+        if masked is False:
+            # The clients have to mask all their frames
+            return ServerControlChannel.close_protocol_error
+        if opcode == ServerControlChannel.op_ping:
+            self.__connections.send(
+                connection, ServerControlChannel.encode_frame(
+                    payload, ServerControlChannel.op_pong))
+        elif opcode == ServerControlChannel.op_close:
+            # Echoes the status code, and closes once sent
+            context['closing'] = True
+            self.__connections.send(
+                connection, ServerControlChannel.encode_frame(
+                    payload[:2], ServerControlChannel.op_close), True)
+        elif opcode == ServerControlChannel.op_binary:
+            return ServerControlChannel.close_unsupported
+        elif opcode in (ServerControlChannel.op_text,
+                        ServerControlChannel.op_continuation):
+            fragments = context['fragments']
+            if (opcode == ServerControlChannel.op_text) != (fragments is None):
+                return ServerControlChannel.close_protocol_error
+            fragments = (fragments or []) + [payload]
+            if sum(len(fragment) for fragment in fragments) > \
+                    ServerControlChannel.max_message:
+                return ServerControlChannel.close_too_big
+            if fin is False:
+                context['fragments'] = fragments
+                return None
+            context['fragments'] = None
+            try:
+                message = b''.join(fragments).decode('utf-8')
+            except UnicodeDecodeError:
+                return ServerControlChannel.close_invalid_data
+            result = self.__run_command(message)
+            self.__connections.send(connection, self.__encode_message(result))
+            if result['command'] == 'dismiss' and 'id' in result:
+                # Dismissing a ringing alarm without a snooze has no event
+                self.__stop_ringing(result['id'])
+        elif opcode != ServerControlChannel.op_pong:
+            return ServerControlChannel.close_protocol_error
+        return None
+
+    def __run_command(self, message):
+        """
+        Runs a client command.
+        :param message: String with the JSON command object.
+        :return: Dictionary with the result message.
+        """
+        result = {'type': 'result', 'command': None, 'ref': None,
+                  'success': False}
+        try:
+            command = json.loads(message)
+        except ValueError:
+            result['error'] = 'The message has to be a JSON object'
+            return result
+        if not isinstance(command, dict):
+            result['error'] = 'The message has to be a JSON object'
+            return result
+        result['command'] = command.get('command')
+        result['ref'] = command.get('ref')
+
+        if result['command'] in ('snooze', 'dismiss'):
+            alarm_id = command.get('id')
+            if isinstance(alarm_id, bool) or \
+                    not isinstance(alarm_id, int):
+                result['error'] = 'The \'id\' has to be an integer'
+                return result
+            result['id'] = alarm_id
+            if result['command'] == 'snooze':
+                alert_time = self.alarm_mgr.snooze(alarm_id)
+                result['success'] = alert_time is not None
+                result['alert_time'] = alert_time
+            else:
+                result['success'] = self.alarm_mgr.dismiss(alarm_id)
+        elif result['command'] == 'abort':
+            if self.hardware is None:
+                result['error'] = 'There is no hardware to abort'
+            else:
+                result['success'] = self.hardware.abort()
+        elif result['command'] == 'state':
+            with self.__lock:
+                result['state'] = self.__get_state()
+            result['success'] = True
+        else:
+            result['error'] = 'Unknown command: %s' % result['command']
+        return result
+
+    def __on_ping(self):
+        """ Sends a ping frame to the connections. """
+        self.__connections.broadcast(ServerControlChannel.encode_frame(
+            b'', ServerControlChannel.op_ping))
+
+    #
+    # private member methods to send the state
+    #
+    @staticmethod
+    def __encode_message(message):
+        """
+        :param message: Dictionary with the message to send.
+        :return: Bytes with the text frame of the JSON message.
+        """
+        return ServerControlChannel.encode_frame(json.dumps(
+            message, separators=(',', ':')).encode('utf-8'))
+
+    def __get_state(self):
+        """
+        Gets the state message, the lock must be held.
+        :return: Dictionary with the state message.
+        """
+        hardware_state = None
+        if self.hardware is not None:
+            hardware_state = self.hardware.get_state()
+        return {'type': 'state',
+                'ringing': sorted(self.__ringing),
+                'snoozes': self.alarm_mgr.get_snoozes(),
+                'hardware': hardware_state}
+
+    def __stop_ringing(self, alarm_id):
+        """
+        Removes an alarm from the ringing set, sending the state if changed.
+        :param alarm_id: ID of the alarm.
+        """
+        with self.__lock:
+            if alarm_id in self.__ringing:
+                self.__ringing.discard(alarm_id)
+                self.__connections.broadcast(
+                    self.__encode_message(self.__get_state()))
+
+    def __on_events(self, events):
+        """
+        AlarmManager events callback, updates the ringing alarms and sends the
+        alert and snooze events to all the clients.
+        :param events: List of AlarmEventBus event dictionaries.
+        """
+        messages = []
+        with self.__lock:
+            for event in events:
+                if event['type'] == AlarmEventBus.alarm_alert:
+                    self.__ringing.add(event['id'])
+                elif event['type'] != AlarmEventBus.offset_alert:
+                    self.__ringing.discard(event['id'])
+                if event['type'] == AlarmEventBus.alarm_deleted:
+                    continue
+                data = event['data']
+                if hasattr(data, 'to_dict'):
+                    data = data.to_dict()
+                messages.append(self.__encode_message(
+                    {'type': 'event', 'event': event['type'],
+                     'id': event['id'], 'data': data, 'time': event['time']}))
+            if messages:
+                self.__connections.broadcast(b''.join(messages))
+
+    def __on_hardware_state(self, state):
+        """
+        Hardware state listener, sends the state to all the clients.
+        :param state: Dictionary with the hardware state.
+        """
+        self.__connections.broadcast(
+            self.__encode_message({'type': 'hardware', 'state': state}))
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+#
+# Server-Sent Events stream of the alarm events from the LightUpServer package.
+#
+# Copyright (c) 2015 carlosperate http://carlosperate.github.io
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# The web app keeps its alarms data refreshed with a text/event-stream
+# response, which pushes the AlarmManager events as they happen instead of
+# having every client poll the alarms data.
+#
+from __future__ import unicode_literals, absolute_import
+import json
+import threading
+from collections import deque
+try:
+    from LightUpServer.SocketMultiplexer import SocketMultiplexer
+except ImportError:
+    from SocketMultiplexer import SocketMultiplexer
+
+
+class ServerEventStream(object):
+    """
+    Formats the events of an AlarmManager as Server-Sent Events and sends them
+    to the connected clients.
+    Each event has the ID '<process token>-<number>', and the latest events
+    are kept so that a reconnecting client (which sends the ID of the last
+    event received) gets the events it has missed. If they are no longer kept,
+    or the ID is from a previous run of the server, a 'reset' event is sent
+    instead to indicate the client to reload all the data.
+    The event data is a JSON object with the 'id', 'data' and 'time' of the
+    AlarmEventBus event, the alarms and stations data as their to_dict().
+    The clients are served in two ways:
+        Connections: Sockets handed over by the server once the response
+                     headers are sent (see add_connection()). All of them are
+                     served by a single SocketMultiplexer thread, so the idle
+                     clients do not hold a server thread.
+        Generators: For the servers that cannot hand over the connections,
+                    stream() blocks the request thread between the events.
+    """
+
+    # Milliseconds for the clients to wait before reconnecting
+    retry = 3000
+
+    #
+    # metaclass methods
+    #
+    def __init__(self, alarm_mgr, token, history=100, heartbeat=15):
+        """
+        ServerEventStream initialiser, it subscribes to all the events of the
+        AlarmManager namespace.
+        :param alarm_mgr: AlarmManager instance to stream the events from.
+        :param token: String unique to this process, the start of the event
+                      IDs.
+        :param history: Integer with the number of events kept for the
+                        reconnecting clients.
+        :param heartbeat: Seconds between the heartbeat comments sent to the
+                          idle clients, which keep the connection open through
+                          proxies and detect the disconnected clients.
+        """
+        self.alarm_mgr = alarm_mgr
+        self.token = token
+        self.heartbeat = heartbeat
+        self.__history = deque(maxlen=history)
+        self.__last_number = 0
+        self.__condition = threading.Condition()
+        self.__connections = SocketMultiplexer(
+            'ServerEventStream', on_timer=self.__on_heartbeat,
+            timer_interval=heartbeat)
+        self.__generators = 0
+        self.__closed = False
+        self.alarm_mgr.subscribe(self.__on_events)
+
+    #
+    # member methods to connect the clients
+    #
+    def connect(self, last_event_id=None):
+        """
+        Starts the stream of a client.
+        :param last_event_id: String with the Last-Event-ID sent by the
+                              client when reconnecting, None for a new client.
+        :return: Tuple with the bytes to send first, and the position of the
+                 stream they cover, to be used with add_connection().
+        """
+        with self.__condition:
+            position = self.__last_number
+            data = ('retry: %d\n\n' % ServerEventStream.retry).encode('utf-8')
+            if last_event_id is not None:
+                data += self.__messages_since(
+                    self.__parse_event_id(last_event_id))
+        return data, position
+
+    def add_connection(self, connection, position):
+        """
+        Serves a client connection from the stream thread, after the response
+        headers and the bytes from connect() have been sent. The connection is
+        closed when the client disconnects or the stream is closed.
+        :param connection: Socket of the client connection.
+        :param position: Position returned by connect().
+        """
+        with self.__condition:
+            # Added within the lock, so that no event is sent in between
+            self.__connections.add(connection, self.__messages_since(position))
+
+    def stream(self, last_event_id=None):
+        """
+        Generator of the stream of a client, it blocks between events.
+        :param last_event_id: String with the Last-Event-ID sent by the
+                              client when reconnecting, None for a new client.
+        :return: Generator of the bytes to send to the client.
+        """
+        data, position = self.connect(last_event_id)
+        with self.__condition:
+            self.__generators += 1
+        try:
+            yield data
+            while True:
+                with self.__condition:
+                    if self.__last_number == position and \
+                            self.__closed is False:
+                        self.__condition.wait(self.heartbeat)
+                    if self.__closed is True:
+                        return
+                    if self.__last_number == position:
+                        data = b': heartbeat\n\n'
+                    else:
+                        data = self.__messages_since(position)
+                        position = self.__last_number
+                yield data
+        finally:
+            with self.__condition:
+                self.__generators -= 1
+
+    def get_number_of_clients(self):
+        """
+        :return: Integer with the number of clients connected to the stream.
+        """
+        with self.__condition:
+            return self.__connections.get_number_of_connections() + \
+                self.__generators
+
+    def close(self):
+        """
+        Stops the stream, unsubscribing from the AlarmManager events and
+        disconnecting all the clients.
+        """
+        with self.__condition:
+            if self.__closed is True:
+                return
+            self.__closed = True
+            self.__condition.notify_all()
+        self.alarm_mgr.unsubscribe(self.__on_events)
+        self.__connections.close()
+
+    #
+    # member methods to format the events
+    #
+    def __on_events(self, events):
+        """
+        AlarmManager events callback, formats and queues the events for all
+        the clients.
+        :param events: List of AlarmEventBus event dictionaries.
+        """
+        messages = []
+        with self.__condition:
+            for event in events:
+                self.__last_number += 1
+                message = self.__format_event(event, self.__last_number)
+                self.__history.append((self.__last_number, message))
+                messages.append(message)
+            self.__connections.broadcast(b''.join(messages))
+            self.__condition.notify_all()
+
+    def __on_heartbeat(self):
+        """ Sends the heartbeat comment to the connections. """
+        self.__connections.broadcast(b': heartbeat\n\n')
+
+    def __format_event(self, event, number):
+        """
+        :param event: AlarmEventBus event dictionary.
+        :param number: Integer with the number of the event in the stream.
+        :return: Bytes with the Server-Sent Event message.
+        """
+        data = event['data']
+        if hasattr(data, 'to_dict'):
+            data = data.to_dict()
+        data = json.dumps({'id': event['id'], 'data': data,
+                           'time': event['time']}, separators=(',', ':'))
+        message = 'id: %s-%d\nevent: %s\ndata: %s\n\n' % (
+            self.token, number, event['type'], data)
+        return message.encode('utf-8')
+
+    def __parse_event_id(self, event_id):
+        """
+        :param event_id: String with an event ID sent by a client.
+        :return: Integer with the number of the event, None if it is not an ID
+                 of this stream.
+        """
+        token, _, number = event_id.strip().rpartition('-')
+        if token != self.token:
+            return None
+        try:
+            return int(number)
+        except ValueError:
+            return None
+
+    def __messages_since(self, number):
+        """
+        Gets the messages following an event, the condition lock must be
+        held.
+        :param number: Integer with the number of the last event the client
+                       received, None if unknown.
+        :return: Bytes with the messages, or with a reset event if they are
+                 not available.
+        """
+        if number is not None and number <= self.__last_number:
+            if number == self.__last_number:
+                return b''
+            if self.__history and number >= self.__history[0][0] - 1:
+                return b''.join(message for n, message in self.__history
+                                if n > number)
+        return ('id: %s-%d\nevent: reset\ndata: {}\n\n' %
+                (self.token, self.__last_number)).encode('utf-8')
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+#
+# Single thread server of many socket connections from the LightUpServer
+# package.
+#
+# Copyright (c) 2015 carlosperate http://carlosperate.github.io
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# The long lived connections (event streams and control channels) are handed
+# over by the multi-threaded server once their response headers are sent, and
+# served from here, so that the idle clients do not hold a server thread.
+#
+from __future__ import unicode_literals, absolute_import, print_function
+import sys
+import time
+import errno
+import select
+import socket
+import threading
+
+
+class SocketMultiplexer(object):
+    """
+    Serves non-blocking socket connections from a single thread with select().
+    The data to send is queued per connection and sent when the socket is
+    writable, so a slow client does not delay the others, and it is closed if
+    it has more than max_pending bytes queued.
+    The thread is started with the first connection, and it calls:
+        on_receive(connection, context, data): With the data received from a
+            connection, and the context object given to add().
+        on_timer(): Every timer_interval seconds, if set.
+    The callbacks are called without any lock held, so they can queue data.
+    The connections are closed when the client disconnects, or with
+    send(close=True) once the data has been sent.
+    """
+
+    # Maximum number of bytes queued for a connection
+    max_pending = 64 * 1024
+
+    #
+    # metaclass methods
+    #
+    def __init__(self, name, on_receive=None, on_timer=None,
+                 timer_interval=None):
+        """
+        SocketMultiplexer initialiser.
+        :param name: String with the name of the thread.
+        :param on_receive: Optional data received callback, if None the
+                           received data is discarded.
+        :param on_timer: Optional periodic callback.
+        :param timer_interval: Seconds between the on_timer calls.
+        """
+        self.name = name
+        self.timer_interval = timer_interval
+        self.__on_receive = on_receive
+        self.__on_timer = on_timer
+        self.__lock = threading.Lock()
+        # Each connection socket maps to a list with its pending data, its
+        # context and if it is to be closed once the data is sent
+        self.__connections = {}
+        self.__thread = None
+        self.__wake_sockets = None
+        self.__closed = False
+
+    #
+    # member methods
+    #
+    def add(self, connection, data=b'', context=None):
+        """
+        Adds a connection to serve.
+        :param connection: Socket of the connection, set as non-blocking.
+        :param data: Bytes to send first.
+        :param context: Object passed to on_receive with the connection data.
+        :return: Boolean indicating if the connection was added, it is closed
+                 otherwise.
+        """
+        try:
+            connection.setblocking(0)
+        except socket.error:
+            connection.close()
+            return False
+        with self.__lock:
+            if self.__closed is True:
+                connection.close()
+                return False
+            if self.__thread is None:
+                self.__wake_sockets = SocketMultiplexer.__socket_pair()
+                self.__thread = threading.Thread(
+                    target=self.__serve, name=self.name)
+                self.__thread.daemon = True
+                self.__thread.start()
+            self.__connections[connection] = [data, context, False]
+        self.__wake()
+        return True
+
+    def send(self, connection, data, close=False):
+        """
+        Queues data to send to a connection.
+        :param connection: Socket of the connection.
+        :param data: Bytes to send.
+        :param close: Boolean to close the connection once the data is sent.
+        :return: Boolean indicating if the data was queued.
+        """
+        with self.__lock:
+            if connection not in self.__connections:
+                return False
+            queued = self.__queue(connection, data)
+            if queued is True and close is True:
+                self.__connections[connection][2] = True
+        self.__wake()
+        return queued
+
+    def broadcast(self, data):
+        """
+        Queues data to send to all the connections.
+        :param data: Bytes to send.
+        """
+        with self.__lock:
+            for connection in list(self.__connections):
+                self.__queue(connection, data)
+        self.__wake()
+
+    def get_number_of_connections(self):
+        """
+        :return: Integer with the number of connections served.
+        """
+        with self.__lock:
+            return len(self.__connections)
+
+    def close(self):
+        """ Closes all the connections and stops the thread. """
+        with self.__lock:
+            if self.__closed is True:
+                return
+            self.__closed = True
+        if self.__thread is not None:
+            self.__wake()
+            self.__thread.join(5)
+
+    #
+    # private member methods, the lock must be held unless indicated
+    #
+    def __queue(self, connection, data):
+        """
+        Queues data for a connection, closing it if it has too much pending.
+        :param connection: Socket of the connection.
+        :param data: Bytes to send.
+        :return: Boolean indicating if the data was queued.
+        """
+        if self.__connections[connection][2] is True:
+            # Nothing is sent after the data to close with
+            return False
+        pending = self.__connections[connection][0] + data
+        if len(pending) > SocketMultiplexer.max_pending:
+            self.__drop(connection)
+            return False
+        self.__connections[connection][0] = pending
+        return True
+
+    def __drop(self, connection):
+        """
+        Closes a connection.
+        :param connection: Socket of the connection.
+        """
+        self.__connections.pop(connection, None)
+        try:
+            connection.close()
+        except socket.error:
+            pass
+
+    def __send(self, connection):
+        """
+        Sends the pending data of a connection without blocking.
+        :param connection: Socket of the connection.
+        """
+        pending = self.__connections[connection][0]
+        if pending:
+            try:
+                sent = connection.send(pending)
+            except socket.error as e:
+                if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK,
+                                     errno.EINTR):
+                    self.__drop(connection)
+                return
+            pending = pending[sent:]
+            self.__connections[connection][0] = pending
+        if not pending and self.__connections[connection][2] is True:
+            self.__drop(connection)
+
+    def __wake(self):
+        """ Wakes up the thread to send the queued data, no lock required. """
+        wake_sockets = self.__wake_sockets
+        if wake_sockets is not None:
+            try:
+                wake_sockets[1].send(b'x')
+            except socket.error:
+                # The buffer is full, so the thread is already woken up
+                pass
+
+    def __serve(self):
+        """
+        Thread loop, sends the queued data, receives the data of the
+        connections and closes the disconnected ones. No lock required.
+        """
+        wake_socket = self.__wake_sockets[0]
+        next_timer = None
+        if self.timer_interval is not None:
+            next_timer = time.time() + self.timer_interval
+        while True:
+            with self.__lock:
+                if self.__closed is True:
+                    break
+                connections = list(self.__connections)
+                writing = [connection for connection in connections
+                           if self.__connections[connection][0]]
+            timeout = None
+            if next_timer is not None:
+                timeout = max(next_timer - time.time(), 0)
+            try:
+                readable, writable, _ = select.select(
+                    [wake_socket] + connections, writing, [], timeout)
+            except (select.error, socket.error, ValueError):
+                # A connection was closed meanwhile, find and drop it
+                with self.__lock:
+                    for connection in connections:
+                        try:
+                            select.select([connection], [], [], 0)
+                        except (select.error, socket.error, ValueError):
+                            self.__drop(connection)
+                continue
+
+            received = []
+            with self.__lock:
+                for connection in readable:
+                    if connection is wake_socket:
+                        SocketMultiplexer.__receive(wake_socket)
+                    elif connection in self.__connections:
+                        data = SocketMultiplexer.__receive(connection)
+                        if data is None:
+                            # The client has closed the connection
+                            self.__drop(connection)
+                        elif data:
+                            received.append((connection, data))
+                for connection in writable:
+                    if connection in self.__connections:
+                        self.__send(connection)
+
+            if self.__on_receive is not None:
+                for connection, data in received:
+                    with self.__lock:
+                        if connection not in self.__connections:
+                            continue
+                        context = self.__connections[connection][1]
+                    self.__call(self.__on_receive, connection, context, data)
+            if next_timer is not None and time.time() >= next_timer:
+                next_timer = time.time() + self.timer_interval
+                if self.__on_timer is not None:
+                    self.__call(self.__on_timer)
+
+        with self.__lock:
+            for connection in list(self.__connections):
+                self.__drop(connection)
+        for wake_socket in self.__wake_sockets:
+            wake_socket.close()
+
+    def __call(self, callback, *args):
+        """ Calls a callback from the thread, printing its errors. """
+        try:
+            callback(*args)
+        except Exception as e:
+            print('ERROR: %s callback failed: %s' % (self.name, e),
+                  file=sys.stderr)
+
+    @staticmethod
+    def __receive(connection):
+        """
+        Reads the data available in a socket.
+        :param connection: Socket to read.
+        :return: Bytes received, None if the socket is disconnected.
+        """
+        try:
+            data = connection.recv(4096)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return b''
+            return None
+        return data if data else None
+
+    @staticmethod
+    def __socket_pair():
+        """
+        Creates a pair of connected sockets to wake up the thread, as Python 2
+        on Windows does not have socket.socketpair().
+        :return: Tuple with the reading and writing non-blocking sockets.
+        """
+        try:
+            pair = socket.socketpair()
+        except AttributeError:
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                listener.bind(('127.0.0.1', 0))
+                listener.listen(1)
+                writer = socket.create_connection(listener.getsockname())
+                reader = listener.accept()[0]
+                pair = (reader, writer)
+            finally:
+                listener.close()
+        for wake_socket in pair:
+            wake_socket.setblocking(0)
+        return pair
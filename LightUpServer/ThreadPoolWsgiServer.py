@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+#
+# Multi-threaded WSGI server from the LightUpServer package.
+#
+# Copyright (c) 2015 carlosperate http://carlosperate.github.io
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# The Flask development server handles the requests one at a time, so a slow
+# request (like deleting all the alarms, which waits for the alarm threads)
+# stalls every other client. This server is built on the Werkzeug WSGI server,
+# which is already a Flask dependency, and hands the accepted connections to a
+# fixed pool of worker threads.
+#
+from __future__ import unicode_literals, absolute_import
+import time
+import socket
+import threading
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class ThreadPoolRequestHandler(WSGIRequestHandler):
+    """
+    Request handler of the ThreadPoolWsgiServer. A kept-alive connection holds
+    its worker thread, so it is closed after the current response when other
+    connections are waiting for a worker.
+    The WSGI environ contains a function, with the ThreadPoolWsgiServer
+    detach_key, to hand over the connection to a callback after the response,
+    see detach_connection().
+    """
+
+    def setup(self):
+        """
+        Sets the server timeout and HTTP version before the connection streams
+        are created.
+        """
+        self.timeout = self.server.request_timeout
+        if self.server.keep_alive is True:
+            self.protocol_version = 'HTTP/1.1'
+        else:
+            self.protocol_version = 'HTTP/1.0'
+        WSGIRequestHandler.setup(self)
+
+    def make_environ(self):
+        """ Adds the function to detach the connection to the WSGI environ. """
+        environ = WSGIRequestHandler.make_environ(self)
+        environ[ThreadPoolWsgiServer.detach_key] = self.detach_connection
+        return environ
+
+    def detach_connection(self, callback):
+        """
+        Hands over the connection to a callback once the current response has
+        been sent, instead of closing it, and frees the worker thread. Used for
+        the long lived responses (like event streams) that would otherwise hold
+        a worker while idle. The response must not have a Content-Length, so
+        its end is the connection close.
+        :param callback: Function that takes the connection socket, called from
+                         the worker thread.
+        """
+        self.close_connection = True
+        self.server.detach_request(self.request, callback)
+
+    def end_headers(self):
+        """ Adds the closing header when other connections are waiting. """
+        if not self.close_connection and \
+                self.server.has_waiting_connections() is True:
+            self.send_header('Connection', 'close')
+        WSGIRequestHandler.end_headers(self)
+
+
+class ThreadPoolWsgiServer(BaseWSGIServer):
+    """
+    WSGI server that serves the connections from a fixed pool of worker
+    threads. The serving thread only accepts the connections and queues them
+    for the workers, so a slow request only holds its own worker.
+    With keep-alive each worker serves all the requests of a connection, until
+    the client closes it, it is idle for longer than the request timeout, or
+    other connections are waiting for a worker.
+    """
+    multithread = True
+
+    # WSGI environ key of the function to detach the connection of a request
+    detach_key = 'lightuppi.detach_connection'
+
+    #
+    # metaclass methods
+    #
+    def __init__(self, host, port, app, threads=8, request_timeout=30,
+                 keep_alive=True, backlog=64):
+        """
+        ThreadPoolWsgiServer initialiser, the socket is bound and listening
+        after it.
+        :param host: String with the host address to bind.
+        :param port: Integer with the port to bind, 0 for any free port.
+        :param app: WSGI application to serve.
+        :param threads: Integer with the number of worker threads.
+        :param request_timeout: Seconds to wait for the data of a request,
+                                or for a new request on a kept-alive
+                                connection, before closing it.
+        :param keep_alive: Boolean to keep the HTTP/1.1 connections open for
+                           more requests.
+        :param backlog: Integer with the size of the socket listen queue.
+        """
+        self.threads = max(1, int(threads))
+        self.request_timeout = request_timeout
+        self.keep_alive = keep_alive
+        # Used by the socket activation in BaseWSGIServer.__init__
+        self.request_queue_size = backlog
+
+        self.__connections = queue.Queue()
+        self.__detached = {}
+        self.__workers = []
+        self.__closed = False
+        BaseWSGIServer.__init__(
+            self, host, port, app, handler=ThreadPoolRequestHandler)
+
+        for i in range(self.threads):
+            worker = threading.Thread(
+                target=self.__worker, name='WsgiWorker-%s' % i)
+            worker.daemon = True
+            worker.start()
+            self.__workers.append(worker)
+
+    #
+    # member methods
+    #
+    def get_request(self):
+        """
+        Accepts a connection, with the Nagle algorithm disabled so that the
+        response headers and body are not delayed waiting for the client ACK.
+        :return: Tuple with the connection socket and the client address.
+        """
+        request, client_address = BaseWSGIServer.get_request(self)
+        try:
+            request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (socket.error, AttributeError):
+            pass
+        return request, client_address
+
+    def process_request(self, request, client_address):
+        """
+        Queues an accepted connection for the worker threads.
+        :param request: Socket of the accepted connection.
+        :param client_address: Address of the client.
+        """
+        self.__connections.put((request, client_address))
+
+    def server_close(self):
+        """
+        Closes the listening socket and stops the worker threads, waiting up
+        to the request timeout for the connections in progress to finish.
+        """
+        BaseWSGIServer.server_close(self)
+        if self.__closed is True:
+            return
+        self.__closed = True
+        for _ in self.__workers:
+            self.__connections.put(None)
+        deadline = time.time() + self.request_timeout
+        for worker in self.__workers:
+            worker.join(max(deadline - time.time(), 0))
+
+    def detach_request(self, request, callback):
+        """
+        Keeps the connection of a request open after its response, to be
+        handed over to the callback, see ThreadPoolRequestHandler.
+        :param request: Socket of the connection.
+        :param callback: Function that takes the connection socket.
+        """
+        self.__detached[request] = callback
+
+    def has_waiting_connections(self):
+        """
+        :return: Boolean indicating if there are connections waiting for a
+                 worker thread.
+        """
+        return not self.__connections.empty()
+
+    def get_running_workers(self):
+        """
+        :return: Integer with the number of worker threads alive.
+        """
+        return len([worker for worker in self.__workers if worker.is_alive()])
+
+    def __worker(self):
+        """ Worker thread loop, serves the queued connections until stopped. """
+        while True:
+            connection = self.__connections.get()
+            if connection is None:
+                break
+            request, client_address = connection
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                callback = self.__detached.pop(request, None)
+                if callback is None:
+                    self.shutdown_request(request)
+            if callback is not None:
+                try:
+                    callback(request)
+                except Exception:
+                    self.handle_error(request, client_address)
+                    self.shutdown_request(request)
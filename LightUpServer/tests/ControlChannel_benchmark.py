@@ -0,0 +1,234 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Latency benchmark of the WebSocket control channel commands.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# Serves the Flask app with the multi-threaded WSGI server on a free local
+# port and times, from the client sending the command:
+#   Snooze through the control channel: until its result, and until the
+#       alarm_snoozed event is pushed.
+#   Snooze with a snoozeAlarm request: in a new connection each time (as a
+#       client woken up by an alert does), and in a kept-alive connection.
+#   Abort of a hardware run through the control channel: until its result, and
+#       until the hardware state pushed shows the run stopped. The hardware is
+#       the local stand-in, the HardwareThread lamp with the mock unicornhat
+#       module (the room light and coffee machine are not launched).
+# It prints the median, 95th percentile and maximum latencies. It is not part
+# of the unit tests, run it directly with: python ControlChannel_benchmark.py
+# It uses the default alarms database, which alarms are deleted.
+#
+from __future__ import unicode_literals, absolute_import, print_function
+import sys
+import json
+import time
+import socket
+import logging
+import threading
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+try:
+    import LightUpServer.Server as Server
+    from LightUpServer.ServerAlarmAdapter import ServerAlarmAdapter
+    from LightUpServer.ServerControlChannel import ServerControlChannel
+    from LightUpAlarm.AlarmManager import AlarmManager
+    from LightUpAlarm.AlarmEventBus import AlarmEventBus
+    from LightUpHardware.HardwareThread import HardwareThread
+except ImportError:
+    import os
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    import LightUpServer.Server as Server
+    from LightUpServer.ServerAlarmAdapter import ServerAlarmAdapter
+    from LightUpServer.ServerControlChannel import ServerControlChannel
+    from LightUpAlarm.AlarmManager import AlarmManager
+    from LightUpAlarm.AlarmEventBus import AlarmEventBus
+    from LightUpHardware.HardwareThread import HardwareThread
+
+
+NUMBER_OF_ALARMS = 20
+SNOOZE_REPEAT = 200
+ABORT_REPEAT = 10
+SERVER_THREADS = 4
+
+
+class NullOutput(object):
+    """ Discards the HardwareThread prints while the benchmark runs. """
+
+    def write(self, data):
+        pass
+
+    def flush(self):
+        pass
+
+
+class ControlClient(object):
+    """ WebSocket client of the control channel. """
+
+    def __init__(self, port):
+        self.socket = socket.create_connection(('127.0.0.1', port), 10)
+        self.socket.sendall(b'GET /LightUpPi/control HTTP/1.1\r\n'
+                            b'Host: localhost\r\n'
+                            b'Upgrade: websocket\r\n'
+                            b'Connection: Upgrade\r\n'
+                            b'Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n'
+                            b'Sec-WebSocket-Version: 13\r\n\r\n')
+        data = b''
+        while b'\r\n\r\n' not in data:
+            data += self.socket.recv(4096)
+        headers, self.data = data.split(b'\r\n\r\n', 1)
+        if not headers.startswith(b'HTTP/1.1 101'):
+            raise Exception('Handshake failed: %s' % headers)
+        self.messages = []
+
+    def send(self, command):
+        self.socket.sendall(ServerControlChannel.encode_frame(
+            json.dumps(command).encode('utf-8'), mask=True))
+
+    def wait_for(self, condition):
+        """ Reads the messages until one matches, returns the time of it. """
+        while True:
+            for message in self.messages:
+                if condition(message):
+                    self.messages.remove(message)
+                    return time.time()
+            frames, self.data = ServerControlChannel.decode_frames(self.data)
+            self.messages += [json.loads(payload.decode('utf-8'))
+                              for _, opcode, _, payload in frames
+                              if opcode == ServerControlChannel.op_text]
+            if not frames:
+                self.data += self.socket.recv(4096)
+
+    def close(self):
+        self.socket.close()
+
+
+def percentile(sorted_values, percent):
+    """ Nearest rank percentile of a sorted list. """
+    index = int(round(percent / 100.0 * len(sorted_values))) - 1
+    return sorted_values[min(max(index, 0), len(sorted_values) - 1)]
+
+
+def print_latencies(name, latencies):
+    """ Prints the median, 95th percentile and maximum latencies. """
+    latencies = sorted(latencies)
+    ms = lambda x: x * 1000
+    print('    %-34s p50 %7.2f ms   p95 %7.2f ms   max %7.2f ms' %
+          (name, ms(percentile(latencies, 50)),
+           ms(percentile(latencies, 95)), ms(latencies[-1])))
+
+
+def benchmark_snooze(port, alarm_mgr, alarm_ids):
+    """ Times the snoozes through the control channel and HTTP requests. """
+    client = ControlClient(port)
+    client.wait_for(lambda message: message['type'] == 'state')
+    results = []
+    events = []
+    for i in range(SNOOZE_REPEAT):
+        alarm_id = alarm_ids[i % len(alarm_ids)]
+        start_time = time.time()
+        client.send({'command': 'snooze', 'id': alarm_id})
+        results.append(client.wait_for(
+            lambda message: message['type'] == 'result') - start_time)
+        events.append(client.wait_for(
+            lambda message: message.get('event') ==
+            AlarmEventBus.alarm_snoozed) - start_time)
+        alarm_mgr.dismiss(alarm_id)
+    client.close()
+
+    new_connections = []
+    kept_alive = []
+    connection = httplib.HTTPConnection('127.0.0.1', port, timeout=10)
+    for i in range(SNOOZE_REPEAT):
+        alarm_id = alarm_ids[i % len(alarm_ids)]
+        path = '/LightUpPi/snoozeAlarm?id=%s' % alarm_id
+        start_time = time.time()
+        new_connection = httplib.HTTPConnection('127.0.0.1', port, timeout=10)
+        new_connection.request('GET', path)
+        new_connection.getresponse().read()
+        new_connections.append(time.time() - start_time)
+        new_connection.close()
+        alarm_mgr.dismiss(alarm_id)
+
+        start_time = time.time()
+        connection.request('GET', path)
+        connection.getresponse().read()
+        kept_alive.append(time.time() - start_time)
+        alarm_mgr.dismiss(alarm_id)
+    connection.close()
+
+    print('Snooze, %d times:' % SNOOZE_REPEAT)
+    print_latencies('control channel result', results)
+    print_latencies('control channel snoozed event', events)
+    print_latencies('HTTP request, new connection', new_connections)
+    print_latencies('HTTP request, kept-alive', kept_alive)
+
+
+def benchmark_abort(port):
+    """ Times the aborts of the stand-in hardware run. """
+    client = ControlClient(port)
+    client.wait_for(lambda message: message['type'] == 'state')
+    results = []
+    stopped = []
+    hardware_thread = HardwareThread(
+        lamp=(0, 60), room_light=(300, 60), coffee_time=300, total_time=600)
+    stdout = sys.stdout
+    sys.stdout = NullOutput()
+    try:
+        for _ in range(ABORT_REPEAT):
+            hardware_thread.start()
+            # Aborts while the lamp is increasing its brightness
+            client.wait_for(lambda message: message['type'] == 'hardware' and
+                            message['state']['lamp'] is not None)
+            start_time = time.time()
+            client.send({'command': 'abort'})
+            results.append(client.wait_for(
+                lambda message: message['type'] == 'result') - start_time)
+            stopped.append(client.wait_for(
+                lambda message: message['type'] == 'hardware' and
+                message['state']['running'] is False) - start_time)
+            while hardware_thread.isAlive():
+                time.sleep(0.01)
+            client.messages = []
+    finally:
+        sys.stdout = stdout
+        client.close()
+
+    print('Hardware abort, %d times:' % ABORT_REPEAT)
+    print_latencies('control channel result', results)
+    print_latencies('control channel run stopped state', stopped)
+
+
+def main():
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    alarm_mgr = AlarmManager()
+    alarm_mgr.delete_all_alarms()
+    alarm_ids = [alarm_mgr.add_alarm(
+        i % 24, i % 60, days=(True, True, True, True, True, True, True),
+        enabled=True, label='') for i in range(NUMBER_OF_ALARMS)]
+    Server.alarm_adapt = ServerAlarmAdapter(alarm_mgr, HardwareThread)
+
+    wsgi_server = Server.make_server(
+        host='127.0.0.1', port=0, threads=SERVER_THREADS)
+    serve_thread = threading.Thread(target=wsgi_server.serve_forever)
+    serve_thread.daemon = True
+    serve_thread.start()
+
+    try:
+        benchmark_snooze(wsgi_server.port, alarm_mgr, alarm_ids)
+        benchmark_abort(wsgi_server.port)
+    finally:
+        wsgi_server.shutdown()
+        serve_thread.join()
+        Server.alarm_adapt.close()
+        alarm_mgr.delete_all_alarms()
+
+
+if __name__ == '__main__':
+    main()
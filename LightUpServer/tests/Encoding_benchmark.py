@@ -0,0 +1,83 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Benchmark for the size and encoding time of the alarms JSON responses.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# Encodes the 'getAlarm?id=all' response for 10, 1k and 10k alarms as pretty
+# printed JSON (the old format), compact JSON, and compact JSON compressed
+# with each of the server content encodings. It prints the payload size and
+# the best encoding time of several runs. The alarms are kept in memory, so
+# the database access time is not included. It is not part of the unit tests,
+# run it directly with: python Encoding_benchmark.py
+#
+from __future__ import unicode_literals, absolute_import, print_function
+import json
+import timeit
+try:
+    import LightUpServer.Server as Server
+    from LightUpServer.ServerAlarmAdapter import ServerAlarmAdapter
+    from LightUpAlarm.AlarmItem import AlarmItem
+except ImportError:
+    import os
+    import sys
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    import LightUpServer.Server as Server
+    from LightUpServer.ServerAlarmAdapter import ServerAlarmAdapter
+    from LightUpAlarm.AlarmItem import AlarmItem
+
+
+ALARM_COUNTS = (10, 1000, 10000)
+REPEAT = 5
+
+
+class MemoryAlarms(object):
+    """ Provides the alarms to the ServerAlarmAdapter from memory. """
+
+    def __init__(self, number_of_alarms):
+        self.alarms = [AlarmItem(i % 24, i % 60, days=tuple(
+            bool(i & (1 << day)) for day in range(7)), enabled=bool(i % 2),
+            label='Alarm %d' % i, timestamp=1430000000 + i, alarm_id=i + 1,
+            station_id=i % 10) for i in range(number_of_alarms)]
+
+    def get_all_alarms(self):
+        return self.alarms
+
+
+def indented_json(alarms):
+    """ The indented 'getAlarm?id=all' JSON sent before the compact one. """
+    alarms_dicts = [alarm.to_dict() for alarm in alarms]
+    return json.dumps({'dataType': 'All alarms',
+                       'size': len(alarms_dicts),
+                       'alarms': alarms_dicts},
+                      indent=4, separators=(',', ': '))
+
+
+def benchmark(name, function):
+    """ Prints the size of the function result and its best time. """
+    size = len(function())
+    best = min(timeit.repeat(function, number=1, repeat=REPEAT))
+    print('    %-24s %10d bytes %10.2f ms' % (name, size, best * 1000))
+
+
+def main():
+    for number_of_alarms in ALARM_COUNTS:
+        memory_alarms = MemoryAlarms(number_of_alarms)
+        adapter = ServerAlarmAdapter(memory_alarms)
+        print('%d alarms, best of %d:' % (number_of_alarms, REPEAT))
+        benchmark('JSON indent=4', lambda: indented_json(
+            memory_alarms.alarms).encode('utf-8'))
+        benchmark('JSON compact',
+                  lambda: adapter.json_get_all_alarms().encode('utf-8'))
+        for encoding in Server.CONTENT_ENCODINGS:
+            benchmark('JSON compact + %s' % encoding, lambda: Server.compress(
+                adapter.json_get_all_alarms().encode('utf-8'), encoding))
+
+
+if __name__ == '__main__':
+    main()
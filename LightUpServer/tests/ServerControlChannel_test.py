@@ -0,0 +1,293 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Unit test for the ServerControlChannel class.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# The connections are tested with a pair of connected local sockets, the client
+# end sends masked frames and reads the messages like a WebSocket client.
+#
+from __future__ import unicode_literals, absolute_import
+import json
+import time
+import socket
+import struct
+import unittest
+import mock
+try:
+    from LightUpServer.ServerControlChannel import ServerControlChannel
+    from LightUpAlarm.AlarmManager import AlarmManager
+    from LightUpAlarm.AlarmEventBus import AlarmEventBus
+    from LightUpAlarm.AlarmItem import AlarmItem
+except ImportError:
+    import os
+    import sys
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    from LightUpServer.ServerControlChannel import ServerControlChannel
+    from LightUpAlarm.AlarmManager import AlarmManager
+    from LightUpAlarm.AlarmEventBus import AlarmEventBus
+    from LightUpAlarm.AlarmItem import AlarmItem
+
+
+class WebSocketClient(object):
+    """ Client end of a connection, sends commands and reads the messages. """
+
+    def __init__(self, client):
+        self.client = client
+        self.data = b''
+        self.frames = []
+
+    def send(self, message, opcode=ServerControlChannel.op_text):
+        if isinstance(message, dict):
+            message = json.dumps(message).encode('utf-8')
+        self.client.sendall(
+            ServerControlChannel.encode_frame(message, opcode, mask=True))
+
+    def receive_frames(self, number_of_frames, timeout=5, pings=False):
+        """
+        Reads frames, returns the (opcode, payload) tuples read. The pings
+        from the server are excluded unless requested.
+        """
+        deadline = time.time() + timeout
+        while True:
+            new_frames, self.data = ServerControlChannel.decode_frames(
+                self.data)
+            self.frames += [(opcode, payload)
+                            for _, opcode, _, payload in new_frames
+                            if pings is True or
+                            opcode != ServerControlChannel.op_ping]
+            if len(self.frames) >= number_of_frames or \
+                    time.time() >= deadline:
+                break
+            self.client.settimeout(max(deadline - time.time(), 0.01))
+            try:
+                data = self.client.recv(4096)
+            except socket.timeout:
+                break
+            if not data:
+                break
+            self.data += data
+        frames = self.frames[:number_of_frames]
+        self.frames = self.frames[number_of_frames:]
+        return frames
+
+    def receive(self, number_of_messages=1, timeout=5):
+        """ Reads JSON messages, the control frames are excluded. """
+        messages = []
+        deadline = time.time() + timeout
+        while len(messages) < number_of_messages and time.time() < deadline:
+            frames = self.receive_frames(1, max(deadline - time.time(), 0))
+            if not frames:
+                break
+            opcode, payload = frames[0]
+            if opcode == ServerControlChannel.op_text:
+                messages.append(json.loads(payload.decode('utf-8')))
+        return messages
+
+
+class ServerControlChannelTestCase(unittest.TestCase):
+    """ Tests for ServerControlChannel class. """
+
+    def setUp(self):
+        self.alarm_mgr = AlarmManager()
+        self.alarm_mgr.delete_all_alarms()
+        self.alarm_mgr.flush_events(5)
+        self.hardware = mock.Mock()
+        self.hardware.get_state.return_value = {
+            'running': False, 'lamp': None, 'room_light': None,
+            'coffee': None}
+        self.hardware.abort.return_value = True
+        self.channel = ServerControlChannel(
+            self.alarm_mgr, self.hardware, ping_interval=0.2)
+
+    def tearDown(self):
+        self.channel.close()
+        self.alarm_mgr.delete_all_alarms()
+
+    def connect(self):
+        """ Adds a connection, returns its client and the state message. """
+        connection, client = socket.socketpair()
+        self.channel.add_connection(connection)
+        client = WebSocketClient(client)
+        messages = client.receive(1)
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]['type'], 'state')
+        return client, messages[0]
+
+    def test_frames(self):
+        """ Tests the handshake key, and encoding and decoding the frames. """
+        # Example of the RFC 6455
+        self.assertEqual(
+            ServerControlChannel.accept_key('dGhlIHNhbXBsZSBub25jZQ=='),
+            's3pPLMBiTxaQ9kYGzzhZRbK+xOo=')
+
+        for length in (0, 125, 126, 65535, 65536):
+            payload = b'x' * length
+            frame = ServerControlChannel.encode_frame(payload, mask=True)
+            # Incomplete frames are kept for the next data
+            frames, rest = ServerControlChannel.decode_frames(frame[:-1])
+            if length > 0:
+                self.assertEqual((frames, rest), ([], frame[:-1]))
+            frames, rest = ServerControlChannel.decode_frames(
+                frame + frame[:3])
+            self.assertEqual(
+                frames, [(True, ServerControlChannel.op_text, True, payload)])
+            self.assertEqual(rest, frame[:3])
+
+        frame = ServerControlChannel.encode_frame(
+            b'ping', ServerControlChannel.op_ping)
+        self.assertEqual(frame, b'\x89\x04ping')
+        self.assertEqual(ServerControlChannel.decode_frames(frame)[0],
+                         [(True, ServerControlChannel.op_ping, False,
+                           b'ping')])
+        for frame in (b'\xc1\x00',           # Reserved bit
+                      b'\x09\x00',           # Fragmented control frame
+                      b'\x81\xff' + struct.pack(str('!Q'), 1 << 20)):
+            self.assertRaises(
+                ValueError, ServerControlChannel.decode_frames, frame)
+
+    def test_commands(self):
+        """ Tests the commands are run and replied. """
+        client, state = self.connect()
+        self.assertEqual(state['ringing'], [])
+        self.assertEqual(state['snoozes'], {})
+        self.assertEqual(state['hardware'], self.hardware.get_state())
+        self.assertEqual(self.channel.get_number_of_clients(), 1)
+
+        alarm_id = self.alarm_mgr.add_alarm(
+            8, 30, (True, True, True, True, True, True, True), True)
+        # The result and the event are sent from different threads
+        client.send({'command': 'snooze', 'id': alarm_id, 'ref': 1})
+        snooze_event, result = sorted(client.receive(2),
+                                      key=lambda message: message['type'])
+        self.assertEqual(result['type'], 'result')
+        self.assertEqual((result['command'], result['ref'], result['id']),
+                         ('snooze', 1, alarm_id))
+        self.assertTrue(result['success'])
+        self.assertEqual(
+            (snooze_event['type'], snooze_event['event'], snooze_event['id']),
+            ('event', AlarmEventBus.alarm_snoozed, alarm_id))
+        self.assertEqual(snooze_event['data'], result['alert_time'])
+
+        client.send({'command': 'dismiss', 'id': alarm_id, 'ref': 'a'})
+        dismiss_event, result = sorted(client.receive(2),
+                                       key=lambda message: message['type'])
+        self.assertEqual((result['command'], result['ref'], result['success']),
+                         ('dismiss', 'a', True))
+        self.assertEqual((dismiss_event['event'], dismiss_event['id']),
+                         (AlarmEventBus.alarm_dismissed, alarm_id))
+
+        client.send({'command': 'abort'})
+        result = client.receive(1)[0]
+        self.assertEqual((result['command'], result['success']),
+                         ('abort', True))
+        self.hardware.abort.assert_called_once_with()
+
+        client.send({'command': 'state', 'ref': 2})
+        result = client.receive(1)[0]
+        self.assertEqual(result['state']['type'], 'state')
+
+        # Errors
+        for message, command in ((b'not json', None), (b'[1]', None),
+                                 ({'command': 'snooze', 'id': '1'}, 'snooze'),
+                                 ({'command': 'other'}, 'other')):
+            client.send(message)
+            result = client.receive(1)[0]
+            self.assertEqual((result['command'], result['success']),
+                             (command, False))
+            self.assertIn('error', result)
+
+        # Ping and fragmented messages
+        client.send(b'hello', ServerControlChannel.op_ping)
+        self.assertEqual(client.receive_frames(1),
+                         [(ServerControlChannel.op_pong, b'hello')])
+        message = json.dumps({'command': 'state'}).encode('utf-8')
+        client.client.sendall(
+            b'\x01\x85' + b'\x00' * 4 + message[:5] +
+            b'\x80' + struct.pack(str('!B'), 0x80 | (len(message) - 5)) +
+            b'\x00' * 4 + message[5:])
+        self.assertTrue(client.receive(1)[0]['success'])
+
+        # Close handshake
+        status = struct.pack(str('!H'), ServerControlChannel.close_normal)
+        client.send(status, ServerControlChannel.op_close)
+        self.assertEqual(client.receive_frames(1),
+                         [(ServerControlChannel.op_close, status)])
+        self.assertEqual(client.client.recv(4096), b'')
+        client.client.close()
+
+    def test_protocol_errors(self):
+        """ Tests the connections are closed on the protocol errors. """
+        client, _ = self.connect()
+        client.client.sendall(b'\x81\x02hi')
+        self.assertEqual(client.receive_frames(1), [
+            (ServerControlChannel.op_close,
+             struct.pack(str('!H'), ServerControlChannel.close_protocol_error))
+        ])
+        self.assertEqual(client.client.recv(4096), b'')
+
+        client, _ = self.connect()
+        client.send(b'\x00', ServerControlChannel.op_binary)
+        self.assertEqual(client.receive_frames(1), [
+            (ServerControlChannel.op_close,
+             struct.pack(str('!H'), ServerControlChannel.close_unsupported))])
+
+    def test_push(self):
+        """
+        Tests the alerts, ringing alarms and hardware state are pushed to the
+        clients, and the ping frames are sent while idle.
+        """
+        clients = [self.connect()[0] for _ in range(2)]
+        alarm_id = self.alarm_mgr.add_alarm(
+            8, 30, (True, True, True, True, True, True, True), True)
+        alarm = AlarmItem(
+            8, 30, (True, True, True, True, True, True, True), True,
+            alarm_id=alarm_id)
+        self.alarm_mgr._AlarmManager__alarm_alert(alarm.snapshot())
+        for client in clients:
+            event = client.receive(1)[0]
+            self.assertEqual((event['event'], event['id']),
+                             (AlarmEventBus.alarm_alert, alarm_id))
+            self.assertEqual(event['data']['hour'], 8)
+        client, state = self.connect()
+        self.assertEqual(state['ringing'], [alarm_id])
+
+        # Dismissing without a snooze stops the ringing
+        client.send({'command': 'dismiss', 'id': alarm_id})
+        messages = client.receive(2)
+        self.assertEqual([message['type'] for message in messages],
+                         ['result', 'state'])
+        self.assertFalse(messages[0]['success'])
+        self.assertEqual(messages[1]['ringing'], [])
+        for other_client in clients:
+            self.assertEqual(other_client.receive(1)[0]['ringing'], [])
+
+        # The hardware state listener
+        listener = self.hardware.add_state_listener.call_args[0][0]
+        listener({'running': True, 'lamp': 3, 'room_light': None,
+                  'coffee': None})
+        for client in clients:
+            self.assertEqual(client.receive(1), [
+                {'type': 'hardware', 'state': {
+                    'running': True, 'lamp': 3, 'room_light': None,
+                    'coffee': None}}])
+
+        # Pings while idle
+        self.assertEqual(clients[0].receive_frames(1, 2, True),
+                         [(ServerControlChannel.op_ping, b'')])
+
+        self.channel.close()
+        self.hardware.remove_state_listener.assert_called_once_with(listener)
+        client.client.settimeout(5)
+        while client.client.recv(4096):
+            pass
+        self.assertEqual(self.channel.get_number_of_clients(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
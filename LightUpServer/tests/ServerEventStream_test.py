@@ -0,0 +1,190 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Unit test for the ServerEventStream class.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# The connections are tested with a pair of connected local sockets, the client
+# end is read by the test.
+#
+from __future__ import unicode_literals, absolute_import
+import json
+import time
+import socket
+import unittest
+try:
+    from LightUpServer.ServerEventStream import ServerEventStream
+    from LightUpAlarm.AlarmManager import AlarmManager
+    from LightUpAlarm.AlarmEventBus import AlarmEventBus
+except ImportError:
+    import os
+    import sys
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    from LightUpServer.ServerEventStream import ServerEventStream
+    from LightUpAlarm.AlarmManager import AlarmManager
+    from LightUpAlarm.AlarmEventBus import AlarmEventBus
+
+
+def parse_events(data):
+    """
+    :param data: Bytes of a Server-Sent Events stream.
+    :return: List of dictionaries with the fields of each event, the comments
+             are included with the '' key.
+    """
+    events = []
+    for block in data.decode('utf-8').split('\n\n'):
+        if block:
+            event = {}
+            for line in block.split('\n'):
+                field, _, value = line.partition(':')
+                event[field] = value.strip()
+            events.append(event)
+    return events
+
+
+class ServerEventStreamTestCase(unittest.TestCase):
+    """ Tests for ServerEventStream class. """
+
+    def setUp(self):
+        self.alarm_mgr = AlarmManager()
+        self.alarm_mgr.delete_all_alarms()
+        self.alarm_mgr.flush_events(5)
+        self.event_stream = ServerEventStream(
+            self.alarm_mgr, 'token', history=3, heartbeat=0.2)
+
+    def tearDown(self):
+        self.event_stream.close()
+        self.alarm_mgr.delete_all_alarms()
+
+    def add_alarm(self, hour=7):
+        """ Adds an alarm, waiting for its event to be streamed. """
+        alarm_id = self.alarm_mgr.add_alarm(
+            hour, 30, (True, False, False, False, False, False, False), False)
+        self.assertTrue(self.alarm_mgr.flush_events(5))
+        return alarm_id
+
+    def receive(self, client, number_of_events, timeout=5):
+        """ Reads events from a client socket, heartbeats excluded. """
+        data = b''
+        events = []
+        deadline = time.time() + timeout
+        while len(events) < number_of_events and time.time() < deadline:
+            client.settimeout(max(deadline - time.time(), 0.01))
+            try:
+                data += client.recv(4096)
+            except socket.timeout:
+                break
+            events = [event for event in parse_events(data)
+                      if 'event' in event]
+        return events
+
+    def test_resume(self):
+        """
+        Tests the missed events are sent to a reconnecting client, or a reset
+        event if they are not available.
+        """
+        data, position = self.event_stream.connect()
+        self.assertEqual(parse_events(data), [{'retry': '3000'}])
+        self.assertEqual(position, 0)
+
+        alarm_id = self.add_alarm()
+        data, position = self.event_stream.connect('token-0')
+        events = parse_events(data)[1:]
+        self.assertEqual(position, 1)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['id'], 'token-1')
+        self.assertEqual(events[0]['event'], AlarmEventBus.alarm_added)
+        event_data = json.loads(events[0]['data'])
+        self.assertEqual(event_data['id'], alarm_id)
+        self.assertEqual(event_data['data']['hour'], 7)
+        self.assertEqual(self.event_stream.connect('token-1')[0], data[:13])
+
+        # More events than kept
+        for hour in (8, 9, 10):
+            self.add_alarm(hour)
+        events = parse_events(self.event_stream.connect('token-1')[0])[1:]
+        self.assertEqual([event['id'] for event in events],
+                         ['token-2', 'token-3', 'token-4'])
+        for last_event_id in ('token-0', 'other-3', 'token-x', 'token-9'):
+            events = parse_events(
+                self.event_stream.connect(last_event_id)[0])[1:]
+            self.assertEqual([(event['event'], event['id'])
+                              for event in events], [('reset', 'token-4')])
+
+    def test_connections(self):
+        """
+        Tests the connections receive the events and heartbeats from the
+        stream thread, and are dropped once disconnected.
+        """
+        clients = []
+        for _ in range(3):
+            connection, client = socket.socketpair()
+            data, position = self.event_stream.connect()
+            self.event_stream.add_connection(connection, position)
+            clients.append(client)
+        self.assertEqual(self.event_stream.get_number_of_clients(), 3)
+
+        alarm_id = self.add_alarm()
+        for client in clients:
+            events = self.receive(client, 1)
+            self.assertEqual(
+                [(event['event'], event['id']) for event in events],
+                [(AlarmEventBus.alarm_added, 'token-1')])
+            self.assertEqual(json.loads(events[0]['data'])['id'], alarm_id)
+
+        # Heartbeat comments while idle
+        clients[0].settimeout(2)
+        self.assertEqual(clients[0].recv(4096), b': heartbeat\n\n')
+
+        # An event between connect() and add_connection() is not missed
+        connection, client = socket.socketpair()
+        data, position = self.event_stream.connect()
+        self.alarm_mgr.delete_alarm(alarm_id)
+        self.assertTrue(self.alarm_mgr.flush_events(5))
+        self.event_stream.add_connection(connection, position)
+        self.assertEqual([event['event'] for event in self.receive(client, 1)],
+                         [AlarmEventBus.alarm_deleted])
+        clients.append(client)
+
+        for client in clients:
+            client.close()
+        for _ in range(50):
+            if self.event_stream.get_number_of_clients() == 0:
+                break
+            time.sleep(0.05)
+        self.assertEqual(self.event_stream.get_number_of_clients(), 0)
+
+    def test_close(self):
+        """ Tests closing the stream disconnects the clients. """
+        connection, client = socket.socketpair()
+        self.event_stream.add_connection(connection, 0)
+        generator = self.event_stream.stream()
+        next(generator)
+        self.assertEqual(self.event_stream.get_number_of_clients(), 2)
+        self.event_stream.close()
+        client.settimeout(5)
+        self.assertEqual(client.recv(4096), b'')
+        self.assertEqual(list(generator), [])
+        self.assertEqual(self.event_stream.get_number_of_clients(), 0)
+        client.close()
+
+    def test_stream(self):
+        """ Tests the generator yields the events and the heartbeats. """
+        generator = self.event_stream.stream()
+        self.assertEqual(parse_events(next(generator)), [{'retry': '3000'}])
+        self.assertEqual(next(generator), b': heartbeat\n\n')
+        self.add_alarm()
+        events = parse_events(next(generator))
+        self.assertEqual([event['event'] for event in events],
+                         [AlarmEventBus.alarm_added])
+        generator.close()
+        self.assertEqual(self.event_stream.get_number_of_clients(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
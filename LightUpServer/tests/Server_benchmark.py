@@ -0,0 +1,122 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Load test for the multi-threaded Server requests.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# Serves the Flask app with the multi-threaded WSGI server on a free local
+# port and sends 'getAlarm?id=all' requests from 1, 10 and 50 concurrent
+# clients, each one with its own kept-alive connection. It prints the total
+# requests per second and the median, 95th, 99th percentile and maximum
+# latencies. It is not part of the unit tests, run it directly with:
+#     python Server_benchmark.py [number of server threads]
+# It uses the default alarms database, which alarms are deleted.
+#
+from __future__ import unicode_literals, absolute_import, print_function
+import sys
+import time
+import logging
+import threading
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+try:
+    import LightUpServer.Server as Server
+    from LightUpServer.ServerAlarmAdapter import ServerAlarmAdapter
+    from LightUpAlarm.AlarmManager import AlarmManager
+except ImportError:
+    import os
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    import LightUpServer.Server as Server
+    from LightUpServer.ServerAlarmAdapter import ServerAlarmAdapter
+    from LightUpAlarm.AlarmManager import AlarmManager
+
+
+NUMBER_OF_ALARMS = 20
+REQUESTS_PER_CLIENT = 100
+CLIENT_COUNTS = (1, 10, 50)
+SERVER_THREADS = 8
+REQUEST_PATH = '/LightUpPi/getAlarm?id=all'
+
+
+def client(port, latencies, errors):
+    """ Sends the requests through a single connection, timing each one. """
+    connection = httplib.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        for _ in range(REQUESTS_PER_CLIENT):
+            start_time = time.time()
+            connection.request('GET', REQUEST_PATH)
+            response = connection.getresponse()
+            response.read()
+            latencies.append(time.time() - start_time)
+            if response.status != 200:
+                errors.append(response.status)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        connection.close()
+
+
+def percentile(sorted_values, percent):
+    """ Nearest rank percentile of a sorted list. """
+    index = int(round(percent / 100.0 * len(sorted_values))) - 1
+    return sorted_values[min(max(index, 0), len(sorted_values) - 1)]
+
+
+def benchmark(port, number_of_clients):
+    """ Prints the throughput and latencies of the concurrent clients. """
+    latencies = []
+    errors = []
+    threads = [threading.Thread(target=client, args=(port, latencies, errors))
+               for _ in range(number_of_clients)]
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start_time
+    latencies.sort()
+    ms = lambda x: x * 1000
+    print('%2d client(s) %8.1f req/s   p50 %7.1f ms   p95 %7.1f ms   '
+          'p99 %7.1f ms   max %7.1f ms   errors %d' %
+          (number_of_clients, len(latencies) / elapsed,
+           ms(percentile(latencies, 50)), ms(percentile(latencies, 95)),
+           ms(percentile(latencies, 99)), ms(latencies[-1]), len(errors)))
+
+
+def main(argv):
+    threads = int(argv[0]) if len(argv) > 0 else SERVER_THREADS
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    alarm_mgr = AlarmManager()
+    alarm_mgr.delete_all_alarms()
+    for i in range(NUMBER_OF_ALARMS):
+        alarm_mgr.add_alarm(
+            i % 24, i % 60, days=(True, False, True, False, True, False, False),
+            enabled=False, label='')
+    Server.alarm_adapt = ServerAlarmAdapter(alarm_mgr)
+
+    wsgi_server = Server.make_server(host='127.0.0.1', port=0, threads=threads)
+    serve_thread = threading.Thread(target=wsgi_server.serve_forever)
+    serve_thread.daemon = True
+    serve_thread.start()
+
+    print('%d alarms, %d server threads, %d requests per client' %
+          (NUMBER_OF_ALARMS, threads, REQUESTS_PER_CLIENT))
+    try:
+        for number_of_clients in CLIENT_COUNTS:
+            benchmark(wsgi_server.port, number_of_clients)
+    finally:
+        wsgi_server.shutdown()
+        serve_thread.join()
+        alarm_mgr.delete_all_alarms()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,566 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Unit test for the Server module.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# The requests are sent with the Flask test client, so no HTTP server is
+# launched. The AlarmManager uses the default alarms database.
+#
+from __future__ import unicode_literals, absolute_import
+import json
+import time
+import zlib
+import mock
+import socket
+import unittest
+import threading
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+try:
+    import LightUpServer.Server as Server
+    from LightUpServer.ServerAlarmAdapter import ServerAlarmAdapter
+    from LightUpServer.ServerControlChannel import ServerControlChannel
+    from LightUpAlarm.AlarmManager import AlarmManager
+    from LightUpAlarm.AlarmNamespaces import AlarmNamespaces
+except ImportError:
+    import os
+    import sys
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    import LightUpServer.Server as Server
+    from LightUpServer.ServerAlarmAdapter import ServerAlarmAdapter
+    from LightUpServer.ServerControlChannel import ServerControlChannel
+    from LightUpAlarm.AlarmManager import AlarmManager
+    from LightUpAlarm.AlarmNamespaces import AlarmNamespaces
+
+
+class ServerTestCase(unittest.TestCase):
+    """ Tests for the Server module. """
+
+    def setUp(self):
+        self.alarm_mgr = AlarmManager()
+        self.alarm_mgr.delete_all_alarms()
+        self.alarm_ids = [
+            self.alarm_mgr.add_alarm(
+                hour, hour, (True, False, True, False, True, False, True),
+                enabled=True, label='')
+            for hour in (6, 7, 8, 9, 10)]
+        Server.alarm_adapt = ServerAlarmAdapter(self.alarm_mgr)
+
+    def tearDown(self):
+        self.alarm_mgr.delete_all_alarms()
+        Server.alarm_adapt.close()
+        Server.alarm_adapt = None
+
+    def test_concurrent_requests(self):
+        """
+        Stress test with concurrent requests reading all the alarms while
+        other requests edit them. All the responses have to be successful and
+        contain consistent alarms.
+        """
+        errors = []
+
+        def reader():
+            client = Server.flask_server.test_client()
+            try:
+                for i in range(30):
+                    response = client.get('/LightUpPi/getAlarm?id=all')
+                    if response.status_code != 200:
+                        errors.append('Response %s' % response.status_code)
+                        continue
+                    data = json.loads(response.get_data(as_text=True))
+                    if data['size'] != len(self.alarm_ids):
+                        errors.append('Read %s alarms' % data['size'])
+                    for alarm in data['alarms']:
+                        if alarm['hour'] != alarm['minute']:
+                            errors.append('Inconsistent alarm %s' % alarm)
+            except Exception as e:
+                errors.append(e)
+
+        def editor(seed):
+            client = Server.flask_server.test_client()
+            try:
+                for i in range(15):
+                    value = (seed + i) % 24
+                    alarm_id = self.alarm_ids[(seed + i) % len(self.alarm_ids)]
+                    response = client.get(
+                        '/LightUpPi/editAlarm?id=%s&hour=%s&minute=%s' %
+                        (alarm_id, value, value))
+                    data = json.loads(response.get_data(as_text=True))
+                    if data.get('success') is not True:
+                        errors.append('Edit failed: %s' % data)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=reader) for _ in range(4)]
+        threads += [threading.Thread(target=editor, args=(seed,))
+                    for seed in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(60)
+            self.assertFalse(thread.isAlive())
+        self.assertEqual(errors, [])
+        self.assertTrue(self.alarm_mgr.check_threads_state())
+
+    def test_threaded_server(self):
+        """
+        Tests the requests served through the multi-threaded WSGI server from
+        several concurrent connections.
+        """
+        wsgi_server = Server.make_server(host='127.0.0.1', port=0, threads=4)
+        serve_thread = threading.Thread(target=wsgi_server.serve_forever)
+        serve_thread.daemon = True
+        serve_thread.start()
+        results = []
+
+        def client():
+            connection = httplib.HTTPConnection(
+                '127.0.0.1', wsgi_server.port, timeout=10)
+            for i in range(5):
+                connection.request('GET', '/LightUpPi/getAlarm?id=all')
+                response = connection.getresponse()
+                data = json.loads(response.read().decode('utf-8'))
+                results.append((response.status, data['size']))
+            connection.close()
+
+        clients = [threading.Thread(target=client) for _ in range(6)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        wsgi_server.shutdown()
+        serve_thread.join(5)
+        self.assertEqual(results, [(200, len(self.alarm_ids))] * 30)
+
+    def test_event_stream(self):
+        """
+        Tests the events request, which connection is handed over to the event
+        stream by the multi-threaded server, and the streamed response of the
+        servers that cannot hand it over.
+        """
+        wsgi_server = Server.make_server(host='127.0.0.1', port=0, threads=1)
+        serve_thread = threading.Thread(target=wsgi_server.serve_forever)
+        serve_thread.daemon = True
+        serve_thread.start()
+        event_stream = Server.alarm_adapt.get_event_stream()
+        try:
+            events_connection = httplib.HTTPConnection(
+                '127.0.0.1', wsgi_server.port, timeout=10)
+            events_connection.request('GET', '/LightUpPi/events')
+            response = events_connection.getresponse()
+            self.assertEqual(response.status, 200)
+            self.assertIn('text/event-stream',
+                          response.getheader('Content-Type'))
+            self.assertIsNone(response.getheader('Content-Length'))
+            self.assertEqual(response.fp.readline(), b'retry: 3000\n')
+
+            # The only worker thread is free for the other requests
+            connection = httplib.HTTPConnection(
+                '127.0.0.1', wsgi_server.port, timeout=10)
+            connection.request('GET', '/LightUpPi/editAlarm?id=%s&label=sse' %
+                               self.alarm_ids[0])
+            self.assertEqual(connection.getresponse().status, 200)
+            connection.close()
+            self.assertEqual(event_stream.get_number_of_clients(), 1)
+
+            line = b''
+            while not line.startswith(b'data:'):
+                line = response.fp.readline()
+                if line.startswith(b'event:'):
+                    self.assertEqual(line, b'event: alarm_edited\n')
+            data = json.loads(line[5:].decode('utf-8'))
+            self.assertEqual(data['id'], self.alarm_ids[0])
+            self.assertEqual(data['data']['label'], 'sse')
+            response.close()
+            events_connection.close()
+            for _ in range(50):
+                if event_stream.get_number_of_clients() == 0:
+                    break
+                time.sleep(0.05)
+            self.assertEqual(event_stream.get_number_of_clients(), 0)
+        finally:
+            wsgi_server.shutdown()
+            serve_thread.join(5)
+
+        # Streamed by the request thread
+        client = Server.flask_server.test_client()
+        response = client.get('/LightUpPi/events',
+                              headers={'Last-Event-ID': 'previous-run-1'})
+        data = next(iter(response.response))
+        self.assertTrue(data.startswith(b'retry: 3000\n\n'))
+        self.assertIn(b'event: reset\n', data)
+        self.assertEqual(event_stream.get_number_of_clients(), 1)
+        response.close()
+        self.assertEqual(event_stream.get_number_of_clients(), 0)
+
+    def test_control_channel(self):
+        """
+        Tests the WebSocket handshake of the control request, which connection
+        is handed over to the control channel, and a snooze command.
+        """
+        wsgi_server = Server.make_server(host='127.0.0.1', port=0, threads=1)
+        serve_thread = threading.Thread(target=wsgi_server.serve_forever)
+        serve_thread.daemon = True
+        serve_thread.start()
+        try:
+            client = socket.create_connection(
+                ('127.0.0.1', wsgi_server.port), 10)
+            client.sendall(b'GET /LightUpPi/control HTTP/1.1\r\n'
+                           b'Host: localhost\r\n'
+                           b'Upgrade: websocket\r\n'
+                           b'Connection: Upgrade\r\n'
+                           b'Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n'
+                           b'Sec-WebSocket-Version: 13\r\n\r\n')
+            data = b''
+            while b'\r\n\r\n' not in data:
+                data += client.recv(4096)
+            headers, data = data.split(b'\r\n\r\n', 1)
+            headers = headers.decode('utf-8').lower()
+            self.assertTrue(headers.startswith('http/1.1 101'))
+            self.assertIn('\r\nupgrade: websocket', headers)
+            self.assertIn('sec-websocket-accept: s3pplmbitxaq9kygzzhzrbk+xoo=',
+                          headers)
+            self.assertNotIn('content-length', headers)
+
+            client.sendall(ServerControlChannel.encode_frame(json.dumps(
+                {'command': 'snooze', 'id': self.alarm_ids[0]}).encode(
+                    'utf-8'), mask=True))
+            messages = []
+            while not [message for message in messages
+                       if message['type'] == 'result']:
+                frames, data = ServerControlChannel.decode_frames(data)
+                messages += [json.loads(payload.decode('utf-8'))
+                             for _, opcode, _, payload in frames
+                             if opcode == ServerControlChannel.op_text]
+                if not frames:
+                    data += client.recv(4096)
+            self.assertEqual(messages[0]['type'], 'state')
+            self.assertEqual(messages[-1]['command'], 'snooze')
+            self.assertTrue(messages[-1]['success'])
+            self.assertIn(self.alarm_ids[0], self.alarm_mgr.get_snoozes())
+            control_channel = Server.alarm_adapt.get_control_channel()
+            self.assertEqual(control_channel.get_number_of_clients(), 1)
+            client.close()
+        finally:
+            wsgi_server.shutdown()
+            serve_thread.join(5)
+
+        # Not a handshake, or a server that cannot hand over the connection
+        client = Server.flask_server.test_client()
+        self.assertEqual(client.get('/LightUpPi/control').status_code, 400)
+        response = client.get('/LightUpPi/control', headers={
+            'Upgrade': 'websocket', 'Connection': 'Upgrade',
+            'Sec-WebSocket-Key': 'dGhlIHNhbXBsZSBub25jZQ==',
+            'Sec-WebSocket-Version': '13'})
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(json.loads(response.data.decode('utf-8'))['success'])
+
+    def test_conditional_requests(self):
+        """
+        Tests the getAlarm and getStation ETag and Last-Modified validators,
+        with a 304 response that does not access the database or create the
+        JSON when the client data is up to date.
+        """
+        client = Server.flask_server.test_client()
+        response = client.get('/LightUpPi/getAlarm?id=all')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+
+        not_called = mock.Mock(side_effect=AssertionError('Not cached'))
+        with mock.patch.object(AlarmManager.alarmdb, 'get_all_alarms',
+                               new=not_called), \
+                mock.patch.object(AlarmManager.alarmdb, 'get_alarm',
+                                  new=not_called), \
+                mock.patch.object(ServerAlarmAdapter, 'json_get_all_alarms',
+                                  new=not_called):
+            response = client.get('/LightUpPi/getAlarm?id=all',
+                                  headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.get_data(), b'')
+            self.assertEqual(response.headers['ETag'], etag)
+            response = client.get('/LightUpPi/getAlarm?id=all',
+                                  headers={'If-Modified-Since': last_modified})
+            self.assertEqual(response.status_code, 304)
+            response = client.get(
+                '/LightUpPi/getAlarm?id=%s' % self.alarm_ids[0],
+                headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+        self.assertFalse(not_called.called)
+
+        # A change invalidates the ETag
+        self.alarm_mgr.edit_alarm(self.alarm_ids[0], label='changed')
+        response = client.get('/LightUpPi/getAlarm?id=all',
+                              headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual(data['alarms'][0]['label'], 'changed')
+
+        # The stations have their own validators
+        response = client.get('/LightUpPi/getStation?id=all')
+        station_etag = response.headers['ETag']
+        self.assertNotEqual(station_etag, etag)
+        response = client.get('/LightUpPi/getStation?id=all',
+                              headers={'If-None-Match': station_etag})
+        self.assertEqual(response.status_code, 304)
+        station_id = self.alarm_mgr.add_station('Radio', 'http://radio')
+        try:
+            response = client.get('/LightUpPi/getStation?id=all',
+                                  headers={'If-None-Match': station_etag})
+            self.assertEqual(response.status_code, 200)
+        finally:
+            self.alarm_mgr.delete_station(station_id)
+
+    def test_encoded_responses(self):
+        """
+        Tests the JSON responses are compact by default, pretty printed when
+        requested, and compressed with the accepted encoding when they are
+        large enough.
+        """
+        client = Server.flask_server.test_client()
+        compact = client.get('/LightUpPi/getAlarm?id=all')
+        self.assertIsNone(compact.headers.get('Content-Encoding'))
+        self.assertIn('Accept-Encoding', compact.headers['Vary'])
+        compact_data = compact.get_data(as_text=True)
+        self.assertNotIn('\n', compact_data)
+        self.assertNotIn(': ', compact_data)
+        pretty = client.get('/LightUpPi/getAlarm?id=all&pretty')
+        pretty_data = pretty.get_data(as_text=True)
+        self.assertIn('\n    "', pretty_data)
+        self.assertEqual(json.loads(pretty_data), json.loads(compact_data))
+        self.assertLess(len(compact_data), len(pretty_data))
+
+        # Small responses are not compressed
+        with mock.patch.object(Server, 'COMPRESS_MIN_SIZE',
+                               new=len(compact_data) + 1):
+            response = client.get('/LightUpPi/getAlarm?id=all',
+                                  headers={'Accept-Encoding': 'gzip'})
+            self.assertIsNone(response.headers.get('Content-Encoding'))
+
+        with mock.patch.object(Server, 'COMPRESS_MIN_SIZE', new=0):
+            gzipped = client.get('/LightUpPi/getAlarm?id=all',
+                                 headers={'Accept-Encoding': 'gzip, deflate'})
+            self.assertEqual(gzipped.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(
+                zlib.decompress(gzipped.get_data(), 16 + zlib.MAX_WBITS),
+                compact_data.encode('utf-8'))
+            self.assertEqual(gzipped.headers['ETag'],
+                             compact.headers['ETag'][:-1] + '-gzip"')
+
+            deflated = client.get('/LightUpPi/getAlarm?id=all',
+                                  headers={'Accept-Encoding': 'deflate'})
+            self.assertEqual(deflated.headers['Content-Encoding'], 'deflate')
+            self.assertEqual(zlib.decompress(deflated.get_data()),
+                             compact_data.encode('utf-8'))
+            response = client.get('/LightUpPi/getAlarm?id=all',
+                                  headers={'Accept-Encoding': 'br'})
+            self.assertIsNone(response.headers.get('Content-Encoding'))
+
+            # Each representation ETag validates the data
+            response = client.get(
+                '/LightUpPi/getAlarm?id=all',
+                headers={'Accept-Encoding': 'gzip',
+                         'If-None-Match': gzipped.headers['ETag']})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.headers['ETag'], gzipped.headers['ETag'])
+
+    def test_list_queries(self):
+        """
+        Tests the pages, field selection and filters of the alarms list, and
+        the pages of the stations list.
+        """
+        client = Server.flask_server.test_client()
+
+        def get_json(path):
+            response = client.get(path)
+            self.assertEqual(response.status_code, 200)
+            return json.loads(response.data.decode('utf-8'))
+
+        def get_ids(arguments):
+            data = get_json('/LightUpPi/getAlarm?id=all&%s' % arguments)
+            self.assertIsNone(data['nextCursor'])
+            return [self.alarm_ids.index(alarm['id'])
+                    for alarm in data['alarms']]
+
+        data = get_json('/LightUpPi/getAlarm?id=all&limit=2&fields=hour')
+        self.assertEqual(data['alarms'], [
+            {'id': self.alarm_ids[0], 'hour': 6},
+            {'id': self.alarm_ids[1], 'hour': 7}])
+        self.assertEqual((data['size'], data['nextCursor']),
+                         (2, self.alarm_ids[1]))
+        data = get_json('/LightUpPi/getAlarm?id=all&limit=3&cursor=%s' %
+                        data['nextCursor'])
+        self.assertEqual([alarm['hour'] for alarm in data['alarms']],
+                         [8, 9, 10])
+        self.assertEqual(data['alarms'][0], self.alarm_mgr.get_alarm(
+            self.alarm_ids[2]).to_dict())
+        self.assertIsNone(data['nextCursor'])
+
+        self.assertEqual(get_ids('enabled=true'), [0, 1, 2, 3, 4])
+        self.assertEqual(get_ids('active=false'), [])
+        self.assertEqual(get_ids('day=Sunday'), [0, 1, 2, 3, 4])
+        self.assertEqual(get_ids('day=1'), [])
+        self.assertEqual(get_ids('hour_from=7&hour_to=8'), [1, 2])
+        self.assertEqual(get_ids('hour_from=10&hour_to=6'), [0, 4])
+        self.assertEqual(get_ids('hour_from=10&hour_to=6&station_id=2'), [])
+
+        for arguments in ('limit=0', 'cursor=x', 'enabled=maybe', 'day=7',
+                          'hour_to=24', 'fields=hour,nope'):
+            data = get_json('/LightUpPi/getAlarm?id=all&%s' % arguments)
+            self.assertIn('error', data)
+            self.assertNotIn('alarms', data)
+
+        data = get_json('/LightUpPi/getStation?id=all&limit=1&fields=name')
+        self.assertEqual(data['dataType'], 'All stations')
+        self.assertIn('nextCursor', data)
+        for station in data['stations']:
+            self.assertEqual(sorted(station), ['id', 'name'])
+
+    def test_snooze_requests(self):
+        """ Tests the snoozeAlarm and dismissAlarm requests. """
+        client = Server.flask_server.test_client()
+        alarm_id = self.alarm_ids[0]
+        response = client.get('/LightUpPi/snoozeAlarm?id=%s' % alarm_id)
+        data = json.loads(response.get_data(as_text=True))
+        self.assertTrue(data['success'])
+        self.assertEqual(self.alarm_mgr.get_snoozes(),
+                         {alarm_id: data['alert_time']})
+
+        response = client.get('/LightUpPi/dismissAlarm?id=%s' % alarm_id)
+        data = json.loads(response.get_data(as_text=True))
+        self.assertTrue(data['success'])
+        self.assertEqual(self.alarm_mgr.get_snoozes(), {})
+
+        response = client.get('/LightUpPi/snoozeAlarm?id=one')
+        data = json.loads(response.get_data(as_text=True))
+        self.assertIn('error', data)
+
+    def test_batch_requests(self):
+        """ Tests the batch requests, atomic by default. """
+        client = Server.flask_server.test_client()
+        operations = [
+            {'op': 'edit', 'type': 'alarm', 'id': self.alarm_ids[0],
+             'data': {'label': 'batch'}},
+            {'op': 'delete', 'type': 'alarm', 'id': self.alarm_ids[1]},
+            {'op': 'edit', 'type': 'alarm', 'id': self.alarm_ids[2],
+             'data': {'minute': 60}}]
+        response = client.post('/LightUpPi/batch', data=json.dumps(operations),
+                               content_type='application/json')
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual(data['dataType'], 'Batch')
+        self.assertFalse(data['success'])
+        self.assertEqual([result['success'] for result in data['results']],
+                         [False, False, False])
+        self.assertEqual(self.alarm_mgr.get_alarm(self.alarm_ids[0]).label, '')
+        self.assertEqual(self.alarm_mgr.get_number_of_alarms(), 5)
+
+        response = client.post('/LightUpPi/batch?atomic=false',
+                               data=json.dumps(operations),
+                               content_type='application/json')
+        data = json.loads(response.get_data(as_text=True))
+        self.assertTrue(data['success'])
+        self.assertEqual([result['success'] for result in data['results']],
+                         [True, True, False])
+        self.assertEqual(self.alarm_mgr.get_alarm(self.alarm_ids[0]).label,
+                         'batch')
+        self.assertEqual(self.alarm_mgr.get_number_of_alarms(), 4)
+
+        for body in ('{"op": "add"}', 'not json'):
+            response = client.post('/LightUpPi/batch', data=body)
+            data = json.loads(response.get_data(as_text=True))
+            self.assertIn('error', data)
+        response = client.post('/LightUpPi/batch?atomic=maybe', data='[]')
+        self.assertIn('error', json.loads(response.get_data(as_text=True)))
+
+    def test_namespace_requests(self):
+        """ Tests the requests to the namespace routes. """
+        namespaces = AlarmNamespaces()
+        kitchen_mgr = namespaces.add('kitchen')
+        kitchen_mgr.delete_all_alarms()
+        Server.alarm_namespaces = namespaces
+        client = Server.flask_server.test_client()
+        try:
+            response = client.get(
+                '/LightUpPi/ns/kitchen/addAlarm?hour=7&minute=45'
+                '&label=kitchen')
+            data = json.loads(response.get_data(as_text=True))
+            self.assertTrue(data['success'])
+            self.assertEqual(kitchen_mgr.get_alarm(data['id']).label,
+                             'kitchen')
+
+            response = client.get('/LightUpPi/ns/kitchen/getAlarm?id=all')
+            data = json.loads(response.get_data(as_text=True))
+            self.assertEqual(data['size'], 1)
+            response = client.get('/LightUpPi/getAlarm?id=all')
+            data = json.loads(response.get_data(as_text=True))
+            self.assertEqual(data['size'], len(self.alarm_ids))
+
+            response = client.get('/LightUpPi/ns/bedroom/getAlarm?id=all')
+            data = json.loads(response.get_data(as_text=True))
+            self.assertIn('bedroom', data['error'])
+        finally:
+            Server.alarm_namespaces = None
+            kitchen_mgr.delete_all_alarms()
+            namespaces.shutdown()
+
+    def test_namespace_adapters(self):
+        """
+        Tests the concurrent first requests to a namespace share a single
+        adapter, and that the adapters of removed or replaced namespaces are
+        closed.
+        """
+        namespaces = AlarmNamespaces()
+        kitchen_mgr = namespaces.add('kitchen')
+        Server.alarm_namespaces = namespaces
+        created = []
+
+        def create_adapter(alarm_mgr):
+            # Slow creation, to overlap the requests
+            time.sleep(0.05)
+            adapter = mock.Mock(alarm_mgr=alarm_mgr)
+            created.append(adapter)
+            return adapter
+
+        adapters = []
+        try:
+            with mock.patch.object(Server, 'ServerAlarmAdapter',
+                                   side_effect=create_adapter):
+                threads = [threading.Thread(target=lambda: adapters.append(
+                    Server.get_alarm_adapter('kitchen'))) for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join(10)
+                self.assertEqual(len(created), 1)
+                self.assertEqual(adapters, created * 8)
+
+                # Replaced namespace
+                namespaces.remove('kitchen')
+                kitchen_mgr = namespaces.add('kitchen')
+                adapter = Server.get_alarm_adapter('kitchen')
+                self.assertIs(adapter.alarm_mgr, kitchen_mgr)
+                created[0].close.assert_called_once_with()
+
+                # Removed namespace
+                namespaces.remove('kitchen')
+                self.assertIsNone(Server.get_alarm_adapter('kitchen'))
+                adapter.close.assert_called_once_with()
+                self.assertNotIn('kitchen', Server.namespace_adapters)
+        finally:
+            Server.alarm_namespaces = None
+            Server.namespace_adapters.clear()
+            namespaces.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+# Unit test for the ThreadPoolWsgiServer class.
+#
+# Copyright (c) 2015 carlosperate https://github.com/carlosperate/
+#
+# Licensed under The MIT License (MIT), a copy can be found in the LICENSE file
+#
+# The servers are bound to a free port on the local host and serve a minimal
+# WSGI application.
+#
+from __future__ import unicode_literals, absolute_import
+import time
+import socket
+import unittest
+import threading
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+try:
+    from LightUpServer.ThreadPoolWsgiServer import ThreadPoolWsgiServer
+except ImportError:
+    import os
+    import sys
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    package_dir = os.path.dirname(os.path.dirname(file_dir))
+    sys.path.insert(0, package_dir)
+    from LightUpServer.ThreadPoolWsgiServer import ThreadPoolWsgiServer
+
+
+def wsgi_app(environ, start_response):
+    """ Responds with the client port, after a second for the /slow path. """
+    if environ['PATH_INFO'] == '/slow':
+        time.sleep(1)
+    body = ('%s' % environ['REMOTE_PORT']).encode('utf-8')
+    start_response(str('200 OK'),
+                   [(str('Content-Type'), str('text/plain')),
+                    (str('Content-Length'), str(len(body)))])
+    return [body]
+
+
+class ThreadPoolWsgiServerTestCase(unittest.TestCase):
+    """ Tests for ThreadPoolWsgiServer class. """
+
+    def start_server(self, **kwargs):
+        """ Launches a server on a free port, it is closed at the tear down. """
+        self.server = ThreadPoolWsgiServer('127.0.0.1', 0, wsgi_app, **kwargs)
+        self.serve_thread = threading.Thread(target=self.server.serve_forever)
+        self.serve_thread.daemon = True
+        self.serve_thread.start()
+        return self.server
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.serve_thread.join(5)
+
+    def get(self, path, connection=None):
+        """ Sends a GET request, in a new connection if none is given. """
+        if connection is None:
+            connection = httplib.HTTPConnection(
+                '127.0.0.1', self.server.port, timeout=10)
+        connection.request('GET', path)
+        response = connection.getresponse()
+        return response, response.read().decode('utf-8')
+
+    def test_slow_request(self):
+        """ Tests a slow request does not stall the other clients requests. """
+        self.start_server(threads=4)
+        slow_thread = threading.Thread(target=self.get, args=('/slow',))
+        slow_thread.start()
+        time.sleep(0.1)
+        start_time = time.time()
+        for _ in range(5):
+            response, _ = self.get('/')
+            self.assertEqual(response.status, 200)
+        self.assertLess(time.time() - start_time, 0.5)
+        slow_thread.join()
+
+    def test_keep_alive(self):
+        """ Tests the requests of a client reuse the same connection. """
+        self.start_server(threads=2)
+        connection = httplib.HTTPConnection(
+            '127.0.0.1', self.server.port, timeout=10)
+        ports = [self.get('/', connection)[1] for _ in range(3)]
+        self.assertEqual(len(set(ports)), 1)
+        connection.close()
+
+    def test_keep_alive_waiting(self):
+        """
+        Tests a kept-alive connection is closed after its next response when
+        other connections are waiting for the worker.
+        """
+        self.start_server(threads=1)
+        connection = httplib.HTTPConnection(
+            '127.0.0.1', self.server.port, timeout=10)
+        response, _ = self.get('/', connection)
+        self.assertNotEqual(response.getheader('Connection'), 'close')
+
+        # Only one worker, held by the kept-alive connection
+        waiting = []
+        waiting_thread = threading.Thread(
+            target=lambda: waiting.append(self.get('/')[0].status))
+        waiting_thread.start()
+        for _ in range(50):
+            if self.server.has_waiting_connections() is True:
+                break
+            time.sleep(0.01)
+        self.assertTrue(self.server.has_waiting_connections())
+
+        response, _ = self.get('/', connection)
+        self.assertEqual(response.getheader('Connection'), 'close')
+        waiting_thread.join(5)
+        self.assertEqual(waiting, [200])
+        connection.close()
+
+    def test_no_keep_alive(self):
+        """ Tests the connections are closed after a request without it. """
+        self.start_server(threads=2, keep_alive=False)
+        response, _ = self.get('/')
+        self.assertEqual(response.version, 10)
+        self.assertEqual(response.status, 200)
+
+    def test_request_timeout(self):
+        """ Tests an idle connection is closed after the request timeout. """
+        self.start_server(threads=1, request_timeout=0.2)
+        client = socket.create_connection(('127.0.0.1', self.server.port), 5)
+        start_time = time.time()
+        self.assertEqual(client.recv(1024), b'')
+        self.assertLess(time.time() - start_time, 2)
+        client.close()
+        # The only worker is free for the next connection
+        response, _ = self.get('/')
+        self.assertEqual(response.status, 200)
+
+    def test_server_close(self):
+        """ Tests the worker threads are stopped when the server is closed. """
+        self.start_server(threads=3, backlog=8)
+        self.assertEqual(self.server.get_running_workers(), 3)
+        self.assertEqual(self.server.request_queue_size, 8)
+        self.server.shutdown()
+        self.serve_thread.join(5)
+        self.assertEqual(self.server.get_running_workers(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,8 +12,8 @@ LightUpPi.app = angular.module("lightUpPi", ["ui.bootstrap"]);
 
 /**
  * Main controller for the LightUpPi Angular App.
- * It sets short polling to the server to maintain the displayed alarm data 
- * refreshed.
+ * It keeps the displayed alarm data refreshed with the server events stream,
+ * or with short polling to the server on the browsers without EventSource.
  */
 LightUpPi.app.controller("lightUpCtrl", ["$scope", "$interval", "$http",
     function($scope, $interval, $http) {
@@ -56,7 +56,35 @@ LightUpPi.app.controller("lightUpCtrl", ["$scope", "$interval", "$http",
 
   $scope.refreshAlarmsData();
   $scope.refreshStationsData();
-//  var promise = $interval($scope.refreshAlarmsData, 2000);
+
+  // The server pushes the changes, the data is only requested when it changes
+  if (typeof EventSource !== "undefined") {
+    var serverEvents = new EventSource("/LightUpPi/events");
+    var onEvent = function(refreshFunctions) {
+      return function() {
+        $scope.$apply(function() {
+          refreshFunctions.forEach(function(refresh) { refresh(); });
+        });
+      };
+    };
+    ["alarm_added", "alarm_edited", "alarm_deleted", "settings_changed"]
+        .forEach(function(eventType) {
+      serverEvents.addEventListener(
+          eventType, onEvent([$scope.refreshAlarmsData]));
+    });
+    ["station_added", "station_edited", "station_deleted"]
+        .forEach(function(eventType) {
+      serverEvents.addEventListener(
+          eventType, onEvent([$scope.refreshStationsData]));
+    });
+    // Sent when the missed events are not available, reload everything
+    serverEvents.addEventListener("reset", onEvent(
+        [$scope.refreshAlarmsData, $scope.refreshStationsData]));
+    $scope.$on("$destroy", function() { serverEvents.close(); });
+  } else {
+    var promise = $interval($scope.refreshAlarmsData, 2000);
+    $scope.$on("$destroy", function() { $interval.cancel(promise); });
+  }
 }]);
 
 /**
@@ -19,10 +19,20 @@ import threading
 from time import sleep
 from LightUpAlarm import AlarmCli
 from LightUpAlarm import AlarmManager
+from LightUpAlarm.AlarmEventBus import AlarmEventBus
+from LightUpAlarm.AlarmSimulation import AlarmSimulation
 from LightUpServer import Server
 from LightUpHardware import HardwareThread
 
 
+# Seconds between the background checks of the alarm threads
+RECONCILE_INTERVAL = 60
+
+# Minutes ahead for the alarm threads launched before the application starts,
+# the rest are launched in the background
+ARMING_WINDOW = 60
+
+
 class CliThread(threading.Thread):
     """
     Simple thread class for launching command line ui in its own process (to be
@@ -46,13 +56,14 @@ class CliThread(threading.Thread):
         # this thread needs to request a keyboard interrupt to the main thread.
         thread.interrupt_main()
 
-    def callback_event(self):
-        """ Updates the cli data, to be used as a server callback. """
+    def callback_event(self, events):
+        """ Updates the cli data, to be subscribed to the alarm changes. """
         self.cli_instance.onecmd('alarms')
         sys.stdout.flush()
         sys.stdout.write('\n%s' % self.cli_instance.prompt)
 
-    def alarm_alert(self):
+    def alarm_alert(self, alarm):
+        """ Rings the terminal bell, as the AlarmManager alert callback. """
         # '\a' is a request to the terminal to beep
         print('\n\nRING RING RING!!!!\a')
         sleep(0.8)
@@ -62,17 +73,45 @@ class CliThread(threading.Thread):
         sys.stdout.write(self.cli_instance.prompt)
 
 
-def alarm_offset_alert():
-    """ Function executed as the 'offset alert' as a AlarmManager callback. """
+def get_hardware_thread():
+    """ Gets the HardwareThread instance set with the alert timeline. """
     minutes = lambda x: x * 60
-    hw_alert = HardwareThread.HardwareThread(
+    return HardwareThread.HardwareThread(
         lamp=(0, minutes(3)),
         room_light=(minutes(2), minutes(13)),
         coffee_time=minutes(10),
         total_time=minutes(15))
+
+
+def alarm_offset_alert(alarm):
+    """ Function executed as the 'offset alert' as a AlarmManager callback. """
+    hw_alert = get_hardware_thread()
     hw_alert.start()
 
 
+def simulate_week():
+    """
+    Prints the alarm alerts and hardware timeline of the next week, replayed
+    with a virtual clock.
+    """
+    hardware_timeline = get_hardware_thread().get_timeline()
+    simulation = AlarmSimulation(
+        AlarmManager.AlarmManager.get_all_active_alarms(),
+        offset_alert_time=AlarmManager.AlarmManager.get_offset_alert_time(),
+        hardware_timeline=hardware_timeline)
+    log = simulation.run(days=7)
+    print('\n========== Simulated week of alarm events ==========')
+    print(AlarmSimulation.format_log(log))
+
+
+def print_startup_timings(alarm_mgr):
+    """ Prints the duration of the AlarmManager startup phases. """
+    timings = alarm_mgr.get_startup_timings()
+    print('AlarmManager ready in %.1f ms (load %.1f ms, schedule %.1f ms, '
+          'arm %.1f ms)' % (timings['ready'] * 1000, timings['load'] * 1000,
+                            timings['schedule'] * 1000, timings['arm'] * 1000))
+
+
 def parsing_args(argv):
     """
     Processes the command line arguments. Arguments supported:
@@ -80,12 +119,15 @@ def parsing_args(argv):
     -c / --cli
     -s / --server
     -b / --both
+    -m / --simulate
+    -t / --threads <number of server worker threads>
     :return: dictionary with available options(keys) and value(value)
     """
     option_dict = {}
     try:
         opts, args = getopt.getopt(
-            argv, 'hscb', ['help', 'server', 'cli', 'both'])
+            argv, 'hscbmt:',
+            ['help', 'server', 'cli', 'both', 'simulate', 'threads='])
     except getopt.GetoptError as e:
         print('There was a problem parsing the command line arguments:')
         print('\t%s' % e)
@@ -96,7 +138,9 @@ def parsing_args(argv):
             print('Choose between running the application in command line ' +
                   'interface, to launch the HTTP server, or both.\n' +
                   '\t-c Command Line Interface\n\t-s Launch HTTP server\n'
-                  '\t-b Both command line and server')
+                  '\t-b Both command line and server\n'
+                  '\t-m Simulate the alarm events of the next week\n'
+                  '\t-t <n> Serve with a pool of n threads')
             sys.exit(0)
         elif opt in ('-c', '--cli'):
                 option_dict['cli'] = None
@@ -104,6 +148,14 @@ def parsing_args(argv):
                 option_dict['server'] = None
         elif opt in ('-b', '--both'):
                 option_dict['both'] = None
+        elif opt in ('-m', '--simulate'):
+                option_dict['simulate'] = None
+        elif opt in ('-t', '--threads'):
+            try:
+                option_dict['threads'] = max(int(arg), 1)
+            except ValueError:
+                print('The number of server threads has to be an integer.')
+                sys.exit(1)
         else:
             print('Flag ' + opt + ' not recognised.')
 
@@ -122,12 +174,18 @@ def main(argv):
 
     # This variable is used to select between the different modes, defaults both
     start = 'both'
+    # Number of threads of the server, None for the Flask development server
+    server_threads = None
 
     # Checking command line arguments in order of priority
     print('\n======= Parsing Command line arguments =======')
     if len(argv) > 0:
         arguments = parsing_args(argv)
-        if 'both' in arguments:
+        server_threads = arguments.get('threads')
+        if 'simulate' in arguments:
+            print('Simulation selected')
+            start = 'simulate'
+        elif 'both' in arguments:
             print('Command line and server selected')
             start = 'both'
         elif 'cli' in arguments:
@@ -141,28 +199,39 @@ def main(argv):
 
     # Loading the settings
     print('\n=========== Launching LightUpPi Alarm ==========')
-    if start == 'server':
+    if start == 'simulate':
+        simulate_week()
+    elif start == 'server':
         # For the server we only set the offset alarm, as it is meant to be run
         # headless and nothing else will be connected to ring/alert
         alarm_mgr = AlarmManager.AlarmManager(
-            offset_alert_callback=alarm_offset_alert)
-        Server.run(alarm_mgr_arg=alarm_mgr)
+            offset_alert_callback=alarm_offset_alert,
+            reconcile_interval=RECONCILE_INTERVAL,
+            arming_window=ARMING_WINDOW)
+        print_startup_timings(alarm_mgr)
+        Server.run(alarm_mgr_arg=alarm_mgr, threads=server_threads,
+                   hardware=HardwareThread.HardwareThread)
     else:
         # The command line interface running on its own thread is common to
         # the 'cli' and 'both' options.
         cli_thread = CliThread()
         alarm_mgr = AlarmManager.AlarmManager(
             alert_callback=cli_thread.alarm_alert,
-            offset_alert_callback=alarm_offset_alert)
+            offset_alert_callback=alarm_offset_alert,
+            reconcile_interval=RECONCILE_INTERVAL,
+            arming_window=ARMING_WINDOW)
+        print_startup_timings(alarm_mgr)
         cli_thread.attach_alarm_mgr(alarm_mgr)
         cli_thread.start()
         # Infinite loop can be the Flask server, or just a loop
         try:
             if start == 'both':
-                Server.run(
-                    alarm_mgr_arg=alarm_mgr,
-                    silent=True,
-                    callback_arg=cli_thread.callback_event)
+                # Refresh the cli with the changes done through the server
+                alarm_mgr.subscribe(cli_thread.callback_event,
+                                    AlarmEventBus.change_events)
+                Server.run(alarm_mgr_arg=alarm_mgr, silent=True,
+                           threads=server_threads,
+                           hardware=HardwareThread.HardwareThread)
             else:
                 while cli_thread.isAlive():
                     sleep(0.2)